@@ -0,0 +1,153 @@
+"""Import time benchmark for the summarize_media modules
+
+Each module is imported in a fresh interpreter with `python -X importtime`, its cumulative import time is
+compared against a budget, and the set of loaded modules is checked for heavy dependencies that should only be
+imported on first use (e.g. torch, whisperx, the LLM client libraries).
+
+Usage (from the repository root):
+```bash
+python benchmarks/import_time.py
+python benchmarks/import_time.py --repeat 10 --budget-scale 2.0  # e.g. on slow CI machines
+```
+
+Exits with a non-zero status if any module exceeds its budget, fails to import, or loads a forbidden dependency.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_LOCAL_ML = ["torch", "whisperx", "faster_whisper", "pyannote"]
+LLM_CLIENTS = ["openai", "groq"]
+
+# module: (budget in milliseconds, dependencies that must not be loaded by the import)
+BUDGETS: Dict[str, Tuple[float, List[str]]] = {
+    "summarize_media.cache.artifact_cache": (30, HEAVY_LOCAL_ML + ["numpy"]),
+    "summarize_media.cache.fingerprint_index": (30, HEAVY_LOCAL_ML + ["numpy"]),
+    "summarize_media.cache.response_cache": (30, HEAVY_LOCAL_ML + LLM_CLIENTS),
+    "summarize_media.instrumentation.stages": (30, HEAVY_LOCAL_ML + ["numpy"]),
+    "summarize_media.job_queue.cli": (50, HEAVY_LOCAL_ML + LLM_CLIENTS + ["numpy"]),
+    "summarize_media.post_processing.reformat_output": (20, HEAVY_LOCAL_ML + ["numpy"]),
+    "summarize_media.post_processing.columnar_transcript": (200, HEAVY_LOCAL_ML),
+    "summarize_media.post_processing.compact_transcript": (
+        20,
+        HEAVY_LOCAL_ML + ["numpy"],
+    ),
+    "summarize_media.pre_processing.audio_source": (20, HEAVY_LOCAL_ML + ["numpy"]),
+    "summarize_media.pre_processing.convert_audio_format": (
+        50,
+        HEAVY_LOCAL_ML + ["numpy"],
+    ),
+    "summarize_media.pre_processing.fingerprint": (20, HEAVY_LOCAL_ML + ["numpy"]),
+    "summarize_media.transcribe.model_pool": (30, HEAVY_LOCAL_ML),
+    "summarize_media.transcribe.transcribe": (250, HEAVY_LOCAL_ML),
+    "summarize_media.transcribe.transcribe_batch": (250, HEAVY_LOCAL_ML),
+    "summarize_media.transcribe.windowed": (250, HEAVY_LOCAL_ML),
+    "summarize_media.transcribe.checkpoint": (50, HEAVY_LOCAL_ML),
+    "summarize_media.transcribe.autotune": (100, HEAVY_LOCAL_ML),
+    "summarize_media.transcribe.streaming": (250, HEAVY_LOCAL_ML),
+    "summarize_media.transcribe.transcribe_cloud": (1000, HEAVY_LOCAL_ML),
+    "summarize_media.transcribe.cloud_jobs": (1000, HEAVY_LOCAL_ML),
+    "summarize_media.summarize_transcription.llm_inference": (100, LLM_CLIENTS),
+    "summarize_media.summarize_transcription.summarize": (
+        150,
+        LLM_CLIENTS + ["tiktoken"],
+    ),
+    "summarize_media.host_files.host_files": (300, HEAVY_LOCAL_ML),
+    "summarize_media.get_media.bilibili": (50, ["bilix"]),
+    "summarize_media.get_media.youtube": (50, ["pytubefix"]),
+    "summarize_media.get_media.fetch": (50, ["bilix", "pytubefix"]),
+}
+
+
+def measure(module: str) -> Tuple[Optional[float], List[str], str]:
+    """Imports `module` in a fresh interpreter
+
+    Returns:
+        Tuple[Optional[float], List[str], str]: Cumulative import time of the module in milliseconds (None if the import failed), the loaded module names, and the error output
+    """
+    code = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT,
+    )
+    if result.returncode != 0:
+        errors = [
+            line
+            for line in result.stderr.splitlines()
+            if not line.startswith("import time:")
+        ]
+        return None, [], "\n".join(errors[-3:])
+
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.strip() == module:
+            cumulative_us = int(cumulative)
+
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return (cumulative_us or 0) / 1000, loaded, ""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Runs per module, the best run is kept"
+    )
+    parser.add_argument(
+        "--budget-scale",
+        type=float,
+        default=1.0,
+        help="Multiplier applied to every budget",
+    )
+    parser.add_argument(
+        "modules",
+        nargs="*",
+        help="Modules to check, defaults to every module with a budget",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules or BUDGETS:
+        budget, forbidden = BUDGETS.get(module, (float("inf"), []))
+        budget *= args.budget_scale
+
+        best = None
+        for _ in range(args.repeat):
+            elapsed, loaded, error = measure(module)
+            if elapsed is None:
+                break
+            best = elapsed if best is None else min(best, elapsed)
+
+        if best is None:
+            print(f"ERROR  {module}: import failed\n{error}")
+            failed = True
+            continue
+
+        leaked = sorted(
+            dep
+            for dep in forbidden
+            if any(name.split(".")[0] == dep for name in loaded)
+        )
+        status = "OK" if best <= budget and not leaked else "FAIL"
+        failed |= status == "FAIL"
+        leaked_text = f", loads {', '.join(leaked)}" if leaked else ""
+        print(
+            f"{status:<6} {module}: {best:.1f} ms (budget {budget:.0f} ms){leaked_text}"
+        )
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Local mock of an OpenAI compatible chat completions server, for benchmarking the LLM calls without a network
+
+Example:
+```python
+with MockLLMServer(latency=0.05) as server:
+    client = OpenAI(base_url=server.base_url, api_key="mock")
+    get_response(messages, client=client, client_args={"model": "mock"})
+```
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+class MockLLMServer:
+    """Serves POST /v1/chat/completions (plain and streamed) on localhost, in a background thread
+
+    The reply is deterministic: a few bullet points derived from the length of the last message.
+
+    Args:
+        latency (float, optional): Seconds to wait before answering, simulating the model. Defaults to 0.
+        completion_words (int, optional): Number of words of every reply. Defaults to 64.
+        rate_limited (int, optional): Number of first requests answered with a 429, simulating a rate limit. Defaults to 0.
+        retry_after (float, optional): "Retry-After" header (in seconds) of the 429 responses. Defaults to 0.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        completion_words: int = 64,
+        rate_limited: int = 0,
+        retry_after: float = 0.0,
+    ):
+        self.latency = latency
+        self.completion_words = completion_words
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self) -> "MockLLMServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reply(self, messages: List[Dict[str, Any]]) -> str:
+        length = len(str(messages[-1].get("content", ""))) if messages else 0
+        words = [f"point{i % 7}" for i in range(self.completion_words)]
+        lines = [" ".join(words[i : i + 8]) for i in range(0, len(words), 8)]
+        return f"- input of {length} characters\n" + "\n".join(
+            f"- {line}" for line in lines
+        )
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.requests += 1
+                    limited = server.requests <= server.rate_limited
+                if limited:
+                    self._send_json(
+                        {"error": {"message": "Rate limited", "type": "rate_limit"}},
+                        status=429,
+                        headers={"Retry-After": str(server.retry_after)},
+                    )
+                    return
+                if server.latency:
+                    time.sleep(server.latency)
+
+                content = server.reply(body.get("messages", []))
+                prompt_tokens = sum(
+                    len(str(m.get("content", "")).split())
+                    for m in body.get("messages", [])
+                )
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": server.completion_words,
+                    "total_tokens": prompt_tokens + server.completion_words,
+                }
+                base = {
+                    "id": "chatcmpl-mock",
+                    "created": 0,
+                    "model": body.get("model", "mock"),
+                }
+                if body.get("stream"):
+                    self._stream(base, content)
+                else:
+                    self._send_json(
+                        {
+                            **base,
+                            "object": "chat.completion",
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "message": {
+                                        "role": "assistant",
+                                        "content": content,
+                                    },
+                                    "finish_reason": "stop",
+                                }
+                            ],
+                            "usage": usage,
+                        }
+                    )
+
+            def _send_json(
+                self,
+                payload: Dict[str, Any],
+                status: int = 200,
+                headers: Optional[Dict[str, str]] = None,
+            ) -> None:
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, base: Dict[str, Any], content: str) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for piece in content.split(" "):
+                    chunk = {
+                        **base,
+                        "object": "chat.completion.chunk",
+                        "choices": [
+                            {
+                                "index": 0,
+                                "delta": {"content": piece + " "},
+                                "finish_reason": None,
+                            }
+                        ],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,135 @@
+"""In-memory mock of the Replicate predictions API, served through an `httpx.MockTransport`, for testing
+`ReplicateJobManager` without a network
+
+Example:
+```python
+replicate_mock = MockReplicate(polls=2)
+manager = ReplicateJobManager(db_path, client=replicate_mock.client(), poll_interval=0.01)
+transcripts = asyncio.run(manager.run_many(audio_urls))
+```
+"""
+
+import itertools
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import httpx
+import replicate
+
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+
+class MockReplicate:
+    """Serves POST /v1/predictions, GET /v1/predictions/{id} and POST /v1/predictions/{id}/cancel
+
+    A created prediction is "starting", then "processing" once polled, and completes after `polls` polls. The
+    output is derived from the input, so every job has a distinct and deterministic result.
+
+    Args:
+        polls (int, optional): Number of polls after which a prediction completes, None to only complete predictions through `complete`. Defaults to 1.
+        failures (int, optional): Number of first predictions that fail instead of succeeding. Defaults to 0.
+    """
+
+    def __init__(self, polls: Optional[int] = 1, failures: int = 0):
+        self.polls = polls
+        self.failures = failures
+        self.predictions: Dict[str, Dict[str, Any]] = {}
+        # Bodies of the create requests that reached the API, including the failed ones
+        self.create_requests: List[Dict[str, Any]] = []
+        self.requests: List[Tuple[str, str]] = []
+        self.max_running = 0
+        self._errors: List[Tuple[str, str, Union[int, Exception]]] = []
+        self._polled: Dict[str, int] = {}
+        self._ids = itertools.count()
+
+    def client(self) -> replicate.Client:
+        return replicate.Client(
+            api_token="mock", transport=httpx.MockTransport(self.handle)
+        )
+
+    def fail_next(self, method: str, path: str, error: Union[int, Exception]) -> None:
+        """Fails the next request to `path` (a prefix, e.g. "/v1/predictions") with a status code or an exception
+
+        httpx exceptions are raised as if the connection failed, an exception class is instantiated with the request.
+        """
+        self._errors.append((method, path, error))
+
+    def complete(self, prediction_id: str, status: str = "succeeded") -> Dict[str, Any]:
+        """Completes a prediction, returns it as Replicate would post it to a webhook"""
+        prediction = self.predictions[prediction_id]
+        prediction["status"] = status
+        if status == "succeeded":
+            prediction["output"] = {
+                "segments": [{"text": json.dumps(prediction["input"], sort_keys=True)}]
+            }
+        elif status == "failed":
+            prediction["error"] = "CUDA out of memory"
+        return dict(prediction)
+
+    def running(self) -> List[str]:
+        return [
+            prediction_id
+            for prediction_id, prediction in self.predictions.items()
+            if prediction["status"] not in TERMINAL_STATUSES
+        ]
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        method, path = request.method, request.url.path
+        self.requests.append((method, path))
+        if method == "POST" and path == "/v1/predictions":
+            self.create_requests.append(json.loads(request.content))
+
+        for index, (error_method, error_path, error) in enumerate(self._errors):
+            if error_method == method and path.startswith(error_path):
+                del self._errors[index]
+                if isinstance(error, int):
+                    return httpx.Response(error, json={"detail": "Injected error"})
+                if isinstance(error, type):
+                    error = error("Injected error", request=request)
+                raise error
+
+        parts = path.strip("/").split("/")
+        if method == "POST" and parts == ["v1", "predictions"]:
+            return httpx.Response(201, json=self._create(self.create_requests[-1]))
+        if parts[:2] == ["v1", "predictions"] and parts[2] in self.predictions:
+            if method == "GET" and len(parts) == 3:
+                return httpx.Response(200, json=self._poll(parts[2]))
+            if method == "POST" and parts[3:] == ["cancel"]:
+                prediction = self.predictions[parts[2]]
+                if prediction["status"] not in TERMINAL_STATUSES:
+                    prediction["status"] = "canceled"
+                return httpx.Response(200, json=prediction)
+        return httpx.Response(404, json={"detail": "Not found"})
+
+    def _create(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        prediction_id = f"prediction{next(self._ids)}"
+        self.predictions[prediction_id] = {
+            "id": prediction_id,
+            "model": "mock/whisperx",
+            "version": body["version"],
+            "status": "starting",
+            "input": body["input"],
+            "output": None,
+            "error": None,
+            "logs": "",
+            "webhook": body.get("webhook"),
+            "urls": {
+                "get": f"https://api.replicate.com/v1/predictions/{prediction_id}",
+                "cancel": f"https://api.replicate.com/v1/predictions/{prediction_id}/cancel",
+            },
+        }
+        self._polled[prediction_id] = 0
+        self.max_running = max(self.max_running, len(self.running()))
+        return self.predictions[prediction_id]
+
+    def _poll(self, prediction_id: str) -> Dict[str, Any]:
+        prediction = self.predictions[prediction_id]
+        if prediction["status"] in TERMINAL_STATUSES:
+            return prediction
+
+        self._polled[prediction_id] += 1
+        if self.polls is not None and self._polled[prediction_id] >= self.polls:
+            failed = list(self.predictions).index(prediction_id) < self.failures
+            return self.complete(prediction_id, "failed" if failed else "succeeded")
+        prediction["status"] = "processing"
+        return prediction
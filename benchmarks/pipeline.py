@@ -0,0 +1,439 @@
+"""Throughput benchmarks of the pipeline, compared against a JSON baseline
+
+Every case runs on deterministic synthetic inputs (see `synthetic` and `stub_models`), nothing is downloaded:
+- convert_to_wav: audio generated with ffmpeg's lavfi sources, in several formats and channel layouts
+- reformat: large synthetic transcripts, as a list of segments, as a `ColumnarTranscript` and in the compact format
+- get_response/ get_summarization: against a local mock LLM server (see `mock_llm`)
+- get_transcription: with stubbed whisperx models (see `stub_models`), sequential and with parallel diarization
+
+Each case is repeated and its best throughput kept. With `--save-baseline`, the results are written to the
+baseline file; otherwise they are compared against it, and the run fails if any case is slower than its baseline
+by more than the threshold. Baselines depend on the machine, save one per machine (or CI runner type).
+
+Usage (from the repository root):
+```bash
+python benchmarks/pipeline.py --save-baseline  # e.g. before upgrading a dependency
+python benchmarks/pipeline.py  # after, fails on regressions of more than 10%
+python benchmarks/pipeline.py --only reformat --threshold 0.25 --output results.json
+```
+
+Cases whose requirements are missing (e.g. ffmpeg) are reported as skipped and don't fail the run.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from mock_llm import MockLLMServer  # noqa: E402
+from stub_models import stub_whisperx, synthetic_samples  # noqa: E402
+from synthetic import generate_audio, synthetic_segments  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, "benchmarks", "baselines", "pipeline.json")
+
+# (format, channels, sample rate) of the audio converted by the convert_to_wav cases
+CONVERT_INPUTS = [
+    ("mp3", 2, 44100),
+    ("m4a", 2, 48000),
+    ("opus", 1, 48000),
+    ("flac", 6, 48000),
+]
+
+# A case returns its throughput (higher is faster) and extra measurements
+CaseResult = Tuple[float, Dict[str, Any]]
+
+
+class Skip(Exception):
+    """Raised by a case whose requirements are missing"""
+
+
+def best_of(repeat: int, run: Callable[[], CaseResult]) -> CaseResult:
+    """Runs a case `repeat` times, keeps the run with the highest throughput"""
+    best = None
+    for _ in range(repeat):
+        result = run()
+        if best is None or result[0] > best[0]:
+            best = result
+    return best
+
+
+def timed(fn: Callable[[], Any]) -> Tuple[float, Any]:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+# Cases
+
+
+def convert_cases(args: argparse.Namespace, work_dir: str) -> Dict[str, Callable]:
+    from summarize_media.pre_processing.convert_audio_format import convert_to_wav
+
+    def case(audio_format: str, channels: int, sample_rate: int, num_workers: int):
+        def run() -> CaseResult:
+            if shutil.which("ffmpeg") is None:
+                raise Skip("ffmpeg is not installed")
+            input_path = generate_audio(
+                os.path.join(work_dir, "audio"),
+                args.audio_seconds,
+                audio_format,
+                channels,
+                sample_rate,
+            )
+            output_path = os.path.join(work_dir, "converted")
+            os.makedirs(output_path, exist_ok=True)
+            wall, _ = timed(
+                lambda: convert_to_wav(
+                    input_path,
+                    output_path=output_path,
+                    overwrite=True,
+                    num_workers=num_workers,
+                )
+            )
+            return args.audio_seconds / wall, {
+                "unit": "audio seconds/s",
+                "wall_seconds": wall,
+            }
+
+        return run
+
+    cases = {}
+    for audio_format, channels, sample_rate in CONVERT_INPUTS:
+        name = f"convert_to_wav[{audio_format}-{channels}ch]"
+        cases[name] = case(audio_format, channels, sample_rate, 1)
+    cases["convert_to_wav[mp3-2ch-parallel]"] = case("mp3", 2, 44100, 0)
+    return cases
+
+
+def reformat_cases(args: argparse.Namespace, work_dir: str) -> Dict[str, Callable]:
+    from summarize_media.post_processing.columnar_transcript import to_columnar
+    from summarize_media.post_processing.compact_transcript import compact
+    from summarize_media.post_processing.reformat_output import reformat
+
+    segments = synthetic_segments(args.segments)
+
+    def run_list() -> CaseResult:
+        wall, text = timed(lambda: reformat(segments))
+        return len(segments) / wall, {
+            "unit": "segments/s",
+            "wall_seconds": wall,
+            "characters": len(text),
+        }
+
+    def run_columnar() -> CaseResult:
+        transcript = to_columnar(segments)
+        wall, text = timed(lambda: reformat(transcript))
+        return len(segments) / wall, {
+            "unit": "segments/s",
+            "wall_seconds": wall,
+            "characters": len(text),
+        }
+
+    def run_compact() -> CaseResult:
+        wall, text = timed(lambda: compact(segments))
+        # Token counts of the list format and of the compact one, outside of the timing
+        stats = {}
+        compact(segments, stats=stats)
+        return len(segments) / wall, {
+            "unit": "segments/s",
+            "wall_seconds": wall,
+            "characters": len(text),
+            **stats,
+        }
+
+    return {
+        "reformat[list]": run_list,
+        "reformat[columnar]": run_columnar,
+        "reformat[compact]": run_compact,
+    }
+
+
+def llm_cases(args: argparse.Namespace, work_dir: str) -> Dict[str, Callable]:
+    from openai import OpenAI
+
+    from summarize_media.cache.response_cache import ResponseCache
+    from summarize_media.summarize_transcription import llm_inference, summarize
+    from summarize_media.summarize_transcription.rate_limit import get_sync_rate_limiter
+
+    messages = [
+        {"role": "system", "content": "Summarize"},
+        {"role": "user", "content": "hello " * 2000},
+    ]
+    client_args = {"model": "mock", "temperature": 0.3}
+
+    @contextmanager
+    def mock_client() -> Iterator[Tuple[MockLLMServer, OpenAI]]:
+        with MockLLMServer(latency=args.llm_latency) as server:
+            client = OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+            # The default limiter of get_response (2 requests per second) would be all that is measured
+            get_sync_rate_limiter(client, requests_per_minute=None)
+            yield server, client
+
+    def run_response() -> CaseResult:
+        with mock_client() as (_, client):
+            wall, _ = timed(
+                lambda: [
+                    llm_inference.get_response(messages, client, client_args)
+                    for _ in range(args.llm_requests)
+                ]
+            )
+        return args.llm_requests / wall, {"unit": "requests/s", "wall_seconds": wall}
+
+    def run_cached_response() -> CaseResult:
+        cache = ResponseCache(os.path.join(work_dir, "responses.sqlite3"))
+        conversations = [
+            [*messages, {"role": "user", "content": f"part {i}"}]
+            for i in range(args.llm_requests)
+        ]
+        with mock_client() as (server, client):
+            for conversation in conversations:
+                llm_inference.get_response(
+                    conversation, client, client_args, cache=cache
+                )
+            requests = server.requests
+            wall, _ = timed(
+                lambda: [
+                    llm_inference.get_response(
+                        conversation, client, client_args, cache=cache
+                    )
+                    for conversation in conversations
+                ]
+            )
+            # Every request of the timed pass is a hit
+            assert server.requests == requests
+        cache.clear()
+        cache.close()
+        return len(conversations) / wall, {
+            "unit": "requests/s",
+            "wall_seconds": wall,
+        }
+
+    def run_summarization() -> CaseResult:
+        segments = synthetic_segments(args.segments // 4)
+        with mock_client() as (server, client):
+            get_client = summarize.get_client
+            summarize.get_client = lambda: client
+            try:
+                wall, _ = timed(
+                    lambda: summarize.get_summarization_map_reduce(
+                        segments, chunk_tokens=4000
+                    )
+                )
+            finally:
+                summarize.get_client = get_client
+            requests = server.requests
+        return len(segments) / wall, {
+            "unit": "segments/s",
+            "wall_seconds": wall,
+            "requests": requests,
+        }
+
+    return {
+        "llm.get_response": run_response,
+        "llm.get_response[cached]": run_cached_response,
+        "llm.get_summarization_map_reduce": run_summarization,
+    }
+
+
+def transcribe_cases(args: argparse.Namespace, work_dir: str) -> Dict[str, Callable]:
+    from summarize_media.transcribe.transcribe import get_transcription
+
+    audio = synthetic_samples(args.audio_seconds)
+
+    def case(parallel_diarization: Optional[str]):
+        def run() -> CaseResult:
+            timings = {}
+            with stub_whisperx():
+                wall, _ = timed(
+                    lambda: get_transcription(
+                        audio,
+                        device="cpu",
+                        # Early language detection runs the real VAD model
+                        language="en",
+                        assign_speaker_labels=True,
+                        hugging_face_token="stub",
+                        parallel_diarization=parallel_diarization,
+                        timings=timings,
+                    )
+                )
+            return args.audio_seconds / wall, {
+                "unit": "audio seconds/s",
+                "wall_seconds": wall,
+                "timings": timings,
+            }
+
+        return run
+
+    return {
+        "get_transcription[sequential]": case(None),
+        "get_transcription[thread]": case("thread"),
+    }
+
+
+CASE_GROUPS = [convert_cases, reformat_cases, llm_cases, transcribe_cases]
+
+
+# Baselines
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    threshold: float,
+) -> List[str]:
+    """Returns the names of the cases slower than their baseline by more than `threshold` (a fraction)"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if result.get("throughput") is None or reference is None:
+            continue
+        change = result["throughput"] / reference["throughput"] - 1
+        result["change"] = change
+        if change < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def machine_info() -> Dict[str, Any]:
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--only", nargs="*", help="Only run the cases containing any of these strings"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per case, the best is kept"
+    )
+    parser.add_argument(
+        "--audio-seconds",
+        type=float,
+        default=600.0,
+        help="Length of the synthetic audio",
+    )
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=20000,
+        help="Segments of the synthetic transcripts",
+    )
+    parser.add_argument(
+        "--llm-requests",
+        type=int,
+        default=50,
+        help="Requests sent to the mock LLM server",
+    )
+    parser.add_argument(
+        "--llm-latency",
+        type=float,
+        default=0.0,
+        help="Latency of the mock LLM server in seconds",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=DEFAULT_BASELINE,
+        help="Baseline file to compare against (or save to)",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save the results as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Allowed throughput regression, as a fraction",
+    )
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument(
+        "--work-dir",
+        help="Folder for the synthetic media, defaults to a temporary folder",
+    )
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="summarize_media_bench_")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for group in CASE_GROUPS:
+        try:
+            cases = group(args, work_dir)
+        except ImportError as e:
+            print(f"SKIP   {group.__name__}: {e}")
+            continue
+        for name, run in cases.items():
+            if args.only and not any(part in name for part in args.only):
+                continue
+            try:
+                throughput, extra = best_of(args.repeat, run)
+            except Skip as e:
+                results[name] = {"throughput": None, "skipped": str(e)}
+                print(f"SKIP   {name}: {e}")
+                continue
+            results[name] = {"throughput": throughput, **extra}
+            print(f"RAN    {name}: {throughput:,.1f} {extra['unit']}")
+
+    if args.work_dir is None:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"machine": machine_info(), "created": time.time(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.isfile(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)["results"]
+        # Skipped or filtered out cases keep their previous baseline
+        baseline.update(
+            {
+                name: result
+                for name, result in results.items()
+                if result["throughput"] is not None
+            }
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**report, "results": baseline}, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.isfile(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("machine") != report["machine"]:
+        print("Warning: the baseline was recorded on a different machine")
+
+    regressions = compare(results, baseline["results"], args.threshold)
+    for name, result in results.items():
+        if "change" in result:
+            status = "SLOWER" if name in regressions else "OK"
+            print(f"{status:<6} {name}: {result['change']:+.1%} vs baseline")
+
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
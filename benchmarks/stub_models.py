@@ -0,0 +1,141 @@
+"""Stand-in for the `whisperx` module, for benchmarking `get_transcription` without models or a GPU
+
+The stubs keep the shapes of the whisperx outputs and do a small amount of work proportional to the audio (one
+pass over the samples per model), so the benchmark measures the pipeline around the models: audio handling,
+caching, scheduling of the concurrent diarization and speaker assignment.
+
+Example:
+```python
+with stub_whisperx():
+    get_transcription(audio, device="cpu")
+```
+"""
+
+import sys
+import types
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+SEGMENT_SECONDS = 8.0
+WORDS_PER_SEGMENT = 20
+
+
+class StubWhisperModel:
+    preset_language = None
+
+    def transcribe(self, audio: np.ndarray, batch_size: int = 16, **kwargs) -> Dict:
+        step = int(SEGMENT_SECONDS * SAMPLE_RATE)
+        segments = []
+        for start in range(0, len(audio), step):
+            chunk = audio[start : start + step]
+            level = float(np.abs(chunk).mean())
+            segments.append(
+                {
+                    "start": start / SAMPLE_RATE,
+                    "end": (start + len(chunk)) / SAMPLE_RATE,
+                    "text": " "
+                    + " ".join(f"word{i}" for i in range(WORDS_PER_SEGMENT))
+                    + f" {level:.3f}",
+                }
+            )
+        return {"language": "en", "segments": segments}
+
+
+def align(
+    segments: List[Dict[str, Any]],
+    model: Any,
+    metadata: Any,
+    audio: np.ndarray,
+    device: Any,
+    **kwargs,
+) -> Dict:
+    # One pass over the audio, like the alignment model's forward pass
+    np.square(audio).sum()
+    aligned = []
+    for segment in segments:
+        words = segment["text"].split()
+        step = (segment["end"] - segment["start"]) / max(1, len(words))
+        aligned.append(
+            {
+                **segment,
+                "words": [
+                    {
+                        "word": word,
+                        "start": segment["start"] + i * step,
+                        "end": segment["start"] + (i + 1) * step,
+                        "score": 0.9,
+                    }
+                    for i, word in enumerate(words)
+                ],
+            }
+        )
+    return {"segments": aligned}
+
+
+class StubDiarizationPipeline:
+    def __init__(self, **kwargs):
+        pass
+
+    def __call__(self, audio: np.ndarray, **kwargs) -> List[Dict[str, Any]]:
+        # Speaker turns every few seconds, decided by the energy of each second of audio
+        seconds = len(audio) // SAMPLE_RATE
+        energy = np.abs(audio[: seconds * SAMPLE_RATE]).reshape(seconds, -1).mean(1)
+        turns = []
+        for start in range(0, seconds, 5):
+            speaker = int(energy[start] * 1e4) % 3
+            turns.append(
+                {
+                    "start": float(start),
+                    "end": float(min(seconds, start + 5)),
+                    "speaker": f"SPEAKER_{speaker:02d}",
+                }
+            )
+        return turns
+
+
+def assign_word_speakers(turns: List[Dict[str, Any]], result: Dict) -> Dict:
+    starts = np.array([turn["start"] for turn in turns])
+    for segment in result["segments"]:
+        middle = (segment["start"] + segment["end"]) / 2
+        index = max(0, int(np.searchsorted(starts, middle, side="right")) - 1)
+        segment["speaker"] = turns[index]["speaker"] if turns else None
+        for word in segment.get("words", []):
+            word["speaker"] = segment["speaker"]
+    return result
+
+
+def load_audio(file_path: str, sr: int = SAMPLE_RATE) -> np.ndarray:
+    raise NotImplementedError("The stub only transcribes already decoded audio")
+
+
+@contextmanager
+def stub_whisperx() -> Iterator[types.ModuleType]:
+    """Installs the stub as the `whisperx` module for the duration of the block"""
+    module = types.ModuleType("whisperx")
+    module.load_model = lambda *args, **kwargs: StubWhisperModel()
+    module.load_align_model = lambda *args, **kwargs: (object(), {"language": "en"})
+    module.align = align
+    module.DiarizationPipeline = StubDiarizationPipeline
+    module.assign_word_speakers = assign_word_speakers
+    module.load_audio = load_audio
+
+    previous = sys.modules.get("whisperx")
+    sys.modules["whisperx"] = module
+    try:
+        yield module
+    finally:
+        if previous is None:
+            sys.modules.pop("whisperx", None)
+        else:
+            sys.modules["whisperx"] = previous
+
+
+def synthetic_samples(seconds: float, seed: int = 0) -> np.ndarray:
+    """Deterministic 16 kHz mono float32 samples (a tone under noise), like the output of `convert_to_array`"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE), dtype=np.float32) / SAMPLE_RATE
+    tone = 0.1 * np.sin(2 * np.pi * 220 * t, dtype=np.float32)
+    return tone + rng.normal(0, 0.02, len(t)).astype(np.float32)
@@ -0,0 +1,152 @@
+"""Deterministic synthetic inputs for the benchmarks
+
+Audio is generated with ffmpeg's `lavfi` sources (a pink noise bed under a tone, both seeded), so the same
+arguments always produce the same samples, and transcripts are generated from a seeded random generator.
+"""
+
+import os
+import random
+import subprocess
+from typing import Any, Dict, List, Optional
+
+# Container of each format, mapped to the ffmpeg encoder arguments used for it
+AUDIO_FORMATS = {
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "128k"],
+    "m4a": ["-c:a", "aac", "-b:a", "128k"],
+    "opus": ["-c:a", "libopus", "-b:a", "64k"],
+    "flac": ["-c:a", "flac"],
+    "ogg": ["-c:a", "libvorbis", "-q:a", "4"],
+    "wav": ["-c:a", "pcm_s16le"],
+}
+
+WORDS = (
+    "so the thing about this is that we actually never really looked at how much "
+    "time goes into the model itself versus everything around it and honestly i "
+    "think that is where most of the latency hides you know"
+).split()
+
+
+def generate_audio(
+    output_path: str,
+    seconds: float = 600.0,
+    audio_format: str = "mp3",
+    channels: int = 2,
+    sample_rate: int = 44100,
+    seed: int = 0,
+) -> str:
+    """Generates `seconds` of deterministic audio with ffmpeg, reusing the file if it already exists
+
+    Args:
+        output_path (str): Folder to write the file to, the name encodes the arguments
+        seconds (float, optional): Duration of the audio. Defaults to 600.
+        audio_format (str, optional): One of `AUDIO_FORMATS`. Defaults to "mp3".
+        channels (int, optional): Number of channels, e.g. 1 (mono), 2 (stereo) or 6 (5.1). Defaults to 2.
+        sample_rate (int, optional): Sample rate in Hz. Defaults to 44100.
+        seed (int, optional): Seed of the noise source. Defaults to 0.
+
+    Raises:
+        ValueError: If the format is not supported
+        RuntimeError: When the ffmpeg call either fails to start, or results in an error
+
+    Returns:
+        str: Path of the generated file
+    """
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Format not supported: {audio_format}")
+
+    os.makedirs(output_path, exist_ok=True)
+    file_path = os.path.join(
+        output_path,
+        f"synthetic-{seconds:g}s-{channels}ch-{sample_rate}hz-seed{seed}.{audio_format}",
+    )
+    if os.path.isfile(file_path):
+        return file_path
+
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"anoisesrc=d={seconds}:c=pink:r={sample_rate}:a=0.05:seed={seed}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=f=220:d={seconds}:r={sample_rate}",
+        "-filter_complex",
+        "amix=inputs=2:duration=shortest",
+        "-ac",
+        str(channels),
+        *AUDIO_FORMATS[audio_format],
+        # Bit exact output, so the files (and their hashes) don't depend on the ffmpeg build metadata
+        "-fflags",
+        "+bitexact",
+        "-flags:a",
+        "+bitexact",
+        "-map_metadata",
+        "-1",
+        "-y",
+        file_path,
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        raise RuntimeError(f"FFmpeg execution failed: {str(e)}")
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg synthesis failed: {result.stderr}")
+
+    return file_path
+
+
+def synthetic_segments(
+    count: int,
+    speakers: int = 3,
+    words_per_segment: int = 20,
+    with_words: bool = False,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """Generates a transcript of `count` segments, shaped like the output of `get_transcription`
+
+    Args:
+        count (int): Number of segments
+        speakers (int, optional): Number of speakers taking turns. Defaults to 3.
+        words_per_segment (int, optional): Average number of words per segment. Defaults to 20.
+        with_words (bool, optional): Whether to add word level timestamps. Defaults to False.
+        seed (int, optional): Seed of the generator. Defaults to 0.
+
+    Returns:
+        List[Dict[str, Any]]: The segments, each with "start", "end", "text" and "speaker" keys
+    """
+    rng = random.Random(seed)
+    segments = []
+    time = 0.0
+    speaker: Optional[int] = None
+    for _ in range(count):
+        if speaker is None or rng.random() < 0.3:
+            speaker = rng.randrange(speakers)
+        words = rng.choices(WORDS, k=max(1, int(rng.gauss(words_per_segment, 5))))
+        duration = len(words) * rng.uniform(0.25, 0.45)
+        segment = {
+            "start": round(time, 3),
+            "end": round(time + duration, 3),
+            "text": " " + " ".join(words),
+            "speaker": f"SPEAKER_{speaker:02d}",
+        }
+        if with_words:
+            step = duration / len(words)
+            segment["words"] = [
+                {
+                    "word": word,
+                    "start": round(time + i * step, 3),
+                    "end": round(time + (i + 1) * step, 3),
+                    "score": round(rng.random(), 3),
+                    "speaker": segment["speaker"],
+                }
+                for i, word in enumerate(words)
+            ]
+        segments.append(segment)
+        time += duration + rng.uniform(0.0, 1.0)
+    return segments
@@ -0,0 +1,8 @@
+"""Entry point of `python -m summarize_media`, see `summarize_media.job_queue.cli`"""
+
+import sys
+
+from summarize_media.job_queue.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
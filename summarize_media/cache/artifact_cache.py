@@ -0,0 +1,321 @@
+"""Content-addressed, size-bounded on-disk cache for pipeline artifacts
+
+Every stage of the pipeline (download, conversion, transcription, summary) derives a key from a hash of
+its source plus the parameters that affect its output, and looks the artifact up before doing any work.
+Reprocessing the same media therefore costs a hash and a few file reads instead of a GPU pass and an LLM call.
+Downloads are the exception: their source is only known by its url, so they are keyed by the url (a URL cache).
+
+Example:
+```python
+from summarize_media.cache.artifact_cache import get_artifact_cache
+
+cache = get_artifact_cache()  # ~/.cache/summarize_media/artifacts, 20 GB by default
+
+audio = convert_to_wav(path, cache=cache)
+transcript = get_transcription(audio, cache=cache)
+summary = get_summarization(reformat(transcript["segments"]), cache=cache)
+```
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "summarize_media", "artifacts"
+)
+DEFAULT_MAX_BYTES = 20 * 1024**3
+
+# Suffix of the sidecar file holding the metadata of a cached artifact
+_META_SUFFIX = ".meta.json"
+
+
+class ArtifactCache:
+    """On-disk key/ artifact store with least recently used eviction
+
+    Artifacts are stored under `root/<first two hex digits>/<key>`, with a small sidecar metadata file. The folder is
+    scanned once, on the first write or size query, afterwards the sizes and recency of the artifacts are tracked in
+    memory, so writes don't rescan the cache. Artifacts written by other processes are picked up on the next start.
+
+    Args:
+        root (str, optional): Folder to store the artifacts in. Defaults to "~/.cache/summarize_media/artifacts".
+        max_bytes (int, optional): Maximum total size of the cached artifacts, least recently used artifacts are evicted past this size. Defaults to 20 GB.
+        hard_link (bool, optional): Whether to hard link files in and out of the cache instead of copying them (falls back to copying across file systems). Saves disk space, but a linked file that is later modified in place (e.g. overwritten by ffmpeg) corrupts the cached copy. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        hard_link: bool = False,
+    ):
+        self.root = root or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.hard_link = hard_link
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Artifact path -> size in bytes, least recently used first (None until the folder is scanned)
+        self._index: Optional["OrderedDict[str, int]"] = None
+        self._total = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def make_key(self, stage: str, source_hash: str, **params: Any) -> str:
+        """Builds the key of an artifact from its stage, the hash of its source and the parameters of the stage
+
+        Args:
+            stage (str): Name of the stage e.g. "convert", "transcribe", "summarize"
+            source_hash (str): Hash of the source media/ text, see `hash_file`, `hash_text` and `hash_bytes`
+            params: Parameters that affect the artifact, must be JSON serializable
+
+        Returns:
+            str: Hex digest identifying the artifact
+        """
+        payload = json.dumps(
+            {"stage": stage, "source": source_hash, "params": params},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_file(
+        self, key: str, output_folder: str, file_name: Optional[str] = None
+    ) -> Optional[str]:
+        """Materializes a cached file in the output folder
+
+        Args:
+            key (str): Key of the artifact
+            output_folder (str): Folder to place the file in (created if missing)
+            file_name (str, optional): Name of the materialized file, if not provided, the name the file was cached with is used
+
+        Returns:
+            Optional[str]: Path of the materialized file, or None on a cache miss
+        """
+        found = self._lookup(key)
+        if found is None:
+            return None
+        path, meta = found
+
+        os.makedirs(output_folder, exist_ok=True)
+        output_path = os.path.join(output_folder, file_name or meta.get("name", key))
+        if not _same_file(path, output_path):
+            _link_or_copy(path, output_path, self.hard_link)
+        return output_path
+
+    def put_file(self, key: str, file_path: str) -> None:
+        """Stores a copy (or hard link) of a file under `key`"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        _link_or_copy(file_path, tmp_path, self.hard_link)
+        os.replace(tmp_path, path)
+        self._write_meta(key, {"name": os.path.basename(file_path), "kind": "file"})
+        self._evict(path)
+
+    def get_json(self, key: str) -> Optional[Any]:
+        """Returns the cached JSON artifact stored under `key`, or None on a cache miss"""
+        found = self._lookup(key)
+        if found is None:
+            return None
+        with open(found[0], "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def put_json(self, key: str, obj: Any) -> None:
+        """Stores a JSON serializable object under `key`"""
+        self._write_atomic(key, json.dumps(obj, default=_json_default).encode("utf-8"))
+        self._write_meta(key, {"kind": "json"})
+        self._evict(self._path(key))
+
+    def get_text(self, key: str) -> Optional[str]:
+        """Returns the cached text stored under `key`, or None on a cache miss"""
+        found = self._lookup(key)
+        if found is None:
+            return None
+        with open(found[0], "r", encoding="utf-8") as file:
+            return file.read()
+
+    def put_text(self, key: str, text: str) -> None:
+        """Stores a string under `key`"""
+        self._write_atomic(key, text.encode("utf-8"))
+        self._write_meta(key, {"kind": "text"})
+        self._evict(self._path(key))
+
+    def size(self) -> int:
+        """Returns the total size of the cached artifacts in bytes"""
+        with self._lock:
+            self._load_index()
+            return self._total
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the hit/ miss/ eviction counters along with the current cache usage"""
+        size = self.size()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        path = self._path(key)
+        try:
+            with open(path + _META_SUFFIX, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+            # Bumps the modification time, which is used as the recency for eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if self._index is not None and path in self._index:
+                self._index.move_to_end(path)
+        logger.info(f"Artifact cache hit: {key}")
+        return path, meta
+
+    def _write_atomic(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path), delete=False, suffix=".tmp"
+        ) as file:
+            file.write(data)
+        os.replace(file.name, path)
+
+    def _write_meta(self, key: str, meta: Dict[str, Any]) -> None:
+        # The metadata is written last, an artifact without metadata is treated as missing
+        meta = {**meta, "created": time.time()}
+        with open(self._path(key) + _META_SUFFIX, "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+
+    def _scan(self):
+        """Yields (path, mtime, size) for every cached artifact"""
+        for prefix in os.listdir(self.root):
+            folder = os.path.join(self.root, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name.endswith(_META_SUFFIX) or name.endswith(".tmp"):
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _load_index(self) -> None:
+        """Scans the folder once, must be called with the lock held"""
+        if self._index is not None:
+            return
+        entries = sorted(self._scan(), key=lambda entry: entry[1])
+        self._index = OrderedDict((path, size) for path, _, size in entries)
+        self._total = sum(self._index.values())
+
+    def _evict(self, written: str) -> None:
+        """Records the artifact just written, then evicts the least recently used artifacts until the cache fits in `max_bytes`"""
+        try:
+            size = os.path.getsize(written)
+        except OSError:
+            size = 0
+        with self._lock:
+            self._load_index()
+            self._total += size - self._index.pop(written, 0)
+            self._index[written] = size
+            while self._total > self.max_bytes and len(self._index) > 1:
+                path, size = self._index.popitem(last=False)
+                logger.info(f"Evicting artifact: {os.path.basename(path)}")
+                for stale in (path + _META_SUFFIX, path):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+                self._total -= size
+                self.evictions += 1
+
+
+# Memoized file hashes, keyed by (path, size, modification time)
+_file_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def hash_file(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """Returns the sha256 hex digest of a file's content, memoized on its path, size and modification time"""
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _file_hashes:
+        return _file_hashes[memo_key]
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+
+    _file_hashes[memo_key] = digest.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def hash_bytes(data) -> str:
+    """Returns the sha256 hex digest of a bytes-like object (e.g. a contiguous numpy array)"""
+    return hashlib.sha256(memoryview(data).cast("B")).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """Returns the sha256 hex digest of a string"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(src: str, dst: str, hard_link: bool) -> None:
+    """Copies `src` to `dst`, or hard links it if `hard_link` is set (falling back to a copy e.g. across file systems)"""
+    if os.path.exists(dst):
+        os.remove(dst)
+    if hard_link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+
+def _same_file(a: str, b: str) -> bool:
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def _json_default(obj: Any) -> Any:
+    """Converts numpy scalars/ arrays (as found in whisperx outputs) to plain python objects"""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_default_cache: Optional[ArtifactCache] = None
+
+
+def get_artifact_cache() -> ArtifactCache:
+    """Returns the process-wide artifact cache, rooted at $SUMMARIZE_MEDIA_CACHE_DIR if set"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ArtifactCache(os.getenv("SUMMARIZE_MEDIA_CACHE_DIR"))
+    return _default_cache
@@ -0,0 +1,450 @@
+"""Local index of audio fingerprints, to reuse the transcript of content that was already transcribed
+
+Mirrored uploads of the same content (other container, bitrate, trimmed or added intro) don't share a byte hash,
+but share their acoustic fingerprint (see `summarize_media.pre_processing.fingerprint`). The index keeps, for every
+transcribed file, its fingerprint, its transcript and an inverted index of a sample of its sub-fingerprints.
+
+A lookup lets the sampled sub-fingerprints of the query vote for (file, offset) pairs: copies of the same audio
+share many exact sub-fingerprints, all at the same offset. The best candidates are then verified by comparing the
+fingerprints bit by bit at that offset, and a match reuses the stored transcript, shifted by the offset.
+
+The sub-fingerprints are sampled by value (about 1 in `density`), not by position, so the same ones are picked in
+every copy regardless of trimming. With the default density, an hour of audio adds ~7000 rows to the inverted
+index (~170 KB) and its fingerprint takes ~450 KB, so a single SQLite file holds hundreds of thousands of files;
+a lookup costs one index seek per sampled sub-fingerprint of the query plus a few fingerprint comparisons.
+
+Example:
+```python
+index = get_fingerprint_index()
+audio_fingerprint = fingerprint(audio)
+found = index.find_transcript(audio_fingerprint)
+if found is None:
+    transcript = transcribe(audio)
+    index.add(key, audio_fingerprint, transcript)
+else:
+    transcript, match = found  # match.offset: seconds the content starts later in this copy
+```
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from ..pre_processing.fingerprint import FRAMES_PER_SECOND, bit_error_rate
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "summarize_media", "fingerprints.sqlite3"
+)
+
+# Sub-fingerprints of digital silence and clipping, they match everything
+_STOP_HASHES = (0, 0xFFFFFFFF)
+
+# Hash values looked up per query, below SQLite's limit on the number of parameters
+_LOOKUP_BATCH = 500
+
+
+class FingerprintMatch:
+    """A file of the index found in the query audio
+
+    Attributes:
+        key (str): Key the file was added with
+        offset (float): Seconds to add to the timestamps of the file to get the ones of the query (negative if the query starts later in the content, e.g. has its intro trimmed)
+        bit_error_rate (float): Fraction of differing bits over the overlap, see `bit_error_rate`
+        coverage (float): Fraction of the query covered by the file
+        votes (int): Sampled sub-fingerprints agreeing on the offset
+    """
+
+    def __init__(
+        self,
+        key: str,
+        offset: float,
+        bit_error_rate: float,
+        coverage: float,
+        votes: int,
+    ):
+        self.key = key
+        self.offset = offset
+        self.bit_error_rate = bit_error_rate
+        self.coverage = coverage
+        self.votes = votes
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "offset": self.offset,
+            "bit_error_rate": self.bit_error_rate,
+            "coverage": self.coverage,
+            "votes": self.votes,
+        }
+
+    def __repr__(self) -> str:
+        return f"FingerprintMatch({self.to_dict()})"
+
+
+class FingerprintIndex:
+    """SQLite store of fingerprints and transcripts, with an inverted index of sampled sub-fingerprints
+
+    Safe to share between threads.
+
+    Args:
+        path (str, optional): Path of the database file. Defaults to "~/.cache/summarize_media/fingerprints.sqlite3".
+        density (int, optional): About one sub-fingerprint in `density` is indexed, a power of two. Lower values find shorter or more degraded copies at the cost of a larger index. Defaults to 16.
+    """
+
+    def __init__(self, path: Optional[str] = None, density: int = 16):
+        if density < 1 or density & (density - 1):
+            raise ValueError(f"density must be a power of two, got {density}")
+        self.path = path or DEFAULT_DB_PATH
+        self.density = density
+        self._lock = threading.Lock()
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS items (
+                    id INTEGER PRIMARY KEY,
+                    key TEXT NOT NULL UNIQUE,
+                    params TEXT NOT NULL,
+                    frames INTEGER NOT NULL,
+                    fingerprint BLOB NOT NULL,
+                    transcript BLOB,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            # Clustered on the hash, a lookup reads the postings of a hash in one seek
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS postings (
+                    hash INTEGER NOT NULL,
+                    item_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    PRIMARY KEY (hash, item_id, position)
+                ) WITHOUT ROWID
+                """
+            )
+            # Replacing or removing a file deletes its postings without scanning the whole table
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS postings_item ON postings (item_id)"
+            )
+
+    def add(
+        self,
+        key: str,
+        fingerprint: "np.ndarray",
+        transcript: Any = None,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Adds (or replaces) a file
+
+        Args:
+            key (str): Unique key of the file, e.g. the artifact cache key of its transcript
+            fingerprint (np.ndarray): Sub-fingerprints of the file, see `fingerprint`
+            transcript (Any, optional): Transcript to reuse for copies of the file, as returned by `get_transcription` (JSON serializable)
+            params (Dict[str, Any], optional): Settings the transcript was made with (e.g. the model), a lookup only matches files added with the same params
+        """
+        import numpy as np
+
+        fingerprint = np.ascontiguousarray(fingerprint, dtype="<u4")
+        positions = self._sample(fingerprint)
+        postings = [(int(fingerprint[i]), int(i)) for i in positions]
+        data = (
+            zlib.compress(json.dumps(transcript, default=str).encode("utf-8"))
+            if transcript is not None
+            else None
+        )
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._delete(key)
+                item_id = self._conn.execute(
+                    "INSERT INTO items (key, params, frames, fingerprint, transcript, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        _canonical(params),
+                        len(fingerprint),
+                        fingerprint.tobytes(),
+                        data,
+                        time.time(),
+                    ),
+                ).lastrowid
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO postings (hash, item_id, position) VALUES (?, ?, ?)",
+                    [(value, item_id, position) for value, position in postings],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def remove(self, key: str) -> None:
+        """Removes a file, if present"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._delete(key)
+            self._conn.execute("COMMIT")
+
+    def lookup(
+        self,
+        fingerprint: "np.ndarray",
+        params: Optional[Dict[str, Any]] = None,
+        max_bit_error_rate: float = 0.3,
+        min_coverage: float = 0.9,
+        min_votes: int = 3,
+        max_candidates: int = 5,
+    ) -> Optional[FingerprintMatch]:
+        """Finds the file of the index the query audio is a copy of
+
+        Args:
+            fingerprint (np.ndarray): Sub-fingerprints of the query, see `fingerprint`
+            params (Dict[str, Any], optional): Only files added with these params match, see `add`
+            max_bit_error_rate (float, optional): Highest bit error rate over the overlap of a match (unrelated audio is around 0.5). Defaults to 0.3.
+            min_coverage (float, optional): Lowest fraction of the query the file must cover, e.g. 0.9 accepts copies with up to 10% of the query (an added intro, a longer outro) missing from the file. Defaults to 0.9.
+            min_votes (int, optional): Lowest number of sampled sub-fingerprints agreeing on an offset for a file to be verified. Defaults to 3.
+            max_candidates (int, optional): Number of (file, offset) candidates verified, by decreasing votes. Defaults to 5.
+
+        Returns:
+            Optional[FingerprintMatch]: The match with the lowest bit error rate, None if no file matches
+        """
+        import numpy as np
+
+        fingerprint = np.ascontiguousarray(fingerprint, dtype="<u4")
+        if len(fingerprint) == 0:
+            return None
+
+        # Positions of every sampled hash value in the query
+        query_positions: Dict[int, List[int]] = {}
+        for i in self._sample(fingerprint):
+            query_positions.setdefault(int(fingerprint[i]), []).append(int(i))
+
+        votes: Counter = Counter()
+        values = list(query_positions)
+        with self._lock:
+            for start in range(0, len(values), _LOOKUP_BATCH):
+                batch = values[start : start + _LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    "SELECT p.hash, p.item_id, p.position FROM postings p JOIN items i ON i.id = p.item_id "
+                    f"WHERE p.hash IN ({', '.join('?' * len(batch))}) AND i.params = ?",
+                    (*batch, _canonical(params)),
+                ).fetchall()
+                for value, item_id, position in rows:
+                    for query_position in query_positions[value]:
+                        votes[(item_id, query_position - position)] += 1
+
+        # Frames of neighbouring offsets are slightly misaligned copies of each other, count them together
+        smoothed = Counter(
+            {
+                (item_id, delta): votes[(item_id, delta - 1)]
+                + count
+                + votes[(item_id, delta + 1)]
+                for (item_id, delta), count in votes.items()
+            }
+        )
+
+        best = None
+        verified = set()
+        for (item_id, delta), count in smoothed.most_common():
+            if count < min_votes or len(verified) >= max_candidates:
+                break
+            if (item_id, delta) in verified:
+                continue
+            verified.update(
+                {(item_id, delta - 1), (item_id, delta), (item_id, delta + 1)}
+            )
+            match = self._verify(fingerprint, item_id, delta, count)
+            if match is None or match.coverage < min_coverage:
+                continue
+            if match.bit_error_rate <= max_bit_error_rate and (
+                best is None or match.bit_error_rate < best.bit_error_rate
+            ):
+                best = match
+
+        return best
+
+    def find_transcript(
+        self,
+        fingerprint: "np.ndarray",
+        params: Optional[Dict[str, Any]] = None,
+        **lookup_args: Any,
+    ) -> Optional[Tuple[Any, FingerprintMatch]]:
+        """Looks the query up (see `lookup`), and returns the transcript of the match on the timeline of the query
+
+        Returns:
+            Optional[Tuple[Any, FingerprintMatch]]: The shifted transcript and the match, None if no file with a transcript matches
+        """
+        match = self.lookup(fingerprint, params, **lookup_args)
+        if match is None:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT transcript FROM items WHERE key = ?", (match.key,)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+
+        transcript = json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        logger.info(
+            f"Reusing the transcript of {match.key} (offset {match.offset:+.2f}s, bit error rate {match.bit_error_rate:.3f})"
+        )
+        return shift_transcript(
+            transcript, match.offset, len(fingerprint) / FRAMES_PER_SECOND
+        ), match
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _sample(self, fingerprint: "np.ndarray") -> "np.ndarray":
+        """Positions of the sub-fingerprints picked for the inverted index, by their (mixed) value"""
+        import numpy as np
+
+        bits = self.density.bit_length() - 1
+        mixed = (fingerprint.astype(np.uint64) * 0x9E3779B1) & 0xFFFFFFFF
+        picked = (
+            (mixed >> np.uint64(32 - bits)) == 0
+            if bits
+            else np.ones_like(mixed, dtype=bool)
+        )
+        picked &= ~np.isin(fingerprint, _STOP_HASHES)
+        return np.flatnonzero(picked)
+
+    def _verify(
+        self, query: "np.ndarray", item_id: int, delta: int, votes: int
+    ) -> Optional[FingerprintMatch]:
+        """Compares the query with a file at the offset of a candidate (and the frames next to it)"""
+        import numpy as np
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, fingerprint FROM items WHERE id = ?", (item_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        key, data = row
+        item = np.frombuffer(data, dtype="<u4")
+
+        best = None
+        for shift in (delta - 1, delta, delta + 1):
+            # Frame i of the file is frame i + shift of the query
+            start = max(0, -shift)
+            end = min(len(item), len(query) - shift)
+            if end <= start:
+                continue
+            error_rate = bit_error_rate(
+                item[start:end], query[start + shift : end + shift]
+            )
+            if best is None or error_rate < best.bit_error_rate:
+                best = FingerprintMatch(
+                    key,
+                    offset=shift / FRAMES_PER_SECOND,
+                    bit_error_rate=error_rate,
+                    coverage=(end - start) / len(query),
+                    votes=votes,
+                )
+        return best
+
+    def _delete(self, key: str) -> None:
+        row = self._conn.execute(
+            "SELECT id FROM items WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM postings WHERE item_id = ?", (row[0],))
+            self._conn.execute("DELETE FROM items WHERE id = ?", (row[0],))
+
+
+def shift_transcript(
+    transcript: Any, offset: float, duration: Optional[float] = None
+) -> Any:
+    """Shifts the timestamps of a transcript by `offset` seconds, dropping the parts outside [0, duration]
+
+    Accepts the outputs of `get_transcription` (a list of segments, or a dict with "segments" and "word_segments")
+    and of `get_transcribe_cloud` (a dict with "segments").
+    """
+    if isinstance(transcript, list):
+        return _shift_segments(transcript, offset, duration)
+
+    shifted = dict(transcript)
+    for name in ("segments", "word_segments"):
+        if name in shifted:
+            shifted[name] = _shift_segments(shifted[name], offset, duration)
+    return shifted
+
+
+def _shift_segments(
+    segments: List[Dict[str, Any]], offset: float, duration: Optional[float]
+) -> List[Dict[str, Any]]:
+    shifted = []
+    for segment in segments:
+        segment = _shift_item(segment, offset, duration)
+        if segment is None:
+            continue
+        if "words" in segment:
+            segment["words"] = [
+                word
+                for word in (
+                    _shift_item(word, offset, duration) for word in segment["words"]
+                )
+                if word is not None
+            ]
+        shifted.append(segment)
+    return shifted
+
+
+def _shift_item(
+    item: Dict[str, Any], offset: float, duration: Optional[float]
+) -> Optional[Dict[str, Any]]:
+    """Shifted copy of a segment/ word, None if it falls outside the query (words without timestamps are kept)"""
+    item = dict(item)
+    start, end = item.get("start"), item.get("end")
+    if start is not None:
+        start += offset
+    if end is not None:
+        end += offset
+    if (end is not None and end <= 0) or (
+        duration is not None and start is not None and start >= duration
+    ):
+        return None
+    if start is not None:
+        item["start"] = round(max(0.0, start), 3)
+    if end is not None:
+        item["end"] = round(end if duration is None else min(duration, end), 3)
+    return item
+
+
+def _canonical(params: Optional[Dict[str, Any]]) -> str:
+    return json.dumps(params or {}, sort_keys=True, default=str)
+
+
+_default_index: Optional[FingerprintIndex] = None
+
+
+def get_fingerprint_index() -> FingerprintIndex:
+    """Returns the process-wide fingerprint index, stored at $SUMMARIZE_MEDIA_FINGERPRINTS if set"""
+    global _default_index
+    if _default_index is None:
+        _default_index = FingerprintIndex(os.getenv("SUMMARIZE_MEDIA_FINGERPRINTS"))
+    return _default_index
@@ -0,0 +1,371 @@
+"""SQLite cache of LLM responses, with time to live, least recently used eviction and single-flight requests
+
+Re-running a summary (after a UI refresh, a retry, or on the same transcript) sends the exact same request again.
+With a `ResponseCache`, `get_response`/ `get_response_async` look the request up first, keyed on a canonical hash of
+the base url, the messages and the sampling arguments (model, temperature, ...), and only call the provider on a
+miss. Concurrent identical requests share a single in-flight call.
+
+Example:
+```python
+from summarize_media.cache.response_cache import get_response_cache
+
+cache = get_response_cache()  # ~/.cache/summarize_media/llm_responses.sqlite3
+response = get_response(messages, client=client, client_args=client_args, cache=cache)
+print(cache.stats())  # hits, misses, hit_rate, saved_tokens, ...
+```
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "summarize_media", "llm_responses.sqlite3"
+)
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_MAX_BYTES = 512 * 1024**2
+
+# Arguments of a request that don't change its response
+_IGNORED_ARGS = ("stream", "timeout", "extra_headers", "user")
+
+# A cached response and the total tokens its request used
+Entry = Tuple[Dict[str, Any], int]
+
+
+class ResponseCache:
+    """Key/ response store backed by SQLite, safe to share between threads (and processes, through the file)
+
+    Args:
+        path (str, optional): Path of the database file. Defaults to "~/.cache/summarize_media/llm_responses.sqlite3".
+        ttl (float, optional): Seconds a response stays valid, None keeps responses until they are evicted. Defaults to 30 days.
+        max_entries (int, optional): Maximum number of cached responses, least recently used responses are evicted past it. Defaults to 50000.
+        max_bytes (int, optional): Maximum total size of the cached responses. Defaults to 512 MB.
+        bypass_sampled (bool, optional): Whether to skip the cache for requests with a non-zero temperature (whose responses are expected to vary). Defaults to False.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: Optional[float] = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        bypass_sampled: bool = False,
+    ):
+        self.path = path or DEFAULT_DB_PATH
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bypass_sampled = bypass_sampled
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.saved_tokens = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self._in_flight_async: Dict[str, asyncio.Task] = {}
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    tokens INTEGER NOT NULL DEFAULT 0,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    used_at REAL NOT NULL,
+                    expires_at REAL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)"
+            )
+            # Totals of the table, kept up to date by triggers (also for other processes sharing the file), so
+            # writes don't have to count the responses
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    entries INTEGER NOT NULL,
+                    size INTEGER NOT NULL
+                )
+                """
+            )
+            self._conn.executescript(
+                """
+                BEGIN;
+                INSERT OR IGNORE INTO totals
+                    SELECT 1, COUNT(*), COALESCE(SUM(size), 0) FROM responses;
+                CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN
+                    UPDATE totals SET entries = entries + 1, size = size + new.size WHERE id = 1;
+                END;
+                CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN
+                    UPDATE totals SET entries = entries - 1, size = size - old.size WHERE id = 1;
+                END;
+                CREATE TRIGGER IF NOT EXISTS responses_update AFTER UPDATE OF size ON responses BEGIN
+                    UPDATE totals SET size = size - old.size + new.size WHERE id = 1;
+                END;
+                COMMIT;
+                """
+            )
+
+    def make_key(
+        self, base_url: str, messages: Any, client_args: Dict[str, Any]
+    ) -> str:
+        """Builds the key of a request from the base url of the client, the messages and the sampling arguments
+
+        Args:
+            base_url (str): Base url of the client, e.g. str(client.base_url)
+            messages (List[dict]): The conversation sent
+            client_args (dict): Arguments of the request (model, temperature, max_tokens, ...)
+
+        Returns:
+            str: Hex digest identifying the request
+        """
+        args = {
+            name: value
+            for name, value in client_args.items()
+            if name not in _IGNORED_ARGS
+        }
+        payload = json.dumps(
+            {"base_url": base_url.rstrip("/"), "messages": messages, "args": args},
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_cacheable(self, client_args: Dict[str, Any]) -> bool:
+        """Whether requests with these arguments go through the cache, see `bypass_sampled`"""
+        # The providers sample with a temperature of 1 when none is given
+        return not (self.bypass_sampled and client_args.get("temperature", 1.0) != 0)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns the cached response stored under `key`, or None on a miss (or if it expired)"""
+        entry = self._lookup(key)
+        return entry[0] if entry is not None else None
+
+    def put(self, key: str, response: Dict[str, Any], tokens: int = 0) -> None:
+        """Stores a response (a JSON serializable dict) under `key`
+
+        Args:
+            key (str): Key of the request, see `make_key`
+            response (dict): The response message
+            tokens (int, optional): Total tokens used by the request, counted as saved on every hit. Defaults to 0.
+        """
+        data = json.dumps(response, default=str)
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete doesn't fire the delete trigger
+            self._conn.execute(
+                "INSERT INTO responses (key, response, tokens, size, created_at, used_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET response = excluded.response, tokens = excluded.tokens, "
+                "size = excluded.size, created_at = excluded.created_at, used_at = excluded.used_at, "
+                "expires_at = excluded.expires_at",
+                (key, data, tokens or 0, len(data), now, now, expires_at),
+            )
+        self._evict()
+
+    def get_or_call(self, key: str, call: Callable[[], Entry]) -> Dict[str, Any]:
+        """Returns the cached response, or calls `call` (once for concurrent identical requests) and caches its result
+
+        Args:
+            key (str): Key of the request, see `make_key`
+            call (Callable[[], Tuple[dict, int]]): Sends the request, returns the response and its total tokens
+
+        Returns:
+            dict: The response
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry[0]
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            return self._follow(future.result())
+
+        try:
+            response, tokens = call()
+            self.put(key, response, tokens)
+            future.set_result((response, tokens))
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        return _copy(response)
+
+    async def get_or_call_async(
+        self, key: str, call: Callable[[], Awaitable[Entry]]
+    ) -> Dict[str, Any]:
+        """Async version of `get_or_call`, concurrent identical requests of the same event loop share one call"""
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry[0]
+
+        loop = asyncio.get_running_loop()
+        task = self._in_flight_async.get(key)
+        leader = task is None or task.get_loop() is not loop
+        if leader:
+            # The call runs in its own task, so cancelling the caller doesn't cancel the requests waiting on it
+            task = self._in_flight_async[key] = loop.create_task(
+                self._call_and_put(key, call)
+            )
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        entry = await asyncio.shield(task)
+        return _copy(entry[0]) if leader else self._follow(entry)
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the hit/ miss counters, the tokens saved by hits, and the current cache usage"""
+        with self._lock:
+            entries, size = self._totals()
+        # Coalesced requests didn't reach the provider either
+        served = self.hits + self.coalesced
+        lookups = served + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "hit_rate": served / lookups if lookups else 0.0,
+            "saved_tokens": self.saved_tokens,
+            "entries": entries,
+            "size": size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self) -> None:
+        """Removes every cached response"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    async def _call_and_put(
+        self, key: str, call: Callable[[], Awaitable[Entry]]
+    ) -> Entry:
+        response, tokens = await call()
+        self.put(key, response, tokens)
+        return response, tokens
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight_async.get(key) is task:
+            del self._in_flight_async[key]
+        # Every waiter may have been cancelled, don't warn about a never retrieved exception
+        if not task.cancelled():
+            task.exception()
+
+    def _follow(self, entry: Entry) -> Dict[str, Any]:
+        """Counts a request served by the in-flight call of an identical one (its lookup was counted as a miss)"""
+        with self._lock:
+            self.misses -= 1
+            self.coalesced += 1
+            self.saved_tokens += entry[1]
+        return _copy(entry[0])
+
+    def _lookup(self, key: str) -> Optional[Entry]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, tokens, expires_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None or (row[2] is not None and row[2] <= now):
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            # The last use is the recency for eviction
+            self._conn.execute(
+                "UPDATE responses SET used_at = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+            self.saved_tokens += row[1]
+
+        logger.info(f"LLM response cache hit: {key}")
+        return json.loads(row[0]), row[1]
+
+    def _evict(self) -> None:
+        """Removes the expired responses, then the least recently used ones until the limits are met
+
+        Both only read the rows they remove (through the indexes on `expires_at` and `used_at`).
+        """
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM responses WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+            entries, size = self._totals()
+            if entries > self.max_entries or size > self.max_bytes:
+                evicted = []
+                for key, entry_size in self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY used_at"
+                ):
+                    if entries <= self.max_entries and size <= self.max_bytes:
+                        break
+                    evicted.append((key,))
+                    entries -= 1
+                    size -= entry_size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+                deleted += len(evicted)
+            self.evictions += deleted
+
+    def _totals(self) -> Tuple[int, int]:
+        """Number and total size of the cached responses, the caller holds the lock"""
+        return self._conn.execute(
+            "SELECT entries, size FROM totals WHERE id = 1"
+        ).fetchone()
+
+
+def _copy(response: Dict[str, Any]) -> Dict[str, Any]:
+    """Shallow copy, so callers sharing a response can't modify each other's"""
+    return dict(response)
+
+
+_default_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Returns the process-wide response cache, stored at $SUMMARIZE_MEDIA_LLM_CACHE if set"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache(os.getenv("SUMMARIZE_MEDIA_LLM_CACHE"))
+    return _default_cache
@@ -2,59 +2,152 @@
 
 There is no way to get the file path directly, see the [source code](https://github.com/HFrost0/bilix/blob/bb5b234cdfe3fafc4db9d992b91091f2edf791e5/bilix/sites/bilibili/downloader.py#L314)
 
-we use the following workaround instead (very hacky):
-- Create a new temp folder (with a unique randomized name)
+we use the following workaround instead:
+- Create a new temp folder (with a unique randomized name) inside the output folder
 - Download the media inside the folder, now it only contains 1 file
-- Obtain the name of the file
-- Move the file back to the parent file and then delete the temp folder
+- Move the file to the output folder, appending " - copy" to its name until it no longer collides with an existing file
+- Delete the temp folder
+
+The downloader holds an httpx client and asyncio primitives, which are bound to the event loop they are used in, so
+each event loop gets its own downloader (see `get_bili`).
 """
 
-from bilix.sites.bilibili import DownloaderBilibili
 import asyncio
 import os
 import shutil
-from typing import Optional, Dict
+import weakref
+from pathlib import Path
 from time import time
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from ..instrumentation.stages import file_size, stage
+
+if TYPE_CHECKING:
+    from bilix.sites.bilibili import DownloaderBilibili
+
+# One downloader per event loop, created on first use in the loop (see `get_bili`)
+_bilis: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, DownloaderBilibili]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_bili() -> "DownloaderBilibili":
+    """Returns the DownloaderBilibili of the running event loop, created (and bilix imported) on first use in the loop
+
+    The downloader is reused by every download of the loop, call `close_bili` before the loop ends to close its
+    connections (`get_bilibili` and `fetch_many` do so for the loop they run).
+
+    Raises:
+        RuntimeError: If there is no running event loop
+    """
+    loop = asyncio.get_running_loop()
+    bili = _bilis.get(loop)
+    if bili is None:
+        from bilix.sites.bilibili import DownloaderBilibili
+
+        bili = _bilis[loop] = DownloaderBilibili()
+    return bili
+
+
+async def close_bili() -> None:
+    """Closes the downloader of the running event loop, if it has one"""
+    bili = _bilis.pop(asyncio.get_running_loop(), None)
+    if bili is not None:
+        await bili.aclose()
+
 
-# Reusable global instance,
-bili = DownloaderBilibili()
+def __getattr__(name: str) -> Any:
+    # `bili` used to be created at import time, it is now the downloader of the running event loop
+    if name == "bili":
+        return get_bili()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-# TODO: Doc string
-# TODO: set up collision stratergies (rename, replace, )
 def get_bilibili(
     url: str, output_path: str, verbose=True, bili_args: Optional[Dict] = None
-):
-    temp_output_path = os.path.join(output_path, get_random_name())
+) -> str:
+    """Downloads the audio of a bilibili video, see `get_bilibili_async`
 
-    os.makedirs(temp_output_path)
+    Runs its own event loop, use `summarize_media.get_media.fetch.fetch_many` to download several urls concurrently
+
+    Returns:
+        str: File path of the downloaded file
+    """
+
+    async def download() -> str:
+        try:
+            return await get_bilibili_async(url, output_path, bili_args=bili_args)
+        finally:
+            await close_bili()
+
+    return asyncio.run(download())
 
-    # Downloads the video
-    asyncio.run(
-        download_from_bilibili(
-            url=url, output_path=temp_output_path, bili_args=bili_args
-        )
-    )
 
-    file_name_test = os.listdir(temp_output_path)[0]  # only 1 object in the temp folder
+async def get_bilibili_async(
+    url: str, output_path: str, bili_args: Optional[Dict] = None
+) -> str:
+    """Downloads the audio of a bilibili video with the downloader of the running event loop (see `get_bili`)
 
-    file_name_dest = str(file_name_test)
+    If a file of the same name already exists in `output_path`, " - copy" is appended to the name of the new one.
 
-    while os.path.exists(os.path.join(output_path, file_name_dest)):
-        base_name, extension = os.path.splitext(file_name_dest)
-        file_name_dest = base_name + " - copy" + extension
+    Args:
+        url (str): Url of the bilibili video
+        output_path (str): Folder to download the file to
+        bili_args (dict, optional): Additional arguments to feed into `DownloaderBilibili.get_video`, e.g. quality or codec
 
-    file_path_temp = os.path.join(temp_output_path, file_name_test)
-    file_path_dest = os.path.join(output_path, file_name_dest)
+    Raises:
+        ValueError: If bilix did not download exactly one file
 
-    shutil.move(file_path_temp, file_path_dest)
+    Returns:
+        str: File path of the downloaded file
+    """
+    path = Path(output_path)
+    path.mkdir(parents=True, exist_ok=True)
+    temp_path = path / get_random_name()
+    temp_path.mkdir()
+
+    try:
+        with stage("download.bilibili", url=url) as record:
+            await download_from_bilibili(
+                url=url, output_path=temp_path, bili_args=bili_args
+            )
+            # Only 1 file is expected in the temp folder, bilix logs (rather than raises) most errors
+            downloaded = [file for file in temp_path.iterdir() if file.is_file()]
+            if len(downloaded) != 1:
+                raise ValueError(
+                    f"Cannot obtain media from {url}, please check if url is valid "
+                    f"(downloaded {[file.name for file in downloaded]})"
+                )
+            record.bytes_out = file_size(str(downloaded[0]))
+
+        return str(_move_without_collision(downloaded[0], path))
+    finally:
+        shutil.rmtree(temp_path, ignore_errors=True)
 
 
 async def download_from_bilibili(url: str, output_path: str, bili_args):
-    await bili.get_video(url=url, path=output_path, only_audio=True, **bili_args)
+    await get_bili().get_video(
+        url=url, path=Path(output_path), only_audio=True, **(bili_args or dict())
+    )
     return
 
 
+def _move_without_collision(file_path: Path, directory: Path) -> Path:
+    """Moves a file into `directory`, appending " - copy" to its name until it doesn't collide with an existing file"""
+    base_name, extension = os.path.splitext(file_path.name)
+    while True:
+        destination = directory / f"{base_name}{extension}"
+        try:
+            # Reserves the name, so concurrent downloads of the same video don't overwrite each other
+            with open(destination, "x"):
+                pass
+        except FileExistsError:
+            base_name += " - copy"
+            continue
+        os.replace(file_path, destination)
+        return destination
+
+
 def get_random_name(prefix: str = "temp", name_length: int = 32):
     """Creates a psudo random name consisting of a prefix and a hex string of specified length
 
@@ -66,4 +159,4 @@ def get_random_name(prefix: str = "temp", name_length: int = 32):
         str: A randomized name
     """
 
-    return "_".join((prefix, str(int(time())), os.urandom(name_length / 2).hex()))
+    return "_".join((prefix, str(int(time())), os.urandom(name_length // 2).hex()))
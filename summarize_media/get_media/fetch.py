@@ -0,0 +1,140 @@
+"""Downloads media from several urls concurrently on one event loop
+
+Example:
+```python
+paths = fetch_many(playlist_urls, "media/", max_per_host=4)
+```
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Literal, Optional, Sequence, Union
+from urllib.parse import urlparse
+
+from ..cache.artifact_cache import ArtifactCache
+
+logger = logging.getLogger(__name__)
+
+Site = Literal["youtube", "bilibili"]
+
+# Host suffixes of each supported site
+SITE_HOSTS: Dict[Site, tuple] = {
+    "youtube": ("youtube.com", "youtu.be"),
+    "bilibili": ("bilibili.com", "b23.tv"),
+}
+
+
+def get_site(url: str) -> Site:
+    """Returns the site a url belongs to
+
+    Raises:
+        ValueError: If the url does not belong to a supported site
+    """
+    host = (urlparse(url).hostname or "").lower()
+    for site, suffixes in SITE_HOSTS.items():
+        if any(host == suffix or host.endswith("." + suffix) for suffix in suffixes):
+            return site
+    raise ValueError(f"Unsupported url {url}, must be one of {list(SITE_HOSTS)}")
+
+
+def fetch_many(
+    urls: Sequence[str],
+    output_path: str,
+    max_per_host: int = 3,
+    host_limits: Optional[Dict[Site, int]] = None,
+    return_exceptions: bool = False,
+    youtube_args: Optional[Dict] = None,
+    dl_args: Optional[Dict] = None,
+    bili_args: Optional[Dict] = None,
+    cache: Optional[ArtifactCache] = None,
+) -> List[Union[str, BaseException]]:
+    """Downloads the audio of several urls concurrently, see `fetch_many_async`
+
+    Runs its own event loop, call `fetch_many_async` from inside a running one
+
+    Returns:
+        list[str | BaseException]: File path of each url (in the order of `urls`)
+    """
+
+    async def fetch() -> List[Union[str, BaseException]]:
+        try:
+            return await fetch_many_async(
+                urls,
+                output_path,
+                max_per_host=max_per_host,
+                host_limits=host_limits,
+                return_exceptions=return_exceptions,
+                youtube_args=youtube_args,
+                dl_args=dl_args,
+                bili_args=bili_args,
+                cache=cache,
+            )
+        finally:
+            # The bilibili downloader (and its httpx client) belongs to this loop, see `get_bili`
+            from .bilibili import close_bili
+
+            await close_bili()
+
+    return asyncio.run(fetch())
+
+
+async def fetch_many_async(
+    urls: Sequence[str],
+    output_path: str,
+    max_per_host: int = 3,
+    host_limits: Optional[Dict[Site, int]] = None,
+    return_exceptions: bool = False,
+    youtube_args: Optional[Dict] = None,
+    dl_args: Optional[Dict] = None,
+    bili_args: Optional[Dict] = None,
+    cache: Optional[ArtifactCache] = None,
+) -> List[Union[str, BaseException]]:
+    """Downloads the audio of several urls concurrently, dispatching each url to its site's downloader
+
+    Bilibili downloads share the async `DownloaderBilibili` of the running event loop (see `get_bili`), youtube
+    downloads (pytubefix is synchronous) run in worker threads.
+
+    Args:
+        urls (Sequence[str]): Urls of the media, e.g. the videos of a playlist
+        output_path (str): Folder to download the files to
+        max_per_host (int, optional): Maximum number of concurrent downloads per site. Defaults to 3.
+        host_limits (dict, optional): Per site overrides of `max_per_host`, e.g. {"bilibili": 1}
+        return_exceptions (bool, optional): Whether to return the exception of a failed url in its place instead of raising it. Defaults to False.
+        youtube_args (dict, optional): See `get_youtube`
+        dl_args (dict, optional): See `get_youtube`
+        bili_args (dict, optional): See `get_bilibili_async`
+        cache (ArtifactCache, optional): Cache for the youtube downloads, see `get_youtube`
+
+    Returns:
+        list[str | BaseException]: File path of each url (in the order of `urls`)
+    """
+    host_limits = host_limits or dict()
+    semaphores = {
+        site: asyncio.Semaphore(host_limits.get(site, max_per_host))
+        for site in SITE_HOSTS
+    }
+
+    async def fetch(url: str) -> str:
+        site = get_site(url)
+        async with semaphores[site]:
+            logger.info(f"Downloading {url}")
+            if site == "bilibili":
+                from .bilibili import get_bilibili_async
+
+                return await get_bilibili_async(url, output_path, bili_args=bili_args)
+
+            from .youtube import get_youtube
+
+            return await asyncio.to_thread(
+                get_youtube,
+                url,
+                output_path,
+                verbose=False,
+                youtube_args=youtube_args,
+                dl_args=dl_args,
+                cache=cache,
+            )
+
+    return await asyncio.gather(
+        *(fetch(url) for url in urls), return_exceptions=return_exceptions
+    )
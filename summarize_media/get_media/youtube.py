@@ -1,8 +1,13 @@
-from pytubefix import YouTube
-from pytubefix.cli import on_progress
-from pytubefix.exceptions import VideoUnavailable
-from typing import Optional, Dict
 import datetime
+import os
+from typing import TYPE_CHECKING, Dict, Optional
+
+from ..cache.artifact_cache import ArtifactCache, hash_text
+from ..instrumentation.stages import file_size, stage
+
+# pytubefix is imported on first use, so importing the package doesn't require it
+if TYPE_CHECKING:
+    from pytubefix import YouTube
 
 
 def get_youtube(
@@ -11,6 +16,7 @@ def get_youtube(
     verbose=True,
     youtube_args: Optional[Dict] = None,
     dl_args: Optional[Dict] = None,
+    cache: Optional[ArtifactCache] = None,
 ):
     """_summary_
 
@@ -20,14 +26,26 @@ def get_youtube(
         verbose (bool, optional): Whether to print information during download. Defaults to True.
         youtube_args (dict, optional): Arguments to feed into the main youtube downloader objects, see docs [here](https://pytubefix.readthedocs.io/en/latest/api.html#youtube-object)
         dl_args (dict, optional): Additional arguments to feed into the stream download method, see docs [here](https://pytube.io/en/latest/api.html#pytube.Stream.download)
+        cache (ArtifactCache, optional): Cache to look the downloaded file up in, and to store it in after downloading. This is a URL cache, keyed by the url and the download arguments rather than the content: a video re-uploaded under another url is downloaded again, and a video changed under the same url is not.
 
     Returns:
         str: File path of the downloaded file
 
     """
+    from pytubefix import YouTube
+    from pytubefix.cli import on_progress
+    from pytubefix.exceptions import VideoUnavailable
+
     youtube_args = youtube_args or dict()
     dl_args = dl_args or dict()
 
+    # Reuse a previous download of the same url (a URL cache, the content isn't known before downloading)
+    if cache is not None:
+        cache_key = cache.make_key("download", hash_text(url), **dl_args)
+        file_path = cache.get_file(cache_key, output_path)
+        if file_path is not None:
+            return file_path
+
     # Set up function to show progress bar if verbose
     on_progress_fn = on_progress if verbose else None
 
@@ -54,14 +72,19 @@ def get_youtube(
         default_dl_args.update(dl_args)
 
     # Downloads media and obtaining it's path
-    file_path = ys.download(
-        output_path=output_path, skip_existing=True, mp3=True, **dl_args
-    )
+    with stage("download.youtube", url=url) as record:
+        file_path = ys.download(
+            output_path=output_path, skip_existing=True, mp3=True, **dl_args
+        )
+        record.bytes_out = file_size(file_path)
+
+    if cache is not None and os.path.isfile(file_path):
+        cache.put_file(cache_key, file_path)
 
     return file_path
 
 
-def show_info(yt: YouTube, date_format: str = "%d/%m/%y %H:%M:%S"):
+def show_info(yt: "YouTube", date_format: str = "%d/%m/%y %H:%M:%S"):
     """Shows selected info for obtained youtube video
 
     Args:
@@ -1,9 +1,11 @@
 import logging
+import mimetypes
 import os
 
 import requests
 
-logging.basicConfig(level=logging.INFO)
+from ..instrumentation.stages import file_size, stage
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,16 +21,18 @@ def upload_file_to_0x0(file_path: str, timeout: int = 600) -> str:
         str: URL of the uploaded file
     """
     filename = os.path.basename(file_path)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
     logger.info(f"Uploading file: {filename}")
 
-    with open(file_path, "rb") as f:
-        response = requests.post(
-            "https://0x0.st",
-            files={"file": (filename, f, "audio/wav")},
-            timeout=timeout,
-        )
+    with stage("upload", bytes_in=file_size(file_path), uploader="0x0"):
+        with open(file_path, "rb") as f:
+            response = requests.post(
+                "https://0x0.st",
+                files={"file": (filename, f, content_type)},
+                timeout=timeout,
+            )
 
-    response.raise_for_status()
+        response.raise_for_status()
     url = response.text.strip()
     logger.info(f"Successfully uploaded to {url}")
 
@@ -0,0 +1,190 @@
+"""Pluggable uploaders to make local audio reachable by cloud transcription services
+
+Example:
+```python
+uploader = S3Uploader()  # Wasabi credentials from the environment, see .env.template
+url = upload_audio(convert_to_wav(path), uploader=uploader, codec="opus")
+transcript = get_transcribe_cloud(url)
+```
+"""
+
+import logging
+import mimetypes
+import os
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Literal, Optional
+
+from ..instrumentation.stages import file_size, stage
+from ..pre_processing.convert_audio_format import UPLOAD_CODECS, encode_for_upload
+from .host_files import upload_file_to_0x0
+
+logger = logging.getLogger(__name__)
+
+
+class Uploader(ABC):
+    """Uploads a local file and returns a URL the file can be downloaded from"""
+
+    @abstractmethod
+    def upload(self, file_path: str) -> str:
+        """Uploads a file and returns a URL it can be downloaded from"""
+
+
+class ZeroX0Uploader(Uploader):
+    """Uploads files to 0x0.st, see `upload_file_to_0x0`
+
+    Args:
+        timeout (int, optional): Upload timeout in seconds. Defaults to 600.
+    """
+
+    def __init__(self, timeout: int = 600):
+        self.timeout = timeout
+
+    def upload(self, file_path: str) -> str:
+        return upload_file_to_0x0(file_path, timeout=self.timeout)
+
+
+class S3Uploader(Uploader):
+    """Uploads files to an S3 compatible bucket (S3, Wasabi, MinIO, ...) and returns a presigned download URL
+
+    Large files are uploaded in parallel multipart chunks over a pool of connections. The credentials default to the
+    "WASABI_*" environment variables (see .env.template), the Wasabi endpoint is derived from "WASABI_REGION" unless
+    `endpoint_url` (or "WASABI_ENDPOINT_URL") is set, e.g. to a local MinIO server.
+
+    Args:
+        bucket (str, optional): Bucket to upload to. Defaults to $WASABI_BUCKET.
+        region (str, optional): Region of the bucket. Defaults to $WASABI_REGION.
+        access_key (str, optional): Access key. Defaults to $WASABI_ACCESS_KEY.
+        secret_key (str, optional): Secret key. Defaults to $WASABI_SECRET_KEY.
+        endpoint_url (str, optional): Endpoint of the S3 API. Defaults to $WASABI_ENDPOINT_URL, or the Wasabi endpoint of the region.
+        prefix (str, optional): Prefix of the uploaded object keys. Defaults to "summarize-media/".
+        expires_in (int, optional): Lifetime of the presigned URLs in seconds. Defaults to 1 day.
+        multipart_threshold (int, optional): Files larger than this (in bytes) are uploaded in parts. Defaults to 8 MiB.
+        multipart_chunksize (int, optional): Size of each part in bytes. Defaults to 8 MiB.
+        max_concurrency (int, optional): Number of parts uploaded in parallel (and size of the connection pool). Defaults to 8.
+        client (optional): Preconfigured boto3 S3 client, overrides the credential and endpoint arguments.
+    """
+
+    def __init__(
+        self,
+        bucket: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        endpoint_url: Optional[str] = None,
+        prefix: str = "summarize-media/",
+        expires_in: int = 24 * 3600,
+        multipart_threshold: int = 8 * 1024**2,
+        multipart_chunksize: int = 8 * 1024**2,
+        max_concurrency: int = 8,
+        client: Optional[Any] = None,
+    ):
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket or os.getenv("WASABI_BUCKET")
+        if not self.bucket:
+            raise ValueError("No bucket provided, pass `bucket` or set WASABI_BUCKET")
+
+        self.prefix = prefix
+        self.expires_in = expires_in
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True,
+        )
+        self.client = client or self._create_client(
+            region, access_key, secret_key, endpoint_url, max_concurrency
+        )
+
+    def upload(self, file_path: str) -> str:
+        """Uploads a file and returns a presigned GET URL for it
+
+        A failed multipart upload is aborted, so no parts are left behind in the bucket.
+        """
+        key = f"{self.prefix}{uuid.uuid4().hex}/{os.path.basename(file_path)}"
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+        logger.info(f"Uploading {file_path} to s3://{self.bucket}/{key}")
+        with stage("upload", bytes_in=file_size(file_path), uploader="s3"):
+            self.client.upload_file(
+                file_path,
+                self.bucket,
+                key,
+                ExtraArgs={"ContentType": content_type},
+                Config=self.transfer_config,
+            )
+
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=self.expires_in,
+        )
+
+    @staticmethod
+    def _create_client(
+        region: Optional[str],
+        access_key: Optional[str],
+        secret_key: Optional[str],
+        endpoint_url: Optional[str],
+        max_concurrency: int,
+    ) -> Any:
+        import boto3
+        from botocore.config import Config
+
+        region = region or os.getenv("WASABI_REGION")
+        endpoint_url = endpoint_url or os.getenv("WASABI_ENDPOINT_URL")
+        if endpoint_url is None and region:
+            endpoint_url = f"https://s3.{region}.wasabisys.com"
+
+        return boto3.client(
+            "s3",
+            region_name=region,
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key or os.getenv("WASABI_ACCESS_KEY"),
+            aws_secret_access_key=secret_key or os.getenv("WASABI_SECRET_KEY"),
+            # One pooled connection per concurrently uploaded part
+            config=Config(
+                max_pool_connections=max_concurrency,
+                signature_version="s3v4",
+                retries={"max_attempts": 5, "mode": "adaptive"},
+            ),
+        )
+
+
+def upload_audio(
+    file_path: str,
+    uploader: Optional[Uploader] = None,
+    codec: Optional[Literal["opus", "flac"]] = "opus",
+    bitrate: str = "32k",
+) -> str:
+    """Re-encodes audio to a compact format (see `encode_for_upload`) and uploads it
+
+    Args:
+        file_path (str): Path of the audio file
+        uploader (Uploader, optional): Uploader to use. Defaults to `ZeroX0Uploader()`.
+        codec (Literal["opus", "flac"], optional): Codec to re-encode to before uploading, None uploads the file as is. Defaults to "opus".
+        bitrate (str, optional): Target bitrate of lossy codecs. Defaults to "32k".
+
+    Returns:
+        str: URL of the uploaded file
+    """
+    uploader = uploader if uploader is not None else ZeroX0Uploader()
+
+    if codec is None:
+        return uploader.upload(file_path)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        encoded_path = encode_for_upload(
+            file_path,
+            output_path=os.path.join(temp_dir, name + UPLOAD_CODECS[codec][1]),
+            codec=codec,
+            bitrate=bitrate,
+        )
+        logger.info(
+            f"Re-encoded {os.path.getsize(file_path) / 1024**2:.1f} MB to "
+            f"{os.path.getsize(encoded_path) / 1024**2:.1f} MB of {codec}"
+        )
+        return uploader.upload(encoded_path)
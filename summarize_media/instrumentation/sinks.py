@@ -0,0 +1,152 @@
+"""Destinations of the stage events recorded by `summarize_media.instrumentation.stages`
+
+Every sink receives each finished stage as a flat dict (see `StageRecord.to_event`) through `emit`.
+"""
+
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import IO, Any, Dict, List, Optional, Tuple, Union
+
+
+class Sink:
+    """Receives stage events"""
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonLinesSink(Sink):
+    """Appends every event as one JSON object per line
+
+    Args:
+        target (str | IO[str]): Path of the file to append to, or an open text stream (e.g. sys.stderr)
+    """
+
+    def __init__(self, target: Union[str, IO[str]]):
+        self._lock = threading.Lock()
+        if isinstance(target, str):
+            if os.path.dirname(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+            self._stream = open(target, "a", encoding="utf-8")
+            self._owned = True
+        else:
+            self._stream = target
+            self._owned = False
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        line = json.dumps(event, default=str)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+    def close(self) -> None:
+        if self._owned:
+            self._stream.close()
+
+
+class MemorySink(Sink):
+    """Keeps the events in a list, e.g. to inspect them from a notebook"""
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        self.events.append(event)
+
+
+class PrometheusSink(Sink):
+    """Aggregates the events into Prometheus metrics, rendered in the text exposition format
+
+    Per stage (and status), counts the runs, sums the wall/ CPU time, bytes and audio seconds, and keeps the
+    highest peak memory seen. Serve `render()` from a /metrics endpoint, or `write` it to the textfile collector
+    directory of node_exporter.
+
+    Args:
+        namespace (str, optional): Prefix of the metric names. Defaults to "summarize_media".
+        path (str, optional): If provided, the metrics are rewritten to this file after every event.
+    """
+
+    # (event key, metric suffix, help), summed over the runs of a stage
+    SUMS = (
+        ("wall_seconds", "stage_wall_seconds_total", "Wall time spent in the stage"),
+        ("cpu_seconds", "stage_cpu_seconds_total", "CPU time spent in the stage"),
+        ("bytes_in", "stage_bytes_in_total", "Bytes read by the stage"),
+        ("bytes_out", "stage_bytes_out_total", "Bytes written by the stage"),
+        ("audio_seconds", "stage_audio_seconds_total", "Seconds of audio processed"),
+    )
+    # (event key, metric suffix, help), maximum over the runs of a stage
+    PEAKS = (
+        ("peak_rss_bytes", "stage_peak_rss_bytes", "Highest resident memory"),
+        ("peak_gpu_bytes", "stage_peak_gpu_bytes", "Highest allocated GPU memory"),
+    )
+
+    def __init__(self, namespace: str = "summarize_media", path: Optional[str] = None):
+        self.namespace = namespace
+        self.path = path
+        self._lock = threading.Lock()
+        self._runs: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._sums: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._peaks: Dict[Tuple[str, str], float] = {}
+
+    def emit(self, event: Dict[str, Any]) -> None:
+        stage = event["stage"]
+        with self._lock:
+            self._runs[(stage, event["status"])] += 1
+            for key, name, _ in self.SUMS:
+                if event.get(key) is not None:
+                    self._sums[(stage, name)] += event[key]
+            for key, name, _ in self.PEAKS:
+                if event.get(key) is not None:
+                    self._peaks[(stage, name)] = max(
+                        self._peaks.get((stage, name), 0), event[key]
+                    )
+        if self.path is not None:
+            self.write(self.path)
+
+    def render(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            name = f"{self.namespace}_stage_runs_total"
+            lines += [
+                f"# HELP {name} Finished runs of the stage",
+                f"# TYPE {name} counter",
+            ]
+            for (stage, status), count in sorted(self._runs.items()):
+                lines.append(
+                    f'{name}{{stage="{_escape(stage)}",status="{status}"}} {count}'
+                )
+
+            for metrics, kind in ((self.SUMS, "counter"), (self.PEAKS, "gauge")):
+                values = self._sums if kind == "counter" else self._peaks
+                for _, suffix, help in metrics:
+                    name = f"{self.namespace}_{suffix}"
+                    samples = sorted(
+                        (stage, value)
+                        for (stage, metric), value in values.items()
+                        if metric == suffix
+                    )
+                    if not samples:
+                        continue
+                    lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                    lines += [
+                        f'{name}{{stage="{_escape(stage)}"}} {value:g}'
+                        for stage, value in samples
+                    ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Writes `render()` to a file atomically (so a collector never reads a partial file)"""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
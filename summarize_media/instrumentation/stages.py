@@ -0,0 +1,522 @@
+"""Per-stage instrumentation of the pipeline
+
+Every stage of the pipeline (download, conversion, upload, transcription, alignment, diarization, summarization)
+runs inside `stage`, which records its wall time, CPU time, peak resident/ GPU memory, bytes in/ out and audio seconds
+(hence real time factor), and emits the record as an event to the configured sinks (see `sinks`). Stages can also
+be profiled with cProfile or py-spy on demand.
+
+Nothing is emitted (or sampled) until a sink is configured, either in code:
+```python
+configure(sinks=[JsonLinesSink("metrics.jsonl"), PrometheusSink(path="metrics.prom")], profile={"transcribe": "py-spy"})
+```
+or with environment variables:
+- SUMMARIZE_MEDIA_METRICS: path of a JSON lines file to append the events to
+- SUMMARIZE_MEDIA_PROMETHEUS: path of a file to keep the Prometheus metrics in
+- SUMMARIZE_MEDIA_PROFILE: stages to profile, e.g. "transcribe=py-spy,convert_to_wav=cprofile"
+- SUMMARIZE_MEDIA_PROFILE_DIR: folder the profiles are written to, defaults to "profiles"
+
+Instrumenting code:
+```python
+with stage("convert_to_wav", bytes_in=os.path.getsize(path)) as record:
+    output_path = convert(path)
+    record.bytes_out = os.path.getsize(output_path)
+```
+"""
+
+import cProfile
+import functools
+import inspect
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, get_args
+
+from .sinks import JsonLinesSink, PrometheusSink, Sink
+
+logger = logging.getLogger(__name__)
+
+Profiler = Literal["cprofile", "py-spy"]
+
+# Seconds between two memory samples while a stage runs
+SAMPLE_INTERVAL = 0.05
+
+_sinks: List[Sink] = []
+_profile: Dict[str, Profiler] = {}
+_profile_dir = "profiles"
+_env_loaded = False
+_config_lock = threading.Lock()
+
+# Innermost running stage of the current thread/ task
+_current_stage: ContextVar[Optional["StageRecord"]] = ContextVar(
+    "current_stage", default=None
+)
+
+
+class StageRecord:
+    """Measurements of one run of a stage, the fields set by the caller (bytes, audio seconds) can be updated while it runs"""
+
+    def __init__(
+        self,
+        name: str,
+        labels: Dict[str, Any],
+        parent: Optional["StageRecord"] = None,
+        bytes_in: Optional[int] = None,
+        bytes_out: Optional[int] = None,
+        audio_seconds: Optional[float] = None,
+    ):
+        self.name = name
+        self.labels = labels
+        self.parent = parent
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.audio_seconds = audio_seconds
+        self.start_time = time.time()
+        self.wall_seconds: Optional[float] = None
+        self.cpu_seconds: Optional[float] = None
+        self.peak_rss_bytes: Optional[int] = None
+        self.peak_gpu_bytes: Optional[int] = None
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.profile_path: Optional[str] = None
+        self.profiling = False
+
+    @property
+    def real_time_factor(self) -> Optional[float]:
+        """Wall time over audio duration (lower is faster), None if the stage processed no audio"""
+        if not self.audio_seconds or self.wall_seconds is None:
+            return None
+        return self.wall_seconds / self.audio_seconds
+
+    def observe_rss(self, rss_bytes: int) -> None:
+        if self.peak_rss_bytes is None or rss_bytes > self.peak_rss_bytes:
+            self.peak_rss_bytes = rss_bytes
+
+    def to_event(self) -> Dict[str, Any]:
+        """Flat dict of the record, as received by the sinks"""
+        return {
+            "stage": self.name,
+            "parent": self.parent.name if self.parent is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "start_time": self.start_time,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "peak_gpu_bytes": self.peak_gpu_bytes,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "audio_seconds": self.audio_seconds,
+            "real_time_factor": self.real_time_factor,
+            "profile_path": self.profile_path,
+            "labels": self.labels,
+        }
+
+
+def configure(
+    sinks: Optional[List[Sink]] = None,
+    profile: Optional[Dict[str, Profiler]] = None,
+    profile_dir: Optional[str] = None,
+) -> None:
+    """Sets the sinks the stage events are emitted to and the stages to profile (replacing the environment configuration)
+
+    Args:
+        sinks (List[Sink], optional): Sinks to emit the events to, an empty list disables the instrumentation
+        profile (Dict[str, Literal["cprofile", "py-spy"]], optional): Profiler to run for each stage name, a name also matches its sub stages (e.g. "transcribe" matches "transcribe.align")
+        profile_dir (str, optional): Folder the profiles are written to
+    """
+    global _sinks, _profile, _profile_dir, _env_loaded
+    with _config_lock:
+        _env_loaded = True
+        if sinks is not None:
+            for sink in _sinks:
+                if sink not in sinks:
+                    sink.close()
+            _sinks = list(sinks)
+        if profile is not None:
+            _profile = _valid_profilers(profile)
+        if profile_dir is not None:
+            _profile_dir = profile_dir
+
+
+def add_sink(sink: Sink) -> None:
+    """Adds a sink to the configured ones"""
+    _load_env()
+    with _config_lock:
+        _sinks.append(sink)
+
+
+def is_enabled() -> bool:
+    """Whether stage events are recorded (at least one sink is configured)"""
+    _load_env()
+    return bool(_sinks)
+
+
+@contextmanager
+def stage(
+    name: str,
+    bytes_in: Optional[int] = None,
+    bytes_out: Optional[int] = None,
+    audio_seconds: Optional[float] = None,
+    profile: Optional[Profiler] = None,
+    **labels: Any,
+) -> Iterator[StageRecord]:
+    """Records a stage of the pipeline, see the module docstring
+
+    Stages nest: a stage started inside another one (in the same thread or task) records it as its parent.
+
+    Args:
+        name (str): Name of the stage, sub stages are dotted, e.g. "transcribe.align"
+        bytes_in (int, optional): Bytes read by the stage, can also be set on the record later
+        bytes_out (int, optional): Bytes written by the stage, can also be set on the record later
+        audio_seconds (float, optional): Seconds of audio processed, can also be set on the record later
+        profile (Literal["cprofile", "py-spy"], optional): Profiler to run, overrides the configured one
+        labels: Additional labels of the event, e.g. the model name
+
+    Yields:
+        StageRecord: The record of the stage
+    """
+    _load_env()
+    parent = _current_stage.get()
+    record = StageRecord(name, labels, parent, bytes_in, bytes_out, audio_seconds)
+    profiler = profile or _find_profiler(name)
+    if profiler is not None and _ancestor_profiled(parent):
+        # The profile of the enclosing stage already covers this one
+        profiler = None
+
+    if not _sinks and profiler is None:
+        # Instrumentation is off, only keep the nesting
+        token = _current_stage.set(record)
+        try:
+            yield record
+        finally:
+            _current_stage.reset(token)
+        return
+
+    token = _current_stage.set(record)
+    gpu = _get_cuda()
+    if gpu is not None:
+        _gpu_peak.enter(gpu)
+    _sampler.add(record)
+    stop_profiler = None
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        # Inside the `try`, so a profiler failing to start still restores the current stage, sampler and GPU peak
+        if profiler is not None:
+            stop_profiler = _start_profiler(profiler, record)
+            record.profiling = stop_profiler is not None
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+        yield record
+        record.status = "ok"
+    except BaseException as e:
+        record.status = "error"
+        record.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        # CPU time is process wide, i.e. includes the other threads running meanwhile
+        record.cpu_seconds = time.process_time() - cpu_start
+        record.wall_seconds = time.perf_counter() - wall_start
+        if stop_profiler is not None:
+            stop_profiler()
+        _sampler.remove(record)
+        record.observe_rss(_current_rss())
+        if gpu is not None:
+            record.peak_gpu_bytes = gpu.max_memory_allocated()
+            _gpu_peak.exit()
+        if parent is not None and record.peak_rss_bytes is not None:
+            parent.observe_rss(record.peak_rss_bytes)
+        _current_stage.reset(token)
+        _emit(record)
+
+
+def instrument(name: Optional[str] = None, **labels: Any) -> Callable:
+    """Decorator running every call of a function (or coroutine function) inside `stage`
+
+    Args:
+        name (str, optional): Name of the stage. Defaults to the name of the function.
+        labels: Additional labels of the events
+    """
+
+    def decorator(function: Callable) -> Callable:
+        stage_name = name or function.__name__
+
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with stage(stage_name, **labels):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name, **labels):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def current_stage() -> Optional[StageRecord]:
+    """Returns the record of the innermost running stage, e.g. to set its audio seconds from inside an instrumented function"""
+    return _current_stage.get()
+
+
+@contextmanager
+def remote_parent(name: Optional[str]) -> Iterator[None]:
+    """Nests the enclosed stages under a stage of another process, e.g. in the entry point of a worker process
+
+    Threads get the current stage by running in a copy of the context (`contextvars.copy_context().run`), but
+    contexts can't be sent to other processes, so only the name of the parent stage is passed and reported.
+
+    Args:
+        name (str, optional): Name of the parent stage, None to run the stages without a parent
+    """
+    if name is None:
+        yield
+        return
+    token = _current_stage.set(StageRecord(name, {}))
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+def file_size(path: Optional[str]) -> Optional[int]:
+    """Size of a file in bytes, None if it doesn't exist (e.g. a url)"""
+    try:
+        return os.path.getsize(path) if path else None
+    except (OSError, TypeError):
+        return None
+
+
+def _emit(record: StageRecord) -> None:
+    event = record.to_event()
+    for sink in list(_sinks):
+        try:
+            sink.emit(event)
+        except Exception:
+            # A broken sink must never break the pipeline
+            logger.exception(f"Failed to emit stage event to {sink}")
+
+
+def _load_env() -> None:
+    """Configures the sinks and profilers from the environment variables, once"""
+    global _env_loaded, _profile_dir
+    if _env_loaded:
+        return
+    with _config_lock:
+        if _env_loaded:
+            return
+        _env_loaded = True
+        if path := os.getenv("SUMMARIZE_MEDIA_METRICS"):
+            _sinks.append(JsonLinesSink(path))
+        if path := os.getenv("SUMMARIZE_MEDIA_PROMETHEUS"):
+            _sinks.append(PrometheusSink(path=path))
+        profile = {}
+        for item in filter(None, os.getenv("SUMMARIZE_MEDIA_PROFILE", "").split(",")):
+            stage_name, _, profiler = item.partition("=")
+            profile[stage_name.strip()] = profiler.strip() or "cprofile"
+        _profile.update(_valid_profilers(profile))
+        _profile_dir = os.getenv("SUMMARIZE_MEDIA_PROFILE_DIR", _profile_dir)
+
+
+def _valid_profilers(profile: Dict[str, str]) -> Dict[str, Profiler]:
+    """Drops (with a warning) the stages configured with an unknown profiler, so they run unprofiled"""
+    valid = {}
+    for stage_name, profiler in profile.items():
+        if profiler in get_args(Profiler):
+            valid[stage_name] = profiler
+        else:
+            logger.warning(
+                f"Unknown profiler {profiler!r} for stage {stage_name!r}, must be one of {get_args(Profiler)}, "
+                "not profiling it"
+            )
+    return valid
+
+
+def _find_profiler(name: str) -> Optional[Profiler]:
+    """Profiler configured for the stage or its closest parent stage name"""
+    parts = name.split(".")
+    for i in range(len(parts), 0, -1):
+        profiler = _profile.get(".".join(parts[:i]))
+        if profiler is not None:
+            return profiler
+    return None
+
+
+def _ancestor_profiled(record: Optional[StageRecord]) -> bool:
+    while record is not None:
+        if record.profiling:
+            return True
+        record = record.parent
+    return False
+
+
+def _start_profiler(
+    profiler: Profiler, record: StageRecord
+) -> Optional[Callable[[], None]]:
+    """Starts profiling the stage, returns the function stopping it and saving the profile (None if it can't run)"""
+    os.makedirs(_profile_dir, exist_ok=True)
+    base_path = os.path.join(
+        _profile_dir, f"{record.name}-{os.getpid()}-{int(record.start_time * 1000)}"
+    )
+
+    if profiler == "cprofile":
+        # Only profiles the calling thread
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            logger.warning(f"Cannot profile {record.name}, another profiler is active")
+            return None
+
+        def stop_cprofile():
+            profile.disable()
+            record.profile_path = base_path + ".prof"
+            profile.dump_stats(record.profile_path)
+
+        return stop_cprofile
+
+    if profiler == "py-spy":
+        executable = shutil.which("py-spy")
+        if executable is None:
+            logger.warning(
+                "py-spy is not installed (pip install py-spy), not profiling"
+            )
+            return None
+        output_path = base_path + ".svg"
+        # Samples every thread (and native frames of the subprocesses) without slowing the stage down
+        process = subprocess.Popen(
+            [
+                executable,
+                "record",
+                "--pid",
+                str(os.getpid()),
+                "--output",
+                output_path,
+                "--rate",
+                "100",
+                "--subprocesses",
+                "--nonblocking",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+
+        def stop_py_spy():
+            # py-spy writes the flame graph when interrupted
+            process.send_signal(signal.SIGINT)
+            try:
+                _, stderr = process.communicate(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                return
+            if os.path.isfile(output_path):
+                record.profile_path = output_path
+            else:
+                logger.warning(
+                    f"py-spy failed: {stderr.decode(errors='replace').strip()}"
+                )
+
+        return stop_py_spy
+
+    raise ValueError(f"profiler must be one of 'cprofile' or 'py-spy', got {profiler}")
+
+
+def _current_rss() -> int:
+    """Resident memory of the process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # Peak over the process lifetime, in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _get_cuda() -> Any:
+    """Returns torch.cuda, None if torch isn't loaded or CUDA isn't initialized (they are never loaded just to measure)"""
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_initialized():
+        return None
+    return torch.cuda
+
+
+class _GpuPeak:
+    """Resets the peak GPU memory statistic when the outermost running stage starts
+
+    The statistic is process wide, resetting it in a sub stage (or a stage running concurrently in another thread)
+    would lose the peak of the stages still running. A stage's peak is therefore the peak since the outermost stage
+    started, which is exact for the outermost stages and an upper bound for the others.
+    """
+
+    def __init__(self):
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def enter(self, gpu: Any) -> None:
+        with self._lock:
+            if self._running == 0:
+                gpu.reset_peak_memory_stats()
+            self._running += 1
+
+    def exit(self) -> None:
+        with self._lock:
+            self._running -= 1
+
+
+class _MemorySampler:
+    """Background thread sampling the resident memory of the process while stages run"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self._records: List[StageRecord] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, record: StageRecord) -> None:
+        record.observe_rss(_current_rss())
+        with self._lock:
+            self._records.append(record)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="stage-memory-sampler", daemon=True
+                )
+                self._thread.start()
+
+    def remove(self, record: StageRecord) -> None:
+        with self._lock:
+            if record in self._records:
+                self._records.remove(record)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._records:
+                    self._thread = None
+                    return
+                records = list(self._records)
+            rss = _current_rss()
+            for record in records:
+                record.observe_rss(rss)
+            time.sleep(self.interval)
+
+
+_gpu_peak = _GpuPeak()
+_sampler = _MemorySampler()
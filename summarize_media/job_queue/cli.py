@@ -0,0 +1,274 @@
+"""Command line interface of the job queue: submit jobs, run workers and follow their status
+
+Example:
+```bash
+python -m summarize_media submit https://youtu.be/... talk.mp3 --priority 5
+python -m summarize_media worker --devices cuda:0,cuda:1 --stages transcribe --limit transcribe=2
+python -m summarize_media worker --processes 4 --device cpu --stages download,convert,summarize --limit convert=2
+python -m summarize_media status
+python -m summarize_media autotune --device cpu --model-name large-v3
+```
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from .pipeline import STAGES
+from .queue import DEFAULT_MAX_ATTEMPTS, STATUSES, JobQueue
+from .worker import DEFAULT_OUTPUT_DIR, run_workers
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        pass
+    else:
+        load_dotenv()
+
+    return args.command(args)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="summarize-media",
+        description="Queue media for download, conversion, transcription and summarization, and run the workers",
+    )
+    parser.add_argument(
+        "--queue",
+        default=os.getenv("SUMMARIZE_MEDIA_JOBS"),
+        help="Path of the queue database (default: $SUMMARIZE_MEDIA_JOBS or ~/.cache/summarize_media/jobs.sqlite3)",
+    )
+    commands = parser.add_subparsers(required=True, metavar="command")
+
+    submit = commands.add_parser("submit", help="Add jobs to the queue")
+    submit.add_argument("sources", nargs="+", help="Urls or local paths of the media")
+    submit.add_argument("--priority", type=int, default=0)
+    submit.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    submit.add_argument(
+        "--cloud", action="store_true", help="Transcribe with replicate"
+    )
+    submit.add_argument("--model-name", help="Whisper model, e.g. large-v3")
+    submit.add_argument("--language", help="Language code of the audio, e.g. en")
+    submit.add_argument(
+        "--no-speakers", action="store_true", help="Skip the speaker labels"
+    )
+    submit.add_argument(
+        "--no-summary", action="store_true", help="Stop after the transcription"
+    )
+    submit.add_argument(
+        "--compact",
+        action="store_true",
+        help="Summarize a compact transcript (merged speaker turns, coarse timestamps, no filler words)",
+    )
+    submit.add_argument("--output-dir", help="Folder of the job's files")
+    submit.add_argument(
+        "--options",
+        type=json.loads,
+        default={},
+        help="Other job options as JSON, see summarize_media/job_queue/pipeline.py",
+    )
+    submit.set_defaults(command=submit_command)
+
+    worker = commands.add_parser("worker", help="Run worker processes")
+    devices = worker.add_mutually_exclusive_group()
+    devices.add_argument(
+        "--devices", type=_split, help="One worker per device, e.g. cuda:0,cuda:1"
+    )
+    devices.add_argument("--device", default="cuda", help="Device of every worker")
+    worker.add_argument(
+        "--processes", type=int, default=1, help="Number of workers with --device"
+    )
+    worker.add_argument(
+        "--stages",
+        type=_split,
+        default=list(STAGES),
+        help=f"Stages the workers run (default: {','.join(STAGES)})",
+    )
+    worker.add_argument(
+        "--limit",
+        action="append",
+        default=[],
+        metavar="STAGE=SLOTS",
+        help="Jobs running a stage at the same time across every worker of the queue, 0 removes the limit",
+    )
+    worker.add_argument("--lease-seconds", type=float, default=300.0)
+    worker.add_argument("--retry-delay", type=float, default=30.0)
+    worker.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    worker.add_argument("--cache", action="store_true", help="Use the artifact cache")
+    worker.add_argument(
+        "--llm-cache", action="store_true", help="Use the LLM response cache"
+    )
+    worker.add_argument("--max-jobs", type=int, help="Stages to run per worker")
+    worker.add_argument(
+        "--exit-when-idle",
+        action="store_true",
+        help="Exit once there is nothing left to run",
+    )
+    worker.set_defaults(command=worker_command)
+
+    status = commands.add_parser("status", help="Show the queue or a job")
+    status.add_argument("job_id", nargs="?", type=int)
+    status.add_argument("--status", choices=STATUSES)
+    status.add_argument("--last", type=int, default=20, help="Number of jobs listed")
+    status.add_argument("--json", action="store_true", help="Print JSON")
+    status.set_defaults(command=status_command)
+
+    autotune = commands.add_parser(
+        "autotune",
+        help="Calibrate the batch size, compute type and threads of the whisper model on this host",
+    )
+    autotune.add_argument("--device", default="cuda")
+    autotune.add_argument("--model-name", default="large-v2")
+    autotune.add_argument("--model-save-dir", help="Download directory of the model")
+    autotune.add_argument(
+        "--refresh", action="store_true", help="Calibrate again even if already tuned"
+    )
+    autotune.set_defaults(command=autotune_command)
+    return parser
+
+
+def submit_command(args: argparse.Namespace) -> int:
+    options: Dict[str, Any] = dict(args.options)
+    transcribe_args = dict(options.get("transcribe_args") or {})
+    if args.cloud:
+        options["transcribe"] = "cloud"
+    if args.model_name:
+        transcribe_args["model_name"] = args.model_name
+    if args.language:
+        transcribe_args["language"] = args.language
+    if args.no_speakers:
+        transcribe_args["assign_speaker_labels"] = False
+    if transcribe_args:
+        options["transcribe_args"] = transcribe_args
+    if args.no_summary:
+        options["summarize"] = False
+    if args.compact:
+        options["summarize_args"] = {
+            **(options.get("summarize_args") or {}),
+            "compact": True,
+        }
+    if args.output_dir:
+        options["output_dir"] = args.output_dir
+
+    queue = JobQueue(args.queue)
+    for source in args.sources:
+        # Workers may run in another directory
+        if os.path.isfile(source):
+            source = os.path.abspath(source)
+        job_id = queue.submit(
+            source, options, priority=args.priority, max_attempts=args.max_attempts
+        )
+        print(f"{job_id}\t{source}")
+    return 0
+
+
+def worker_command(args: argparse.Namespace) -> int:
+    unknown = [stage for stage in args.stages if stage not in STAGES]
+    if unknown:
+        raise SystemExit(
+            f"Invalid --stages {','.join(unknown)}, expected stages among {','.join(STAGES)}"
+        )
+    queue = JobQueue(args.queue)
+    limits = {}
+    for limit in args.limit:
+        stage, _, slots = limit.partition("=")
+        if stage not in STAGES or not slots.isdigit():
+            raise SystemExit(f"Invalid --limit {limit}, expected STAGE=SLOTS")
+        limits[stage] = int(slots) or None
+    queue.set_stage_limits(limits)
+    queue.close()
+
+    try:
+        run_workers(
+            args.queue,
+            args.devices or [args.device] * args.processes,
+            stages=args.stages,
+            max_jobs=args.max_jobs,
+            exit_when_idle=args.exit_when_idle,
+            lease_seconds=args.lease_seconds,
+            retry_delay=args.retry_delay,
+            output_dir=args.output_dir,
+            cache=args.cache,
+            response_cache=args.llm_cache,
+        )
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+def status_command(args: argparse.Namespace) -> int:
+    queue = JobQueue(args.queue)
+    if args.job_id is not None:
+        job = queue.get(args.job_id)
+        if job is None:
+            print(f"No job {args.job_id}", file=sys.stderr)
+            return 1
+        print(json.dumps(job, indent=2))
+        return 0
+
+    jobs = queue.list(status=args.status, limit=args.last)
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "counts": queue.counts(),
+                    "stage_limits": queue.stage_limits(),
+                    "jobs": jobs,
+                },
+                indent=2,
+            )
+        )
+        return 0
+
+    for stage, counts in sorted(queue.counts().items()):
+        print(
+            f"{stage:<11} " + ", ".join(f"{n} {s}" for s, n in sorted(counts.items()))
+        )
+    limits = queue.stage_limits()
+    if limits:
+        print("limits      " + ", ".join(f"{s}={n}" for s, n in sorted(limits.items())))
+    print()
+    for job in jobs:
+        print(_format_job(job))
+    return 0
+
+
+def autotune_command(args: argparse.Namespace) -> int:
+    import logging
+
+    from ..transcribe.autotune import get_tuned_config
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    config = get_tuned_config(
+        args.model_name,
+        args.device,
+        model_save_dir=args.model_save_dir,
+        refresh=args.refresh,
+    )
+    print(json.dumps(config, indent=2))
+    return 0
+
+
+def _format_job(job: Dict[str, Any]) -> str:
+    age = time.time() - job["created_at"]
+    line = (
+        f"{job['id']:>5}  {job['status']:<7}  {job['stage']:<10}  p{job['priority']:<3} "
+        f"attempts {job['attempts']}/{job['max_attempts']}  {age / 60:>6.1f} min  {job['source']}"
+    )
+    if job["status"] == "running":
+        line += f"  [{job['lease_owner']}]"
+    if job["error"]:
+        line += f"\n       {job['error']}"
+    return line
+
+
+def _split(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
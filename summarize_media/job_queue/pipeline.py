@@ -0,0 +1,156 @@
+"""Stages of a pipeline job: download -> convert -> transcribe -> summarize
+
+Every stage reads the files written by the previous ones from the job's state, writes its own files to the job's
+folder, and returns the state entries it adds. Stages are run by `Worker`s, possibly different ones for the same
+job, so they only share state through the files and the job's state (never through memory).
+
+Options of a job (all optional):
+- "output_dir": Folder of the job's files. Defaults to "<worker output dir>/<job id>".
+- "transcribe": "local" (`get_transcription` on the worker's device) or "cloud" (`get_transcribe_cloud`). Defaults to "local".
+- "transcribe_args": Arguments of `get_transcription`/ `get_transcribe_cloud`, e.g. {"model_name": "large-v3", "language": "en"}
+- "summarize": Whether to summarize the transcript. Defaults to True.
+- "summarize_args": Arguments of `get_summarization_map_reduce`, e.g. {"chunk_tokens": 8000, "compact": true}
+"""
+
+import json
+import os
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from ..cache.artifact_cache import _json_default
+
+if TYPE_CHECKING:
+    from .worker import Worker
+
+STAGES = ("download", "convert", "transcribe", "summarize")
+
+
+def job_dir(job: Dict[str, Any], worker: "Worker") -> str:
+    """Folder of the files of a job (created if missing)"""
+    path = job["options"].get("output_dir") or os.path.join(
+        worker.output_dir, str(job["id"])
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def next_stage(job: Dict[str, Any]) -> Optional[str]:
+    """Stage to run after the job's current one, None if the job is done"""
+    index = STAGES.index(job["stage"]) + 1
+    if index == len(STAGES):
+        return None
+    if STAGES[index] == "summarize" and not job["options"].get("summarize", True):
+        return None
+    return STAGES[index]
+
+
+def run_stage(job: Dict[str, Any], worker: "Worker") -> Dict[str, Any]:
+    """Runs the current stage of a job
+
+    Returns:
+        Dict[str, Any]: The job's state, updated with the outputs of the stage
+    """
+    return {**job["state"], **STAGE_RUNNERS[job["stage"]](job, worker)}
+
+
+def download(job: Dict[str, Any], worker: "Worker") -> Dict[str, Any]:
+    """Downloads the media of a url, local files are used in place"""
+    source = job["source"]
+    if os.path.isfile(source):
+        return {"media_path": os.path.abspath(source)}
+
+    from ..get_media.fetch import get_site
+
+    output_path = job_dir(job, worker)
+    if get_site(source) == "bilibili":
+        from ..get_media.bilibili import get_bilibili
+
+        media_path = get_bilibili(source, output_path, verbose=False)
+    else:
+        from ..get_media.youtube import get_youtube
+
+        media_path = get_youtube(source, output_path, verbose=False, cache=worker.cache)
+    return {"media_path": media_path}
+
+
+def convert(job: Dict[str, Any], worker: "Worker") -> Dict[str, Any]:
+    from ..pre_processing.convert_audio_format import convert_to_wav
+
+    wav_path = convert_to_wav(
+        job["state"]["media_path"],
+        output_path=job_dir(job, worker),
+        cache=worker.cache,
+    )
+    return {"wav_path": wav_path}
+
+
+def transcribe(job: Dict[str, Any], worker: "Worker") -> Dict[str, Any]:
+    wav_path = job["state"]["wav_path"]
+    transcribe_args = job["options"].get("transcribe_args") or {}
+    # A retry of the job resumes the transcription where the failed attempt stopped
+    checkpoint_dir = os.path.join(job_dir(job, worker), "checkpoint")
+    if job["options"].get("transcribe", "local") == "cloud":
+        from ..cache.artifact_cache import hash_file
+        from ..host_files.uploaders import upload_audio
+        from ..transcribe.checkpoint import TranscriptionCheckpoint
+        from ..transcribe.transcribe_cloud import get_transcribe_cloud
+
+        # The same url on a retry, so the running prediction is found again
+        upload = TranscriptionCheckpoint.for_input(
+            checkpoint_dir, hash_file(wav_path), stage="upload"
+        )
+        saved = upload.load("upload")
+        url = saved["url"] if saved is not None else upload_audio(wav_path)
+        upload.save("upload", {"url": url})
+        transcript = get_transcribe_cloud(
+            url, checkpoint_dir=checkpoint_dir, **transcribe_args
+        )
+        upload.clear()
+    else:
+        from ..transcribe.transcribe import get_transcription
+
+        transcript = get_transcription(
+            wav_path,
+            device=worker.device,
+            model_pool=worker.model_pool,
+            cache=worker.cache,
+            checkpoint_dir=checkpoint_dir,
+            **transcribe_args,
+        )
+
+    transcript_path = os.path.join(job_dir(job, worker), "transcript.json")
+    with open(transcript_path, "w", encoding="utf-8") as file:
+        json.dump(transcript, file, default=_json_default)
+    return {"transcript_path": transcript_path}
+
+
+def summarize(job: Dict[str, Any], worker: "Worker") -> Dict[str, Any]:
+    from ..post_processing.reformat_output import reformat
+    from ..summarize_transcription.summarize import get_summarization_map_reduce
+
+    with open(job["state"]["transcript_path"], encoding="utf-8") as file:
+        transcript = json.load(file)
+    segments = transcript["segments"] if isinstance(transcript, dict) else transcript
+
+    summary = get_summarization_map_reduce(
+        segments,
+        cache=worker.cache,
+        response_cache=worker.response_cache,
+        **(job["options"].get("summarize_args") or {}),
+    )
+
+    output_path = job_dir(job, worker)
+    text_path = os.path.join(output_path, "transcript.txt")
+    summary_path = os.path.join(output_path, "summary.md")
+    with open(text_path, "w", encoding="utf-8") as file:
+        file.write(reformat(segments))
+    with open(summary_path, "w", encoding="utf-8") as file:
+        file.write(summary)
+    return {"transcript_text_path": text_path, "summary_path": summary_path}
+
+
+STAGE_RUNNERS: Dict[str, Callable[[Dict[str, Any], "Worker"], Dict[str, Any]]] = {
+    "download": download,
+    "convert": convert,
+    "transcribe": transcribe,
+    "summarize": summarize,
+}
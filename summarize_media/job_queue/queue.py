@@ -0,0 +1,383 @@
+"""SQLite backed queue of pipeline jobs, shared by the worker processes of one host
+
+A job runs the pipeline (see `summarize_media.job_queue.pipeline`) one stage at a time. Workers lease a job for
+its current stage, renew the lease while they work on it, and hand the job back queued for its next stage when
+they're done, so different workers (e.g. CPU workers converting audio and GPU workers transcribing) can take
+different stages of the same job. A worker that crashes stops renewing its lease; once the lease expires, the stage
+is retried by another worker, up to `max_attempts` times.
+
+Per-stage slots bound how many jobs run a stage at the same time across every worker of the queue, e.g. so that
+conversions (CPU bound) don't take every core away from transcriptions. Among the jobs whose stage has a free slot,
+the ones with the highest priority run first, then the oldest.
+
+Example:
+```python
+queue = JobQueue("jobs.sqlite3")
+queue.set_stage_limits({"convert": 2, "transcribe": 1})
+job_id = queue.submit("https://youtu.be/...", priority=10)
+print(queue.get(job_id)["status"])  # "queued", "running", "done" or "failed"
+```
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "summarize_media", "jobs.sqlite3"
+)
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Statuses of a job, it is "queued" between its stages
+STATUSES = ("queued", "running", "done", "failed")
+
+
+class JobQueue:
+    """Queue of pipeline jobs backed by SQLite, safe to share between threads and processes (through the file)
+
+    Args:
+        path (str, optional): Path of the database file. Defaults to "~/.cache/summarize_media/jobs.sqlite3".
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DEFAULT_DB_PATH
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        # Writers of other processes are waited for rather than failed on
+        self._conn = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=30.0
+        )
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    available_at REAL NOT NULL,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, stage, priority DESC, id)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS stage_limits (
+                    stage TEXT PRIMARY KEY,
+                    slots INTEGER NOT NULL
+                )
+                """
+            )
+
+    def submit(
+        self,
+        source: str,
+        options: Optional[Dict[str, Any]] = None,
+        priority: int = 0,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        stage: str = None,
+    ) -> int:
+        """Adds a job
+
+        Args:
+            source (str): Url or local path of the media
+            options (dict, optional): Options of the job, see `summarize_media.job_queue.pipeline`
+            priority (int, optional): Jobs with a higher priority run first. Defaults to 0.
+            max_attempts (int, optional): Number of times each stage is tried before the job fails. Defaults to 3.
+            stage (str, optional): Stage the job starts at. Defaults to the first stage of the pipeline.
+
+        Returns:
+            int: Id of the job
+        """
+        from .pipeline import STAGES
+
+        stage = stage or STAGES[0]
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage {stage}, must be one of {STAGES}")
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (source, options, priority, stage, status, state, max_attempts, available_at, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', '{}', ?, ?, ?, ?)",
+                (
+                    source,
+                    json.dumps(options or {}),
+                    priority,
+                    stage,
+                    max_attempts,
+                    now,
+                    now,
+                    now,
+                ),
+            )
+        return cursor.lastrowid
+
+    def claim(
+        self, worker_id: str, stages: Sequence[str], lease_seconds: float
+    ) -> Optional[Dict[str, Any]]:
+        """Leases the next job to run, among the jobs at one of `stages` whose stage has a free slot
+
+        Jobs whose lease expired (their worker died) are claimed again, or failed once out of attempts.
+
+        Args:
+            worker_id (str): Id of the claiming worker, the owner of the lease
+            stages (Sequence[str]): Stages the worker runs
+            lease_seconds (float): Duration of the lease, see `renew`
+
+        Returns:
+            Optional[Dict[str, Any]]: The job (with "options" and "state" decoded), None if there is nothing to run
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = self._next_job(stages, now)
+                if job is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?, "
+                        "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (worker_id, now + lease_seconds, now, job["id"]),
+                    )
+                    job.update(
+                        status="running",
+                        lease_owner=worker_id,
+                        lease_expires=now + lease_seconds,
+                        attempts=job["attempts"] + 1,
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job
+
+    def renew(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """Extends the lease of a running job, returns False if the worker lost it (it expired and was claimed again)"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (now + lease_seconds, now, job_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+    def advance(
+        self,
+        job_id: int,
+        worker_id: str,
+        state: Dict[str, Any],
+        next_stage: Optional[str],
+    ) -> bool:
+        """Completes the current stage of a job, queueing it for `next_stage`, or marking it done if there is none
+
+        Args:
+            job_id (int): Id of the job
+            worker_id (str): Id of the worker holding the lease
+            state (dict): State of the job after the stage (e.g. the paths of the files it wrote)
+            next_stage (str, optional): Stage to run next, None if the job is done
+
+        Returns:
+            bool: False if the worker lost the lease, the stage's result is then discarded
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET stage = ?, status = ?, state = ?, attempts = 0, lease_owner = NULL, "
+                "lease_expires = NULL, available_at = ?, error = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (
+                    next_stage or "done",
+                    "queued" if next_stage else "done",
+                    json.dumps(state),
+                    now,
+                    now,
+                    job_id,
+                    worker_id,
+                ),
+            )
+        return cursor.rowcount > 0
+
+    def fail(
+        self, job_id: int, worker_id: str, error: str, retry_delay: float = 0.0
+    ) -> Optional[str]:
+        """Records a failed attempt of the current stage, the stage is retried after `retry_delay` if attempts remain
+
+        Returns:
+            Optional[str]: The new status of the job ("queued" or "failed"), None if the worker lost the lease
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (job_id, worker_id),
+            ).fetchone()
+            if row is None:
+                return None
+            status = "queued" if row["attempts"] < row["max_attempts"] else "failed"
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, "
+                "available_at = ?, updated_at = ? WHERE id = ?",
+                (status, error, now + retry_delay, now, job_id),
+            )
+        return status
+
+    def release(self, job_id: int, worker_id: str) -> bool:
+        """Gives a running job back without counting the attempt, e.g. when its worker is shut down"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), lease_owner = NULL, "
+                "lease_expires = NULL, available_at = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (now, now, job_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Returns a job (with "options" and "state" decoded), None if unknown"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return _decode_row(row)
+
+    def list(
+        self, status: Optional[str] = None, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Returns the jobs (optionally only the ones with a status), the most recent first"""
+        query = "SELECT * FROM jobs"
+        args: List[Any] = []
+        if status is not None:
+            query += " WHERE status = ?"
+            args.append(status)
+        query += " ORDER BY id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [_decode_row(row) for row in rows]
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Returns the number of jobs of every stage, by status, e.g. {"transcribe": {"queued": 3, "running": 1}}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, status, COUNT(*) FROM jobs GROUP BY stage, status"
+            ).fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for stage, status, count in rows:
+            counts.setdefault(stage, {})[status] = count
+        return counts
+
+    def set_stage_limits(self, limits: Dict[str, Optional[int]]) -> None:
+        """Sets the number of jobs that may run each stage at the same time, across every worker (None removes a limit)"""
+        with self._lock:
+            for stage, slots in limits.items():
+                if slots is None:
+                    self._conn.execute(
+                        "DELETE FROM stage_limits WHERE stage = ?", (stage,)
+                    )
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO stage_limits (stage, slots) VALUES (?, ?)",
+                        (stage, slots),
+                    )
+
+    def stage_limits(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, slots FROM stage_limits"
+            ).fetchall()
+        return {stage: slots for stage, slots in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _next_job(self, stages: Sequence[str], now: float) -> Optional[Dict[str, Any]]:
+        """Finds the job to claim next, in the open transaction of `claim`"""
+        running = dict(
+            self._conn.execute(
+                "SELECT stage, COUNT(*) FROM jobs WHERE status = 'running' AND lease_expires > ? GROUP BY stage",
+                (now,),
+            ).fetchall()
+        )
+        limits = dict(
+            self._conn.execute("SELECT stage, slots FROM stage_limits").fetchall()
+        )
+        open_stages = [
+            stage
+            for stage in stages
+            if stage not in limits or running.get(stage, 0) < limits[stage]
+        ]
+        if not open_stages:
+            return None
+
+        placeholders = ", ".join("?" * len(open_stages))
+        while True:
+            row = self._conn.execute(
+                f"SELECT * FROM jobs WHERE stage IN ({placeholders}) AND available_at <= ? "
+                "AND (status = 'queued' OR (status = 'running' AND lease_expires <= ?)) "
+                "ORDER BY priority DESC, id LIMIT 1",
+                (*open_stages, now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            if row["status"] == "queued" or row["attempts"] < row["max_attempts"]:
+                if row["status"] == "running":
+                    logger.warning(
+                        f"Lease of job {row['id']} held by {row['lease_owner']} expired, retrying its {row['stage']} stage"
+                    )
+                return _decode_row(row)
+
+            # The worker died on the last attempt
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE id = ?",
+                (
+                    f"Lease of {row['lease_owner']} expired during the {row['stage']} stage, out of attempts",
+                    now,
+                    row["id"],
+                ),
+            )
+
+
+def _decode_row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    job = dict(row)
+    job["options"] = json.loads(job["options"])
+    job["state"] = json.loads(job["state"])
+    return job
+
+
+_default_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Returns the process-wide job queue, stored at $SUMMARIZE_MEDIA_JOBS if set"""
+    global _default_queue
+    if _default_queue is None:
+        _default_queue = JobQueue(os.getenv("SUMMARIZE_MEDIA_JOBS"))
+    return _default_queue
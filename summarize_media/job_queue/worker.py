@@ -0,0 +1,224 @@
+"""Workers running the stages of the jobs of a `JobQueue`
+
+A worker owns a device and a model pool, so the models stay warm across the jobs it runs. Run one worker process
+per GPU (and, if needed, CPU workers for the download, convert and summarize stages) with `run_workers`; the stage
+slots of the queue bound how many of them run each stage at the same time.
+
+Example:
+```python
+# One process per GPU, transcribing, plus two CPU processes for everything else
+run_workers("jobs.sqlite3", devices=["cuda:0", "cuda:1"], stages=["transcribe"], exit_when_idle=False)
+run_workers("jobs.sqlite3", devices=["cpu", "cpu"], stages=["download", "convert", "summarize"])
+```
+"""
+
+import logging
+import os
+import signal
+import socket
+import threading
+from multiprocessing import get_context
+from typing import Any, Dict, Optional, Sequence
+
+from ..cache.artifact_cache import ArtifactCache
+from ..cache.response_cache import ResponseCache
+from ..instrumentation.stages import stage
+from ..transcribe.model_pool import ModelPool
+from .pipeline import STAGES, next_stage, run_stage
+from .queue import JobQueue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT_DIR = os.path.join("data", "jobs")
+
+
+class Worker:
+    """Claims jobs from a queue and runs their current stage, one job at a time
+
+    Args:
+        queue (JobQueue): Queue to take the jobs from
+        stages (Sequence[str], optional): Stages this worker runs. Defaults to every stage.
+        device (str, optional): Device of the local models. Defaults to "cuda".
+        worker_id (str, optional): Id of the worker, the owner of its leases. Defaults to "<host>:<pid>:<device>".
+        lease_seconds (float, optional): Duration of a lease, renewed every third of it while a stage runs. A crashed worker's job is retried once its lease expires. Defaults to 300.
+        poll_interval (float, optional): Seconds to wait before looking for a job again when there is none. Defaults to 1.
+        retry_delay (float, optional): Delay before the first retry of a failed stage, doubled on every further attempt. Defaults to 30.
+        output_dir (str, optional): Folder of the jobs' files (one sub folder per job). Defaults to "data/jobs".
+        model_pool (ModelPool, optional): Pool of the worker's models. Defaults to a new unbounded pool.
+        cache (ArtifactCache, optional): Cache of the downloads, conversions, transcripts and summaries.
+        response_cache (ResponseCache, optional): Cache of the LLM responses.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        stages: Optional[Sequence[str]] = None,
+        device: str = "cuda",
+        worker_id: Optional[str] = None,
+        lease_seconds: float = 300.0,
+        poll_interval: float = 1.0,
+        retry_delay: float = 30.0,
+        output_dir: str = DEFAULT_OUTPUT_DIR,
+        model_pool: Optional[ModelPool] = None,
+        cache: Optional[ArtifactCache] = None,
+        response_cache: Optional[ResponseCache] = None,
+    ):
+        stages = list(stages or STAGES)
+        unknown = [name for name in stages if name not in STAGES]
+        if unknown:
+            raise ValueError(f"Unknown stages {unknown}, must be among {STAGES}")
+        self.queue = queue
+        self.stages = stages
+        self.device = device
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{device}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.output_dir = output_dir
+        self.model_pool = model_pool if model_pool is not None else ModelPool()
+        self.cache = cache
+        self.response_cache = response_cache
+        self._stop = threading.Event()
+
+    def run(self, max_jobs: Optional[int] = None, exit_when_idle: bool = False) -> int:
+        """Runs stages until `stop` is called
+
+        Args:
+            max_jobs (int, optional): Number of stages to run before returning. Defaults to no limit.
+            exit_when_idle (bool, optional): Whether to return as soon as there is nothing to run. Defaults to False.
+
+        Returns:
+            int: Number of stages run
+        """
+        logger.info(f"Worker {self.worker_id} running stages {self.stages}")
+        ran = 0
+        while not self._stop.is_set() and (max_jobs is None or ran < max_jobs):
+            if self.run_once():
+                ran += 1
+            elif exit_when_idle:
+                break
+            else:
+                self._stop.wait(self.poll_interval)
+        return ran
+
+    def run_once(self) -> bool:
+        """Claims a job and runs its current stage, returns False if there was nothing to run"""
+        job = self.queue.claim(self.worker_id, self.stages, self.lease_seconds)
+        if job is None:
+            return False
+
+        logger.info(
+            f"Job {job['id']}: {job['stage']} (attempt {job['attempts']}/{job['max_attempts']})"
+        )
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job["id"], stop_heartbeat), daemon=True
+        )
+        heartbeat.start()
+        try:
+            with stage(f"job.{job['stage']}", job_id=job["id"], device=self.device):
+                state = run_stage(job, self)
+        except KeyboardInterrupt:
+            self.queue.release(job["id"], self.worker_id)
+            raise
+        except Exception as e:
+            status = self.queue.fail(
+                job["id"],
+                self.worker_id,
+                f"{type(e).__name__}: {e}",
+                retry_delay=self.retry_delay * 2 ** (job["attempts"] - 1),
+            )
+            logger.exception(f"Job {job['id']}: {job['stage']} failed, job {status}")
+        else:
+            if not self.queue.advance(
+                job["id"], self.worker_id, state, next_stage(job)
+            ):
+                logger.warning(
+                    f"Job {job['id']}: lost the lease during {job['stage']}, discarding its result"
+                )
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+        return True
+
+    def stop(self) -> None:
+        """Stops the worker after the stage it is running"""
+        self._stop.set()
+
+    def _heartbeat(self, job_id: int, stop: threading.Event) -> None:
+        while not stop.wait(self.lease_seconds / 3):
+            if not self.queue.renew(job_id, self.worker_id, self.lease_seconds):
+                logger.warning(f"Job {job_id}: lease lost")
+                return
+
+
+def run_workers(
+    queue_path: Optional[str],
+    devices: Sequence[str],
+    stages: Optional[Sequence[str]] = None,
+    max_jobs: Optional[int] = None,
+    exit_when_idle: bool = False,
+    **worker_args: Any,
+) -> None:
+    """Runs one worker process per device (repeat a device for several workers on it) until they all exit
+
+    Args:
+        queue_path (str, optional): Path of the queue's database, see `JobQueue`
+        devices (Sequence[str]): Device of every worker, e.g. ["cuda:0", "cuda:1"] or ["cpu"] * 4
+        stages (Sequence[str], optional): Stages the workers run. Defaults to every stage.
+        max_jobs (int, optional): See `Worker.run`
+        exit_when_idle (bool, optional): See `Worker.run`
+        worker_args: Other arguments of `Worker` (lease_seconds, output_dir, ...), the caches are given as booleans ("cache", "response_cache") since they can't be sent to another process
+    """
+    # CUDA and torch do not survive a fork
+    context = get_context("spawn")
+    processes = [
+        context.Process(
+            target=_worker_main,
+            args=(queue_path, device, stages, max_jobs, exit_when_idle, worker_args),
+            name=f"summarize-media-worker-{index}",
+        )
+        for index, device in enumerate(devices)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # The workers got the interrupt as well, they give their jobs back before exiting
+        for process in processes:
+            process.join()
+        raise
+
+
+def _worker_main(
+    queue_path: Optional[str],
+    device: str,
+    stages: Optional[Sequence[str]],
+    max_jobs: Optional[int],
+    exit_when_idle: bool,
+    worker_args: Dict[str, Any],
+) -> None:
+    """Entry point of a worker process"""
+    from ..cache.artifact_cache import get_artifact_cache
+    from ..cache.response_cache import get_response_cache
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(processName)s %(message)s"
+    )
+    worker_args = dict(worker_args)
+    worker_args["cache"] = get_artifact_cache() if worker_args.get("cache") else None
+    worker_args["response_cache"] = (
+        get_response_cache() if worker_args.get("response_cache") else None
+    )
+    worker = Worker(JobQueue(queue_path), stages=stages, device=device, **worker_args)
+    # Finish the current stage on SIGTERM, instead of leaving it to the lease to expire
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    try:
+        worker.run(max_jobs=max_jobs, exit_when_idle=exit_when_idle)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.queue.close()
+        logger.info(f"Worker {worker.worker_id} stopped")
@@ -0,0 +1,397 @@
+"""Compact, columnar representation of transcripts
+
+A transcript as returned by whisperX is a list of segment dicts, each holding a list of word dicts. For long audio
+(10+ hours) these small objects dominate memory and post-processing time. `ColumnarTranscript` instead keeps
+
+- starts, ends and speaker ids in NumPy arrays (NaN / -1 when missing)
+- the text of every segment (and word) in one shared UTF-8 buffer, addressed by byte offsets
+
+while still behaving like the list of dicts (indexing, iteration, `len`).
+
+Example:
+```python
+transcript = ColumnarTranscript.from_segments(get_transcription(path))
+transcript.save("transcript.smct")
+transcript = ColumnarTranscript.load("transcript.smct")  # Memory-mapped, nothing is read until used
+text = reformat(transcript)
+```
+"""
+
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+# Binary format: magic, little-endian uint64 header length, JSON header, then every array aligned to ALIGNMENT bytes
+MAGIC = b"SMCT0001"
+ALIGNMENT = 64
+
+SEGMENT_COLUMNS = ("starts", "ends", "speaker_ids", "text_starts", "text_ends")
+WORD_COLUMNS = (
+    "word_starts",
+    "word_ends",
+    "word_scores",
+    "word_speaker_ids",
+    "word_text_starts",
+    "word_text_ends",
+    "word_firsts",
+    "word_lasts",
+)
+
+
+class ColumnarTranscript:
+    """Transcript segments (and optionally their words) stored as NumPy columns over one shared text buffer
+
+    Use `from_segments` to build one from whisperX output, indexing returns the same dicts whisperX would
+    (slicing returns a `ColumnarTranscript` sharing the same buffers).
+
+    Args:
+        starts (np.ndarray): Start time of each segment in seconds, NaN when missing
+        ends (np.ndarray): End time of each segment in seconds, NaN when missing
+        speaker_ids (np.ndarray): Index of the speaker of each segment in `speakers`, -1 when missing
+        text_starts (np.ndarray): Byte offset of the text of each segment in `text`
+        text_ends (np.ndarray): End byte offset of the text of each segment in `text`
+        text (np.ndarray): Shared UTF-8 text buffer (uint8)
+        speakers (List[str]): Speaker labels
+        words (Dict[str, np.ndarray], optional): Word columns (see `WORD_COLUMNS`), "word_firsts" and "word_lasts" hold the range of words of each segment
+    """
+
+    def __init__(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        speaker_ids: np.ndarray,
+        text_starts: np.ndarray,
+        text_ends: np.ndarray,
+        text: np.ndarray,
+        speakers: List[str],
+        words: Optional[Dict[str, np.ndarray]] = None,
+    ):
+        self.starts = starts
+        self.ends = ends
+        self.speaker_ids = speaker_ids
+        self.text_starts = text_starts
+        self.text_ends = text_ends
+        self.text = text
+        self.speakers = speakers
+        self.words = words
+
+    @classmethod
+    def from_segments(
+        cls, segments: Union[List[Dict[Any, Any]], Dict[str, Any]]
+    ) -> "ColumnarTranscript":
+        """Builds a columnar transcript from whisperX segments (a list of segment dicts, or a dict with a "segments" key)"""
+        if isinstance(segments, dict):
+            segments = segments["segments"]
+
+        speakers: Dict[str, int] = {}
+        buffer = bytearray()
+
+        def add_text(text: str):
+            start = len(buffer)
+            buffer.extend(text.encode("utf-8"))
+            return start, len(buffer)
+
+        def speaker_id(item: Dict[Any, Any]) -> int:
+            speaker = item.get("speaker")
+            if speaker is None:
+                return -1
+            return speakers.setdefault(speaker, len(speakers))
+
+        n = len(segments)
+        starts = np.full(n, np.nan)
+        ends = np.full(n, np.nan)
+        speaker_ids = np.full(n, -1, dtype=np.int32)
+        text_starts = np.zeros(n, dtype=np.int64)
+        text_ends = np.zeros(n, dtype=np.int64)
+        word_firsts = np.zeros(n, dtype=np.int64)
+        word_lasts = np.zeros(n, dtype=np.int64)
+        words = []
+        has_words = False
+
+        for i, segment in enumerate(segments):
+            starts[i] = segment.get("start", np.nan)
+            ends[i] = segment.get("end", np.nan)
+            speaker_ids[i] = speaker_id(segment)
+            text_starts[i], text_ends[i] = add_text(segment.get("text", ""))
+
+            word_firsts[i] = len(words)
+            if "words" in segment:
+                has_words = True
+                for word in segment["words"]:
+                    words.append(
+                        (
+                            word.get("start", np.nan),
+                            word.get("end", np.nan),
+                            word.get("score", np.nan),
+                            speaker_id(word),
+                            *add_text(word.get("word", "")),
+                        )
+                    )
+            word_lasts[i] = len(words)
+
+        word_columns = None
+        if has_words:
+            columns = list(zip(*words)) if words else [()] * 6
+            word_columns = {
+                "word_starts": np.array(columns[0], dtype=np.float64),
+                "word_ends": np.array(columns[1], dtype=np.float64),
+                "word_scores": np.array(columns[2], dtype=np.float64),
+                "word_speaker_ids": np.array(columns[3], dtype=np.int32),
+                "word_text_starts": np.array(columns[4], dtype=np.int64),
+                "word_text_ends": np.array(columns[5], dtype=np.int64),
+                "word_firsts": word_firsts,
+                "word_lasts": word_lasts,
+            }
+
+        return cls(
+            starts,
+            ends,
+            speaker_ids,
+            text_starts,
+            text_ends,
+            np.frombuffer(bytes(buffer), dtype=np.uint8),
+            list(speakers),
+            word_columns,
+        )
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self._segment(i)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            words = None
+            if self.words is not None:
+                words = dict(self.words)
+                words["word_firsts"] = self.words["word_firsts"][index]
+                words["word_lasts"] = self.words["word_lasts"][index]
+            return ColumnarTranscript(
+                self.starts[index],
+                self.ends[index],
+                self.speaker_ids[index],
+                self.text_starts[index],
+                self.text_ends[index],
+                self.text,
+                self.speakers,
+                words,
+            )
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transcript index out of range")
+        return self._segment(index)
+
+    def get_text(self, index: int) -> str:
+        """Returns the text of a segment without building its dict"""
+        return self._decode(self.text_starts[index], self.text_ends[index])
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Converts back to whisperX's list of segment dicts"""
+        return list(self)
+
+    def nbytes(self) -> int:
+        """Returns the size of every column and the text buffer in bytes"""
+        arrays = [getattr(self, name) for name in SEGMENT_COLUMNS] + [self.text]
+        if self.words is not None:
+            arrays += list(self.words.values())
+        return sum(array.nbytes for array in arrays)
+
+    def save(self, path: str) -> None:
+        """Saves the transcript to `path` in a binary format that `load` can memory-map"""
+        arrays = {name: getattr(self, name) for name in SEGMENT_COLUMNS}
+        if self.words is not None:
+            arrays.update(self.words)
+
+        arrays["text"] = self.text
+
+        header = {"speakers": self.speakers, "arrays": {}}
+        offset = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            arrays[name] = array
+            header["arrays"][name] = {
+                "dtype": array.dtype.newbyteorder("<").str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+            offset = _align(offset + array.nbytes)
+
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(8, "little"))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.seek(data_start + header["arrays"][name]["offset"])
+                f.write(array.astype(header["arrays"][name]["dtype"]).tobytes())
+            f.truncate(data_start + offset)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "ColumnarTranscript":
+        """Loads a transcript saved with `save`
+
+        Args:
+            path (str): Path of the saved transcript
+            mmap (bool, optional): Whether to memory-map the columns (read lazily by the OS) instead of reading them into memory. Defaults to True.
+        """
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a saved ColumnarTranscript")
+            header_length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_length))
+        data_start = _align(len(MAGIC) + 8 + header_length)
+
+        if mmap and os.path.getsize(path) > data_start:
+            buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            with open(path, "rb") as f:
+                buffer = np.frombuffer(f.read(), dtype=np.uint8)
+
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            start = data_start + spec["offset"]
+            arrays[name] = (
+                buffer[start : start + count * dtype.itemsize]
+                .view(dtype)
+                .reshape(spec["shape"])
+            )
+
+        words = (
+            {name: arrays[name] for name in WORD_COLUMNS}
+            if "word_starts" in arrays
+            else None
+        )
+        return cls(
+            *(arrays[name] for name in SEGMENT_COLUMNS),
+            arrays["text"],
+            header["speakers"],
+            words,
+        )
+
+    def _decode(self, start: int, end: int) -> str:
+        return self.text[start:end].tobytes().decode("utf-8")
+
+    def _segment(self, i: int) -> Dict[str, Any]:
+        segment: Dict[str, Any] = {}
+        if not np.isnan(self.starts[i]):
+            segment["start"] = float(self.starts[i])
+        if not np.isnan(self.ends[i]):
+            segment["end"] = float(self.ends[i])
+        segment["text"] = self.get_text(i)
+        if self.speaker_ids[i] >= 0:
+            segment["speaker"] = self.speakers[self.speaker_ids[i]]
+        if self.words is not None:
+            segment["words"] = [
+                self._word(j)
+                for j in range(
+                    self.words["word_firsts"][i], self.words["word_lasts"][i]
+                )
+            ]
+        return segment
+
+    def _word(self, j: int) -> Dict[str, Any]:
+        words = self.words
+        word: Dict[str, Any] = {
+            "word": self._decode(
+                words["word_text_starts"][j], words["word_text_ends"][j]
+            )
+        }
+        for key, column in (
+            ("start", "word_starts"),
+            ("end", "word_ends"),
+            ("score", "word_scores"),
+        ):
+            if not np.isnan(words[column][j]):
+                word[key] = float(words[column][j])
+        if words["word_speaker_ids"][j] >= 0:
+            word["speaker"] = self.speakers[words["word_speaker_ids"][j]]
+        return word
+
+
+def reformat_columnar(transcript: ColumnarTranscript) -> str:
+    """Vectorized `summarize_media.post_processing.reformat_output.reformat` of a columnar transcript
+
+    Builds the whole output as one byte array: the timestamps are rendered with integer arithmetic and the text is
+    gathered from the shared buffer, without any per-segment Python objects.
+    """
+    n = len(transcript)
+    if n == 0:
+        return ""
+
+    has_start = ~np.isnan(transcript.starts)
+    has_end = ~np.isnan(transcript.ends)
+
+    # "Start: HH:MM:SS - " and "End: HH:MM:SS\n", matching time.strftime(time.gmtime(t))
+    start_part = _render_times(transcript.starts, b"Start: ", b" - ")
+    end_part = _render_times(transcript.ends, b"End: ", b"\n")
+    header = np.concatenate([start_part, end_part], axis=1)
+    header_mask = np.concatenate(
+        [
+            np.repeat(has_start[:, None], start_part.shape[1], axis=1),
+            np.repeat(has_end[:, None], end_part.shape[1], axis=1),
+        ],
+        axis=1,
+    )
+    header_lengths = header_mask.sum(axis=1)
+    text_lengths = (transcript.text_ends - transcript.text_starts).astype(np.int64)
+
+    # Each segment is its header, its text and a joining newline (except the last)
+    piece_lengths = header_lengths + text_lengths + 1
+    piece_lengths[-1] -= 1
+    piece_starts = np.concatenate([[0], np.cumsum(piece_lengths)[:-1]])
+
+    output = np.full(int(piece_lengths.sum()), ord("\n"), dtype=np.uint8)
+    output[_ranges(piece_starts, header_lengths)] = header[header_mask]
+    output[_ranges(piece_starts + header_lengths, text_lengths)] = transcript.text[
+        _ranges(transcript.text_starts, text_lengths)
+    ]
+    return output.tobytes().decode("utf-8")
+
+
+def to_columnar(
+    segments: Union[Sequence[Dict[Any, Any]], Dict[str, Any], ColumnarTranscript],
+) -> ColumnarTranscript:
+    """Returns `segments` as a `ColumnarTranscript`, converting whisperX output if needed"""
+    if isinstance(segments, ColumnarTranscript):
+        return segments
+    return ColumnarTranscript.from_segments(segments)
+
+
+def _render_times(seconds: np.ndarray, prefix: bytes, suffix: bytes) -> np.ndarray:
+    """Renders "{prefix}HH:MM:SS{suffix}" for every time as rows of a uint8 array (hours wrap at 24 like `time.gmtime`)"""
+    total = np.nan_to_num(seconds).astype(np.int64)
+    fields = np.stack([(total // 3600) % 24, (total // 60) % 60, total % 60], axis=1)
+
+    template = np.frombuffer(prefix + b"00:00:00" + suffix, dtype=np.uint8)
+    rows = np.repeat(template[None, :], len(seconds), axis=0)
+    for k in range(3):
+        column = len(prefix) + 3 * k
+        rows[:, column] += (fields[:, k] // 10).astype(np.uint8)
+        rows[:, column + 1] += (fields[:, k] % 10).astype(np.uint8)
+    return rows
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenation of np.arange(start, start + length) for every start/ length pair"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(np.asarray(starts, dtype=np.int64) - offsets, lengths) + np.arange(
+        total
+    )
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
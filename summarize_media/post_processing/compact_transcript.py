@@ -0,0 +1,175 @@
+"""Token-efficient formatting of transcripts for LLM inputs
+
+`reformat` writes a "Start: HH:MM:SS - End: HH:MM:SS" header above every segment and drops the speaker labels. With
+the short segments whisperX produces, those headers are a large share of the tokens sent to the LLM. The compact
+format instead
+
+- merges consecutive segments of the same speaker into blocks of up to `max_block_seconds`
+- writes a coarse "[HH:MM:SS SPEAKER_00]" header only when the speaker changes, or every `timestamp_every` seconds
+- strips filler words ("um", "uh", ...)
+
+Example:
+```python
+stats = {}
+text = compact(transcript["segments"], stats=stats)
+print(f"{stats['tokens_before']} -> {stats['tokens_after']} tokens")
+```
+"""
+
+import re
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..summarize_transcription.tokens import count_tokens
+from .reformat_output import reformat_one
+
+DEFAULT_MAX_BLOCK_SECONDS = 60.0
+DEFAULT_TIMESTAMP_EVERY = 120.0
+
+# Only words that carry no meaning wherever they appear ("like" or "so" often do)
+FILLER_WORDS = ("um", "umm", "uh", "uhh", "uhm", "erm", "er", "ah", "hmm", "mm", "mhm")
+
+
+def compact(
+    segments: List[Dict[Any, Any]],
+    max_block_seconds: float = DEFAULT_MAX_BLOCK_SECONDS,
+    timestamp_every: float = DEFAULT_TIMESTAMP_EVERY,
+    filler_words: Optional[Iterable[str]] = FILLER_WORDS,
+    stats: Optional[Dict[str, int]] = None,
+) -> str:
+    """Formats transcript segments compactly, see the module docstring
+
+    Args:
+        segments (List[Dict[Any, Any]]): Transcript segments, each with "start", "end" and "text" keys, and optionally "speaker"
+        max_block_seconds (float, optional): Longest duration of merged consecutive segments of one speaker. Defaults to 60.
+        timestamp_every (float, optional): Seconds after which a header is repeated even if the speaker is the same. Defaults to 120.
+        filler_words (Iterable[str], optional): Words to strip, None or empty keeps every word. Defaults to `FILLER_WORDS`.
+        stats (Dict[str, int], optional): If provided, filled with "tokens_before" (of `reformat`), "tokens_after", "segments_before" and "blocks"
+
+    Returns:
+        str: The compact transcript, one block per line
+    """
+    blocks = compact_blocks(segments, max_block_seconds, filler_words)
+    formatter = CompactFormatter(timestamp_every)
+    text = "\n".join(formatter.format(block) for block in blocks)
+    if stats is not None:
+        stats["tokens_before"] = count_tokens(
+            "\n".join(reformat_one(segment) for segment in segments)
+        )
+        stats["tokens_after"] = count_tokens(text)
+        stats["segments_before"] = len(segments)
+        stats["blocks"] = len(blocks)
+    return text
+
+
+def compact_blocks(
+    segments: List[Dict[Any, Any]],
+    max_block_seconds: float = DEFAULT_MAX_BLOCK_SECONDS,
+    filler_words: Optional[Iterable[str]] = FILLER_WORDS,
+) -> List[Dict[str, Any]]:
+    """Merges consecutive segments of the same speaker (and strips filler words)
+
+    Args:
+        segments (List[Dict[Any, Any]]): Transcript segments, each with "start", "end" and "text" keys, and optionally "speaker"
+        max_block_seconds (float, optional): Longest duration of a block. Defaults to 60.
+        filler_words (Iterable[str], optional): Words to strip. Defaults to `FILLER_WORDS`.
+
+    Returns:
+        List[Dict[str, Any]]: Blocks with "start", "end", "speaker" (None without labels) and "text" keys, blocks left empty by the stripping are dropped
+    """
+    fillers = _filler_pattern(tuple(filler_words or ()))
+    blocks: List[Dict[str, Any]] = []
+    for segment in segments:
+        text = segment.get("text", "")
+        if fillers is not None:
+            text = fillers.sub("", text)
+        # A filler starting a sentence leaves its punctuation behind ("Uh. So" -> ". So")
+        text = " ".join(text.split()).lstrip(",.… ")
+        if not text:
+            continue
+
+        speaker = segment.get("speaker")
+        start = segment.get("start")
+        end = segment.get("end")
+        last = blocks[-1] if blocks else None
+        if (
+            last is not None
+            and last["speaker"] == speaker
+            and (
+                start is None
+                or end is None
+                or last["start"] is None
+                or end - last["start"] <= max_block_seconds
+            )
+        ):
+            last["text"] += " " + text
+            if end is not None:
+                last["end"] = end
+        else:
+            blocks.append(
+                {"start": start, "end": end, "speaker": speaker, "text": text}
+            )
+    return blocks
+
+
+class CompactFormatter:
+    """Formats blocks one at a time, writing a header only at speaker changes or every `timestamp_every` seconds
+
+    Call `reset` before formatting blocks that are read on their own (e.g. the first block of a chunk), so they get
+    a header again.
+
+    Args:
+        timestamp_every (float, optional): Seconds after which a header is repeated. Defaults to 120.
+    """
+
+    def __init__(self, timestamp_every: float = DEFAULT_TIMESTAMP_EVERY):
+        self.timestamp_every = timestamp_every
+        self.reset()
+
+    def reset(self) -> None:
+        self._speaker: Optional[str] = None
+        self._last_header: Optional[float] = None
+        self._started = False
+
+    def format(self, block: Dict[str, Any]) -> str:
+        start = block.get("start")
+        speaker = block.get("speaker")
+        header = (
+            not self._started
+            or speaker != self._speaker
+            or (
+                start is not None
+                and (
+                    self._last_header is None
+                    or start - self._last_header >= self.timestamp_every
+                )
+            )
+        )
+        self._started = True
+        self._speaker = speaker
+        if not header:
+            return block["text"]
+
+        self._last_header = start
+        parts = []
+        if start is not None:
+            parts.append(time.strftime("%H:%M:%S", time.gmtime(start)))
+        if speaker is not None:
+            parts.append(speaker)
+        if not parts:
+            return block["text"]
+        return f"[{' '.join(parts)}] {block['text']}"
+
+
+@lru_cache(maxsize=None)
+def _filler_pattern(words: Tuple[str, ...]) -> Optional["re.Pattern"]:
+    """Matches a filler word with the commas around it ("we, uh, decided" -> "we decided")"""
+    if not words:
+        return None
+    alternatives = "|".join(
+        re.escape(word) for word in sorted(words, key=len, reverse=True)
+    )
+    return re.compile(
+        rf"\s*,?\s*(?<![\w'-])(?:{alternatives})(?![\w'-])(?:\s*,)?", re.IGNORECASE
+    )
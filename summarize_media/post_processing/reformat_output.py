@@ -1,5 +1,6 @@
-from typing import List, Dict, Any
+import sys
 import time
+from typing import Any, Dict, List
 
 
 def reformat(inputs: List[Dict[Any, Any]]):
@@ -7,11 +8,16 @@ def reformat(inputs: List[Dict[Any, Any]]):
     Reformats a list of transcript dictionaries into a single formatted string.
 
     Args:
-        inputs (List[Dict[Any, Any]]): List of dictionaries containing transcript segments,where each dictionary has 'start', 'end', and 'text' keys.
+        inputs (List[Dict[Any, Any]]): List of dictionaries containing transcript segments,where each dictionary has 'start', 'end', and 'text' keys. A `ColumnarTranscript` is formatted with the vectorized `reformat_columnar` instead.
 
     Returns:
         str: A formatted string with all transcript segments, including timestamps and text, separated by newlines.
     """
+    # numpy is only needed (and already imported) when a ColumnarTranscript is passed
+    columnar = sys.modules.get(f"{__package__}.columnar_transcript")
+    if columnar is not None and isinstance(inputs, columnar.ColumnarTranscript):
+        return columnar.reformat_columnar(inputs)
+
     input_list = [reformat_one(input) for input in inputs]
     processed_text = "\n".join(input_list)
     return processed_text
@@ -27,16 +33,14 @@ def reformat_one(input: Dict[Any, Any]):
     Returns:
         str: A formatted string with all transcript segments, including timestamps and text, separated by newlines.
     """
-    formatted_text = ""
+    parts = []
     input_fields = input.keys()
     if "start" in input_fields:
         start_time = time.strftime("%H:%M:%S", time.gmtime(input["start"]))
-        start_string = f"Start: {start_time} - "
-        formatted_text += start_string
+        parts.append(f"Start: {start_time} - ")
     if "end" in input_fields:
         end_time = time.strftime("%H:%M:%S", time.gmtime(input["end"]))
-        end_string = f"End: {end_time}\n"
-        formatted_text += end_string
+        parts.append(f"End: {end_time}\n")
     if "text" in input_fields:
-        formatted_text += input["text"]
-    return formatted_text
+        parts.append(input["text"])
+    return "".join(parts)
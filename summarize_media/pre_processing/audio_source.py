@@ -0,0 +1,183 @@
+"""Memory-mapped access to long .wav files, one window of samples at a time
+
+`whisperx.load_audio` decodes a whole file into one float32 array (about 230 MB per hour at 16 kHz), which stays
+alive through transcription, alignment and diarization. `AudioSource` memory-maps the 16 bit PCM .wav written by
+`convert_to_wav` instead, and converts only the requested window to float32. The pages of a window are released
+once it is read, so the memory used stays proportional to the window rather than to the recording.
+
+Example:
+```python
+with AudioSource(convert_to_wav(path)) as source:
+    for start, end in source.windows(1800, overlap_seconds=30):
+        audio = source.read(start, end)  # 16 kHz mono float32, like `whisperx.load_audio`
+```
+See `summarize_media.transcribe.windowed` to transcribe a source window by window.
+"""
+
+import mmap
+import os
+import struct
+from typing import TYPE_CHECKING, List, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# WAVE_FORMAT_PCM and WAVE_FORMAT_EXTENSIBLE (whose sub format is checked through the sample width)
+_PCM_FORMAT_TAGS = (0x0001, 0xFFFE)
+
+
+class AudioSource:
+    """Read-only view of a 16 bit PCM .wav file, handing out float32 windows on demand
+
+    Args:
+        path (str): Path of the .wav file, e.g. from `convert_to_wav` (pcm_s16le)
+
+    Raises:
+        ValueError: If the file is not a 16 bit PCM .wav file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            (
+                self.sample_rate,
+                self.channels,
+                self._data_offset,
+                data_size,
+            ) = _parse_header(self._file)
+            self._frame_bytes = 2 * self.channels
+            # Headers of streamed files may hold a placeholder size, the data then runs to the end of the file
+            file_size = os.fstat(self._file.fileno()).st_size
+            data_size = min(data_size, file_size - self._data_offset)
+            self.num_samples = max(0, data_size) // self._frame_bytes
+            self._mmap = (
+                mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                if self.num_samples
+                else None
+            )
+        except BaseException:
+            self._file.close()
+            raise
+
+    @property
+    def duration(self) -> float:
+        """Duration of the audio in seconds"""
+        return self.num_samples / self.sample_rate
+
+    def read(self, start: float = 0.0, end: float = None) -> "np.ndarray":
+        """Returns the samples between two timestamps, averaged to mono and scaled to [-1, 1)
+
+        Args:
+            start (float, optional): Start of the window in seconds. Defaults to 0.
+            end (float, optional): End of the window in seconds, clipped to the duration. Defaults to the end of the audio.
+
+        Returns:
+            np.ndarray: float32 samples (a copy, the file is not kept mapped through it)
+        """
+        import numpy as np
+
+        first = min(self.num_samples, max(0, round(start * self.sample_rate)))
+        last = self.num_samples if end is None else round(end * self.sample_rate)
+        last = min(self.num_samples, max(first, last))
+        if last == first:
+            return np.zeros(0, dtype=np.float32)
+
+        byte_start = self._data_offset + first * self._frame_bytes
+        byte_end = self._data_offset + last * self._frame_bytes
+        samples = np.frombuffer(
+            self._mmap,
+            dtype="<i2",
+            count=(last - first) * self.channels,
+            offset=byte_start,
+        ).reshape(-1, self.channels)
+        if self.channels == 1:
+            audio = samples[:, 0].astype(np.float32)
+        else:
+            audio = samples.mean(axis=1, dtype=np.float32)
+        audio /= 32768.0
+        # The view must be gone before the mapping can be closed
+        del samples
+
+        self._release(byte_start, byte_end)
+        return audio
+
+    def windows(
+        self, window_seconds: float, overlap_seconds: float = 0.0
+    ) -> List[Tuple[float, float]]:
+        """Splits the audio into windows of `window_seconds`, each overlapping the previous one by `overlap_seconds`
+
+        Returns:
+            List[Tuple[float, float]]: (start, end) of every window in seconds, covering the whole audio
+        """
+        if overlap_seconds >= window_seconds:
+            raise ValueError(
+                f"overlap_seconds ({overlap_seconds}) must be shorter than window_seconds ({window_seconds})"
+            )
+
+        windows = []
+        start = 0.0
+        while True:
+            end = min(self.duration, start + window_seconds)
+            windows.append((start, end))
+            if end >= self.duration:
+                return windows
+            start = end - overlap_seconds
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self) -> "AudioSource":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"AudioSource({self.path!r}, {self.duration:.1f}s, {self.sample_rate} Hz, {self.channels} channel(s))"
+
+    def _release(self, byte_start: int, byte_end: int) -> None:
+        """Drops the pages of a window that was read from the process, the OS page cache still holds them"""
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        page_start = byte_start - byte_start % mmap.PAGESIZE
+        self._mmap.madvise(mmap.MADV_DONTNEED, page_start, byte_end - page_start)
+
+
+def _parse_header(file) -> Tuple[int, int, int, int]:
+    """Reads the RIFF chunks of a .wav file up to its data chunk
+
+    Returns:
+        Tuple[int, int, int, int]: The sample rate, the number of channels, and the offset and size (in bytes) of the samples
+    """
+    riff = file.read(12)
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+        raise ValueError(f"{file.name} is not a .wav file")
+
+    fmt = None
+    while True:
+        header = file.read(8)
+        if len(header) < 8:
+            raise ValueError(f"{file.name} has no data chunk")
+        chunk_id, size = struct.unpack("<4sI", header)
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", file.read(16))
+            file.seek(size - 16 + size % 2, os.SEEK_CUR)
+        elif chunk_id == b"data":
+            break
+        else:
+            # Chunks are padded to an even size
+            file.seek(size + size % 2, os.SEEK_CUR)
+
+    if fmt is None:
+        raise ValueError(f"{file.name} has no fmt chunk")
+    format_tag, channels, sample_rate, _, _, bits_per_sample = fmt
+    if format_tag not in _PCM_FORMAT_TAGS or bits_per_sample != 16:
+        raise ValueError(
+            f"{file.name} is not 16 bit PCM (format {format_tag:#06x}, {bits_per_sample} bits), "
+            'convert it with convert_to_wav(audio_codec="pcm_s16le")'
+        )
+    return sample_rate, channels, file.tell(), size
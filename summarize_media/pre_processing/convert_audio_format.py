@@ -1,9 +1,20 @@
 """Converts files format using using ffmpeg"""
 
-import subprocess
+import json
 import os
-from typing import Optional
+import subprocess
+import tempfile
 import warnings
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Literal, Optional
+
+from ..cache.artifact_cache import ArtifactCache, hash_file
+from ..instrumentation.stages import file_size, stage
+
+# numpy is only needed for in-memory decoding, plain format conversion stays dependency free
+if TYPE_CHECKING:
+    import numpy as np
 
 SUPPORTED_FORMATS = {
     ".mp3",
@@ -22,6 +33,29 @@ SUPPORTED_FORMATS = {
     ".opus",
 }  # Might be wrong
 
+# PCM codecs supported by the parallel conversion, mapped to their raw ffmpeg format and sample width (in bytes)
+PARALLEL_PCM_CODECS = {
+    "pcm_u8": ("u8", 1),
+    "pcm_s16le": ("s16le", 2),
+    "pcm_s24le": ("s24le", 3),
+    "pcm_s32le": ("s32le", 4),
+}
+
+# Audio decoded before (and after) each time slice, discarded after resampling so the slices join seamlessly
+SLICE_PADDING_SECONDS = 1.0
+
+# Compressed codecs used to shrink audio before uploading it, mapped to their ffmpeg encoder arguments and extension
+UPLOAD_CODECS = {
+    "opus": (["-c:a", "libopus", "-application", "voip"], ".ogg"),
+    "flac": (["-c:a", "flac", "-compression_level", "5"], ".flac"),
+}
+
+# Raw sample formats that can be decoded straight into memory, mapped to their numpy dtypes
+RAW_SAMPLE_FORMATS = {
+    "f32le": "float32",
+    "s16le": "int16",
+}
+
 
 def convert_to_wav(
     input_path: str,
@@ -30,6 +64,9 @@ def convert_to_wav(
     sample_rate: int = 16000,
     audio_codec: str = "pcm_s16le",
     overwrite: bool = True,
+    cache: Optional[ArtifactCache] = None,
+    num_workers: int = 1,
+    min_slice_seconds: float = 300.0,
 ) -> str:
     """Converts the provided audio file to .wav format
 
@@ -40,6 +77,9 @@ def convert_to_wav(
         sample_rate (int, optional): Sample rate for the .wav audio. Defaults to 16000.
         audio_codec (str, optional): Audio codec to use, see [availiable pcm audio codecs](https://trac.ffmpeg.org/wiki/audio%20types) (Append "pcm_" in front). Defaults to "pcm_s16le".
         overwrite (bool, optional): Whether or not to overwrite if a file of the same target name exists. Defaults to True.
+        cache (ArtifactCache, optional): Cache to look the converted file up in (keyed by the content of the input file, the sample rate and the codec), and to store it in after conversion.
+        num_workers (int, optional): Number of ffmpeg processes to convert time slices of the input with in parallel, 0 uses every core. Defaults to 1 (a single ffmpeg call over the whole input).
+        min_slice_seconds (float, optional): Minimum length of a time slice in parallel mode, shorter inputs use fewer workers. Defaults to 300.
 
     Returns:
         str: Path of the converted file
@@ -59,9 +99,44 @@ def convert_to_wav(
         warnings.warn(f"File already exist: {output_path}, reusing it")
         return output_path
 
-    convert_ffmpeg(input_path, output_path, sample_rate, audio_codec, overwrite)
-
-    verify_output(output_path)
+    # Reuse a previous conversion of the same content
+    if cache is not None:
+        cache_key = cache.make_key(
+            "convert",
+            hash_file(input_path),
+            sample_rate=sample_rate,
+            audio_codec=audio_codec,
+        )
+        output_folder, output_file = os.path.split(output_path)
+        if cache.get_file(cache_key, output_folder, output_file) is not None:
+            return output_path
+
+    num_workers = num_workers or os.cpu_count() or 1
+    with stage(
+        "convert_to_wav", bytes_in=file_size(input_path), num_workers=num_workers
+    ) as record:
+        if num_workers > 1 and audio_codec in PARALLEL_PCM_CODECS:
+            convert_ffmpeg_parallel(
+                input_path,
+                output_path,
+                sample_rate,
+                audio_codec,
+                num_workers,
+                min_slice_seconds,
+            )
+        else:
+            if num_workers > 1:
+                warnings.warn(
+                    f"Parallel conversion does not support {audio_codec}, converting serially"
+                )
+            convert_ffmpeg(input_path, output_path, sample_rate, audio_codec, overwrite)
+
+        verify_output(output_path)
+        record.bytes_out = file_size(output_path)
+        record.audio_seconds = _wav_duration(output_path)
+
+    if cache is not None:
+        cache.put_file(cache_key, output_path)
 
     return output_path
 
@@ -166,6 +241,125 @@ def convert_ffmpeg(
         raise RuntimeError(f"FFmpeg execution failed: {str(e)}")
 
 
+def convert_ffmpeg_parallel(
+    input_path: str,
+    output_path: str,
+    sample_rate: int,
+    audio_codec: str,
+    num_workers: int,
+    min_slice_seconds: float = 300.0,
+) -> None:
+    """Converts the input in time slices with several ffmpeg processes and stitches the PCM back into one .wav file
+
+    The slice boundaries are placed on exact output sample indices. Each slice is decoded with some padding on
+    both sides (seeking with `-ss`/ `-t`), resampled, and then trimmed to its exact sample range with `atrim`,
+    so the resampler is warmed up at the boundaries and the slices join without gaps or duplicated samples.
+
+    Args:
+        input_path (str): Path of the input file
+        output_path (str): Path of the output file
+        sample_rate (int): Sample rate for the output file
+        audio_codec (str): PCM codec to use, must be one of `PARALLEL_PCM_CODECS`
+        num_workers (int): Maximum number of ffmpeg processes to run at once
+        min_slice_seconds (float, optional): Minimum length of a time slice. Defaults to 300.
+
+    Raises:
+        RuntimeError: When probing the input fails, or when any of the ffmpeg calls fail
+    """
+    raw_format, sample_width = PARALLEL_PCM_CODECS[audio_codec]
+
+    info = probe_media(input_path)
+    total_samples = round(info["duration"] * sample_rate)
+    channels = info["channels"] or 1
+
+    n_slices = max(1, min(num_workers, int(info["duration"] // min_slice_seconds)))
+    boundaries = [round(i * total_samples / n_slices) for i in range(n_slices + 1)]
+    # The last slice runs to the end of the stream, in case the probed duration is slightly off
+    boundaries[-1] = None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        slice_paths = [
+            os.path.join(temp_dir, f"slice_{i:04d}.{raw_format}")
+            for i in range(n_slices)
+        ]
+
+        # Threads are enough here, the work happens in the ffmpeg subprocesses
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = [
+                executor.submit(
+                    _convert_slice,
+                    input_path,
+                    slice_path,
+                    sample_rate,
+                    raw_format,
+                    boundaries[i],
+                    boundaries[i + 1],
+                )
+                for i, slice_path in enumerate(slice_paths)
+            ]
+            for future in futures:
+                future.result()
+
+        with wave.open(output_path, "wb") as output:
+            output.setnchannels(channels)
+            output.setsampwidth(sample_width)
+            output.setframerate(sample_rate)
+            for slice_path in slice_paths:
+                with open(slice_path, "rb") as file:
+                    while chunk := file.read(1 << 20):
+                        output.writeframesraw(chunk)
+
+
+def _convert_slice(
+    input_path: str,
+    output_path: str,
+    sample_rate: int,
+    raw_format: str,
+    start_sample: int,
+    end_sample: Optional[int],
+) -> None:
+    """Converts the samples [start_sample, end_sample) of the input (at the output sample rate) to raw PCM"""
+    padding = round(SLICE_PADDING_SECONDS * sample_rate)
+    seek_sample = max(0, start_sample - padding)
+    lead_in = start_sample - seek_sample
+
+    trim = f"atrim=start_sample={lead_in}"
+    duration_args = []
+    if end_sample is not None:
+        trim += f":end_sample={lead_in + end_sample - start_sample}"
+        duration_args = [
+            "-t",
+            f"{(end_sample - seek_sample + padding) / sample_rate:.6f}",
+        ]
+
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-ss",
+        f"{seek_sample / sample_rate:.6f}",  # Seek (accurately) to the padded start
+        *duration_args,
+        "-i",
+        input_path,  # Input file
+        "-vn",  # Disable video if present
+        "-af",
+        f"aresample={sample_rate}:resampler=soxr,{trim},asetpts=PTS-STARTPTS",
+        "-f",
+        raw_format,  # Raw samples, the .wav header is written once the slices are stitched
+        "-y",
+        output_path,
+    ]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"FFmpeg conversion failed: {result.stderr}")
+    except subprocess.SubprocessError as e:
+        raise RuntimeError(f"FFmpeg execution failed: {str(e)}")
+
+
 def verify_output(output_path: str) -> None:
     """Verifies that the output file exists and is not empty
 
@@ -181,3 +375,222 @@ def verify_output(output_path: str) -> None:
 
     if os.path.getsize(output_path) == 0:
         raise RuntimeError("Conversion Error: Output file is empty")
+
+
+def convert_to_array(
+    input_path: str,
+    sample_rate: int = 16000,
+    sample_format: Literal["f32le", "s16le"] = "f32le",
+    chunk_size: int = 1 << 20,
+) -> "np.ndarray":
+    """Decodes the provided audio file straight into memory as mono float32 samples (no intermediate .wav file)
+
+    ffmpeg is run once and writes raw samples to stdout, which are read in fixed-size chunks into a buffer
+    preallocated from the probed duration of the input. The result can be passed directly to `get_transcription`.
+
+    Args:
+        input_path (str): Path of the input file
+        sample_rate (int, optional): Sample rate of the decoded audio. Defaults to 16000.
+        sample_format (Literal["f32le", "s16le"], optional): Raw sample format ffmpeg writes to stdout, "s16le" halves the pipe traffic at the cost of precision. Defaults to "f32le".
+        chunk_size (int, optional): Number of bytes read from ffmpeg at a time. Defaults to 1 MiB.
+
+    Raises:
+        ValueError: If the file extension or the sample format is not supported
+        RuntimeError: When the ffmpeg call either fails to start, or results in an error
+
+    Returns:
+        np.ndarray: 1D float32 array of samples in [-1, 1]
+    """
+    import numpy as np
+
+    check_and_reject_format(input_path)
+
+    if sample_format not in RAW_SAMPLE_FORMATS:
+        raise ValueError(f"Sample format not supported: {sample_format}")
+    dtype = np.dtype(RAW_SAMPLE_FORMATS[sample_format])
+
+    # Preallocate from the probed duration (with some headroom), the buffer is grown if the estimate is short
+    try:
+        duration = probe_media(input_path)["duration"]
+    except RuntimeError:
+        duration = 0.0
+    buffer = np.empty(int(duration * sample_rate * 1.01) + sample_rate, dtype=dtype)
+
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        input_path,  # Input file
+        "-vn",  # Disable video if present
+        "-ac",
+        "1",  # Downmix to mono
+        "-ar",
+        str(sample_rate),  # Sample rate
+        "-af",
+        "aresample=resampler=soxr",
+        "-f",
+        sample_format,  # Raw samples
+        "-",  # Write to stdout
+    ]
+
+    # stderr goes to a file rather than a second pipe, ffmpeg would block on a full stderr pipe while stdout is read
+    stderr_file = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+    except (OSError, subprocess.SubprocessError) as e:
+        stderr_file.close()
+        raise RuntimeError(f"FFmpeg execution failed: {str(e)}")
+
+    n_bytes = 0
+    with process, stderr_file:
+        while True:
+            raw = buffer.view(np.uint8)
+            if n_bytes + chunk_size > raw.size:
+                buffer = np.resize(buffer, int(buffer.size * 1.5) + chunk_size)
+                raw = buffer.view(np.uint8)
+            n_read = process.stdout.readinto(
+                memoryview(raw)[n_bytes : n_bytes + chunk_size]
+            )
+            if not n_read:
+                break
+            n_bytes += n_read
+        process.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode(errors="replace")
+
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg conversion failed: {stderr}")
+
+    samples = buffer[: n_bytes // dtype.itemsize]
+    if dtype == np.int16:
+        return samples.astype(np.float32) / 32768.0
+    # A copy, so the headroom of the buffer is freed instead of being kept alive by a view
+    return samples.copy()
+
+
+def probe_media(input_path: str) -> dict:
+    """Probes the first audio stream of a file with ffprobe
+
+    Args:
+        input_path (str): Path of the input file
+
+    Raises:
+        RuntimeError: When the ffprobe call either fails to start, or results in an error
+
+    Returns:
+        dict: "duration" (seconds), "sample_rate" and "channels" of the audio stream
+    """
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "a:0",
+        "-show_entries",
+        "stream=sample_rate,channels,duration:format=duration",
+        "-of",
+        "json",
+        input_path,
+    ]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        raise RuntimeError(f"FFprobe execution failed: {str(e)}")
+
+    if result.returncode != 0:
+        raise RuntimeError(f"FFprobe failed: {result.stderr}")
+
+    info = json.loads(result.stdout)
+    streams = info.get("streams") or [{}]
+    stream = streams[0]
+
+    # Containers don't always report the stream duration, fall back to the container duration
+    duration = stream.get("duration") or info.get("format", {}).get("duration") or 0
+    return {
+        "duration": float(duration),
+        "sample_rate": int(stream.get("sample_rate") or 0),
+        "channels": int(stream.get("channels") or 0),
+    }
+
+
+def encode_for_upload(
+    input_path: str,
+    output_path: Optional[str] = None,
+    codec: Literal["opus", "flac"] = "opus",
+    bitrate: str = "32k",
+    sample_rate: int = 16000,
+) -> str:
+    """Re-encodes audio to a compact mono format before uploading it (e.g. for cloud transcription)
+
+    A 16 kHz PCM .wav file is ~115 MB per hour, the same audio is ~14 MB per hour as 32 kbps Opus (lossy, but
+    transparent enough for speech recognition) and roughly half the .wav size as FLAC (lossless).
+
+    Args:
+        input_path (str): Path of the input file
+        output_path (str, optional): Path of the output file, defaults to the input path with the extension of the codec
+        codec (Literal["opus", "flac"], optional): Codec to encode with. Defaults to "opus".
+        bitrate (str, optional): Target bitrate of lossy codecs. Defaults to "32k".
+        sample_rate (int, optional): Sample rate of the output, Opus supports 8/ 12/ 16/ 24/ 48 kHz. Defaults to 16000.
+
+    Raises:
+        ValueError: If the file extension or the codec is not supported
+        RuntimeError: When the ffmpeg call either fails to start, or results in an error
+
+    Returns:
+        str: Path of the encoded file
+    """
+    check_and_reject_format(input_path)
+
+    if codec not in UPLOAD_CODECS:
+        raise ValueError(f"Codec not supported: {codec}")
+    codec_args, extension = UPLOAD_CODECS[codec]
+
+    if output_path is None:
+        output_path = os.path.splitext(input_path)[0] + extension
+
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        input_path,  # Input file
+        "-vn",  # Disable video if present
+        "-ac",
+        "1",  # Downmix to mono
+        "-ar",
+        str(sample_rate),  # Sample rate
+        *codec_args,
+        *(["-b:a", bitrate] if codec == "opus" else []),
+        "-y",
+        output_path,
+    ]
+
+    with stage(
+        "encode_for_upload", bytes_in=file_size(input_path), codec=codec
+    ) as record:
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"FFmpeg encoding failed: {result.stderr}")
+        except subprocess.SubprocessError as e:
+            raise RuntimeError(f"FFmpeg execution failed: {str(e)}")
+
+        verify_output(output_path)
+        record.bytes_out = file_size(output_path)
+
+    return output_path
+
+
+def _wav_duration(path: str) -> Optional[float]:
+    """Returns the duration (in seconds) of a .wav file from its header, or None if it cannot be read"""
+    try:
+        with wave.open(path, "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return None
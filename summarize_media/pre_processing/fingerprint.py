@@ -0,0 +1,128 @@
+"""Compact acoustic fingerprints of audio, robust to re-encoding, resampling and trimming
+
+The same content is often uploaded several times (e.g. to YouTube and Bilibili) in different containers and
+bitrates, with intros cut or added, so the bytes (and their hash) differ. The fingerprints here follow Haitsma and
+Kalker ("A Highly Robust Audio Fingerprinting System"): the audio is cut into overlapping frames, the energy of
+every frame is measured in 33 logarithmically spaced bands between 300 and 2000 Hz, and every frame gets a 32 bit
+sub-fingerprint whose bits are the signs of the energy differences across neighbouring bands and frames. Lossy
+encoders rarely flip those signs, so two copies of the same audio have sub-fingerprints that differ in few bits
+(see `bit_error_rate`), while unrelated audio differs in about half of them.
+
+Example:
+```python
+audio_fingerprint = fingerprint_file(convert_to_wav(path))  # One uint32 every 32 ms
+```
+See `summarize_media.cache.fingerprint_index` to look fingerprints up among previously transcribed files.
+"""
+
+import wave
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# The audio is analysed at 8 kHz, the bands only go up to 2 kHz
+FINGERPRINT_SAMPLE_RATE = 8000
+FRAME_SIZE = 2048  # 256 ms
+HOP_SIZE = 256  # 32 ms, i.e. 8 overlapping frames
+FRAMES_PER_SECOND = FINGERPRINT_SAMPLE_RATE / HOP_SIZE
+
+BAND_RANGE = (300.0, 2000.0)
+NUM_BANDS = 33
+
+# Number of frames analyzed at a time, bounds the memory used by the spectra of long recordings
+_FRAMES_PER_BLOCK = 8192
+
+
+def fingerprint(audio: "np.ndarray", sample_rate: int = 16000) -> "np.ndarray":
+    """Computes the sub-fingerprints of mono audio
+
+    Args:
+        audio (np.ndarray): Mono float32 samples, e.g. from `convert_to_array` or `whisperx.load_audio`
+        sample_rate (int, optional): Sample rate of the audio. Defaults to 16000.
+
+    Returns:
+        np.ndarray: One uint32 sub-fingerprint per frame (every `HOP_SIZE / FINGERPRINT_SAMPLE_RATE` seconds), empty if the audio is shorter than a frame
+    """
+    import numpy as np
+
+    audio = _resample(np.asarray(audio, dtype=np.float32), sample_rate)
+    if len(audio) < FRAME_SIZE + HOP_SIZE:
+        return np.zeros(0, dtype=np.uint32)
+
+    # Band edges as rfft bins, the band energies are the sums of the power spectrum between consecutive edges
+    frequencies = np.geomspace(*BAND_RANGE, NUM_BANDS + 1)
+    edges = np.round(frequencies * FRAME_SIZE / FINGERPRINT_SAMPLE_RATE).astype(int)
+
+    n_frames = 1 + (len(audio) - FRAME_SIZE) // HOP_SIZE
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(audio, FRAME_SIZE)[::HOP_SIZE]
+    energy = np.empty((n_frames, NUM_BANDS), dtype=np.float32)
+    for start in range(0, n_frames, _FRAMES_PER_BLOCK):
+        block = frames[start : start + _FRAMES_PER_BLOCK] * window
+        power = np.abs(np.fft.rfft(block, axis=1)) ** 2
+        energy[start : start + len(block)] = np.add.reduceat(
+            power[:, : edges[-1]], edges[:-1], axis=1
+        )
+
+    # Bit m of frame n: sign of the band difference (m, m + 1), minus the same difference in the previous frame
+    band_difference = energy[:, :-1] - energy[:, 1:]
+    bits = (band_difference[1:] - band_difference[:-1]) > 0
+    packed = np.packbits(bits, axis=1, bitorder="little")
+    return np.ascontiguousarray(packed).view("<u4").ravel().astype(np.uint32)
+
+
+def fingerprint_file(file_path: str) -> "np.ndarray":
+    """Fingerprints an audio file, .wav files written by `convert_to_wav` are read directly, anything else is decoded with ffmpeg"""
+    import numpy as np
+
+    try:
+        with wave.open(file_path, "rb") as wav:
+            if wav.getsampwidth() == 2:
+                sample_rate = wav.getframerate()
+                channels = wav.getnchannels()
+                samples = np.frombuffer(
+                    wav.readframes(wav.getnframes()), dtype="<i2"
+                ).reshape(-1, channels)
+                audio = samples.mean(axis=1, dtype=np.float32) / 32768.0
+                return fingerprint(audio, sample_rate)
+    except (wave.Error, EOFError):
+        pass
+
+    from .convert_audio_format import convert_to_array
+
+    return fingerprint(
+        convert_to_array(file_path, sample_rate=FINGERPRINT_SAMPLE_RATE),
+        FINGERPRINT_SAMPLE_RATE,
+    )
+
+
+def bit_error_rate(a: "np.ndarray", b: "np.ndarray") -> float:
+    """Fraction of the bits that differ between two aligned runs of sub-fingerprints of the same length
+
+    Copies of the same audio typically stay under 0.2 (depending on the encoding), unrelated audio is around 0.5.
+    """
+    import numpy as np
+
+    if len(a) == 0:
+        return 1.0
+    differing = np.unpackbits(np.bitwise_xor(a, b).view(np.uint8)).sum()
+    return float(differing) / (32 * len(a))
+
+
+def _resample(audio: "np.ndarray", sample_rate: int) -> "np.ndarray":
+    """Brings the audio to `FINGERPRINT_SAMPLE_RATE`, by averaging groups of samples for integer ratios (e.g. from 16 kHz)"""
+    import numpy as np
+
+    if sample_rate == FINGERPRINT_SAMPLE_RATE:
+        return audio
+    if sample_rate % FINGERPRINT_SAMPLE_RATE == 0:
+        factor = sample_rate // FINGERPRINT_SAMPLE_RATE
+        usable = len(audio) - len(audio) % factor
+        return audio[:usable].reshape(-1, factor).mean(axis=1)
+
+    duration = len(audio) / sample_rate
+    times = np.arange(int(duration * FINGERPRINT_SAMPLE_RATE)) / FINGERPRINT_SAMPLE_RATE
+    return np.interp(times, np.arange(len(audio)) / sample_rate, audio).astype(
+        np.float32
+    )
@@ -0,0 +1,333 @@
+"""Trims silence and non-speech (e.g. music) from audio before transcription
+
+A lightweight CPU voice activity detector runs over the PCM, non-speech regions longer than `min_silence` are
+cut down to `keep_silence`, and an `OffsetMap` records where every kept region came from, so the timestamps of
+the transcript of the trimmed audio can be mapped back to the original timeline.
+
+Example:
+```python
+audio = convert_to_array(path)
+trimmed, offset_map = trim_non_speech(audio)
+transcript = get_transcription(trimmed, offset_map=offset_map)  # timestamps on the original timeline
+
+# For cloud transcription, trim the .wav file instead
+trimmed_path, offset_map = trim_wav(convert_to_wav(path))
+transcript = get_transcribe_cloud(open(trimmed_path, "rb"), offset_map=offset_map)
+```
+"""
+
+import bisect
+import copy
+import logging
+import os
+import wave
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FRAME_SECONDS = 0.03
+HOP_SECONDS = 0.01
+
+# Frequency band carrying most of the energy of speech
+SPEECH_BAND = (300.0, 3400.0)
+
+# Number of frames analyzed at a time, bounds the memory used by the spectra of long recordings
+_FRAMES_PER_BLOCK = 8192
+
+
+class OffsetMap:
+    """Maps timestamps of trimmed audio back to the original timeline
+
+    The trimmed audio is the concatenation of the kept regions of the original audio. A region starting at
+    `trimmed_starts[i]` in the trimmed audio starts at `original_starts[i]` in the original audio.
+
+    Args:
+        trimmed_starts (List[float]): Start of each kept region in the trimmed audio (seconds, ascending)
+        original_starts (List[float]): Start of each kept region in the original audio (seconds)
+        original_duration (float): Duration of the original audio in seconds
+        trimmed_duration (float): Duration of the trimmed audio in seconds
+    """
+
+    def __init__(
+        self,
+        trimmed_starts: List[float],
+        original_starts: List[float],
+        original_duration: float,
+        trimmed_duration: float,
+    ):
+        self.trimmed_starts = list(trimmed_starts)
+        self.original_starts = list(original_starts)
+        self.original_duration = original_duration
+        self.trimmed_duration = trimmed_duration
+
+    @property
+    def removed_seconds(self) -> float:
+        return self.original_duration - self.trimmed_duration
+
+    @property
+    def removed_ratio(self) -> float:
+        """Fraction of the original audio that was removed"""
+        if not self.original_duration:
+            return 0.0
+        return self.removed_seconds / self.original_duration
+
+    def to_original(self, t: float, is_end: bool = False) -> float:
+        """Maps a timestamp of the trimmed audio to the original timeline
+
+        Args:
+            t (float): Timestamp in the trimmed audio (seconds)
+            is_end (bool, optional): Whether `t` ends an interval, a timestamp on the boundary between two regions then maps to the end of the earlier region rather than the start of the later one. Defaults to False.
+
+        Returns:
+            float: Timestamp in the original audio (seconds)
+        """
+        if not self.trimmed_starts:
+            return t
+        bisect_fn = bisect.bisect_left if is_end else bisect.bisect_right
+        index = max(0, bisect_fn(self.trimmed_starts, t) - 1)
+        return self.original_starts[index] + (t - self.trimmed_starts[index])
+
+    def remap_segments(self, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Returns a copy of the segments (and their words) with "start"/ "end" mapped to the original timeline"""
+        remapped = copy.deepcopy(segments)
+        for segment in remapped:
+            self._remap_item(segment)
+            for word in segment.get("words", []) or []:
+                self._remap_item(word)
+        return remapped
+
+    def remap_transcript(self, transcript: Any) -> Any:
+        """Maps a transcript to the original timeline
+
+        Accepts the outputs of `get_transcription` (a list of segments, or a dict with "segments" and
+        "word_segments") and of `get_transcribe_cloud` (a dict with "segments").
+        """
+        if isinstance(transcript, list):
+            return self.remap_segments(transcript)
+
+        remapped = dict(transcript)
+        if "segments" in remapped:
+            remapped["segments"] = self.remap_segments(remapped["segments"])
+        if "word_segments" in remapped:
+            remapped["word_segments"] = self.remap_segments(remapped["word_segments"])
+        return remapped
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trimmed_starts": self.trimmed_starts,
+            "original_starts": self.original_starts,
+            "original_duration": self.original_duration,
+            "trimmed_duration": self.trimmed_duration,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "OffsetMap":
+        return cls(**data)
+
+    def _remap_item(self, item: Dict[str, Any]) -> None:
+        if item.get("start") is not None:
+            item["start"] = round(self.to_original(item["start"]), 3)
+        if item.get("end") is not None:
+            item["end"] = round(self.to_original(item["end"], is_end=True), 3)
+
+
+def detect_speech(
+    audio: "np.ndarray",
+    sample_rate: int = 16000,
+    threshold_db: float = 12.0,
+    min_band_ratio: float = 0.4,
+) -> "np.ndarray":
+    """Frame level voice activity detection
+
+    A frame (30 ms, every 10 ms) is marked as speech if its energy is `threshold_db` above the noise floor
+    (estimated as the 10th percentile of the frame energies) and at least `min_band_ratio` of its energy lies in
+    the speech band (300-3400 Hz), which rejects most music and broadband noise.
+
+    Args:
+        audio (np.ndarray): Mono float32 samples
+        sample_rate (int, optional): Sample rate of the audio. Defaults to 16000.
+        threshold_db (float, optional): Minimum energy above the noise floor of a speech frame in dB. Defaults to 12.
+        min_band_ratio (float, optional): Minimum fraction of the energy of a speech frame in the speech band. Defaults to 0.4.
+
+    Returns:
+        np.ndarray: Boolean speech flag of every frame, frame `i` starts at sample `i * hop`
+    """
+    import numpy as np
+
+    frame = int(FRAME_SECONDS * sample_rate)
+    hop = int(HOP_SECONDS * sample_rate)
+    if len(audio) < frame:
+        return np.zeros(0, dtype=bool)
+
+    n_frames = 1 + (len(audio) - frame) // hop
+    window = np.hanning(frame).astype(np.float32)
+    frequencies = np.fft.rfftfreq(frame, 1 / sample_rate)
+    in_band = (frequencies >= SPEECH_BAND[0]) & (frequencies <= SPEECH_BAND[1])
+
+    energy_db = np.empty(n_frames, dtype=np.float32)
+    band_ratio = np.empty(n_frames, dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(audio, frame)[::hop]
+    for start in range(0, n_frames, _FRAMES_PER_BLOCK):
+        block = frames[start : start + _FRAMES_PER_BLOCK] * window
+        power = np.abs(np.fft.rfft(block, axis=1)) ** 2
+        total = power.sum(axis=1) + 1e-12
+        energy_db[start : start + len(block)] = 10 * np.log10(total)
+        band_ratio[start : start + len(block)] = power[:, in_band].sum(axis=1) / total
+
+    noise_floor = np.percentile(energy_db, 10)
+    return (energy_db > noise_floor + threshold_db) & (band_ratio >= min_band_ratio)
+
+
+def speech_regions(
+    speech: "np.ndarray",
+    sample_rate: int,
+    n_samples: int,
+    min_silence: float = 1.0,
+    keep_silence: float = 0.3,
+    min_speech: float = 0.1,
+) -> List[Tuple[int, int]]:
+    """Turns frame level speech flags into the (start, end) sample ranges to keep
+
+    Speech runs shorter than `min_speech` are dropped, the rest are padded by `keep_silence / 2` on both sides,
+    and regions separated by less than `min_silence` are merged (short pauses are left untouched).
+    """
+    import numpy as np
+
+    hop = int(HOP_SECONDS * sample_rate)
+    frame = int(FRAME_SECONDS * sample_rate)
+    padding = int(keep_silence / 2 * sample_rate)
+
+    # Edges of the speech runs
+    flags = np.concatenate(([False], speech, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(flags))
+    run_starts, run_ends = edges[::2], edges[1::2]
+
+    regions: List[Tuple[int, int]] = []
+    for run_start, run_end in zip(run_starts, run_ends):
+        start = int(run_start) * hop
+        end = int(run_end - 1) * hop + frame
+        if end - start < min_speech * sample_rate:
+            continue
+        start, end = max(0, start - padding), min(n_samples, end + padding)
+        if regions and start - regions[-1][1] < min_silence * sample_rate:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def trim_non_speech(
+    audio: "np.ndarray",
+    sample_rate: int = 16000,
+    min_silence: float = 1.0,
+    keep_silence: float = 0.3,
+    threshold_db: float = 12.0,
+    min_band_ratio: float = 0.4,
+) -> Tuple["np.ndarray", OffsetMap]:
+    """Removes the non-speech regions of the audio, keeping an offset map back to the original timeline
+
+    Args:
+        audio (np.ndarray): Samples, either mono of shape (n_samples,) or of shape (n_samples, channels)
+        sample_rate (int, optional): Sample rate of the audio. Defaults to 16000.
+        min_silence (float, optional): Only non-speech regions longer than this (in seconds) are trimmed. Defaults to 1.
+        keep_silence (float, optional): Amount of each trimmed region that is kept (in seconds), so words are not clipped and pauses stay audible. Defaults to 0.3.
+        threshold_db (float, optional): See `detect_speech`. Defaults to 12.
+        min_band_ratio (float, optional): See `detect_speech`. Defaults to 0.4.
+
+    Returns:
+        Tuple[np.ndarray, OffsetMap]: The trimmed audio and the offset map
+    """
+    regions, offset_map = find_kept_regions(
+        audio, sample_rate, min_silence, keep_silence, threshold_db, min_band_ratio
+    )
+    return _concatenate(audio, regions), offset_map
+
+
+def find_kept_regions(
+    audio: "np.ndarray",
+    sample_rate: int = 16000,
+    min_silence: float = 1.0,
+    keep_silence: float = 0.3,
+    threshold_db: float = 12.0,
+    min_band_ratio: float = 0.4,
+) -> Tuple[List[Tuple[int, int]], OffsetMap]:
+    """Finds the (start, end) sample ranges of the audio to keep, see `trim_non_speech` for the arguments"""
+    import numpy as np
+
+    mono = audio if audio.ndim == 1 else audio.mean(axis=1)
+    mono = mono.astype(np.float32, copy=False)
+    speech = detect_speech(mono, sample_rate, threshold_db, min_band_ratio)
+    regions = speech_regions(speech, sample_rate, len(mono), min_silence, keep_silence)
+
+    trimmed_starts, original_starts = [], []
+    position = 0
+    for start, end in regions:
+        trimmed_starts.append(position / sample_rate)
+        original_starts.append(start / sample_rate)
+        position += end - start
+
+    offset_map = OffsetMap(
+        trimmed_starts,
+        original_starts,
+        original_duration=len(mono) / sample_rate,
+        trimmed_duration=position / sample_rate,
+    )
+    logger.info(
+        f"Trimmed {offset_map.removed_seconds:.1f}s of non-speech audio "
+        f"({offset_map.removed_ratio:.1%} of {offset_map.original_duration:.1f}s)"
+    )
+    return regions, offset_map
+
+
+def trim_wav(
+    input_path: str, output_path: Optional[str] = None, **trim_args: Any
+) -> Tuple[str, OffsetMap]:
+    """Trims the non-speech regions of a PCM .wav file (e.g. the output of `convert_to_wav`)
+
+    Args:
+        input_path (str): Path of the input .wav file (8/ 16/ 32 bit PCM)
+        output_path (str, optional): Path of the trimmed file, defaults to the input path with a " - trimmed" suffix
+        trim_args: Arguments of `trim_non_speech`
+
+    Returns:
+        Tuple[str, OffsetMap]: Path of the trimmed file and the offset map
+    """
+    import numpy as np
+
+    dtypes = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+    with wave.open(input_path, "rb") as wav:
+        params = wav.getparams()
+        if params.sampwidth not in dtypes:
+            raise ValueError(f"Unsupported sample width: {params.sampwidth} bytes")
+        samples = np.frombuffer(
+            wav.readframes(params.nframes), dtype=dtypes[params.sampwidth]
+        ).reshape(-1, params.nchannels)
+
+    # Detection runs on float samples, the original integer samples are written back untouched
+    audio = samples.astype(np.float32)
+    if samples.dtype == np.uint8:
+        audio -= 128
+    regions, offset_map = find_kept_regions(audio, params.framerate, **trim_args)
+
+    if output_path is None:
+        base_name, extension = os.path.splitext(input_path)
+        output_path = base_name + " - trimmed" + extension
+
+    with wave.open(output_path, "wb") as wav:
+        wav.setparams(params)
+        for start, end in regions:
+            wav.writeframes(samples[start:end].tobytes())
+
+    return output_path, offset_map
+
+
+def _concatenate(audio: "np.ndarray", regions: List[Tuple[int, int]]) -> "np.ndarray":
+    import numpy as np
+
+    if not regions:
+        return audio[:0]
+    return np.concatenate([audio[start:end] for start, end in regions])
@@ -1,19 +1,51 @@
 # "Normal" text response
-from typing import Any, Dict, List, Union
+import asyncio
+import email.utils
+import logging
+import random
+import sys
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from groq import Groq
-from openai import OpenAI
-from ratelimit import limits, sleep_and_retry
+from .rate_limit import (
+    AsyncRateLimiter,
+    RateLimiter,
+    get_rate_limiter,
+    get_sync_rate_limiter,
+)
+from .tokens import count_tokens
+
+# The client libraries are only needed for the type hints, the clients are created by the callers
+if TYPE_CHECKING:
+    from groq import AsyncGroq, Groq
+    from openai import AsyncOpenAI, OpenAI
+
+    from ..cache.response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+# Completion tokens assumed for rate limiting when the request doesn't set "max_tokens"
+DEFAULT_COMPLETION_TOKENS = 1024
 
 
-@sleep_and_retry
-@limits(calls=1, period=0.5)
 def get_response(
     messages: List[dict],
-    client: Union[Groq, OpenAI],
+    client: Union["Groq", "OpenAI"],
     client_args: Dict[str, Any],
     kept_keys: List[str] = None,
     discard_keys: List[str] = None,
+    cache: Optional["ResponseCache"] = None,
+    rate_limiter: Optional[RateLimiter] = None,
     **kwargs,
 ):
     """Gets a text response from llm client
@@ -33,13 +65,201 @@ def get_response(
         client_args (dict): arguments to supply to the llm client
         kept_keys (List[str], optional): A list of keys to keep. If not provided, keeps the "role" and "content" keys only, if argument `discard_keys` is also provided, the behavior of this argument will be over-ridden and not take effect
         discard_keys (List[str], optional): A List of keys to discard. Overrides behavior of `keep_keys`
+        cache (ResponseCache, optional): Cache to look the response up in before sending the request (see `summarize_media.cache.response_cache`), cache hits don't count against the rate limit
+        rate_limiter (RateLimiter, optional): Limiter to use, if not provided, the client's default limiter (120 requests per minute, see `get_sync_rate_limiter`) is used
 
     Returns:
         dict: A dictionary containing the response
     """
-    response = client.chat.completions.create(messages=messages, **client_args)
-    response_dict = dict(response.choices[0].message)
+    rate_limiter = (
+        rate_limiter if rate_limiter is not None else get_sync_rate_limiter(client)
+    )
+
+    if cache is None or not cache.is_cacheable(client_args):
+        if cache is not None:
+            cache.record_bypass()
+        response = _create_completion(messages, client, client_args, rate_limiter)
+        return _filter_keys(dict(response.choices[0].message), kept_keys, discard_keys)
+
+    def call() -> Tuple[Dict[str, Any], int]:
+        response = _create_completion(messages, client, client_args, rate_limiter)
+        return _message_dict(response.choices[0].message), _total_tokens(response)
+
+    key = cache.make_key(str(client.base_url), messages, client_args)
+    return _filter_keys(cache.get_or_call(key, call), kept_keys, discard_keys)
+
+
+def _create_completion(
+    messages: List[dict],
+    client: Union["Groq", "OpenAI"],
+    client_args: Dict[str, Any],
+    rate_limiter: RateLimiter,
+) -> Any:
+    """Sends a chat completion request, rate limited per client"""
+    with rate_limiter.slot():
+        return client.chat.completions.create(messages=messages, **client_args)
+
 
+def get_response_stream(
+    messages: List[dict],
+    client: Union["Groq", "OpenAI"],
+    client_args: Dict[str, Any],
+    cache: Optional["ResponseCache"] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    **kwargs,
+) -> Iterator[str]:
+    """Streams a text response from llm client, yielding the content as it is generated
+
+    The request is sent (and counted against the rate limit) when the iteration starts, not when this is called.
+
+    Example:
+    ```python
+    for delta in get_response_stream(messages, client=OpenAI_client, client_args=client_args):
+        print(delta, end="", flush=True)
+    ```
+
+    Args:
+        messages (List[dict]): The conversation history, see `get_response`
+        client (Union[Groq, OpenAI]): llm client to be used
+        client_args (dict): arguments to supply to the llm client
+        cache (ResponseCache, optional): Cache to look the response up in, see `get_response`. A hit is yielded as a single piece, a fully consumed stream is stored (shared with `get_response`, the "stream" argument is not part of the key).
+        rate_limiter (RateLimiter, optional): Limiter to use, see `get_response`. Only the start of the stream takes a slot.
+
+    Yields:
+        str: The pieces of the response content, in order
+    """
+    key = None
+    if cache is not None:
+        if cache.is_cacheable(client_args):
+            key = cache.make_key(str(client.base_url), messages, client_args)
+            cached = cache.get(key)
+            if cached is not None:
+                if cached.get("content"):
+                    yield cached["content"]
+                return
+        else:
+            cache.record_bypass()
+
+    rate_limiter = (
+        rate_limiter if rate_limiter is not None else get_sync_rate_limiter(client)
+    )
+    with rate_limiter.slot():
+        stream = client.chat.completions.create(
+            messages=messages, stream=True, **client_args
+        )
+
+    pieces = []
+    for piece in _stream_content(stream):
+        pieces.append(piece)
+        yield piece
+    if key is not None:
+        cache.put(key, {"role": "assistant", "content": "".join(pieces)})
+
+
+async def get_response_async(
+    messages: List[dict],
+    client: Union["AsyncGroq", "AsyncOpenAI"],
+    client_args: Dict[str, Any],
+    kept_keys: List[str] = None,
+    discard_keys: List[str] = None,
+    rate_limiter: Optional[AsyncRateLimiter] = None,
+    cache: Optional["ResponseCache"] = None,
+    max_retries: int = 5,
+    backoff_base: float = 1.0,
+    backoff_max: float = 60.0,
+    **kwargs,
+):
+    """Gets a text response from an async llm client, with per-client rate limiting and retries
+
+    Unlike `get_response`, requests are not serialized behind a global limiter: each client has its own limiter
+    on requests per minute, tokens per minute and concurrent requests (see `get_rate_limiter`). Rate limited (429)
+    and server error (5xx) responses are retried with exponential backoff, honoring the "Retry-After" header.
+    Consider creating the client with `max_retries=0`, so retries are not stacked on the client's own.
+
+    Example:
+    ```python
+    client = AsyncOpenAI(base_url="http://localhost:8000/v1", api_key="...", max_retries=0)
+    limiter = get_rate_limiter(client, requests_per_minute=120, tokens_per_minute=200_000, max_concurrency=16)
+
+    responses = await asyncio.gather(
+        *(get_response_async(messages, client, client_args, rate_limiter=limiter) for messages in conversations)
+    )
+    ```
+
+    Args:
+        messages (List[dict]): The conversation history, each message (dictionary) in the list must have fields "role" and "content"
+        client (Union[AsyncGroq, AsyncOpenAI]): async llm client to be used
+        client_args (dict): arguments to supply to the llm client
+        kept_keys (List[str], optional): A list of keys to keep, see `get_response`
+        discard_keys (List[str], optional): A List of keys to discard, see `get_response`
+        rate_limiter (AsyncRateLimiter, optional): Limiter to use, if not provided, the client's default limiter is used
+        cache (ResponseCache, optional): Cache to look the response up in before sending the request, see `get_response`. Concurrent identical requests share one call.
+        max_retries (int, optional): Maximum number of retries on rate limits, server and connection errors. Defaults to 5.
+        backoff_base (float, optional): Delay before the first retry (in seconds) when the server doesn't send "Retry-After", doubled on every retry. Defaults to 1.
+        backoff_max (float, optional): Maximum delay between retries in seconds. Defaults to 60.
+
+    Returns:
+        dict: A dictionary containing the response
+    """
+    rate_limiter = (
+        rate_limiter if rate_limiter is not None else get_rate_limiter(client)
+    )
+
+    prompt_tokens = sum(
+        count_tokens(str(message.get("content") or "")) for message in messages
+    )
+    estimated_tokens = prompt_tokens + client_args.get(
+        "max_tokens", DEFAULT_COMPLETION_TOKENS
+    )
+
+    async def create_completion() -> Any:
+        for attempt in range(max_retries + 1):
+            try:
+                async with rate_limiter.slot(estimated_tokens):
+                    response = await client.chat.completions.create(
+                        messages=messages, **client_args
+                    )
+            except Exception as e:
+                if attempt == max_retries or not _is_retryable(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(
+                        backoff_max, backoff_base * 2**attempt
+                    ) * random.uniform(0.5, 1.0)
+                else:
+                    # Every request of the client waits for the server mandated delay
+                    rate_limiter.cool_down(delay)
+                logger.warning(f"LLM request failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            usage = getattr(response, "usage", None)
+            rate_limiter.settle(estimated_tokens, getattr(usage, "total_tokens", None))
+            return response
+
+    if cache is None or not cache.is_cacheable(client_args):
+        if cache is not None:
+            cache.record_bypass()
+        response = await create_completion()
+        return _filter_keys(dict(response.choices[0].message), kept_keys, discard_keys)
+
+    async def call() -> Tuple[Dict[str, Any], int]:
+        response = await create_completion()
+        return _message_dict(response.choices[0].message), _total_tokens(response)
+
+    key = cache.make_key(str(client.base_url), messages, client_args)
+    return _filter_keys(
+        await cache.get_or_call_async(key, call), kept_keys, discard_keys
+    )
+
+
+def _filter_keys(
+    response_dict: Dict[str, Any],
+    kept_keys: Optional[List[str]],
+    discard_keys: Optional[List[str]],
+) -> Dict[str, Any]:
+    """Keeps/ discards keys of a response message, see `get_response`"""
     kept_keys = kept_keys if kept_keys else ["role", "content"]
     if discard_keys is not None:
         for key in discard_keys:
@@ -51,3 +271,64 @@ def get_response(
         response_dict = kept_keys_dict
 
     return response_dict
+
+
+def _message_dict(message: Any) -> Dict[str, Any]:
+    """JSON serializable dict of a response message, as stored in the response cache"""
+    if hasattr(message, "model_dump"):
+        return message.model_dump(exclude_none=True)
+    return dict(message)
+
+
+def _total_tokens(response: Any) -> int:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) or 0
+
+
+def _stream_content(stream: Iterable[Any]) -> Iterator[str]:
+    """Yields the content deltas of a streamed chat completion, skipping empty chunks (e.g. the final usage chunk)"""
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether a request error is transient: rate limits, server errors, timeouts and connection errors"""
+    # Only the libraries of the clients in use are loaded (the error came from one of them)
+    for module_name in ("openai", "groq"):
+        module = sys.modules.get(module_name)
+        if module is not None and isinstance(error, module.APIConnectionError):
+            return True
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and (
+        status_code in (408, 409, 429) or status_code >= 500
+    )
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Reads the delay (in seconds) requested by the server through the "retry-after(-ms)" headers, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    if (retry_after_ms := headers.get("retry-after-ms")) is not None:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    # The header can also be an HTTP date
+    try:
+        date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
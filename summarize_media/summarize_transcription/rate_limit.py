@@ -0,0 +1,272 @@
+"""Rate limiting for LLM clients
+
+Each async client gets its own limiter (see `get_rate_limiter`), combining
+- a token bucket on requests (requests per minute)
+- a token bucket on LLM tokens (tokens per minute)
+- a semaphore bounding the number of in-flight requests (of each event loop)
+- a shared cool down, so a 429 seen by one request pauses every request of that client
+
+Synchronous clients get a simpler thread-safe limiter on requests per minute and in-flight requests (see
+`get_sync_rate_limiter`).
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, Optional
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second, holding at most `capacity` tokens
+
+    The tokens are shared by every event loop (and thread) using the bucket, waiters queue up per event loop.
+
+    Args:
+        rate (float): Tokens added per second
+        capacity (float): Maximum number of tokens held, i.e. the largest burst allowed
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._state_lock = threading.Lock()
+        self._locks = _PerLoop(asyncio.Lock)
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """Waits until `amount` tokens are available and takes them (amounts above the capacity wait for a full bucket)"""
+        amount = min(amount, self.capacity)
+        async with self._locks.get():
+            while (missing := self._take(amount)) > 0:
+                await asyncio.sleep(missing / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """Takes (positive) or gives back (negative) tokens without waiting, e.g. once the real usage of a request is known"""
+        with self._state_lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+    def _take(self, amount: float) -> float:
+        """Takes `amount` tokens if available, returns the number of missing tokens otherwise"""
+        with self._state_lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return amount - self.tokens
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+
+class AsyncRateLimiter:
+    """Limits requests per minute, tokens per minute and concurrent requests of one LLM client
+
+    The limiter can be used from several event loops (e.g. successive `asyncio.run` calls), the rates and cool down
+    are shared between them.
+
+    Example:
+    ```python
+    limiter = AsyncRateLimiter(requests_per_minute=60, tokens_per_minute=100_000, max_concurrency=8)
+
+    async with limiter.slot(estimated_tokens=2000):
+        response = await client.chat.completions.create(...)
+    limiter.settle(estimated_tokens=2000, actual_tokens=response.usage.total_tokens)
+    ```
+
+    Args:
+        requests_per_minute (float, optional): Maximum sustained request rate, None disables the limit. Defaults to 60.
+        tokens_per_minute (float, optional): Maximum sustained (prompt + completion) token rate, None disables the limit. Defaults to None.
+        max_concurrency (int, optional): Maximum number of in-flight requests of each event loop. Defaults to 8.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = 60,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: int = 8,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.requests = (
+            TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 60))
+            if requests_per_minute
+            else None
+        )
+        self.tokens = (
+            TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+            if tokens_per_minute
+            else None
+        )
+        # asyncio primitives belong to the loop they are first used in, e.g. the one of an `asyncio.run` call
+        self._semaphores = _PerLoop(lambda: asyncio.Semaphore(max_concurrency))
+        self._cool_down_until = 0.0
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int = 0):
+        """Waits for the cool down, a free concurrency slot and enough request/ token budget"""
+        async with self._semaphores.get():
+            await self._wait_cool_down()
+            if self.requests is not None:
+                await self.requests.acquire(1)
+            if self.tokens is not None and estimated_tokens:
+                await self.tokens.acquire(estimated_tokens)
+            yield
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Corrects the token budget once the real token usage of a request is known"""
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def cool_down(self, seconds: float) -> None:
+        """Pauses every request of this limiter for `seconds` (e.g. after a 429 with a Retry-After header)"""
+        self._cool_down_until = max(self._cool_down_until, time.monotonic() + seconds)
+
+    async def _wait_cool_down(self) -> None:
+        while (remaining := self._cool_down_until - time.monotonic()) > 0:
+            await asyncio.sleep(remaining)
+
+
+# One limiter per client, dropped together with the client
+_limiters: "weakref.WeakKeyDictionary[Any, AsyncRateLimiter]" = (
+    weakref.WeakKeyDictionary()
+)
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(client: Any, **limiter_args: Any) -> AsyncRateLimiter:
+    """Returns the rate limiter of a client, creating it with `limiter_args` (see `AsyncRateLimiter`) on first use
+
+    Raises:
+        ValueError: If the client already has a limiter with other `limiter_args`
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(client)
+        if limiter is None:
+            limiter = _limiters[client] = AsyncRateLimiter(**limiter_args)
+        else:
+            _check_args(client, limiter, limiter_args)
+        return limiter
+
+
+class RateLimiter:
+    """Limits requests per minute and concurrent requests of one synchronous LLM client, across threads
+
+    Requests are spaced evenly (no bursts), so the default of 120 requests per minute sends a request every 0.5
+    seconds at most, whatever the number of threads sending them.
+
+    Example:
+    ```python
+    limiter = RateLimiter(requests_per_minute=600, max_concurrency=8)
+
+    with limiter.slot():
+        response = client.chat.completions.create(...)
+    ```
+
+    Args:
+        requests_per_minute (float, optional): Maximum request rate, None disables the limit. Defaults to 120.
+        max_concurrency (int, optional): Maximum number of in-flight requests, None disables the limit. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = 120,
+        max_concurrency: Optional[int] = None,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+        self._interval = 60 / requests_per_minute if requests_per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+        self._semaphore = (
+            threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        )
+
+    @contextmanager
+    def slot(self):
+        """Waits for a free concurrency slot and the turn of the request"""
+        if self._semaphore is not None:
+            self._semaphore.acquire()
+        try:
+            self._wait_turn()
+            yield
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def _wait_turn(self) -> None:
+        # Book the next free send time, then sleep outside the lock so other threads can book theirs
+        with self._lock:
+            now = time.monotonic()
+            turn = max(now, self._next)
+            self._next = turn + self._interval
+        if turn > now:
+            time.sleep(turn - now)
+
+
+_sync_limiters: "weakref.WeakKeyDictionary[Any, RateLimiter]" = (
+    weakref.WeakKeyDictionary()
+)
+_sync_limiters_lock = threading.Lock()
+
+
+def get_sync_rate_limiter(client: Any, **limiter_args: Any) -> RateLimiter:
+    """Returns the rate limiter of a synchronous client, creating it with `limiter_args` (see `RateLimiter`) on first use
+
+    Example:
+    ```python
+    # Up to 10 requests per second, 8 in flight at a time
+    get_sync_rate_limiter(client, requests_per_minute=600, max_concurrency=8)
+    ```
+
+    Raises:
+        ValueError: If the client already has a limiter with other `limiter_args`
+    """
+    with _sync_limiters_lock:
+        limiter = _sync_limiters.get(client)
+        if limiter is None:
+            limiter = _sync_limiters[client] = RateLimiter(**limiter_args)
+        else:
+            _check_args(client, limiter, limiter_args)
+        return limiter
+
+
+def _check_args(client: Any, limiter: Any, limiter_args: Dict[str, Any]) -> None:
+    """Raises if `limiter_args` asks for another configuration than the existing limiter's"""
+    differing = {
+        name: value
+        for name, value in limiter_args.items()
+        if getattr(limiter, name) != value
+    }
+    if differing:
+        current = {name: getattr(limiter, name) for name in differing}
+        raise ValueError(
+            f"The rate limiter of {client!r} already exists with {current}, cannot reconfigure it with {differing}"
+        )
+
+
+class _PerLoop:
+    """One instance of an asyncio primitive per running event loop, dropped together with the loop"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._instances: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            instance = self._instances.get(loop)
+            if instance is None:
+                instance = self._instances[loop] = self._factory()
+            return instance
@@ -4,30 +4,407 @@ Will clean up this file later
 
 """
 
+import contextvars
+import logging
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from importlib.resources import files
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+)
 
-from openai import OpenAI
+from ..cache.artifact_cache import ArtifactCache, hash_text
+from ..cache.response_cache import ResponseCache
+from ..instrumentation.stages import stage
+from ..post_processing.compact_transcript import (
+    DEFAULT_TIMESTAMP_EVERY,
+    CompactFormatter,
+    compact_blocks,
+)
+from ..post_processing.reformat_output import reformat_one
+from .llm_inference import get_response, get_response_stream
+from .tokens import count_tokens
 
-from .llm_inference import get_response
+if TYPE_CHECKING:
+    from openai import OpenAI
 
-# Automatically gets the
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1", api_key=os.getenv("OPENROUTER_API_KEY")
-)
+logger = logging.getLogger(__name__)
 
 client_args = {"temperature": 0.3, "model": "anthropic/claude-3.5-sonnet:beta"}
 
-prompt_path = "/mnt/d/MyPath/Projects/summarize-media/summarize_media/summarize_transcription/prompts/default_prompt.txt"
+# Prompts are shipped as package data in the "prompts" folder next to this module
+DEFAULT_PROMPT = "default_prompt.txt"
+MAP_PROMPT = "map_prompt.txt"
+REDUCE_PROMPT = "reduce_prompt.txt"
+COMBINE_PROMPT = "combine_prompt.txt"
+
+# End of the items of `_iterate_in_background`
+_END = object()
+
+
+@lru_cache(maxsize=None)
+def get_client() -> "OpenAI":
+    """Returns the OpenRouter client, created on first use with the "OPENROUTER_API_KEY" environment variable"""
+    from openai import OpenAI
+
+    return OpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+    )
 
 
-with open(prompt_path, "r") as file:
-    default_sys_prompt = file.read()
+@lru_cache(maxsize=None)
+def load_prompt(name: str) -> str:
+    """Reads a prompt from the package's "prompts" folder (cached after the first read)"""
+    return (files(__package__) / "prompts" / name).read_text(encoding="utf-8")
 
 
-def get_summarization(input_text: str, sys_prompt: str = None) -> str:
-    sys_prompt = sys_prompt if sys_prompt else default_sys_prompt
+def __getattr__(name: str) -> Any:
+    # The client and the default prompt used to be module level globals, they are now created on first access
+    if name == "client":
+        return get_client()
+    if name == "default_sys_prompt":
+        return load_prompt(DEFAULT_PROMPT)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_summarization(
+    input_text: str,
+    sys_prompt: str = None,
+    cache: Optional[ArtifactCache] = None,
+    response_cache: Optional[ResponseCache] = None,
+) -> str:
+    sys_prompt = sys_prompt if sys_prompt else load_prompt(DEFAULT_PROMPT)
+    client = get_client()
+
+    # Reuse a previous summary of the same text with the same model, prompt and sampling arguments
+    if cache is not None:
+        cache_key = cache.make_key(
+            "summarize",
+            hash_text(input_text),
+            base_url=str(client.base_url),
+            sys_prompt=hash_text(sys_prompt),
+            **client_args,
+        )
+        cached = cache.get_text(cache_key)
+        if cached is not None:
+            return cached
+
     sys_msg = {"role": "system", "content": sys_prompt}
     input_msg = {"role": "user", "content": input_text}
     messages = [sys_msg, input_msg]
-    response = get_response(messages=messages, client=client, client_args=client_args)
+    with stage(
+        "summarize", bytes_in=len(input_text.encode()), model=client_args["model"]
+    ) as record:
+        response = get_response(
+            messages=messages,
+            client=client,
+            client_args=client_args,
+            cache=response_cache,
+        )
+        record.bytes_out = len(response["content"].encode())
+
+    if cache is not None:
+        cache.put_text(cache_key, response["content"])
+
     return response["content"]
+
+
+def get_summarization_map_reduce(
+    segments: List[Dict[Any, Any]],
+    sys_prompt: str = None,
+    chunk_tokens: int = 8000,
+    fan_in: int = 4,
+    max_concurrency: int = 4,
+    timings: Optional[Dict[str, float]] = None,
+    cache: Optional[ArtifactCache] = None,
+    response_cache: Optional[ResponseCache] = None,
+    compact: bool = False,
+    compact_args: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Summarizes a transcript that may not fit in the model context, hierarchically
+
+    The segments are formatted (see `reformat`) and packed into chunks of at most `chunk_tokens` tokens, split on
+    segment boundaries. The chunks are summarized concurrently into partial notes (map), and the notes are merged
+    `fan_in` at a time, level by level (reduce), until they can be summarized together into the final summary.
+    Transcripts that fit in a single chunk are summarized directly with `get_summarization`.
+
+    The requests still go through the rate limiter of the client (see `get_sync_rate_limiter`), 120 requests per
+    minute by default, so more than 2 concurrent requests only pay off once its limit is raised, e.g.
+    `get_sync_rate_limiter(get_client(), requests_per_minute=600)`.
+
+    Args:
+        segments (List[Dict[Any, Any]]): Transcript segments, each with "start", "end" and "text" keys
+        sys_prompt (str, optional): System prompt for the final summary (whose input is the labelled notes of the parts, not the transcript), defaults to the combine prompt, or to the default summarization prompt if the transcript fits in one chunk
+        chunk_tokens (int, optional): Token budget of each chunk of the transcript. Defaults to 8000.
+        fan_in (int, optional): Number of partial summaries merged by each reduce call (at least 2). Defaults to 4.
+        max_concurrency (int, optional): Maximum number of concurrent LLM requests, bounded in practice by the rate limit of the client. Defaults to 4.
+        timings (Dict[str, float], optional): If provided, filled with the latency (in seconds) of each stage: "map", "reduce_<level>" and "final"
+        cache (ArtifactCache, optional): Cache to look the summaries of each call up in, see `get_summarization`
+        response_cache (ResponseCache, optional): Cache of the LLM responses, see `get_response`
+        compact (bool, optional): Whether to format the transcript compactly (merged speaker turns, coarse timestamps, no filler words, see `summarize_media.post_processing.compact_transcript`), which cuts the input tokens. Defaults to False.
+        compact_args (Dict[str, Any], optional): Arguments of `compact` (max_block_seconds, timestamp_every, filler_words)
+
+    Returns:
+        str: The summary of the transcript
+    """
+    if fan_in < 2:
+        raise ValueError(f"fan_in must be at least 2, got {fan_in}")
+    timings = timings if timings is not None else {}
+
+    chunks = chunk_segments(
+        segments, chunk_tokens, (compact_args or {}) if compact else None
+    )
+    logger.info(f"Split transcript into {len(chunks)} chunks")
+
+    if len(chunks) <= 1:
+        start = time.perf_counter()
+        summary = get_summarization(
+            chunks[0] if chunks else "", sys_prompt, cache, response_cache
+        )
+        timings["final"] = time.perf_counter() - start
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+
+        def summarize_all(texts: List[str], prompt: str) -> List[str]:
+            return list(
+                executor.map(
+                    lambda text: get_summarization(text, prompt, cache, response_cache),
+                    texts,
+                )
+            )
+
+        # Map: partial notes for every chunk
+        start = time.perf_counter()
+        partials = summarize_all(chunks, load_prompt(MAP_PROMPT))
+        timings["map"] = time.perf_counter() - start
+        logger.info(f"Map stage: {len(chunks)} chunks in {timings['map']:.2f}s")
+
+        # Reduce: merge the notes fan_in at a time until the rest fit in the final call
+        level = 1
+        while len(partials) > fan_in:
+            groups = [
+                _join_partials(partials[i : i + fan_in])
+                for i in range(0, len(partials), fan_in)
+            ]
+            start = time.perf_counter()
+            partials = summarize_all(groups, load_prompt(REDUCE_PROMPT))
+            timings[f"reduce_{level}"] = time.perf_counter() - start
+            logger.info(
+                f"Reduce stage {level}: {len(groups)} groups in {timings[f'reduce_{level}']:.2f}s"
+            )
+            level += 1
+
+    start = time.perf_counter()
+    summary = get_summarization(
+        _join_partials(partials),
+        sys_prompt if sys_prompt else load_prompt(COMBINE_PROMPT),
+        cache,
+        response_cache,
+    )
+    timings["final"] = time.perf_counter() - start
+    logger.info(f"Final stage: {timings['final']:.2f}s")
+
+    return summary
+
+
+def summarize_stream(
+    segments: Iterable[Dict[Any, Any]],
+    sys_prompt: str = None,
+    window_tokens: int = 4000,
+    metrics: Optional[Dict[str, float]] = None,
+    response_cache: Optional[ResponseCache] = None,
+) -> Iterator[Tuple[Literal["partial", "summary"], str]]:
+    """Summarizes a transcript while it is still being transcribed, one rolling window of segments at a time
+
+    Segments are formatted (see `reformat`) as they arrive, and every time `window_tokens` tokens have accumulated,
+    the window is summarized into partial notes (streamed from the LLM). Once the segments run out, the notes are
+    combined into the summary (or the transcript is summarized directly if it fits in one window).
+
+    The segments are pulled on a background thread, so the transcription keeps going while a window is summarized.
+
+    Example:
+    ```python
+    metrics = {}
+    events = stream_transcription(path, metrics=metrics)
+    for kind, text in summarize_stream(stream_segments(events), metrics=metrics):
+        show(kind, text)
+    print(metrics["time_to_first_segment"], metrics["time_to_first_token"])
+    ```
+
+    Args:
+        segments (Iterable[Dict[Any, Any]]): Transcript segments, each with "start", "end" and "text" keys, e.g. `stream_segments(stream_transcription(...))`
+        sys_prompt (str, optional): System prompt for the final summary, defaults to the combine prompt (or the default summarization prompt if the transcript fits in one window)
+        window_tokens (int, optional): Token budget of each window of the transcript. Defaults to 4000.
+        metrics (Dict[str, float], optional): If provided, filled with "time_to_first_token" (first streamed token of any summary), "time_to_first_partial", "time_to_summary" (measured from `metrics["start"]`, set to the time of the first `next` if missing) and "windows"
+        response_cache (ResponseCache, optional): Cache of the LLM responses, see `get_response_stream`
+
+    Yields:
+        Tuple[str, str]: ("partial", notes) for every full window, then ("summary", summary)
+    """
+    metrics = metrics if metrics is not None else {}
+    metrics.setdefault("start", time.perf_counter())
+    metrics["windows"] = 0
+
+    def summarize(text: str, prompt: str) -> str:
+        messages = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": text},
+        ]
+        pieces = []
+        for piece in get_response_stream(
+            messages=messages,
+            client=get_client(),
+            client_args=client_args,
+            cache=response_cache,
+        ):
+            metrics.setdefault(
+                "time_to_first_token", time.perf_counter() - metrics["start"]
+            )
+            pieces.append(piece)
+        return "".join(pieces)
+
+    partials = []
+    window = []
+    window_used = 0
+    for segment in _iterate_in_background(segments):
+        text = reformat_one(segment)
+        tokens = count_tokens(text) + 1  # Joining newline
+        if window and window_used + tokens > window_tokens:
+            partials.append(summarize("\n".join(window), load_prompt(MAP_PROMPT)))
+            metrics["windows"] += 1
+            metrics.setdefault(
+                "time_to_first_partial", time.perf_counter() - metrics["start"]
+            )
+            yield "partial", partials[-1]
+            window, window_used = [], 0
+        window.append(text)
+        window_used += tokens
+
+    if not partials:
+        # The whole transcript fits in one window
+        summary = summarize(
+            "\n".join(window), sys_prompt if sys_prompt else load_prompt(DEFAULT_PROMPT)
+        )
+    else:
+        if window:
+            partials.append(summarize("\n".join(window), load_prompt(MAP_PROMPT)))
+            metrics["windows"] += 1
+            yield "partial", partials[-1]
+        summary = summarize(
+            _join_partials(partials),
+            sys_prompt if sys_prompt else load_prompt(COMBINE_PROMPT),
+        )
+
+    metrics["time_to_summary"] = time.perf_counter() - metrics["start"]
+    yield "summary", summary
+
+
+def chunk_segments(
+    segments: List[Dict[Any, Any]],
+    chunk_tokens: int,
+    compact_args: Optional[Dict[str, Any]] = None,
+) -> List[str]:
+    """Formats the segments (see `reformat`) and packs them into chunks of at most `chunk_tokens` tokens
+
+    Chunks are only split on segment boundaries, a single segment longer than the budget becomes its own chunk.
+
+    Args:
+        segments (List[Dict[Any, Any]]): Transcript segments, each with "start", "end" and "text" keys
+        chunk_tokens (int): Token budget of each chunk
+        compact_args (Dict[str, Any], optional): If provided, the segments are formatted with `compact` and these arguments instead, and chunks are split on block boundaries
+
+    Returns:
+        List[str]: The formatted chunks
+    """
+    items = segments
+    formatter = None
+    if compact_args is not None:
+        compact_args = dict(compact_args)
+        formatter = CompactFormatter(
+            compact_args.pop("timestamp_every", DEFAULT_TIMESTAMP_EVERY)
+        )
+        items = compact_blocks(segments, **compact_args)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for item in items:
+        text = reformat_one(item) if formatter is None else formatter.format(item)
+        tokens = count_tokens(text) + 1  # Joining newline
+        if current and current_tokens + tokens > chunk_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+            if formatter is not None:
+                # Every chunk is summarized on its own, so it starts with a timestamp and speaker
+                formatter.reset()
+                text = formatter.format(item)
+                tokens = count_tokens(text) + 1
+        current.append(text)
+        current_tokens += tokens
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _iterate_in_background(items: Iterable[Any]) -> Iterator[Any]:
+    """Iterates `items` on a background thread, so producing the items (e.g. transcribing) overlaps with consuming them
+
+    Errors of the iteration are raised to the consumer. If the consumer stops early, the producer stops (and closes
+    `items`) after its current item.
+    """
+    buffer: "queue.Queue[Tuple[Any, Optional[BaseException]]]" = queue.Queue()
+    stop = threading.Event()
+
+    def produce() -> None:
+        iterator = iter(items)
+        error = None
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    break
+                buffer.put((item, None))
+        except BaseException as e:
+            error = e
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            buffer.put((_END, error))
+
+    # The producer runs in a copy of the caller's context, e.g. its current instrumentation stage
+    context = contextvars.copy_context()
+    threading.Thread(
+        target=context.run, args=(produce,), name="summarize-stream", daemon=True
+    ).start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _join_partials(partials: List[str]) -> str:
+    """Joins consecutive partial summaries into one input, labelled in transcript order"""
+    return "\n\n".join(
+        f"## Part {i + 1}\n{partial}" for i, partial in enumerate(partials)
+    )
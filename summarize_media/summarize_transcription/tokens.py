@@ -0,0 +1,47 @@
+"""Token counting for budgeting LLM inputs
+
+Uses [tiktoken](https://github.com/openai/tiktoken) when it is installed, otherwise falls back to an
+estimate of ~4 characters per token
+"""
+
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """Counts the tokens of a text
+
+    Args:
+        text (str): Text to count the tokens of
+        encoding_name (str, optional): Name of the tiktoken encoding to use. Defaults to "cl100k_base".
+
+    Returns:
+        int: Number of tokens in the text
+    """
+    encoding = _get_encoding(encoding_name)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(encoding_name: str):
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning(
+            "tiktoken is not installed, estimating token counts from the text length"
+        )
+        return None
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        # The encoding files are downloaded on first use, which fails on offline machines
+        logger.warning(
+            f"Cannot load the {encoding_name} encoding ({e}), estimating token counts from the text length"
+        )
+        return None
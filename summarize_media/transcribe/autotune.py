@@ -0,0 +1,338 @@
+"""Picks the fastest batch size, compute type and thread count of the whisper model on this host
+
+The right `batch_size` and `compute_type` of `get_transcription` depend on the hardware: float16 isn't usable on
+CPU, a batch size that saturates one GPU runs out of memory on a smaller one, and on CPU the number of threads
+matters as much as the batch size. `autotune` runs a short calibration instead: it decodes a synthetic clip with
+every candidate configuration, measures the throughput and the peak memory, and picks the fastest configuration
+that fits in the memory budget.
+
+The choice is saved per host (and model and device) in a JSON file, so only the first run on a machine pays for
+the calibration. `get_transcription(batch_size="auto", compute_type="auto", threads="auto")` uses it.
+
+Example:
+```python
+config = get_tuned_config("large-v2", device="cpu")  # {"batch_size": 4, "compute_type": "int8", "threads": 16, ...}
+get_transcription(path, device="cpu", batch_size="auto", compute_type="auto", threads="auto")
+```
+"""
+
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .batched_inference import SAMPLE_RATE, run_batches
+from .model_pool import release_memory
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+DEFAULT_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "summarize_media", "autotune.json"
+)
+
+CUDA_BATCH_SIZES = (4, 8, 16, 32)
+CPU_BATCH_SIZES = (1, 2, 4, 8)
+CUDA_COMPUTE_TYPES = ("float16", "int8_float16", "int8")
+CPU_COMPUTE_TYPES = ("int8", "float32")
+
+# Length of each synthetic input, whisper pads every input to 30 seconds so the encoder cost doesn't depend on it
+INPUT_SECONDS = 10.0
+
+
+def autotune(
+    model_name: str = "large-v2",
+    device: str = "cuda",
+    batch_sizes: Optional[Sequence[int]] = None,
+    compute_types: Optional[Sequence[str]] = None,
+    thread_counts: Optional[Sequence[int]] = None,
+    memory_budget: Optional[int] = None,
+    model_save_dir: Optional[str] = None,
+    audio: Optional[np.ndarray] = None,
+) -> Dict[str, Any]:
+    """Measures every candidate configuration of the whisper model and returns the fastest one that fits
+
+    Every compute type (and thread count, on CPU) loads the model once, then batch sizes are tried in increasing
+    order on the same inputs. Larger batch sizes stop being tried once one runs out of memory or is slower than the
+    best one so far.
+
+    Args:
+        model_name (str, optional): Whisper model, see `get_transcription`. Defaults to "large-v2".
+        device (str, optional): Device of the model. Defaults to "cuda".
+        batch_sizes (Sequence[int], optional): Candidate batch sizes. Defaults to `CUDA_BATCH_SIZES` or `CPU_BATCH_SIZES`.
+        compute_types (Sequence[str], optional): Candidate compute types. Defaults to the ones of `CUDA_COMPUTE_TYPES` or `CPU_COMPUTE_TYPES` the device supports.
+        thread_counts (Sequence[int], optional): Candidate numbers of CPU threads. Defaults to all the cores, half of them and 4 on CPU, and the whisperx default on GPU.
+        memory_budget (int, optional): Peak memory in bytes a configuration may use (of the GPU, or the resident memory of the process on CPU). Defaults to 90% of the GPU memory, or 80% of the RAM.
+        model_save_dir (str, optional): Download directory of the model, see `get_transcription`
+        audio (np.ndarray, optional): 16 kHz mono float32 samples to calibrate on instead of the synthetic clip, e.g. a few minutes of a typical recording
+
+    Returns:
+        Dict[str, Any]: "batch_size", "compute_type", "threads" (None on GPU), "throughput" (inputs of up to 30 seconds decoded per second), "peak_memory" (bytes), and "candidates", the measurements of every configuration tried
+    """
+    import whisperx
+
+    cuda = str(device).startswith("cuda")
+    batch_sizes = sorted(batch_sizes or (CUDA_BATCH_SIZES if cuda else CPU_BATCH_SIZES))
+    compute_types = list(compute_types or _supported_compute_types(device))
+    if thread_counts is None:
+        thread_counts = [None] if cuda else _default_thread_counts()
+    if memory_budget is None:
+        memory_budget = int(_total_memory(device) * (0.9 if cuda else 0.8))
+    inputs = _calibration_inputs(max(batch_sizes), audio)
+
+    candidates: List[Dict[str, Any]] = []
+    for compute_type in compute_types:
+        for threads in thread_counts:
+            load_args = dict(
+                compute_type=compute_type, language="en", download_root=model_save_dir
+            )
+            if threads is not None:
+                load_args["threads"] = threads
+            try:
+                model = whisperx.load_model(model_name, device, **load_args)
+            except Exception as e:
+                logger.info(f"Skipping {compute_type} (threads {threads}): {e}")
+                continue
+
+            try:
+                # Warm up, the first batch pays for lazy initializations
+                list(run_batches(model, inputs[:1], 1))
+                best = 0.0
+                for batch_size in batch_sizes:
+                    candidate = dict(
+                        batch_size=batch_size,
+                        compute_type=compute_type,
+                        threads=threads,
+                    )
+                    try:
+                        candidate.update(_measure(model, inputs, batch_size, device))
+                    except Exception as e:
+                        if not _is_out_of_memory(e):
+                            raise
+                        logger.info(f"{candidate} ran out of memory")
+                        break
+                    candidate["fits"] = candidate["peak_memory"] <= memory_budget
+                    candidates.append(candidate)
+                    logger.info(
+                        f"{candidate}: {candidate['throughput']:.2f} inputs/s, peak memory {candidate['peak_memory'] / 1024**3:.1f} GB"
+                    )
+                    if not candidate["fits"] or candidate["throughput"] < best * 0.95:
+                        break
+                    best = max(best, candidate["throughput"])
+            finally:
+                del model
+                release_memory()
+
+    fitting = [candidate for candidate in candidates if candidate["fits"]]
+    if not fitting:
+        raise RuntimeError(
+            f"No configuration of {model_name} on {device} fits in {memory_budget} bytes: {candidates}"
+        )
+    best = max(fitting, key=lambda candidate: candidate["throughput"])
+    return {
+        "batch_size": best["batch_size"],
+        "compute_type": best["compute_type"],
+        "threads": best["threads"],
+        "throughput": best["throughput"],
+        "peak_memory": best["peak_memory"],
+        "candidates": candidates,
+    }
+
+
+def get_tuned_config(
+    model_name: str = "large-v2",
+    device: str = "cuda",
+    model_save_dir: Optional[str] = None,
+    path: Optional[str] = None,
+    refresh: bool = False,
+    **autotune_args: Any,
+) -> Dict[str, Any]:
+    """Returns the configuration `autotune` picked on this host, running it if there is none yet
+
+    Args:
+        model_name (str, optional): Whisper model. Defaults to "large-v2".
+        device (str, optional): Device of the model. Defaults to "cuda".
+        model_save_dir (str, optional): Download directory of the model, see `get_transcription`
+        path (str, optional): JSON file of the tuned configurations. Defaults to $SUMMARIZE_MEDIA_AUTOTUNE, or "~/.cache/summarize_media/autotune.json".
+        refresh (bool, optional): Whether to calibrate again even if a configuration was saved. Defaults to False.
+        autotune_args: Other arguments of `autotune`
+
+    Returns:
+        Dict[str, Any]: See `autotune`, without the "candidates"
+    """
+    path = path or os.getenv("SUMMARIZE_MEDIA_AUTOTUNE") or DEFAULT_PATH
+    key = _host_key(model_name, device)
+    with _lock:
+        if not refresh:
+            config = _load(path).get(key)
+            if config is not None:
+                return config
+
+        logger.info(
+            f"Calibrating {model_name} on {device}, this only happens once per host"
+        )
+        start = time.perf_counter()
+        config = autotune(
+            model_name, device, model_save_dir=model_save_dir, **autotune_args
+        )
+        config.pop("candidates")
+        config["tuned_at"] = time.time()
+        logger.info(
+            f"Tuned {model_name} on {device} in {time.perf_counter() - start:.0f}s: {config}"
+        )
+
+        # Other processes may have saved their own configurations meanwhile
+        configs = _load(path)
+        configs[key] = config
+        _save(path, configs)
+        return config
+
+
+def _measure(
+    model: Any, inputs: List[Dict[str, np.ndarray]], batch_size: int, device: str
+) -> Dict[str, float]:
+    """Decodes the inputs in batches, returns the throughput and the peak memory"""
+    sampler = _MemorySampler(device)
+    sampler.start()
+    try:
+        start = time.perf_counter()
+        for _ in run_batches(model, inputs, batch_size):
+            pass
+        wall = time.perf_counter() - start
+    finally:
+        sampler.stop()
+    return {"throughput": len(inputs) / wall, "peak_memory": sampler.peak}
+
+
+class _MemorySampler:
+    """Samples the memory used (of the GPU, or the resident memory of the process) in a background thread"""
+
+    def __init__(self, device: str, interval: float = 0.05):
+        self.device = device
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self.peak = _memory_used(self.device)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _memory_used(self.device))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _memory_used(self.device))
+
+
+def _memory_used(device: str) -> int:
+    if str(device).startswith("cuda"):
+        # CTranslate2 allocates outside of torch, so only the device wide figures see it
+        import torch
+
+        free, total = torch.cuda.mem_get_info(torch.device(device))
+        return total - free
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        # Peak of the whole process (kilobytes on Linux), the best available without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _total_memory(device: str) -> int:
+    if str(device).startswith("cuda"):
+        import torch
+
+        return torch.cuda.mem_get_info(torch.device(device))[1]
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def _supported_compute_types(device: str) -> List[str]:
+    cuda = str(device).startswith("cuda")
+    candidates = CUDA_COMPUTE_TYPES if cuda else CPU_COMPUTE_TYPES
+    try:
+        import ctranslate2
+
+        supported = ctranslate2.get_supported_compute_types("cuda" if cuda else "cpu")
+    except Exception:
+        return list(candidates)
+    return [compute_type for compute_type in candidates if compute_type in supported]
+
+
+def _default_thread_counts() -> List[int]:
+    cores = (
+        len(os.sched_getaffinity(0))
+        if hasattr(os, "sched_getaffinity")
+        else os.cpu_count() or 1
+    )
+    return sorted({cores, max(1, cores // 2), min(4, cores)}, reverse=True)
+
+
+def _calibration_inputs(
+    count: int, audio: Optional[np.ndarray] = None
+) -> List[Dict[str, np.ndarray]]:
+    """`count` pipeline inputs of `INPUT_SECONDS`, cut from `audio` (repeated if too short) or synthesized"""
+    length = int(INPUT_SECONDS * SAMPLE_RATE)
+    if audio is None:
+        # Deterministic tones under noise, so every host calibrates on the same clip
+        rng = np.random.default_rng(0)
+        t = np.arange(length * count, dtype=np.float32) / SAMPLE_RATE
+        pitch = 150 + 100 * np.sin(2 * np.pi * 0.5 * t)
+        audio = 0.1 * np.sin(2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE) + rng.normal(
+            0, 0.02, len(t)
+        )
+    audio = np.resize(np.asarray(audio, dtype=np.float32), length * count)
+    return [{"inputs": audio[i * length : (i + 1) * length]} for i in range(count)]
+
+
+def _is_out_of_memory(error: Exception) -> bool:
+    return isinstance(error, MemoryError) or "out of memory" in str(error).lower()
+
+
+def _host_key(model_name: str, device: str) -> str:
+    """Key of a configuration: the host and its hardware, since home directories may be shared between hosts"""
+    hardware = f"{os.cpu_count()} cpus"
+    if str(device).startswith("cuda"):
+        try:
+            import torch
+
+            hardware = torch.cuda.get_device_name(torch.device(device))
+        except Exception:
+            pass
+    return f"{socket.gethostname()}|{hardware}|{model_name}|{device}"
+
+
+def _load(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save(path: str, configs: Dict[str, Any]) -> None:
+    """Writes the configurations atomically (a temporary file renamed over the previous one)"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(configs, file, indent=2)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
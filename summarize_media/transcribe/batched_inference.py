@@ -0,0 +1,147 @@
+"""Low level helpers over the whisperx batched pipeline
+
+`FasterWhisperPipeline.transcribe` runs VAD, language detection and batched decoding of one file in one call.
+These helpers expose the individual steps, so callers can schedule VAD segments themselves (e.g. pack segments
+from several files into shared batches, or checkpoint between batches).
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Sample rate whisperx works at (`whisperx.audio.SAMPLE_RATE`), kept here so importing this module stays cheap
+SAMPLE_RATE = 16000
+
+
+def detect_vad_segments(
+    model: Any, audio: np.ndarray, chunk_size: int = 30
+) -> List[Dict[str, Any]]:
+    """Runs the model's VAD over the audio and merges the speech regions into chunks of at most `chunk_size` seconds
+
+    Args:
+        model (FasterWhisperPipeline): Model loaded with `whisperx.load_model`
+        audio (np.ndarray): 16 kHz mono float32 samples
+        chunk_size (int, optional): Maximum length of a merged chunk in seconds. Defaults to 30.
+
+    Returns:
+        List[Dict[str, Any]]: Chunks with "start" and "end" keys (in seconds)
+    """
+    import torch
+    from whisperx.vad import merge_chunks
+
+    vad_segments = model.vad_model(
+        {"waveform": torch.from_numpy(audio).unsqueeze(0), "sample_rate": SAMPLE_RATE}
+    )
+    return merge_chunks(
+        vad_segments,
+        chunk_size,
+        onset=model._vad_params["vad_onset"],
+        offset=model._vad_params["vad_offset"],
+    )
+
+
+def detect_language(model: Any, audio: np.ndarray) -> str:
+    """Detects the language from the first 30 seconds of the audio"""
+    return model.detect_language(audio)
+
+
+def detect_language_early(
+    model: Any,
+    audio: np.ndarray,
+    num_chunks: int = 3,
+    search_seconds: float = 120.0,
+    chunk_size: int = 30,
+) -> Optional[str]:
+    """Detects the language from the speech of the first few VAD chunks, before the audio is transcribed
+
+    Only the first `search_seconds` of the audio go through VAD, so this stays cheap on long files, and silence or
+    music at the start of the file doesn't skew the detection.
+
+    Args:
+        model (FasterWhisperPipeline): Model loaded with `whisperx.load_model`
+        audio (np.ndarray): 16 kHz mono float32 samples
+        num_chunks (int, optional): Number of VAD chunks the detection runs on (at most 30 seconds of speech are used). Defaults to 3.
+        search_seconds (float, optional): Length of the start of the audio searched for speech. Defaults to 120.
+        chunk_size (int, optional): Maximum length of a VAD chunk in seconds. Defaults to 30.
+
+    Returns:
+        Optional[str]: The language code, None if there is no speech in the searched audio
+    """
+    window = audio[: int(search_seconds * SAMPLE_RATE)]
+    vad_segments = detect_vad_segments(model, window, chunk_size)[:num_chunks]
+    if not vad_segments:
+        return None
+    speech = np.concatenate(
+        [inputs["inputs"] for inputs in segment_inputs(window, vad_segments)]
+    )
+    return detect_language(model, speech)
+
+
+def set_language(model: Any, language: str, task: str = "transcribe") -> None:
+    """Points the model's tokenizer at `language`, must be called before `run_batches`"""
+    import faster_whisper
+
+    model.tokenizer = faster_whisper.tokenizer.Tokenizer(
+        model.model.hf_tokenizer,
+        model.model.model.is_multilingual,
+        task=task,
+        language=language,
+    )
+
+
+def reset_language(model: Any) -> None:
+    """Reverts the tokenizer so the next call detects the language again (unless the model was loaded with a language)"""
+    if model.preset_language is None:
+        model.tokenizer = None
+
+
+def segment_inputs(
+    audio: np.ndarray, vad_segments: Iterable[Dict[str, Any]]
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Yields the pipeline inputs (audio slices) of the VAD segments"""
+    for segment in vad_segments:
+        start = int(segment["start"] * SAMPLE_RATE)
+        end = int(segment["end"] * SAMPLE_RATE)
+        yield {"inputs": audio[start:end]}
+
+
+def run_batches(
+    model: Any,
+    inputs: Iterable[Dict[str, np.ndarray]],
+    batch_size: int,
+    num_workers: int = 0,
+) -> Iterator[str]:
+    """Decodes the inputs in batches of `batch_size`, yielding the text of each input in order
+
+    Args:
+        model (FasterWhisperPipeline): Model loaded with `whisperx.load_model`, with its language set (see `set_language`)
+        inputs (Iterable[Dict[str, np.ndarray]]): Pipeline inputs, see `segment_inputs`
+        batch_size (int): Number of inputs decoded together
+        num_workers (int, optional): Number of data loader workers. Defaults to 0.
+
+    Yields:
+        str: Transcribed text of each input
+    """
+    for out in model(inputs, batch_size=batch_size, num_workers=num_workers):
+        yield out["text"] if batch_size not in (0, None) else out[0]["text"]
+
+
+def to_segment(
+    text: str, vad_segment: Dict[str, Any], offset: float = 0.0
+) -> Dict[str, Any]:
+    """Builds a transcript segment (as returned by `FasterWhisperPipeline.transcribe`) from a decoded VAD segment"""
+    return {
+        "text": text,
+        "start": round(vad_segment["start"] + offset, 3),
+        "end": round(vad_segment["end"] + offset, 3),
+    }
+
+
+def audio_duration(audio: np.ndarray) -> float:
+    """Duration of 16 kHz audio in seconds"""
+    return len(audio) / SAMPLE_RATE
+
+
+def find_language(model: Any, language: Optional[str], audio: np.ndarray) -> str:
+    """Returns `language` if provided, otherwise the model's preset language, otherwise detects it"""
+    return language or model.preset_language or detect_language(model, audio)
@@ -0,0 +1,111 @@
+"""Checkpoints of long transcriptions, so a failed run resumes where it stopped instead of starting over
+
+A checkpoint is a directory holding the partial results of one transcription as JSON files: the language and VAD
+chunks, every finished chunk of transcribed and aligned segments, the diarization, the id of a cloud prediction,
+or the transcript of every finished window of `transcribe_windowed`. The directory is keyed by the content of the
+input and the parameters of the transcription, so a rerun of the same input with the same parameters finds it,
+and a run with other parameters doesn't reuse results it shouldn't. It is removed once the transcription succeeds.
+
+Files are written atomically (to a temporary file, then renamed), so a crash never leaves a partial file behind.
+
+Example:
+```python
+get_transcription(path, checkpoint_dir="data/checkpoints")  # Fails after 3 hours
+get_transcription(path, checkpoint_dir="data/checkpoints")  # Resumes from the last finished chunk
+```
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any, Optional
+
+from ..cache.artifact_cache import _json_default
+
+logger = logging.getLogger(__name__)
+
+# Number of VAD chunks (of up to 30 seconds) transcribed between two checkpoints
+DEFAULT_CHUNK_SEGMENTS = 64
+
+
+class TranscriptionCheckpoint:
+    """Directory of the partial results of one transcription
+
+    Args:
+        directory (str): Directory of the checkpoint (created if missing)
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def for_input(
+        cls, root: str, source_hash: str, **params: Any
+    ) -> "TranscriptionCheckpoint":
+        """Returns the checkpoint of an input transcribed with some parameters
+
+        Args:
+            root (str): Directory of the checkpoints, e.g. the directory of a job
+            source_hash (str): Hash of the input, see `hash_file` and `hash_bytes`
+            params: Parameters that affect the transcript, must be JSON serializable
+        """
+        payload = json.dumps(
+            {"source": source_hash, "params": params}, sort_keys=True, default=str
+        )
+        key = hashlib.sha256(payload.encode()).hexdigest()[:32]
+        checkpoint = cls(os.path.join(root, key))
+        if os.listdir(checkpoint.directory):
+            logger.info(f"Resuming from checkpoint {checkpoint.directory}")
+        return checkpoint
+
+    def load(self, name: str) -> Optional[Any]:
+        """Returns the JSON value saved under `name`, None if there is none"""
+        try:
+            with open(self._path(name), encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, name: str, value: Any) -> None:
+        """Saves a JSON serializable value under `name` (e.g. "align/00003"), atomically"""
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(value, file, default=_json_default)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def clear(self) -> None:
+        """Removes the checkpoint, once the transcription it belongs to is done"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, *name.split("/")) + ".json"
+
+
+def diarization_to_records(diarize_segments: Any) -> Any:
+    """Converts diarization segments (a pandas DataFrame from `DiarizationPipeline`) to JSON serializable records"""
+    if hasattr(diarize_segments, "to_dict"):
+        return {
+            "frame": True,
+            "records": diarize_segments[["start", "end", "speaker"]].to_dict("records"),
+        }
+    return {"frame": False, "records": list(diarize_segments)}
+
+
+def diarization_from_records(saved: Any) -> Any:
+    """Inverse of `diarization_to_records`, the DataFrame keeps the columns `whisperx.assign_word_speakers` uses"""
+    if not saved["frame"]:
+        return saved["records"]
+
+    import pandas as pd
+
+    return pd.DataFrame(saved["records"], columns=["start", "end", "speaker"])
@@ -0,0 +1,496 @@
+"""Runs many cloud transcriptions concurrently through the Replicate predictions API
+
+`get_transcribe_cloud` blocks on `replicate.run` until its transcription is done (up to hours). `ReplicateJobManager`
+instead creates predictions without waiting, and follows all of them from one event loop, by polling and/ or
+webhooks. Every job is persisted in SQLite (input, prediction id, status and output), so a restarted process picks
+up the predictions still running, and the results of finished ones, instead of paying for them again.
+
+Example:
+```python
+manager = ReplicateJobManager(max_in_flight=16)
+transcripts = asyncio.run(manager.run_many(audio_urls, model_name="large-v3"))
+
+# After a restart, or in another event loop (each loop gets its own semaphore and tasks)
+await manager.resume()
+transcript = await manager.result(key)
+```
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Sequence
+
+import httpx
+import replicate
+from replicate.exceptions import ReplicateError
+
+from ..cache.artifact_cache import hash_text
+from ..summarize_transcription.rate_limit import _PerLoop
+from .transcribe_cloud import audio_input_key, models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "summarize_media", "replicate_jobs.sqlite3"
+)
+
+# Statuses of a job: "pending" (not submitted yet), then the prediction's "starting" and "processing", and finally
+# one of the terminal statuses
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+
+class JobStore:
+    """SQLite table of the transcription jobs, safe to share between threads
+
+    Args:
+        path (str): Path of the database file
+    """
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    key TEXT PRIMARY KEY,
+                    model_name TEXT NOT NULL,
+                    input TEXT NOT NULL,
+                    prediction_id TEXT,
+                    status TEXT NOT NULL,
+                    output TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_prediction_id ON jobs (prediction_id)"
+            )
+
+    def insert(self, key: str, model_name: str, input: Dict[str, Any]) -> bool:
+        """Adds a pending job, returns False if a job with the same key already exists"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (key, model_name, input, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'pending', ?, ?)",
+                (key, model_name, json.dumps(input), now, now),
+            )
+        return cursor.rowcount > 0
+
+    def update(self, key: str, **fields: Any) -> None:
+        """Updates the fields of a job ("output" is stored as JSON)"""
+        if "output" in fields:
+            fields["output"] = json.dumps(fields["output"])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE key = ?", (*fields.values(), key)
+            )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns a job (with "input" and "output" decoded), None if unknown"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE key = ?", (key,)
+            ).fetchone()
+        return _decode_row(row)
+
+    def find(self, prediction_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the job of a prediction, None if unknown"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE prediction_id = ?", (prediction_id,)
+            ).fetchone()
+        return _decode_row(row)
+
+    def list(self, unfinished: bool = False) -> List[Dict[str, Any]]:
+        """Returns every job, or only the ones not in a terminal status yet"""
+        query = "SELECT * FROM jobs"
+        if unfinished:
+            query += f" WHERE status NOT IN ({', '.join('?' * len(TERMINAL_STATUSES))})"
+        with self._lock:
+            rows = self._conn.execute(
+                query + " ORDER BY created_at",
+                TERMINAL_STATUSES if unfinished else (),
+            ).fetchall()
+        return [_decode_row(row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ReplicateJobManager:
+    """Submits transcriptions as Replicate predictions and follows them concurrently, see the module docstring
+
+    Args:
+        db_path (str, optional): Path of the job database. Defaults to $SUMMARIZE_MEDIA_JOBS_DB, or "~/.cache/summarize_media/replicate_jobs.sqlite3".
+        client (replicate.Client, optional): Replicate client to use, e.g. with a different `base_url`. Defaults to a client using $REPLICATE_API_TOKEN.
+        max_in_flight (int, optional): Maximum number of predictions running at the same time, the other jobs wait. Defaults to 8.
+        poll_interval (float, optional): Seconds between two status checks of a prediction. Defaults to 5.
+        max_retries (int, optional): Maximum number of retries of failed predictions, and of each request failing with a transient error (connection errors, 429 and 5xx). Creating a prediction is only retried after errors showing it was not created (failed connections and 429). Defaults to 3.
+        backoff_base (float, optional): Delay before the first retry of a request in seconds, doubled on every retry. Defaults to 2.
+        backoff_max (float, optional): Maximum delay between two retries in seconds. Defaults to 60.
+        webhook_url (str, optional): Url Replicate notifies once a prediction completes, whose handler must pass the request body to `handle_webhook`. Predictions are then only polled every `webhook_poll_interval` seconds, as a fallback.
+        webhook_poll_interval (float, optional): Seconds between two status checks when `webhook_url` is set. Defaults to 120.
+        job_timeout (float, optional): Seconds after which a running prediction is canceled. Defaults to None (no timeout).
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        client: Optional[replicate.Client] = None,
+        max_in_flight: int = 8,
+        poll_interval: float = 5.0,
+        max_retries: int = 3,
+        backoff_base: float = 2.0,
+        backoff_max: float = 60.0,
+        webhook_url: Optional[str] = None,
+        webhook_poll_interval: float = 120.0,
+        job_timeout: Optional[float] = None,
+    ):
+        self.store = JobStore(
+            db_path or os.getenv("SUMMARIZE_MEDIA_JOBS_DB") or DEFAULT_DB_PATH
+        )
+        self.client = client if client is not None else replicate.Client()
+        self.poll_interval = webhook_poll_interval if webhook_url else poll_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.webhook_url = webhook_url
+        self.job_timeout = job_timeout
+
+        # asyncio primitives (and tasks) are bound to their event loop, each loop using the manager gets its own
+        self._semaphores = _PerLoop(lambda: asyncio.Semaphore(max_in_flight))
+        self._loop_tasks = _PerLoop(dict)
+        self._loop_events = _PerLoop(dict)
+        # Predictions reported by webhooks, keyed by prediction id
+        self._webhooks: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def _tasks(self) -> Dict[str, asyncio.Task]:
+        """Tasks following the jobs in the running event loop, keyed by job"""
+        return self._loop_tasks.get()
+
+    @property
+    def _events(self) -> Dict[str, asyncio.Event]:
+        """Events waking the waits of the running event loop on webhooks, keyed by prediction id"""
+        return self._loop_events.get()
+
+    @staticmethod
+    def job_key(model_name: str, input: Dict[str, Any]) -> str:
+        """Key of a job, derived from its model and input so the same transcription is never submitted twice"""
+        return hash_text(json.dumps([model_name, input], sort_keys=True))
+
+    async def submit(
+        self,
+        audio: str,
+        model_name: Literal["medium", "large-v2", "large-v3"] = "large-v3",
+        key: Optional[str] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Registers a transcription job and starts it in the background
+
+        A job already stored under the same key is not submitted again: a finished one keeps its result, an
+        unfinished one (e.g. from a previous process) is resumed.
+
+        Args:
+            audio (str): Url of the audio, or path of a local file (uploaded through Replicate's files API)
+            model_name (Literal["medium", "large-v2", "large-v3"], optional): Model to use, see `get_transcribe_cloud`. Defaults to "large-v3".
+            key (str, optional): Key of the job. Defaults to `job_key` of the model and input.
+            kwargs: Model arguments, see `get_transcribe_cloud`
+
+        Returns:
+            str: Key of the job, see `result`
+        """
+        if model_name not in models:
+            raise ValueError(
+                f"model_name must be one of {list(models)}, got {model_name}"
+            )
+
+        input = {audio_input_key(model_name): audio} | kwargs
+        key = key or self.job_key(model_name, input)
+        if not self.store.insert(key, model_name, input):
+            logger.info(f"Job {key} already exists, not submitting it again")
+        self._start(key)
+        return key
+
+    async def result(self, key: str) -> Any:
+        """Waits for a job to finish and returns its output
+
+        Raises:
+            KeyError: If the job is unknown
+            RuntimeError: If the prediction failed or was canceled
+        """
+        job = self.store.get(key)
+        if job is None:
+            raise KeyError(f"Unknown job {key}")
+
+        if job["status"] not in TERMINAL_STATUSES:
+            self._start(key)
+            task = self._tasks[key]
+            try:
+                # The job keeps running if the caller stops waiting
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+            job = self.store.get(key)
+
+        if job["status"] != "succeeded":
+            raise RuntimeError(
+                f"Transcription job {key} {job['status']}: {job['error']}"
+            )
+        return job["output"]
+
+    async def run_many(
+        self,
+        audios: Sequence[str],
+        model_name: Literal["medium", "large-v2", "large-v3"] = "large-v3",
+        return_exceptions: bool = False,
+        **kwargs: Any,
+    ) -> List[Any]:
+        """Transcribes many audio files concurrently (at most `max_in_flight` at a time)
+
+        Args:
+            audios (Sequence[str]): Urls (or local paths) of the audio files
+            model_name (Literal["medium", "large-v2", "large-v3"], optional): Model to use. Defaults to "large-v3".
+            return_exceptions (bool, optional): Whether to return the exception of a failed job in its place instead of raising it. Defaults to False.
+            kwargs: Model arguments, see `get_transcribe_cloud`
+
+        Returns:
+            List[Any]: Output of each job, in the order of `audios`
+        """
+        keys = [await self.submit(audio, model_name, **kwargs) for audio in audios]
+        return await asyncio.gather(
+            *(self.result(key) for key in keys), return_exceptions=return_exceptions
+        )
+
+    async def resume(self) -> List[str]:
+        """Restarts following the unfinished jobs of the database (e.g. after a restart), returns their keys"""
+        keys = [job["key"] for job in self.store.list(unfinished=True)]
+        for key in keys:
+            self._start(key)
+        logger.info(f"Resumed {len(keys)} unfinished jobs")
+        return keys
+
+    async def cancel(self, key: str) -> None:
+        """Cancels a job, and its prediction if it is running"""
+        job = self.store.get(key)
+        if job is None:
+            raise KeyError(f"Unknown job {key}")
+
+        if job["status"] in TERMINAL_STATUSES:
+            return
+
+        self.store.update(key, status="canceled", error="Canceled")
+        task = self._tasks.get(key)
+        if task is not None:
+            task.cancel()
+        if job["prediction_id"]:
+            await self._with_retries(
+                lambda: self.client.predictions.async_cancel(job["prediction_id"])
+            )
+
+    def status(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns the stored job (status, prediction id, output, ...), None if unknown"""
+        return self.store.get(key)
+
+    def handle_webhook(self, payload: Dict[str, Any]) -> None:
+        """Passes the body of a Replicate webhook request (the prediction as JSON) to the job following it
+
+        Must be called from the thread running the manager's event loop (e.g. from an async web handler).
+        """
+        prediction_id = payload.get("id")
+        if prediction_id is None or self.store.find(prediction_id) is None:
+            logger.warning(f"Webhook for unknown prediction {prediction_id}")
+            return
+        self._webhooks[prediction_id] = payload
+        event = self._events.get(prediction_id)
+        if event is not None:
+            event.set()
+
+    def _start(self, key: str) -> None:
+        if key not in self._tasks or self._tasks[key].done():
+            job = self.store.get(key)
+            if job["status"] not in TERMINAL_STATUSES:
+                self._tasks[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key: str) -> None:
+        async with self._semaphores.get():
+            job = self.store.get(key)
+            attempts = job["attempts"]
+            prediction_id = job["prediction_id"]
+
+            while True:
+                if prediction_id is None:
+                    try:
+                        # A create request that reached Replicate may have started a prediction even if its
+                        # response was lost, sending it again could pay for the transcription twice
+                        prediction = await self._with_retries(
+                            lambda: self._create(job["model_name"], job["input"]),
+                            retryable=_is_safe_to_resend,
+                        )
+                    except Exception as e:
+                        self.store.update(key, status="failed", error=str(e))
+                        raise
+                    attempts += 1
+                    prediction_id = prediction.id
+                    self.store.update(
+                        key,
+                        prediction_id=prediction_id,
+                        status=prediction.status,
+                        attempts=attempts,
+                    )
+                    logger.info(f"Job {key}: created prediction {prediction_id}")
+
+                prediction = await self._wait(key, prediction_id)
+                status = prediction["status"]
+
+                if status == "succeeded":
+                    self.store.update(
+                        key, status=status, output=prediction.get("output"), error=None
+                    )
+                    return
+                if status == "failed" and attempts <= self.max_retries:
+                    logger.warning(
+                        f"Job {key}: prediction {prediction_id} failed ({prediction.get('error')}), retrying"
+                    )
+                    self.store.update(
+                        key,
+                        prediction_id=None,
+                        status="pending",
+                        error=prediction.get("error"),
+                    )
+                    prediction_id = None
+                    continue
+
+                self.store.update(key, status=status, error=prediction.get("error"))
+                return
+
+    async def _create(self, model_name: str, input: Dict[str, Any]):
+        version = models[model_name].split(":")[1]
+        webhook_args = (
+            {"webhook": self.webhook_url, "webhook_events_filter": ["completed"]}
+            if self.webhook_url
+            else {}
+        )
+
+        # Local files are uploaded by the client
+        files = {
+            name: open(value, "rb")
+            for name, value in input.items()
+            if isinstance(value, str) and os.path.isfile(value)
+        }
+        try:
+            return await self.client.predictions.async_create(
+                version=version, input=input | files, **webhook_args
+            )
+        finally:
+            for file in files.values():
+                file.close()
+
+    async def _wait(self, key: str, prediction_id: str) -> Dict[str, Any]:
+        """Waits for a prediction to reach a terminal status (through webhooks or polling), returns it as a dict"""
+        event = self._events.setdefault(prediction_id, asyncio.Event())
+        start = time.monotonic()
+        try:
+            while True:
+                prediction = self._webhooks.pop(prediction_id, None)
+                if prediction is None:
+                    response = await self._with_retries(
+                        lambda: self.client.predictions.async_get(prediction_id)
+                    )
+                    prediction = {
+                        "status": response.status,
+                        "output": response.output,
+                        "error": response.error,
+                    }
+
+                if prediction["status"] in TERMINAL_STATUSES:
+                    return prediction
+                self.store.update(key, status=prediction["status"])
+
+                if (
+                    self.job_timeout is not None
+                    and time.monotonic() - start > self.job_timeout
+                ):
+                    logger.warning(f"Job {key}: timed out, canceling {prediction_id}")
+                    await self._with_retries(
+                        lambda: self.client.predictions.async_cancel(prediction_id)
+                    )
+                    return {"status": "canceled", "error": "Timed out"}
+
+                event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._events.pop(prediction_id, None)
+
+    async def _with_retries(
+        self,
+        request: Callable[[], Awaitable[Any]],
+        retryable: Optional[Callable[[Exception], bool]] = None,
+    ) -> Any:
+        """Runs a request, retrying the errors `retryable` accepts (defaults to `_is_transient`) with exponential backoff"""
+        retryable = retryable or _is_transient
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await request()
+            except Exception as e:
+                if attempt == self.max_retries or not retryable(e):
+                    raise
+                delay = min(
+                    self.backoff_max, self.backoff_base * 2**attempt
+                ) * random.uniform(0.5, 1.0)
+                logger.warning(
+                    f"Replicate request failed ({e}), retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a request error is worth retrying: connection errors, timeouts, rate limits and server errors"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    status = (
+        getattr(error, "status", None) if isinstance(error, ReplicateError) else None
+    )
+    return status is not None and (status in (408, 409, 429) or status >= 500)
+
+
+def _is_safe_to_resend(error: Exception) -> bool:
+    """Whether a request that must not run twice (creating a prediction) can be retried: only if it never reached
+    Replicate (connection errors) or was explicitly rejected without being processed (429)"""
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    return isinstance(error, ReplicateError) and getattr(error, "status", None) == 429
+
+
+def _decode_row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    job = dict(row)
+    job["input"] = json.loads(job["input"])
+    job["output"] = json.loads(job["output"]) if job["output"] is not None else None
+    return job
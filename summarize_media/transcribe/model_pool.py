@@ -0,0 +1,274 @@
+"""Process-wide pool of loaded models, shared across transcription calls
+
+Loading whisper, alignment and diarization models is often slower than transcribing a short clip,
+so instead of loading and deleting them on every call, models are kept warm in a pool and only evicted
+(least recently used first) when the configured memory budget would be exceeded.
+
+Example:
+```python
+from summarize_media.transcribe.model_pool import get_model_pool
+
+pool = get_model_pool()
+pool.set_memory_budget(8 * 1024**3)  # 8 GB
+
+for path in paths:
+    get_transcription(path, model_pool=pool)
+
+print(pool.stats())  # {"hits": ..., "misses": ..., "evictions": ..., ...}
+```
+"""
+
+import gc
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Rough resident sizes (in bytes) of the whisper models at float16, used when the size of a model cannot be measured
+_GB = 1024**3
+WHISPER_MODEL_SIZES = {
+    "tiny": 0.1 * _GB,
+    "base": 0.2 * _GB,
+    "small": 0.6 * _GB,
+    "medium": 1.6 * _GB,
+    "large-v2": 3.2 * _GB,
+    "large-v3": 3.2 * _GB,
+}
+
+# Multiplier applied to the float16 sizes above for each compute type
+COMPUTE_TYPE_SCALE = {
+    "float32": 2.0,
+    "float16": 1.0,
+    "int8_float16": 0.6,
+    "int8": 0.5,
+}
+
+
+class ModelPool:
+    """LRU pool of loaded models bounded by a memory budget
+
+    Entries are keyed by arbitrary hashable keys, see `make_key` for the keys used by `get_transcription`.
+    The pool is thread safe, concurrent requests for the same key only load the model once.
+
+    Args:
+        memory_budget (int, optional): Maximum total (estimated) size of the pooled models in bytes. If no value is provided, the pool is unbounded.
+    """
+
+    def __init__(self, memory_budget: Optional[int] = None):
+        self.memory_budget = memory_budget
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        size_bytes: Optional[int] = None,
+    ) -> Any:
+        """Returns the model stored under `key`, loading it with `loader` on a miss
+
+        Args:
+            key (Hashable): Key of the model, see `make_key`
+            loader (Callable[[], Any]): Zero argument function that loads the model
+            size_bytes (int, optional): Estimated size of the model in bytes, if not provided, the size is measured with `estimate_model_size`
+
+        Returns:
+            Any: The loaded model
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Models are loaded outside of the pool lock, so loading one model doesn't block lookups of others
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][0]
+                self.misses += 1
+
+            logger.info(f"Model pool miss, loading: {key}")
+            model = loader()
+            size_bytes = (
+                size_bytes if size_bytes is not None else estimate_model_size(model)
+            )
+
+            with self._lock:
+                self._entries[key] = (model, int(size_bytes))
+                self._key_locks.pop(key, None)
+                self._evict_to_budget(keep=key)
+            return model
+
+    def set_memory_budget(self, memory_budget: Optional[int]) -> None:
+        """Changes the memory budget, evicting models immediately if the pool is over the new budget"""
+        with self._lock:
+            self.memory_budget = memory_budget
+            self._evict_to_budget()
+
+    def evict(self, key: Hashable) -> bool:
+        """Removes a model from the pool, returns whether the key was present"""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> None:
+        """Removes every model from the pool (counters are kept)"""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def memory_used(self) -> int:
+        """Returns the total estimated size of the pooled models in bytes"""
+        with self._lock:
+            return sum(size for _, size in self._entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the hit/ miss/ eviction counters along with the current pool usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "memory_used": self.memory_used(),
+                "memory_budget": self.memory_budget,
+            }
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _evict_to_budget(self, keep: Optional[Hashable] = None) -> None:
+        """Evicts the least recently used models until the pool fits in the budget, never evicts `keep`"""
+        if self.memory_budget is None:
+            return
+        for key in list(self._entries):
+            if self.memory_used() <= self.memory_budget:
+                break
+            if key == keep:
+                continue
+            self._remove(key)
+            self.evictions += 1
+
+        if keep is not None and self.memory_used() > self.memory_budget:
+            logger.warning(
+                f"Model {keep} alone exceeds the model pool memory budget ({self.memory_budget} bytes)"
+            )
+
+    def _remove(self, key: Hashable) -> None:
+        logger.info(f"Evicting model from pool: {key}")
+        model, _ = self._entries.pop(key)
+        del model
+        release_memory()
+
+
+def load_model(
+    model_pool: Optional[ModelPool],
+    key: Hashable,
+    loader: Callable[[], Any],
+    size_bytes: Optional[int] = None,
+) -> Any:
+    """Loads a model through the pool if one is provided, otherwise loads it directly
+
+    Args:
+        model_pool (ModelPool, optional): Pool to fetch the model from, None loads a model owned by the caller
+        key (Hashable): Key of the model in the pool, see `make_key`
+        loader (Callable[[], Any]): Loads the model on a miss
+        size_bytes (int, optional): Size of the model, see `ModelPool.get`
+
+    Returns:
+        Any: The loaded model
+    """
+    if model_pool is None:
+        return loader()
+    return model_pool.get(key, loader, size_bytes=size_bytes)
+
+
+def make_key(kind: str, *args: Any) -> Tuple:
+    """Builds the pool key for a model
+
+    Keys used by `get_transcription`:
+    - ("transcribe", model_name, device, compute_type, language), followed by the number of threads when set
+    - ("align", language, device)
+    - ("diarize", diarization_model_name, device)
+
+    Args:
+        kind (str): Kind of the model, e.g. "transcribe", "align", "diarize"
+        args: Parameters that determine the loaded model
+
+    Returns:
+        Tuple: A hashable key
+    """
+    return (kind, *(str(arg) if arg is not None else None for arg in args))
+
+
+def estimate_model_size(model: Any) -> int:
+    """Estimates the memory footprint of a model by summing the sizes of its torch parameters and buffers
+
+    Handles plain `torch.nn.Module`s, tuples of models (e.g. alignment model and its metadata) and
+    wrappers exposing a `model` attribute (e.g. the whisperx/ pyannote pipelines). Returns 0 if nothing
+    measurable is found.
+    """
+    if isinstance(model, (tuple, list)):
+        return sum(estimate_model_size(item) for item in model)
+
+    tensors = []
+    if hasattr(model, "parameters") and callable(model.parameters):
+        tensors.extend(model.parameters())
+    if hasattr(model, "buffers") and callable(model.buffers):
+        tensors.extend(model.buffers())
+    if tensors:
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    inner = getattr(model, "model", None)
+    if inner is not None and inner is not model:
+        return estimate_model_size(inner)
+    return 0
+
+
+def estimate_whisper_size(model_name: str, compute_type: str) -> int:
+    """Estimates the size of a whisper (CTranslate2) model, whose weights are not visible to torch"""
+    base = WHISPER_MODEL_SIZES.get(model_name, WHISPER_MODEL_SIZES["large-v2"])
+    return int(base * COMPUTE_TYPE_SCALE.get(compute_type, 1.0))
+
+
+def release_memory() -> None:
+    """Runs the garbage collector and frees cached cuda memory (if torch has been imported)"""
+    gc.collect()
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+_default_pool: Optional[ModelPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_model_pool() -> ModelPool:
+    """Returns the process-wide model pool (created on first use, unbounded by default)"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ModelPool()
+        return _default_pool
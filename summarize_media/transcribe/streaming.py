@@ -0,0 +1,271 @@
+"""Transcribes an audio file locally, yielding the segments as they are decoded
+
+`get_transcription` only returns once the whole file is transcribed, aligned and diarized. `stream_transcription`
+yields the aligned segments of every batch as soon as it is decoded, so consumers (e.g. `summarize_stream`, or a UI)
+can start before the transcription ends. Diarization runs concurrently on the whole audio and its speaker labels are
+backfilled once it finishes.
+
+Example:
+```python
+metrics = {}
+for kind, segments in stream_transcription(path, assign_speaker_labels=True, metrics=metrics):
+    if kind == "segments":
+        show(segments)  # New segments, in order
+    else:
+        show_speakers(segments)  # Every segment so far, with speaker labels
+print(metrics["time_to_first_segment"])
+```
+"""
+
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+from ..instrumentation.stages import stage
+from .batched_inference import (
+    audio_duration,
+    detect_vad_segments,
+    find_language,
+    reset_language,
+    run_batches,
+    segment_inputs,
+    set_language,
+    to_segment,
+)
+from .model_pool import ModelPool, estimate_whisper_size, load_model, make_key
+from .transcribe import diarize
+
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+StreamEvent = Tuple[Literal["segments", "speakers"], List[Dict[str, Any]]]
+
+
+def stream_transcription(
+    file_path: Union[str, np.ndarray],
+    model_name: Literal["medium", "large-v2", "large-v3"] = "large-v2",
+    device: Union["torch.device", str] = "cuda",
+    batch_size: int = 16,
+    compute_type: Literal["float16", "int8"] = "float16",
+    language: Optional[str] = None,
+    align: bool = True,
+    assign_speaker_labels: bool = False,
+    diarization_model_name: str = None,
+    min_speakers: int = None,
+    max_speakers: int = None,
+    hugging_face_token: str = None,
+    model_save_dir: str = None,
+    chunk_size: int = 30,
+    model_pool: Optional[ModelPool] = None,
+    metrics: Optional[Dict[str, float]] = None,
+) -> Iterator[StreamEvent]:
+    """Transcribes an audio file, yielding the (aligned) segments of every batch as soon as it is decoded
+
+    Yields two kinds of events:
+    - ("segments", new_segments): the segments of the latest batch, in order, with speaker labels once diarization is done
+    - ("speakers", segments): every segment yielded so far, with speaker labels, once diarization finishes
+
+    Args:
+        file_path (str | np.ndarray): Path of the audio file, or the already decoded 16 kHz mono float32 samples
+        model_name (Literal["medium", "large-v2", "large-v3"], optional): Whisper model to use. Defaults to "large-v2".
+        device (str, optional): Device to run models on. Defaults to "cuda".
+        batch_size (int, optional): Number of VAD segments decoded together, i.e. yielded per event. Defaults to 16.
+        compute_type (Literal["float16", "int8"], optional): Decides the precision to run the model on. Defaults to "float16".
+        language (str, optional): Language code of the audio, if not provided, the language is detected by the model.
+        align (bool, optional): Whether to align the segments (word level timestamps). Defaults to True.
+        assign_speaker_labels (bool, optional): Whether to diarize the audio (concurrently) and backfill speaker labels. Defaults to False.
+        diarization_model_name (str, optional): Custom diarization model to be used, see `get_transcription`
+        min_speakers (int, optional): Minimum number of speakers, see `get_transcription`
+        max_speakers (int, optional): Maximum number of speakers, see `get_transcription`
+        hugging_face_token (str, optional): HuggingFace token to access the diarization model, see `get_transcription`
+        model_save_dir (str, optional): Local path to save the downloaded whisper model to.
+        chunk_size (int, optional): Maximum length of a VAD segment in seconds. Defaults to 30.
+        model_pool (ModelPool, optional): Pool to fetch (and keep) the models from, if not provided, the models are loaded for this call.
+        metrics (Dict[str, float], optional): If provided, filled with "time_to_first_segment", "time_to_speakers", "wall_seconds" (measured from `metrics["start"]`, set to the time of the first `next` if missing, so one dict can be shared with `summarize_stream`), "audio_seconds" and "real_time_factor"
+
+    Yields:
+        Tuple[str, List[Dict[str, Any]]]: The kind of event and its segments
+    """
+    import whisperx
+
+    metrics = metrics if metrics is not None else {}
+    metrics.setdefault("start", time.perf_counter())
+    model_pool = model_pool if model_pool is not None else ModelPool()
+
+    audio = (
+        file_path
+        if isinstance(file_path, np.ndarray)
+        else whisperx.load_audio(file_path)
+    )
+
+    # Diarization only needs the audio, it runs alongside the transcription
+    executor = None
+    diarize_future = None
+    if assign_speaker_labels:
+        executor = ThreadPoolExecutor(max_workers=1)
+        diarize_future = executor.submit(
+            contextvars.copy_context().run,
+            diarize,
+            audio=audio,
+            model_name=diarization_model_name or "pyannote/speaker-diarization-3.1",
+            auth_token=hugging_face_token or os.getenv("HF_TOKEN"),
+            device=device,
+            min_speakers=min_speakers,
+            max_speakers=max_speakers,
+            model_pool=model_pool,
+            delete_model=False,
+            use_stream=True,
+        )
+
+    # Stages can't span a `yield`, the consumer would run inside them, so each stage covers the work between two
+    with stage(
+        "transcribe.prepare",
+        audio_seconds=audio_duration(audio),
+        model=model_name,
+        mode="stream",
+    ):
+        transcribe_model = load_model(
+            model_pool,
+            make_key("transcribe", model_name, device, compute_type, language),
+            lambda: whisperx.load_model(
+                model_name,
+                device,
+                compute_type=compute_type,
+                language=language,
+                download_root=model_save_dir,
+            ),
+            size_bytes=estimate_whisper_size(model_name, compute_type),
+        )
+
+        vad_segments = detect_vad_segments(transcribe_model, audio, chunk_size)
+        audio_language = find_language(transcribe_model, language, audio)
+
+        align_model = metadata = None
+        if align:
+            align_model, metadata = load_model(
+                model_pool,
+                make_key("align", audio_language, device),
+                lambda: whisperx.load_align_model(
+                    language_code=audio_language, device=device
+                ),
+            )
+
+    done: List[Dict[str, Any]] = []
+    diarize_segments = None
+
+    def finish_batch(batch: List[Dict[str, Any]]) -> Iterator[StreamEvent]:
+        nonlocal diarize_segments
+        if align:
+            with stage(
+                "transcribe.align",
+                audio_seconds=_segments_duration(batch),
+                mode="stream",
+            ):
+                batch = whisperx.align(
+                    batch,
+                    align_model,
+                    metadata,
+                    audio,
+                    device,
+                    return_char_alignments=False,
+                )["segments"]
+
+        # Backfill the speakers of the segments so far as soon as diarization is done
+        if diarize_segments is None and diarize_future is not None:
+            if diarize_future.done():
+                diarize_segments, metrics["diarize"] = diarize_future.result()
+                metrics["time_to_speakers"] = time.perf_counter() - metrics["start"]
+                if done:
+                    yield "speakers", _assign_speakers(diarize_segments, done)
+        if diarize_segments is not None:
+            batch = _assign_speakers(diarize_segments, batch)
+
+        done.extend(batch)
+        metrics.setdefault(
+            "time_to_first_segment", time.perf_counter() - metrics["start"]
+        )
+        yield "segments", batch
+
+    set_language(transcribe_model, audio_language)
+    try:
+        texts = run_batches(
+            transcribe_model, segment_inputs(audio, vad_segments), batch_size
+        )
+        for start in range(0, len(vad_segments), batch_size):
+            batch_vad_segments = vad_segments[start : start + batch_size]
+            # The batch is decoded when its first text is read
+            with stage(
+                "transcribe.transcribe",
+                audio_seconds=_segments_duration(batch_vad_segments),
+                model=model_name,
+                mode="stream",
+            ):
+                batch = [
+                    to_segment(next(texts), vad_segment)
+                    for vad_segment in batch_vad_segments
+                ]
+            yield from finish_batch(batch)
+
+        # Diarization outlived the transcription, backfill everything at once
+        if diarize_segments is None and diarize_future is not None:
+            diarize_segments, metrics["diarize"] = diarize_future.result()
+            metrics["time_to_speakers"] = time.perf_counter() - metrics["start"]
+            yield "speakers", _assign_speakers(diarize_segments, done)
+    finally:
+        reset_language(transcribe_model)
+        if executor is not None:
+            # A stream closed early (or failing) waits for the diarization, rather than leaving it running
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    metrics["wall_seconds"] = time.perf_counter() - metrics["start"]
+    metrics["audio_seconds"] = audio_duration(audio)
+    metrics["real_time_factor"] = (
+        metrics["wall_seconds"] / metrics["audio_seconds"]
+        if metrics["audio_seconds"]
+        else 0.0
+    )
+    logger.info(
+        f"Streamed {len(done)} segments, first after {metrics.get('time_to_first_segment', 0.0):.1f}s, "
+        f"all after {metrics['wall_seconds']:.1f}s"
+    )
+
+
+def stream_segments(events: Iterable[StreamEvent]) -> Iterator[Dict[str, Any]]:
+    """Yields the new segments of a `stream_transcription` stream one by one, ignoring the speaker backfills"""
+    for kind, segments in events:
+        if kind == "segments":
+            yield from segments
+
+
+def _segments_duration(segments: List[Dict[str, Any]]) -> float:
+    """Seconds of audio covered by segments with "start" and "end" keys"""
+    return sum(segment["end"] - segment["start"] for segment in segments)
+
+
+def _assign_speakers(
+    diarize_segments: Any, segments: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Labels the segments (in place) with the speakers of the diarization"""
+    import whisperx
+
+    return whisperx.assign_word_speakers(diarize_segments, {"segments": segments})[
+        "segments"
+    ]
@@ -1,19 +1,64 @@
 """Transcribes audio files locally"""
 
-import gc
+import contextvars
+import json
+import logging
 import os
-from typing import Literal, Union
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from multiprocessing import get_context
+from typing import TYPE_CHECKING, Dict, Literal, Optional, Union
 
-import torch
-import whisperx
+import numpy as np
 
+from ..cache.artifact_cache import ArtifactCache, hash_bytes, hash_file, hash_text
+from ..cache.fingerprint_index import FingerprintIndex
+from ..instrumentation.stages import current_stage, instrument, remote_parent, stage
+from ..pre_processing.audio_source import AudioSource
+from ..pre_processing.fingerprint import fingerprint
+from ..pre_processing.trim_silence import OffsetMap, trim_non_speech
+from .autotune import get_tuned_config
+from .batched_inference import (
+    SAMPLE_RATE,
+    detect_language_early,
+    detect_vad_segments,
+    find_language,
+    reset_language,
+    run_batches,
+    segment_inputs,
+    set_language,
+    to_segment,
+)
+from .checkpoint import (
+    DEFAULT_CHUNK_SEGMENTS,
+    TranscriptionCheckpoint,
+    diarization_from_records,
+    diarization_to_records,
+)
+from .model_pool import (
+    ModelPool,
+    estimate_whisper_size,
+    load_model,
+    make_key,
+    release_memory,
+)
+from .windowed import transcribe_windowed
 
+# torch and whisperx are imported on first use, they take seconds to import
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+
+@instrument("transcribe")
 def get_transcription(
-    file_path: str,
+    file_path: Union[str, np.ndarray],
     model_name: Literal["medium", "large-v2", "large-v3"] = "large-v2",
-    device: Union[torch.device, str] = "cuda",
-    batch_size: int = 16,
-    compute_type: Literal["float16", "int8"] = "float16",
+    device: Union["torch.device", str] = "cuda",
+    batch_size: Union[int, Literal["auto"]] = 16,
+    compute_type: Literal["float16", "int8", "auto"] = "float16",
     assign_speaker_labels: bool = True,
     diarization_model_name: str = None,
     min_speakers: int = None,
@@ -21,81 +66,609 @@ def get_transcription(
     hugging_face_token: str = None,
     model_save_dir: str = None,
     delete_model: bool = True,
+    language: Optional[str] = None,
+    model_pool: Optional[ModelPool] = None,
+    cache: Optional[ArtifactCache] = None,
+    trim_silence: bool = False,
+    offset_map: Optional[OffsetMap] = None,
+    parallel_diarization: Optional[Literal["thread", "process"]] = None,
+    diarization_device: Union["torch.device", str, None] = None,
+    preload_align_model: bool = False,
+    fingerprint_index: Optional[FingerprintIndex] = None,
+    window_seconds: Optional[float] = None,
+    window_overlap_seconds: float = 30.0,
+    checkpoint_dir: Optional[str] = None,
+    threads: Union[int, Literal["auto"], None] = None,
+    timings: Optional[Dict[str, float]] = None,
 ):
     """Transcribes an audio file locally
 
     Args:
-        file_path (str): relative path to the locally stored file
+        file_path (str | np.ndarray): relative path to the locally stored file, or the already decoded 16 kHz mono float32 samples (e.g. from `convert_to_array`)
         device (str, optional): Device to run models on. Defaults to "cuda".
-        batch_size (int, optional): _description_. Defaults to 16.
-        compute_type (Literal[&quot;float16&quot;, &quot;int8&quot;], optional): Decides the precision to run the model on. Defaults to "float16".
+        batch_size (int, optional): Number of 30 second VAD chunks the whisper model decodes at once, larger batches are faster but use more (GPU) memory. "auto" uses the batch size `summarize_media.transcribe.autotune` picked on this host (calibrating on first use). Defaults to 16.
+        compute_type (Literal[&quot;float16&quot;, &quot;int8&quot;, &quot;auto&quot;], optional): Decides the precision to run the model on. "auto" uses the tuned one, like `batch_size`. Defaults to "float16".
         hugging_face_token (str, optional): HuggingFace token to access the diarization (speaker assignment) model. If no value is provided, the function attempts to get a huggingface token from the environment using os.getenv("HF_TOKEN")
         diarization_model_name (str, optional): Custom diarization model to be used, by default, "[pyannote/speaker-diarization-3.1](https://huggingface.co/pyannote/speaker-diarization-3.1)" is used
         min_speakers (int, optional), Specifies the minimum speakers present in the audio, leave blank if unknown
         max_speakers (int, optional), Specifies the maximum speakers present in the audio, leave blank if unknown
         hugging_face_token: (str, optional), huggingface token for model access.
         model_save_dir (str, optional): Local path to save the downloaded whisper model to.
-        delete_model (bool, optional): whether to delete the model from memory after running that section, defaults to true.
+        delete_model (bool, optional): whether to delete the model from memory after running that section, defaults to true. Ignored when `model_pool` is provided.
+        language (str, optional): Language code of the audio (e.g. "en"), if not provided, the language is detected by the model.
+        model_pool (ModelPool, optional): Pool to fetch (and keep) the models from, see `summarize_media.transcribe.model_pool.get_model_pool` for the process-wide pool. The pool is opt-in: if not provided, models are loaded on every call (and deleted after use with `delete_model`), pass `get_model_pool()` to keep them warm across calls.
+        cache (ArtifactCache, optional): Cache to look the transcript up in (keyed by the content of the audio, the model and the diarization settings), and to store it in after transcription.
+        trim_silence (bool, optional): Whether to remove silence and non-speech regions before transcribing (see `summarize_media.pre_processing.trim_silence`), timestamps are mapped back to the original timeline. Defaults to False.
+        offset_map (OffsetMap, optional): Offset map of audio that was already trimmed (e.g. with `trim_non_speech`), the timestamps are mapped back through it.
+        parallel_diarization (Literal["thread", "process"], optional): Runs diarization (which only needs the audio) concurrently with transcription and alignment instead of after them. "thread" runs it on a worker thread (on its own CUDA stream when on a GPU), "process" in a separate process, which sidesteps the GIL on CPU-only nodes but loads the diarization model on every call. Both the whisper and the diarization model are held in memory at the same time. Defaults to None (sequential).
+        diarization_device (str, optional): Device to run diarization on, e.g. a second GPU or "cpu". Defaults to `device`.
+        preload_align_model (bool, optional): Whether to load the alignment model in the background while the audio is transcribed, instead of after it. Without `language`, the language is detected early from the first few VAD chunks (see `detect_language_early`); if the transcription ends up in another language, the matching model is loaded afterwards. Both models are held in memory at the same time. Defaults to False.
+        fingerprint_index (FingerprintIndex, optional): Index of the acoustic fingerprints of previously transcribed audio (see `summarize_media.cache.fingerprint_index.get_fingerprint_index`). If the audio matches one transcribed with the same model and diarization settings (e.g. a mirrored upload, re-encoded or with a trimmed intro), its transcript is reused, shifted to this audio's timeline; otherwise the new transcript is added to the index. Ignored with `offset_map`, whose audio is already trimmed.
+        window_seconds (float, optional): If provided, the file (a 16 kHz 16 bit PCM .wav, as written by `convert_to_wav`) is memory-mapped and transcribed, aligned and diarized in windows of this many seconds (see `summarize_media.transcribe.windowed`), so the memory used stays bounded on multi-hour recordings. `fingerprint_index` and `offset_map` are not supported with windows. Defaults to None (the whole file at once).
+        window_overlap_seconds (float, optional): Overlap between consecutive windows in seconds. Defaults to 30.
+        threads (int, optional): Number of CPU threads of the whisper model, "auto" uses the tuned one, like `batch_size`. Defaults to the whisperx default.
+        checkpoint_dir (str, optional): Directory to persist the partial results in as they are produced (the transcribed and aligned segments every `DEFAULT_CHUNK_SEGMENTS` VAD chunks, the diarization, and with windows, every finished window), see `summarize_media.transcribe.checkpoint`. A rerun with the same input and parameters resumes from the last finished chunk. The checkpoint is removed once the transcription succeeds.
+        timings (Dict[str, float], optional): If provided, filled with the wall time (in seconds) of each stage: "transcribe", "detect_language" (early detection), "align", "align_wait" (time spent waiting for a preloaded alignment model), "diarize", "diarize_wait" (time spent waiting for a parallel diarization to finish), "assign_speakers" and "total"
 
     """
     # Basically stolen from whisperX page
+    import whisperx
 
-    audio = whisperx.load_audio(file_path)
+    if "auto" in (batch_size, compute_type, threads):
+        tuned = get_tuned_config(model_name, str(device), model_save_dir)
+        batch_size = tuned["batch_size"] if batch_size == "auto" else batch_size
+        compute_type = tuned["compute_type"] if compute_type == "auto" else compute_type
+        threads = tuned["threads"] if threads == "auto" else threads
 
-    # 1. Transcribing audio
-    transcribe_model = whisperx.load_model(
-        model_name, device, compute_type=compute_type, download_root=model_save_dir
+    source_hash = None
+    # Windows are checkpointed by `transcribe_windowed`
+    if cache is not None or (checkpoint_dir is not None and window_seconds is None):
+        source_hash = (
+            hash_bytes(np.ascontiguousarray(file_path))
+            if isinstance(file_path, np.ndarray)
+            else hash_file(file_path)
+        )
+    # Everything that affects the transcript
+    transcript_params = dict(
+        model_name=model_name,
+        compute_type=compute_type,
+        batch_size=batch_size,
+        language=language,
+        assign_speaker_labels=assign_speaker_labels,
+        diarization_model_name=diarization_model_name,
+        min_speakers=min_speakers,
+        max_speakers=max_speakers,
+        trim_silence=trim_silence,
+        offset_map=(
+            hash_text(json.dumps(offset_map.to_dict())) if offset_map else None
+        ),
+        # Only part of the key when set, so the keys of whole file transcripts are unchanged
+        **(
+            dict(window=(window_seconds, window_overlap_seconds))
+            if window_seconds is not None
+            else {}
+        ),
     )
-    result = transcribe_model.transcribe(audio, batch_size=batch_size)
+    # Reuse a previous transcription of the same audio
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key("transcribe", source_hash, **transcript_params)
+        cached = cache.get_json(cache_key)
+        if cached is not None:
+            return cached
 
-    # Deletes transcribing model if required
-    if delete_model:
-        _delete_model(transcribe_model)
+    if window_seconds is not None:
+        if isinstance(file_path, np.ndarray) or offset_map is not None:
+            raise ValueError(
+                "window_seconds needs the path of a .wav file and can't be combined with offset_map"
+            )
+        with AudioSource(file_path) as source:
+            result = transcribe_windowed(
+                source,
+                window_seconds,
+                window_overlap_seconds,
+                timings=timings,
+                model_name=model_name,
+                device=device,
+                batch_size=batch_size,
+                compute_type=compute_type,
+                assign_speaker_labels=assign_speaker_labels,
+                diarization_model_name=diarization_model_name,
+                min_speakers=min_speakers,
+                max_speakers=max_speakers,
+                hugging_face_token=hugging_face_token,
+                model_save_dir=model_save_dir,
+                delete_model=delete_model,
+                language=language,
+                model_pool=model_pool,
+                trim_silence=trim_silence,
+                parallel_diarization=parallel_diarization,
+                diarization_device=diarization_device,
+                preload_align_model=preload_align_model,
+                checkpoint_dir=checkpoint_dir,
+                threads=threads,
+            )
+        return _finalize(result, None, cache, cache_key)
 
-    # 2. Align output
-    align_model, metadata = whisperx.load_align_model(
-        language_code=result["language"], device=device
-    )
-    result = whisperx.align(
-        result["segments"],
-        align_model,
-        metadata,
-        audio,
-        device,
-        return_char_alignments=False,
+    audio = (
+        file_path
+        if isinstance(file_path, np.ndarray)
+        else whisperx.load_audio(file_path)
     )
 
-    if delete_model:
-        _delete_model(align_model)
+    # Reuse the transcript of the same content, even if its bytes differ
+    index_entry = None
+    if fingerprint_index is not None and offset_map is None:
+        with stage("fingerprint", audio_seconds=len(audio) / SAMPLE_RATE):
+            audio_fingerprint = fingerprint(audio, SAMPLE_RATE)
+        params = dict(
+            model_name=model_name,
+            language=language,
+            assign_speaker_labels=assign_speaker_labels,
+            diarization_model_name=diarization_model_name,
+            min_speakers=min_speakers,
+            max_speakers=max_speakers,
+        )
+        found = fingerprint_index.find_transcript(audio_fingerprint, params=params)
+        if found is not None:
+            return _finalize(found[0], None, cache, cache_key)
+        index_key = cache_key or hash_text(
+            json.dumps({"audio": hash_bytes(np.ascontiguousarray(audio)), **params})
+        )
+        index_entry = (fingerprint_index, index_key, audio_fingerprint, params)
 
-    # 3. Assign speaker labels
-    if not assign_speaker_labels:
-        return result["segments"]
+    if trim_silence:
+        if offset_map is not None:
+            raise ValueError("Provide either trim_silence or offset_map, not both")
+        audio, offset_map = trim_non_speech(audio)
 
-    # See original code for [Diarization pipeline](https://github.com/m-bain/whisperX/blob/main/whisperx/diarize.py#L10)
-    diarization_model_name = (
-        diarization_model_name
-        if diarization_model_name
-        else "pyannote/speaker-diarization-3.1"
-    )
+    checkpoint = None
+    if checkpoint_dir is not None:
+        checkpoint = TranscriptionCheckpoint.for_input(
+            checkpoint_dir, source_hash, **transcript_params
+        )
+
+    audio_seconds = len(audio) / SAMPLE_RATE
+    record = current_stage()
+    if record is not None:
+        record.audio_seconds = audio_seconds
+
+    # Pooled models are kept alive for later calls
+    delete_model = delete_model and model_pool is None
+    timings = timings if timings is not None else {}
+    total_start = time.perf_counter()
+
+    # Diarization only needs the audio, so it can start right away
+    diarize_args = None
+    diarize_future = None
+    executor: Optional[Executor] = None
+    align_executor: Optional[Executor] = None
+    align_future = None
+    diarize_segments = None
+    if assign_speaker_labels and checkpoint is not None:
+        saved = checkpoint.load("diarize")
+        if saved is not None:
+            diarize_segments = diarization_from_records(saved)
+            timings["diarize"] = 0.0
+    if assign_speaker_labels:
+        diarize_args = dict(
+            audio=audio,
+            # See original code for [Diarization pipeline](https://github.com/m-bain/whisperX/blob/main/whisperx/diarize.py#L10)
+            model_name=diarization_model_name or "pyannote/speaker-diarization-3.1",
+            auth_token=hugging_face_token or os.getenv("HF_TOKEN"),
+            device=diarization_device if diarization_device is not None else device,
+            min_speakers=min_speakers,
+            max_speakers=max_speakers,
+        )
+        if diarize_segments is not None:
+            # Diarized by a previous run
+            pass
+        elif parallel_diarization == "thread":
+            executor = ThreadPoolExecutor(max_workers=1)
+            # The diarization stage nests under the current one
+            diarize_future = executor.submit(
+                contextvars.copy_context().run,
+                diarize,
+                **diarize_args,
+                model_pool=model_pool,
+                delete_model=delete_model,
+                use_stream=True,
+            )
+        elif parallel_diarization == "process":
+            # CUDA and torch do not survive a fork
+            executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=get_context("spawn")
+            )
+            parent = current_stage()
+            diarize_future = executor.submit(
+                _diarize_in_process,
+                parent_stage=parent.name if parent is not None else None,
+                **diarize_args,
+            )
+        elif parallel_diarization is not None:
+            raise ValueError(
+                f"parallel_diarization must be one of 'thread', 'process' or None, got {parallel_diarization}"
+            )
+        if diarize_future is not None and checkpoint is not None:
+            # Saved as soon as it is done, even if the transcription fails later
+            diarize_future.add_done_callback(
+                lambda future: _save_diarization(checkpoint, future)
+            )
+
+    try:
+        # 1. Transcribing audio
+        start = time.perf_counter()
+        with stage(
+            "transcribe.transcribe",
+            audio_seconds=audio_seconds,
+            model=model_name,
+            compute_type=compute_type,
+            batch_size=batch_size,
+        ):
+            transcribe_model = load_model(
+                model_pool,
+                make_key(
+                    "transcribe",
+                    model_name,
+                    device,
+                    compute_type,
+                    language,
+                    *([threads] if threads is not None else []),
+                ),
+                lambda: whisperx.load_model(
+                    model_name,
+                    device,
+                    compute_type=compute_type,
+                    language=language,
+                    download_root=model_save_dir,
+                    **({"threads": threads} if threads is not None else {}),
+                ),
+                size_bytes=estimate_whisper_size(model_name, compute_type),
+            )
 
-    auth_token = hugging_face_token or os.getenv("HF_TOKEN")
-    diarize_model = whisperx.DiarizationPipeline(
-        use_auth_token=auth_token,
-        device=device,
-        model_name=diarization_model_name,
+            # The alignment model only depends on the language, load it while the audio is transcribed
+            if preload_align_model:
+                early_language = language or transcribe_model.preset_language
+                if early_language is None:
+                    detect_start = time.perf_counter()
+                    early_language = detect_language_early(transcribe_model, audio)
+                    timings["detect_language"] = time.perf_counter() - detect_start
+                if early_language is not None:
+                    align_executor = ThreadPoolExecutor(max_workers=1)
+                    align_future = align_executor.submit(
+                        contextvars.copy_context().run,
+                        _load_align_model,
+                        model_pool,
+                        early_language,
+                        device,
+                    )
+
+            if checkpoint is not None:
+                result = _transcribe_chunks(
+                    transcribe_model, audio, language, batch_size, checkpoint
+                )
+            else:
+                result = transcribe_model.transcribe(audio, batch_size=batch_size)
+
+            # Deletes transcribing model if required
+            if delete_model:
+                _delete_model(transcribe_model)
+        timings["transcribe"] = time.perf_counter() - start
+
+        # 2. Align output
+        start = time.perf_counter()
+        with stage("transcribe.align", audio_seconds=audio_seconds):
+            align_model, metadata = _preloaded_align_model(
+                align_future, result["language"], delete_model, timings
+            )
+            if align_model is None:
+                align_model, metadata = _load_align_model(
+                    model_pool, result["language"], device
+                )
+            if checkpoint is not None:
+                result = _align_chunks(
+                    result["segments"], align_model, metadata, audio, device, checkpoint
+                )
+            else:
+                result = whisperx.align(
+                    result["segments"],
+                    align_model,
+                    metadata,
+                    audio,
+                    device,
+                    return_char_alignments=False,
+                )
+
+            if delete_model:
+                _delete_model(align_model)
+        timings["align"] = time.perf_counter() - start
+
+        # 3. Assign speaker labels
+        if not assign_speaker_labels:
+            timings["total"] = time.perf_counter() - total_start
+            return _finalize(
+                result["segments"],
+                offset_map,
+                cache,
+                cache_key,
+                index_entry,
+                checkpoint,
+            )
+
+        if diarize_segments is not None:
+            pass
+        elif diarize_future is not None:
+            start = time.perf_counter()
+            diarize_segments, timings["diarize"] = diarize_future.result()
+            timings["diarize_wait"] = time.perf_counter() - start
+        else:
+            diarize_segments, timings["diarize"] = diarize(
+                **diarize_args, model_pool=model_pool, delete_model=delete_model
+            )
+            if checkpoint is not None:
+                checkpoint.save("diarize", diarization_to_records(diarize_segments))
+    finally:
+        # On errors, don't return while a worker still holds its model (and device memory)
+        _stop_worker(executor, diarize_future)
+        _stop_worker(align_executor, align_future)
+
+    start = time.perf_counter()
+    result = whisperx.assign_word_speakers(diarize_segments, result)
+    timings["assign_speakers"] = time.perf_counter() - start
+    timings["total"] = time.perf_counter() - total_start
+
+    return _finalize(result, offset_map, cache, cache_key, index_entry, checkpoint)
+
+
+def _load_align_model(
+    model_pool: Optional[ModelPool], language: str, device: Union["torch.device", str]
+):
+    """Loads the alignment model (and its metadata) of a language"""
+    import whisperx
+
+    return load_model(
+        model_pool,
+        make_key("align", language, device),
+        lambda: whisperx.load_align_model(language_code=language, device=device),
     )
-    diarize_segments = diarize_model(
-        audio, min_speakers=min_speakers, max_speakers=max_speakers
+
+
+def _preloaded_align_model(
+    align_future: Optional[Future],
+    language: str,
+    delete_model: bool,
+    timings: Dict[str, float],
+):
+    """Waits for the alignment model loaded in the background, if it matches the transcript's language
+
+    Returns:
+        Tuple: The alignment model and its metadata, (None, None) if there is none to use, and it needs to be loaded
+    """
+    if align_future is None:
+        return None, None
+
+    start = time.perf_counter()
+    try:
+        align_model, metadata = align_future.result()
+    except ValueError as e:
+        # whisperX has no default alignment model for the early detected language, the transcript's may have one
+        if "No default align-model" not in str(e):
+            raise
+        logger.warning(
+            f"Preloading the alignment model failed ({e}), loading the one of the transcript's language"
+        )
+        return None, None
+    finally:
+        timings["align_wait"] = time.perf_counter() - start
+
+    if metadata["language"] != language:
+        logger.info(
+            f"Early detected language {metadata['language']} differs from the transcript's {language}, "
+            "loading the matching alignment model"
+        )
+        if delete_model:
+            _delete_model(align_model)
+        return None, None
+    return align_model, metadata
+
+
+def _transcribe_chunks(
+    model,
+    audio: np.ndarray,
+    language: Optional[str],
+    batch_size: int,
+    checkpoint: TranscriptionCheckpoint,
+    chunk_segments: int = DEFAULT_CHUNK_SEGMENTS,
+):
+    """Transcribes the audio like `FasterWhisperPipeline.transcribe`, saving the segments of every `chunk_segments` VAD chunks
+
+    The language, the VAD chunks and the finished chunks of a previous run are loaded from the checkpoint instead.
+
+    Returns:
+        dict: "language" and "segments", as returned by `FasterWhisperPipeline.transcribe`
+    """
+    language = (
+        language or checkpoint.load("language") or find_language(model, None, audio)
     )
+    checkpoint.save("language", language)
+    vad_segments = checkpoint.load("vad")
+    if vad_segments is None:
+        vad_segments = detect_vad_segments(model, audio)
+        checkpoint.save("vad", vad_segments)
+
+    segments = []
+    set_language(model, language)
+    try:
+        for index, start in enumerate(range(0, len(vad_segments), chunk_segments)):
+            name = f"transcribe/{index:05d}"
+            chunk = checkpoint.load(name)
+            if chunk is None:
+                vad_chunk = vad_segments[start : start + chunk_segments]
+                texts = run_batches(model, segment_inputs(audio, vad_chunk), batch_size)
+                chunk = [to_segment(text, vad) for text, vad in zip(texts, vad_chunk)]
+                checkpoint.save(name, chunk)
+            segments.extend(chunk)
+    finally:
+        reset_language(model)
+    return {"language": language, "segments": segments}
+
+
+def _align_chunks(
+    segments,
+    align_model,
+    metadata,
+    audio: np.ndarray,
+    device: Union["torch.device", str],
+    checkpoint: TranscriptionCheckpoint,
+    chunk_segments: int = DEFAULT_CHUNK_SEGMENTS,
+):
+    """Aligns the segments `chunk_segments` at a time, saving every aligned chunk (or loading it from a previous run)"""
+    import whisperx
+
+    result = {"segments": [], "word_segments": []}
+    for index, start in enumerate(range(0, len(segments), chunk_segments)):
+        name = f"align/{index:05d}"
+        chunk = checkpoint.load(name)
+        if chunk is None:
+            chunk = whisperx.align(
+                segments[start : start + chunk_segments],
+                align_model,
+                metadata,
+                audio,
+                device,
+                return_char_alignments=False,
+            )
+            checkpoint.save(name, chunk)
+        result["segments"].extend(chunk["segments"])
+        result["word_segments"].extend(chunk.get("word_segments", []))
+    return result
 
-    result = whisperx.assign_word_speakers(diarize_segments, result)
 
+def _save_diarization(checkpoint: TranscriptionCheckpoint, future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        checkpoint.save("diarize", diarization_to_records(future.result()[0]))
+
+
+def diarize(
+    audio: np.ndarray,
+    model_name: str,
+    auth_token: Optional[str],
+    device: Union["torch.device", str],
+    min_speakers: Optional[int],
+    max_speakers: Optional[int],
+    model_pool: Optional[ModelPool] = None,
+    delete_model: bool = True,
+    use_stream: bool = False,
+):
+    """Runs the diarization model on the audio
+
+    Args:
+        audio (np.ndarray): 16 kHz mono float32 samples
+        model_name (str): Diarization model, e.g. "pyannote/speaker-diarization-3.1"
+        auth_token (str, optional): HuggingFace token to access the model
+        device (str): Device to run the model on
+        min_speakers (int, optional): Minimum number of speakers
+        max_speakers (int, optional): Maximum number of speakers
+        model_pool (ModelPool, optional): Pool to fetch (and keep) the model from, see `load_model`
+        delete_model (bool, optional): Whether to delete the model after use. Defaults to True.
+        use_stream (bool, optional): Whether to run on a dedicated CUDA stream, so the work overlaps with the GPU work of other threads. Defaults to False.
+
+    Returns:
+        Tuple[pd.DataFrame, float]: The diarization segments and the wall time (in seconds) it took
+    """
+    import whisperx
+
+    start = time.perf_counter()
+    with stage(
+        "transcribe.diarize", audio_seconds=len(audio) / SAMPLE_RATE, model=model_name
+    ):
+        diarize_model = load_model(
+            model_pool,
+            make_key("diarize", model_name, device),
+            lambda: whisperx.DiarizationPipeline(
+                use_auth_token=auth_token,
+                device=device,
+                model_name=model_name,
+            ),
+        )
+        with _cuda_stream(device) if use_stream else nullcontext():
+            diarize_segments = diarize_model(
+                audio, min_speakers=min_speakers, max_speakers=max_speakers
+            )
+
+        if delete_model:
+            _delete_model(diarize_model)
+
+    return diarize_segments, time.perf_counter() - start
+
+
+def _diarize_in_process(parent_stage: Optional[str] = None, **diarize_args):
+    """Entry point of the diarization process, models can not be shared across processes so nothing is pooled"""
+    with remote_parent(parent_stage):
+        return diarize(**diarize_args)
+
+
+def _stop_worker(executor: Optional[Executor], future: Optional[Future]) -> None:
+    """Shuts down a background worker, waiting for its running thread (threads can't be interrupted), or
+    terminating its process if the work is not done"""
+    if executor is None:
+        return
+    if (
+        isinstance(executor, ProcessPoolExecutor)
+        and future is not None
+        and not future.done()
+    ):
+        logger.info("Terminating the unfinished diarization process")
+        terminate_workers = getattr(executor, "terminate_workers", None)
+        if terminate_workers is not None:
+            # Python 3.14+
+            terminate_workers()
+            return
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+    executor.shutdown(wait=True, cancel_futures=True)
+
+
+@contextmanager
+def _cuda_stream(device: Union["torch.device", str]):
+    """Runs the enclosed GPU work on a dedicated CUDA stream, so it can overlap with work queued from other threads"""
+    if not str(device).startswith("cuda"):
+        yield
+        return
+
+    import torch
+
+    stream = torch.cuda.Stream(device)
+    with torch.cuda.stream(stream):
+        yield
+    stream.synchronize()
+
+
+def _finalize(
+    result,
+    offset_map: Optional[OffsetMap],
+    cache: Optional[ArtifactCache],
+    cache_key: Optional[str],
+    index_entry: Optional[tuple] = None,
+    checkpoint: Optional[TranscriptionCheckpoint] = None,
+):
+    """Maps the transcript back to the original timeline (if trimmed), caches it and adds it to the fingerprint index
+
+    The checkpoint of the transcription, if any, is no longer needed and removed.
+    """
+    if offset_map is not None:
+        result = offset_map.remap_transcript(result)
+    if cache is not None:
+        cache.put_json(cache_key, result)
+    if index_entry is not None:
+        index, key, audio_fingerprint, params = index_entry
+        index.add(key, audio_fingerprint, transcript=result, params=params)
+    if checkpoint is not None:
+        checkpoint.clear()
     return result
 
 
 def _delete_model(model):
     """Deletes the provided model"""
-    gc.collect()
-    torch.cuda.empty_cache()
+    release_memory()
     del model
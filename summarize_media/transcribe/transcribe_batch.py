@@ -0,0 +1,285 @@
+"""Transcribes many audio files locally, sharing models and batches across files"""
+
+import logging
+import os
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from ..instrumentation.stages import stage
+from .batched_inference import (
+    audio_duration,
+    detect_vad_segments,
+    find_language,
+    reset_language,
+    run_batches,
+    segment_inputs,
+    set_language,
+    to_segment,
+)
+from .model_pool import ModelPool, estimate_whisper_size, load_model, make_key
+
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+
+def transcribe_many(
+    paths: List[str],
+    model_name: Literal["medium", "large-v2", "large-v3"] = "large-v2",
+    device: Union["torch.device", str] = "cuda",
+    batch_size: int = 16,
+    compute_type: Literal["float16", "int8"] = "float16",
+    language: Optional[str] = None,
+    align: bool = True,
+    assign_speaker_labels: bool = False,
+    diarization_model_name: str = None,
+    hugging_face_token: str = None,
+    model_save_dir: str = None,
+    chunk_size: int = 30,
+    model_pool: Optional[ModelPool] = None,
+    stats: Optional[Dict[str, float]] = None,
+) -> Iterator[Tuple[str, Any]]:
+    """Transcribes many audio files, packing the VAD segments of several files into shared batches
+
+    `get_transcription` only batches the VAD segments of one file, so short clips leave the device mostly idle.
+    Here the models are loaded once, the files are sorted by duration (shortest first), and the VAD segments of
+    consecutive files are fed through the model as one stream, so batches span file boundaries. Files are grouped
+    by language (a batch shares one tokenizer), and each file's result is yielded as soon as its last segment is
+    decoded (and aligned/ diarized).
+
+    Only the audio of the files in the batches being decoded is kept in memory: durations are probed with ffprobe,
+    and each file is loaded when its first batch is scheduled and dropped once its result is yielded. Without a
+    `language`, every file is loaded once upfront to detect its language (keeping only the language and the VAD
+    segments), then loaded again when it is transcribed.
+
+    Example:
+    ```python
+    stats = {}
+    for path, segments in transcribe_many(paths, stats=stats):
+        save(path, segments)
+    print(stats["real_time_factor"])
+    ```
+
+    Args:
+        paths (List[str]): Paths of the audio files to transcribe
+        model_name (Literal["medium", "large-v2", "large-v3"], optional): Whisper model to use. Defaults to "large-v2".
+        device (str, optional): Device to run models on. Defaults to "cuda".
+        batch_size (int, optional): Number of VAD segments decoded together. Defaults to 16.
+        compute_type (Literal["float16", "int8"], optional): Decides the precision to run the model on. Defaults to "float16".
+        language (str, optional): Language code of every file, if not provided, the language of each file is detected.
+        align (bool, optional): Whether to align the segments (word level timestamps). Defaults to True.
+        assign_speaker_labels (bool, optional): Whether to assign speaker labels (requires `align`). Defaults to False.
+        diarization_model_name (str, optional): Custom diarization model to be used, see `get_transcription`
+        hugging_face_token (str, optional): HuggingFace token to access the diarization model, see `get_transcription`
+        model_save_dir (str, optional): Local path to save the downloaded whisper model to.
+        chunk_size (int, optional): Maximum length of a VAD segment in seconds. Defaults to 30.
+        model_pool (ModelPool, optional): Pool to fetch the models from, if not provided, the models are loaded once for this call.
+        stats (Dict[str, float], optional): If provided, filled with "files", "audio_seconds", "wall_seconds" and the aggregate "real_time_factor" (wall time over audio duration, lower is faster) once every file is done
+
+    Yields:
+        Tuple[str, Any]: The path of each file along with its transcript, in the same format `get_transcription` returns
+    """
+    import whisperx
+
+    start_time = time.perf_counter()
+    stats = stats if stats is not None else {}
+    model_pool = model_pool if model_pool is not None else ModelPool()
+
+    # Stages can't span a `yield`, the consumer would run inside them, so each stage covers the work between two
+    with stage("transcribe.prepare", model=model_name, mode="batch") as record:
+        transcribe_model = load_model(
+            model_pool,
+            make_key("transcribe", model_name, device, compute_type, language),
+            lambda: whisperx.load_model(
+                model_name,
+                device,
+                compute_type=compute_type,
+                language=language,
+                download_root=model_save_dir,
+            ),
+            size_bytes=estimate_whisper_size(model_name, compute_type),
+        )
+
+        # Probe (or detect the language of) every file, shortest first, without keeping the audio around
+        files = [_scan(path, transcribe_model, language, chunk_size) for path in paths]
+        files.sort(key=lambda file: file["duration"])
+        record.audio_seconds = sum(file["duration"] for file in files)
+
+    languages = list(dict.fromkeys(file["language"] for file in files))
+    total_audio = sum(file["duration"] for file in files)
+
+    try:
+        for group_language in languages:
+            group = [file for file in files if file["language"] == group_language]
+            set_language(transcribe_model, group_language)
+
+            for file, segments in _decode_group(
+                transcribe_model, group, batch_size, chunk_size
+            ):
+                result = {"segments": segments, "language": group_language}
+                result = _post_process(
+                    result,
+                    file["audio"],
+                    device,
+                    align,
+                    assign_speaker_labels,
+                    diarization_model_name,
+                    hugging_face_token,
+                    model_pool,
+                )
+                # The audio is no longer needed once the file is done
+                file["audio"] = None
+                yield file["path"], result
+    finally:
+        reset_language(transcribe_model)
+
+    wall_seconds = time.perf_counter() - start_time
+    stats.update(
+        {
+            "files": len(files),
+            "audio_seconds": total_audio,
+            "wall_seconds": wall_seconds,
+            "real_time_factor": wall_seconds / total_audio if total_audio else 0.0,
+        }
+    )
+    logger.info(
+        f"Transcribed {len(files)} files ({total_audio:.0f}s of audio) in {wall_seconds:.0f}s, "
+        f"real time factor: {stats['real_time_factor']:.3f}"
+    )
+
+
+def _scan(
+    path: str, model: Any, language: Optional[str], chunk_size: int
+) -> Dict[str, Any]:
+    """Collects what is needed to schedule a file: its duration, and its language (and VAD segments) if not known
+
+    The audio is not kept, see `_prepare`.
+    """
+    import whisperx
+
+    from ..pre_processing.convert_audio_format import probe_media
+
+    language = language or model.preset_language
+    file = {"path": path, "audio": None, "vad_segments": None, "language": language}
+    if language is not None:
+        file["duration"] = probe_media(path)["duration"]
+        return file
+
+    audio = whisperx.load_audio(path)
+    file["duration"] = audio_duration(audio)
+    file["vad_segments"] = detect_vad_segments(model, audio, chunk_size)
+    file["language"] = find_language(model, None, audio)
+    return file
+
+
+def _prepare(file: Dict[str, Any], model: Any, chunk_size: int) -> Dict[str, Any]:
+    """Loads the audio (and runs the VAD) of a scanned file, unless it is already loaded"""
+    import whisperx
+
+    if file["audio"] is None:
+        file["audio"] = whisperx.load_audio(file["path"])
+    if file["vad_segments"] is None:
+        file["vad_segments"] = detect_vad_segments(model, file["audio"], chunk_size)
+    return file
+
+
+def _decode_group(
+    model: Any, group: List[Dict[str, Any]], batch_size: int, chunk_size: int
+) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """Decodes the VAD segments of a group of files as one stream, yielding each file once its segments are decoded
+
+    Files are loaded as the batches reach them (the model may read a batch ahead), the caller drops the audio of
+    each yielded file.
+    """
+
+    def inputs():
+        for file in group:
+            _prepare(file, model, chunk_size)
+            yield from segment_inputs(file["audio"], file["vad_segments"])
+
+    texts = run_batches(model, inputs(), batch_size)
+    for file in group:
+        # Batches span files, so the stage of a file includes the rest of the batch it ends in
+        with stage(
+            "transcribe.transcribe",
+            audio_seconds=file["duration"],
+            mode="batch",
+        ):
+            # The file is usually prepared by `inputs` already, unless none of its segments has been read yet
+            _prepare(file, model, chunk_size)
+            segments = [
+                to_segment(next(texts), vad_segment)
+                for vad_segment in file["vad_segments"]
+            ]
+        yield file, segments
+
+
+def _post_process(
+    result: Dict[str, Any],
+    audio,
+    device,
+    align: bool,
+    assign_speaker_labels: bool,
+    diarization_model_name: Optional[str],
+    hugging_face_token: Optional[str],
+    model_pool: ModelPool,
+) -> Any:
+    """Aligns and diarizes the transcript of one file, matching the output format of `get_transcription`"""
+    import whisperx
+
+    if not align:
+        return result["segments"]
+
+    audio_seconds = audio_duration(audio)
+    with stage("transcribe.align", audio_seconds=audio_seconds, mode="batch"):
+        align_model, metadata = load_model(
+            model_pool,
+            make_key("align", result["language"], device),
+            lambda: whisperx.load_align_model(
+                language_code=result["language"], device=device
+            ),
+        )
+        result = whisperx.align(
+            result["segments"],
+            align_model,
+            metadata,
+            audio,
+            device,
+            return_char_alignments=False,
+        )
+
+    if not assign_speaker_labels:
+        return result["segments"]
+
+    diarization_model_name = (
+        diarization_model_name or "pyannote/speaker-diarization-3.1"
+    )
+    auth_token = hugging_face_token or os.getenv("HF_TOKEN")
+    with stage(
+        "transcribe.diarize",
+        audio_seconds=audio_seconds,
+        model=diarization_model_name,
+        mode="batch",
+    ):
+        diarize_model = load_model(
+            model_pool,
+            make_key("diarize", diarization_model_name, device),
+            lambda: whisperx.DiarizationPipeline(
+                use_auth_token=auth_token,
+                device=device,
+                model_name=diarization_model_name,
+            ),
+        )
+        diarize_segments = diarize_model(audio)
+    return whisperx.assign_word_speakers(diarize_segments, result)
@@ -1,14 +1,18 @@
 """Transcribe input media (e.g. podcasts) via cloud service e.g. replicate"""
 
 import logging
-from typing import Any, Literal
+import os
+from typing import Any, Literal, Optional
 
 import httpx
 import replicate
 from _io import BufferedReader
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from ..cache.artifact_cache import hash_file, hash_text
+from ..instrumentation.stages import stage
+from ..pre_processing.trim_silence import OffsetMap
+from .checkpoint import TranscriptionCheckpoint
+
 logger = logging.getLogger(__name__)
 
 models = {
@@ -26,12 +30,19 @@ default_timeout = httpx.Timeout(
 )
 
 
+def audio_input_key(model_name: str) -> str:
+    """Name of the audio input of a model, it differs between the whisperX deployments"""
+    return "audio_file" if model_name == "large-v3" else "audio"
+
+
 # Input must be a .wav file
 def get_transcribe_cloud(
     audio: str | BufferedReader,
     model_name: Literal["medium", "large-v2", "large-v3"] = "large-v3",
     debug: bool = False,
     timeout: httpx.Timeout = None,
+    offset_map: Optional[OffsetMap] = None,
+    checkpoint_dir: Optional[str] = None,
     **kwargs: Any,
 ) -> Any:
     """Transcribes an audio file via replicate (cloud service)
@@ -45,6 +56,8 @@ def get_transcribe_cloud(
         model (str): Choose which model to use, must be one of "medium", "large-v2" and "large-v3", defaults to "large-v2"
         debug (bool): If True, enable logging output. Defaults to False
         timeout (httpx.Timeout): Timeout settings for the replicate service
+        offset_map (OffsetMap, optional): Offset map of audio trimmed with `summarize_media.pre_processing.trim_silence.trim_wav`, the timestamps are mapped back to the original timeline
+        checkpoint_dir (str, optional): Directory to save the id of the prediction in, so a rerun (e.g. after the worker crashed) waits for the running prediction instead of paying for a new one, see `summarize_media.transcribe.checkpoint`
         kwargs: Refer to each model's schema page
 
     returns:
@@ -53,8 +66,11 @@ def get_transcribe_cloud(
     timeout = timeout if timeout is not None else default_timeout
 
     logger.setLevel(logging.INFO if debug else logging.WARNING)
+    if debug and not logging.getLogger().handlers:
+        # Logging is only configured on request, never at import time
+        logging.basicConfig(level=logging.INFO)
 
-    audio_key = "audio_file" if model_name == "large-v3" else "audio"
+    audio_key = audio_input_key(model_name)
 
     # audio = open(file_path, "rb") if file_path else url
     # input = {audio_key: audio} | kwargs
@@ -68,6 +84,59 @@ def get_transcribe_cloud(
     for key, value in kwargs.items():
         logger.info(f"  {key}: {value}")
 
-    output = replicate.run(models[model_name], input=input)
+    with stage("transcribe_cloud", model=model_name):
+        if checkpoint_dir is None:
+            output = replicate.run(models[model_name], input=input)
+        else:
+            output = _run_checkpointed(
+                TranscriptionCheckpoint.for_input(
+                    checkpoint_dir,
+                    _source_hash(audio),
+                    model_name=model_name,
+                    **kwargs,
+                ),
+                model_name,
+                input,
+            )
+
+    if offset_map is not None:
+        output = offset_map.remap_transcript(output)
 
     return output
+
+
+def _run_checkpointed(
+    checkpoint: TranscriptionCheckpoint, model_name: str, input: dict
+) -> Any:
+    """Like `replicate.run`, but resumes the prediction saved in the checkpoint, if it can still succeed"""
+    prediction = None
+    saved = checkpoint.load("prediction")
+    if saved is not None:
+        prediction = replicate.predictions.get(saved["id"])
+        if prediction.status in ("failed", "canceled"):
+            logger.info(
+                f"Prediction {prediction.id} {prediction.status}, starting over"
+            )
+            prediction = None
+        else:
+            logger.info(f"Resuming prediction {prediction.id} ({prediction.status})")
+    if prediction is None:
+        prediction = replicate.predictions.create(
+            version=models[model_name].split(":")[1], input=input
+        )
+        checkpoint.save("prediction", {"id": prediction.id})
+
+    prediction.wait()
+    if prediction.status != "succeeded":
+        raise RuntimeError(
+            f"Prediction {prediction.id} {prediction.status}: {prediction.error}"
+        )
+    checkpoint.clear()
+    return prediction.output
+
+
+def _source_hash(audio: str | BufferedReader) -> str:
+    """Hash of a local file (a path or an open file) or of an url"""
+    if isinstance(audio, str):
+        return hash_file(audio) if os.path.isfile(audio) else hash_text(audio)
+    return hash_file(audio.name)
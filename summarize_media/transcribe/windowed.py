@@ -0,0 +1,243 @@
+"""Transcribes multi-hour recordings window by window, with bounded memory
+
+`get_transcription` holds the whole decoded audio (and every model's intermediate outputs over it) in memory at
+once. `transcribe_windowed` reads overlapping windows from a memory-mapped `AudioSource` instead, and runs
+transcription, alignment and diarization on one window at a time, so the peak memory depends on the window length
+rather than on the length of the recording.
+
+The windows overlap so that speech cut at a window boundary is transcribed whole by one of them: every window keeps
+the segments centered before the middle of its overlap with the next window, and the next one the segments after
+the last kept one. Diarization labels speakers independently in every window, so the labels of a window are mapped
+to the ones of the previous window through the speech both windows transcribed in their overlap. A speaker who
+is silent during an overlap can't be linked that way and gets a new label, longer overlaps make that rarer.
+
+Example:
+```python
+with AudioSource(convert_to_wav(path)) as source:
+    transcript = transcribe_windowed(source, window_seconds=1800, assign_speaker_labels=True)
+```
+"""
+
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..cache.artifact_cache import hash_file
+from ..instrumentation.stages import current_stage
+from ..pre_processing.audio_source import AudioSource
+from .batched_inference import SAMPLE_RATE
+from .checkpoint import TranscriptionCheckpoint
+from .model_pool import ModelPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW_SECONDS = 1800.0
+DEFAULT_OVERLAP_SECONDS = 30.0
+
+# Arguments of `get_transcription` that apply to the whole recording, not to a window
+_WHOLE_FILE_ARGS = ("cache", "offset_map", "fingerprint_index", "window_seconds")
+
+
+def transcribe_windowed(
+    source: AudioSource,
+    window_seconds: float = DEFAULT_WINDOW_SECONDS,
+    overlap_seconds: float = DEFAULT_OVERLAP_SECONDS,
+    timings: Optional[Dict[str, float]] = None,
+    checkpoint_dir: Optional[str] = None,
+    **transcribe_args: Any,
+):
+    """Transcribes (and aligns and diarizes) an audio source one window at a time
+
+    Args:
+        source (AudioSource): 16 kHz audio to transcribe, e.g. `AudioSource(convert_to_wav(path))`
+        window_seconds (float, optional): Length of a window in seconds, bounds the memory used. Defaults to 1800.
+        overlap_seconds (float, optional): Length of the overlap between consecutive windows, should exceed the longest expected segment. Defaults to 30.
+        timings (Dict[str, float], optional): If provided, filled with the wall time of each stage summed over the windows (see `get_transcription`), and "windows", the number of windows
+        checkpoint_dir (str, optional): Directory to save every finished window in (and the chunks of the current one, see `get_transcription`), so a rerun resumes from the last finished window. Removed once every window is done.
+        **transcribe_args: Arguments of `get_transcription` (model_name, device, assign_speaker_labels, ...). A process-wide model pool is not required, the models are kept for the duration of the call either way.
+
+    Returns:
+        The transcript in the format of `get_transcription`: a list of segments, or a dict with "segments" and "word_segments" with speaker labels
+    """
+    from .transcribe import get_transcription
+
+    if source.sample_rate != SAMPLE_RATE:
+        raise ValueError(
+            f"{source.path} is sampled at {source.sample_rate} Hz, convert it to {SAMPLE_RATE} Hz with convert_to_wav"
+        )
+    for name in _WHOLE_FILE_ARGS:
+        if transcribe_args.pop(name, None) is not None:
+            logger.warning(
+                f"{name} is not supported by windowed transcription, ignoring it"
+            )
+
+    # Don't reload the models for every window
+    if transcribe_args.get("model_pool") is None:
+        transcribe_args["model_pool"] = ModelPool()
+
+    record = current_stage()
+    if record is not None:
+        record.audio_seconds = source.duration
+
+    checkpoint = None
+    if checkpoint_dir is not None:
+        checkpoint = TranscriptionCheckpoint.for_input(
+            checkpoint_dir,
+            hash_file(source.path),
+            window=(window_seconds, overlap_seconds),
+            **{
+                name: value
+                for name, value in transcribe_args.items()
+                if isinstance(value, (str, int, float, bool, type(None)))
+            },
+        )
+        # The chunks of the current window are checkpointed alongside the finished windows
+        transcribe_args["checkpoint_dir"] = checkpoint.directory
+
+    windows = source.windows(window_seconds, overlap_seconds)
+    timings = timings if timings is not None else {}
+    timings["windows"] = len(windows)
+
+    segments: List[Dict[str, Any]] = []
+    labels = set()
+    labeled = False
+    previous: List[Dict[str, Any]] = []
+    kept_until = 0.0
+    for index, (start, end) in enumerate(windows):
+        window_timings: Dict[str, float] = {}
+        name = f"window/{index:05d}"
+        result = checkpoint.load(name) if checkpoint is not None else None
+        if result is None:
+            result = get_transcription(
+                source.read(start, end), timings=window_timings, **transcribe_args
+            )
+            if checkpoint is not None:
+                checkpoint.save(name, result)
+        for name, seconds in window_timings.items():
+            timings[name] = timings.get(name, 0.0) + seconds
+
+        labeled = isinstance(result, dict)
+        window_segments = _shift(result["segments"] if labeled else result, start)
+        if labeled:
+            # The previous window's segments already carry the labels of the whole transcript
+            speakers = _map_speakers(previous, window_segments, start, labels)
+            labels.update(speakers.values())
+            _relabel(window_segments, speakers)
+
+        # Up to the middle of the overlap with the next window, past the segments the previous window kept
+        cut = (
+            (windows[index + 1][0] + end) / 2
+            if index + 1 < len(windows)
+            else float("inf")
+        )
+        kept = [
+            segment
+            for segment in window_segments
+            if kept_until <= _middle(segment) < cut
+        ]
+        if kept:
+            kept_until = max(kept_until, max(segment["end"] for segment in kept))
+        segments.extend(kept)
+        previous = window_segments
+        logger.info(
+            f"Transcribed window {index + 1}/{len(windows)} ({start:.0f}s - {end:.0f}s), kept {len(kept)} segments"
+        )
+
+    if checkpoint is not None:
+        checkpoint.clear()
+    if not labeled:
+        return segments
+    return {
+        "segments": segments,
+        "word_segments": [
+            word for segment in segments for word in segment.get("words", []) or []
+        ],
+    }
+
+
+def _shift(segments: List[Dict[str, Any]], offset: float) -> List[Dict[str, Any]]:
+    """Moves the segments (and their words) of a window to the timeline of the whole recording, in place"""
+    for segment in segments:
+        for item in [segment, *(segment.get("words", []) or [])]:
+            for key in ("start", "end"):
+                if item.get(key) is not None:
+                    item[key] = round(item[key] + offset, 3)
+    return segments
+
+
+def _middle(segment: Dict[str, Any]) -> float:
+    return (segment["start"] + segment["end"]) / 2
+
+
+def _map_speakers(
+    previous: List[Dict[str, Any]],
+    segments: List[Dict[str, Any]],
+    overlap_start: float,
+    labels: Set[str],
+) -> Dict[str, str]:
+    """Maps the speaker labels of a window to the labels of the whole transcript
+
+    A window's label is matched to the label of the previous window it shares the most speech time with in their
+    overlap (each label of the previous window matches at most one), the others get new labels.
+
+    Args:
+        previous (List[Dict[str, Any]]): Segments of the previous window, with transcript labels
+        segments (List[Dict[str, Any]]): Segments of the window, with window labels
+        overlap_start (float): Start of the window, i.e. of its overlap with the previous one
+        labels (Set[str]): Transcript labels used so far
+
+    Returns:
+        Dict[str, str]: Window label to transcript label
+    """
+    shared: Dict[Tuple[str, str], float] = defaultdict(float)
+    earlier = [item for item in _speaker_items(previous) if item[1] > overlap_start]
+    for start, end, label in _speaker_items(segments):
+        for other_start, other_end, other_label in earlier:
+            seconds = min(end, other_end) - max(start, other_start)
+            if seconds > 0:
+                shared[label, other_label] += seconds
+
+    mapping: Dict[str, str] = {}
+    taken = set()
+    for (label, other_label), _ in sorted(shared.items(), key=lambda item: -item[1]):
+        if label not in mapping and other_label not in taken:
+            mapping[label] = other_label
+            taken.add(other_label)
+
+    known = labels | taken
+    for label in sorted({item[2] for item in _speaker_items(segments)}):
+        if label in mapping:
+            continue
+        number = len(known)
+        while f"SPEAKER_{number:02d}" in known:
+            number += 1
+        mapping[label] = f"SPEAKER_{number:02d}"
+        known.add(mapping[label])
+    return mapping
+
+
+def _speaker_items(
+    segments: List[Dict[str, Any]],
+) -> List[Tuple[float, float, str]]:
+    """(start, end, speaker) of the words of the segments, or of the segments themselves when they have no words"""
+    items = []
+    for segment in segments:
+        words = [
+            word
+            for word in segment.get("words", []) or []
+            if word.get("start") is not None and word.get("speaker") is not None
+        ]
+        if words:
+            items.extend(
+                (word["start"], word["end"], word["speaker"]) for word in words
+            )
+        elif segment.get("speaker") is not None:
+            items.append((segment["start"], segment["end"], segment["speaker"]))
+    return items
+
+
+def _relabel(segments: List[Dict[str, Any]], mapping: Dict[str, str]) -> None:
+    for segment in segments:
+        for item in [segment, *(segment.get("words", []) or [])]:
+            if item.get("speaker") is not None:
+                item["speaker"] = mapping.get(item["speaker"], item["speaker"])
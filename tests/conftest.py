@@ -0,0 +1,33 @@
+"""Shared fixtures of the tests, run with `python -m pytest tests` from the repository root"""
+
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The package is used from a checkout, not installed
+sys.path.insert(0, REPO_ROOT)
+# The benchmark helpers (mock LLM server, stub models, synthetic inputs) double as test fakes
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+
+import pytest  # noqa: E402
+
+from summarize_media.instrumentation import stages  # noqa: E402
+from summarize_media.instrumentation.sinks import Sink  # noqa: E402
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+
+@pytest.fixture
+def stage_events():
+    """Records the stage events emitted during the test"""
+    sink = ListSink()
+    stages.configure(sinks=[sink], profile={})
+    yield sink.events
+    stages.configure(sinks=[], profile={})
@@ -0,0 +1,32 @@
+import os
+
+from summarize_media.cache.artifact_cache import ArtifactCache
+
+
+def test_evicts_least_recently_used_without_rescanning(tmp_path, monkeypatch):
+    cache = ArtifactCache(str(tmp_path), max_bytes=250)
+    for name in ("a", "b"):
+        cache.put_text(cache.make_key("t", name), name * 100)
+
+    # Only the first write scans the folder
+    monkeypatch.setattr(
+        cache, "_scan", lambda: (_ for _ in ()).throw(AssertionError("rescanned"))
+    )
+    assert cache.get_text(cache.make_key("t", "a")) == "a" * 100
+    cache.put_text(cache.make_key("t", "c"), "c" * 100)
+
+    assert cache.get_text(cache.make_key("t", "b")) is None
+    assert cache.get_text(cache.make_key("t", "a")) == "a" * 100
+    assert cache.size() == 200
+    assert cache.stats()["evictions"] == 1
+
+
+def test_picks_up_existing_artifacts_on_start(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=10_000)
+    cache.put_text(cache.make_key("t", "a"), "a" * 100)
+
+    reopened = ArtifactCache(str(tmp_path), max_bytes=150)
+    assert reopened.size() == 100
+    reopened.put_text(reopened.make_key("t", "b"), "b" * 100)
+    assert reopened.size() == 100
+    assert not os.path.exists(reopened._path(reopened.make_key("t", "a")))
@@ -0,0 +1,212 @@
+import json
+
+import pytest
+from stub_models import StubWhisperModel, stub_whisperx
+
+from summarize_media.transcribe import autotune as A
+
+GB = 1024**3
+
+
+class Calibration:
+    """Scripted measurements: `results[(compute_type, batch_size)]` is (throughput, peak memory), or "oom" """
+
+    def __init__(self, results, failing_compute_types=()):
+        self.results = results
+        self.failing_compute_types = failing_compute_types
+        self.loaded = []
+        self.measured = []
+
+    def load_model(self, model_name, device, compute_type, threads=None, **kwargs):
+        if compute_type in self.failing_compute_types:
+            raise ValueError(f"{compute_type} is not supported")
+        self.loaded.append((compute_type, threads))
+        model = StubWhisperModel()
+        model.compute_type = compute_type
+        return model
+
+    def measure(self, model, inputs, batch_size, device):
+        self.measured.append((model.compute_type, batch_size))
+        result = self.results[(model.compute_type, batch_size)]
+        if result == "oom":
+            raise RuntimeError("CUDA failed with error out of memory")
+        throughput, peak_memory = result
+        return {"throughput": throughput, "peak_memory": peak_memory}
+
+
+@pytest.fixture
+def calibrate(monkeypatch):
+    """Runs `autotune` on the CPU with scripted measurements, returns the calibration to inspect"""
+    monkeypatch.setattr(A, "run_batches", lambda model, inputs, batch_size: iter(()))
+
+    def calibrate(results, **kwargs):
+        calibration = Calibration(results, kwargs.pop("failing_compute_types", ()))
+        monkeypatch.setattr(A, "_measure", calibration.measure)
+        kwargs = (
+            dict(
+                device="cpu",
+                batch_sizes=[1, 2, 4, 8],
+                compute_types=["int8", "float32"],
+                thread_counts=[4],
+                memory_budget=4 * GB,
+            )
+            | kwargs
+        )
+        with stub_whisperx() as whisperx:
+            whisperx.load_model = calibration.load_model
+            return A.autotune("large-v2", **kwargs), calibration
+
+    return calibrate
+
+
+def test_larger_batches_stop_after_running_out_of_memory(calibrate):
+    config, calibration = calibrate(
+        {
+            ("int8", 1): (10, GB),
+            ("int8", 2): (18, GB),
+            ("int8", 4): "oom",
+            ("float32", 1): (5, GB),
+            ("float32", 2): (9, 2 * GB),
+            ("float32", 4): (12, 3 * GB),
+            ("float32", 8): (13, 3 * GB),
+        }
+    )
+
+    assert calibration.measured == [
+        ("int8", 1),
+        ("int8", 2),
+        ("int8", 4),
+        ("float32", 1),
+        ("float32", 2),
+        ("float32", 4),
+        ("float32", 8),
+    ]
+    assert (config["compute_type"], config["batch_size"]) == ("int8", 2)
+    assert (config["threads"], config["throughput"]) == (4, 18)
+    assert len(config["candidates"]) == 6
+
+
+def test_larger_batches_stop_once_slower(calibrate):
+    config, calibration = calibrate(
+        {
+            ("int8", 1): (10, GB),
+            ("int8", 2): (9, GB),
+            ("float32", 1): (5, GB),
+            ("float32", 2): (8, GB),
+            # Within 5% of the best, the next batch size is still tried
+            ("float32", 4): (7.8, GB),
+            ("float32", 8): (7, GB),
+        }
+    )
+
+    assert calibration.measured == [
+        ("int8", 1),
+        ("int8", 2),
+        ("float32", 1),
+        ("float32", 2),
+        ("float32", 4),
+        ("float32", 8),
+    ]
+    assert (config["compute_type"], config["batch_size"]) == ("int8", 1)
+
+
+def test_configurations_over_the_memory_budget_are_not_picked(calibrate):
+    config, calibration = calibrate(
+        {
+            ("int8", 1): (10, GB),
+            ("int8", 2): (18, 5 * GB),
+            ("float32", 1): (12, 3 * GB),
+            ("float32", 2): (20, 6 * GB),
+        }
+    )
+
+    # The first batch size over the budget stops the larger ones
+    assert ("int8", 4) not in calibration.measured
+    assert (config["compute_type"], config["batch_size"]) == ("float32", 1)
+    assert [candidate["fits"] for candidate in config["candidates"]] == [
+        True,
+        False,
+        True,
+        False,
+    ]
+
+
+def test_compute_types_that_fail_to_load_are_skipped(calibrate):
+    config, calibration = calibrate(
+        {("float32", 1): (5, GB), ("float32", 2): (4, GB)},
+        failing_compute_types=["int8"],
+    )
+
+    assert calibration.loaded == [("float32", 4)]
+    assert config["compute_type"] == "float32"
+
+
+def test_no_fitting_configuration_is_an_error(calibrate):
+    with pytest.raises(RuntimeError, match="No configuration of large-v2 on cpu"):
+        calibrate(
+            {("int8", 1): (10, 5 * GB), ("float32", 1): "oom"},
+        )
+
+
+def test_tuned_configurations_are_saved_per_host(tmp_path, monkeypatch):
+    path = str(tmp_path / "autotune.json")
+    runs = []
+
+    def autotune(model_name, device, model_save_dir=None, **kwargs):
+        runs.append((model_name, device, kwargs))
+        return {
+            "batch_size": 4 * len(runs),
+            "compute_type": "int8",
+            "threads": 8,
+            "throughput": 3.0,
+            "peak_memory": GB,
+            "candidates": [],
+        }
+
+    monkeypatch.setattr(A, "autotune", autotune)
+
+    config = A.get_tuned_config("large-v2", "cpu", path=path, thread_counts=[8])
+    assert config["batch_size"] == 4
+    assert "candidates" not in config
+    assert runs == [("large-v2", "cpu", {"thread_counts": [8]})]
+
+    # Reused, from the file
+    assert A.get_tuned_config("large-v2", "cpu", path=path) == config
+    with open(path, encoding="utf-8") as file:
+        saved = json.load(file)
+    assert saved == {A._host_key("large-v2", "cpu"): config}
+    assert len(runs) == 1
+
+    # Other models are tuned separately, and kept next to each other
+    A.get_tuned_config("small", "cpu", path=path)
+    assert len(runs) == 2
+    with open(path, encoding="utf-8") as file:
+        assert len(json.load(file)) == 2
+
+    # Calibrating again replaces the saved configuration
+    assert (
+        A.get_tuned_config("large-v2", "cpu", path=path, refresh=True)["batch_size"]
+        == 12
+    )
+    assert A.get_tuned_config("large-v2", "cpu", path=path)["batch_size"] == 12
+    assert len(runs) == 3
+
+
+def test_configurations_of_other_hosts_are_not_reused(tmp_path, monkeypatch):
+    path = str(tmp_path / "autotune.json")
+    runs = []
+
+    def autotune(model_name, device, **kwargs):
+        runs.append(model_name)
+        return {"batch_size": 2, "compute_type": "int8", "candidates": []}
+
+    monkeypatch.setattr(A, "autotune", autotune)
+    A.get_tuned_config("large-v2", "cpu", path=path)
+
+    # e.g. a home directory shared between hosts
+    monkeypatch.setattr(A.socket, "gethostname", lambda: "other-host")
+    A.get_tuned_config("large-v2", "cpu", path=path)
+
+    assert len(runs) == 2
+    with open(path, encoding="utf-8") as file:
+        assert len(json.load(file)) == 2
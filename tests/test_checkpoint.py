@@ -0,0 +1,263 @@
+import json
+import os
+import types
+import wave
+
+import numpy as np
+import pytest
+from stub_models import SAMPLE_RATE, stub_whisperx, synthetic_samples
+
+from summarize_media.pre_processing.audio_source import AudioSource
+from summarize_media.transcribe import transcribe as T
+from summarize_media.transcribe import transcribe_cloud
+
+ARGS = dict(
+    device="cpu",
+    language="en",
+    assign_speaker_labels=True,
+    parallel_diarization="thread",
+)
+
+# With 2 second VAD chunks, `DEFAULT_CHUNK_SEGMENTS` chunks cover 128 seconds
+VAD_SECONDS = 2
+
+
+class Crash(Exception):
+    """Stands in for the worker dying mid-transcription"""
+
+
+@pytest.fixture
+def models(monkeypatch):
+    """Stub models counting their work, `calls["fail_at"]` makes a model raise once it reaches that count"""
+    calls = {"inputs": 0, "align": 0, "diarize": 0, "fail_at": {}}
+
+    def count(name):
+        calls[name] += 1
+        if calls[name] == calls["fail_at"].get(name):
+            raise Crash(f"{name} #{calls[name]}")
+
+    def detect_vad_segments(model, audio, chunk_size=30):
+        seconds = len(audio) / SAMPLE_RATE
+        return [
+            {"start": float(start), "end": float(min(seconds, start + VAD_SECONDS))}
+            for start in range(0, int(seconds), VAD_SECONDS)
+        ]
+
+    def run_batches(model, inputs, batch_size):
+        for item in inputs:
+            count("inputs")
+            yield f" level {float(np.abs(item['inputs']).mean()):.4f} a b c"
+
+    monkeypatch.setattr(T, "detect_vad_segments", detect_vad_segments)
+    monkeypatch.setattr(T, "run_batches", run_batches)
+    monkeypatch.setattr(T, "set_language", lambda model, language: None)
+    monkeypatch.setattr(T, "reset_language", lambda model: None)
+
+    with stub_whisperx() as whisperx:
+        align, pipeline = whisperx.align, whisperx.DiarizationPipeline
+
+        def counting_align(*args, **kwargs):
+            count("align")
+            return align(*args, **kwargs)
+
+        class CountingDiarizationPipeline(pipeline):
+            def __call__(self, audio, **kwargs):
+                count("diarize")
+                return super().__call__(audio, **kwargs)
+
+        whisperx.align = counting_align
+        whisperx.DiarizationPipeline = CountingDiarizationPipeline
+        whisperx.load_audio = lambda path, sr=SAMPLE_RATE: AudioSource(path).read()
+        yield calls
+
+
+def _reset(calls, **fail_at):
+    calls.update(inputs=0, align=0, diarize=0, fail_at=fail_at)
+
+
+def _json(transcript):
+    """The transcript as saved to a checkpoint, resumed results are read back from JSON"""
+    return json.loads(json.dumps(transcript, default=float))
+
+
+def _files(root):
+    return sorted(
+        os.path.relpath(os.path.join(directory, name), root).split(os.sep, 1)[1]
+        for directory, _, names in os.walk(root)
+        for name in names
+    )
+
+
+@pytest.mark.parametrize(
+    "fail_at, saved, resumed_inputs, resumed_aligns",
+    [
+        # The 3rd transcription chunk fails, the first 2 chunks (of 64 VAD chunks each) are kept
+        (
+            {"inputs": 130},
+            [
+                "diarize.json",
+                "language.json",
+                "transcribe/00000.json",
+                "transcribe/00001.json",
+                "vad.json",
+            ],
+            150 - 128,
+            3,
+        ),
+        # The 2nd alignment chunk fails, the transcription and the first aligned chunk are kept
+        (
+            {"align": 2},
+            [
+                "align/00000.json",
+                "diarize.json",
+                "language.json",
+                "transcribe/00000.json",
+                "transcribe/00001.json",
+                "transcribe/00002.json",
+                "vad.json",
+            ],
+            0,
+            2,
+        ),
+    ],
+)
+def test_interrupted_transcription_resumes_from_the_last_chunk(
+    models, tmp_path, fail_at, saved, resumed_inputs, resumed_aligns
+):
+    audio = synthetic_samples(300)
+    reference = _json(
+        T.get_transcription(audio, checkpoint_dir=str(tmp_path / "reference"), **ARGS)
+    )
+    assert models["inputs"] == 150 and models["align"] == 3
+    # Removed once the transcription succeeds
+    assert os.listdir(tmp_path / "reference") == []
+
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    _reset(models, **fail_at)
+    with pytest.raises(Crash):
+        T.get_transcription(audio, checkpoint_dir=checkpoint_dir, **ARGS)
+    # The diarization thread finishes (and is saved) before the error is raised
+    assert _files(checkpoint_dir) == saved
+
+    _reset(models)
+    resumed = T.get_transcription(audio, checkpoint_dir=checkpoint_dir, **ARGS)
+
+    assert _json(resumed) == reference
+    assert models["inputs"] == resumed_inputs
+    assert models["align"] == resumed_aligns
+    assert models["diarize"] == 0
+    assert os.listdir(checkpoint_dir) == []
+
+
+def _write_wav(path, audio):
+    with wave.open(str(path), "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(SAMPLE_RATE)
+        file.writeframes((audio * 32767).astype(np.int16).tobytes())
+
+
+def test_interrupted_windowed_transcription_resumes_from_the_last_window(
+    models, tmp_path
+):
+    path = tmp_path / "recording.wav"
+    _write_wav(path, synthetic_samples(300))
+    args = dict(ARGS, window_seconds=100, window_overlap_seconds=10)
+
+    reference = _json(
+        T.get_transcription(
+            str(path), checkpoint_dir=str(tmp_path / "reference"), **args
+        )
+    )
+    windows = models["align"]
+    assert windows > 3
+    assert os.listdir(tmp_path / "reference") == []
+
+    # Every window is aligned in one chunk, the 3rd window fails after its transcription is saved
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    _reset(models, align=3)
+    with pytest.raises(Crash):
+        T.get_transcription(str(path), checkpoint_dir=checkpoint_dir, **args)
+    saved = _files(checkpoint_dir)
+    assert "window/00000.json" in saved and "window/00001.json" in saved
+    assert "window/00002.json" not in saved
+
+    _reset(models)
+    resumed = T.get_transcription(str(path), checkpoint_dir=checkpoint_dir, **args)
+
+    assert _json(resumed) == reference
+    # The first 2 windows are not transcribed again, nor are the transcription and diarization of the 3rd
+    assert models["align"] == windows - 2
+    assert models["diarize"] == windows - 3
+    assert os.listdir(checkpoint_dir) == []
+
+
+class FakePrediction:
+    def __init__(self, id, status="starting", wait=None):
+        self.id = id
+        self.status = status
+        self.error = None
+        self.output = None
+        self._wait = wait
+
+    def wait(self):
+        if self._wait is not None:
+            self._wait()
+        self.status = "succeeded"
+        self.output = {"segments": [{"start": 0.0, "end": 1.0, "text": self.id}]}
+
+
+class FakePredictions:
+    """Stands in for `replicate.predictions`, the first `crashes` predictions are interrupted while waiting"""
+
+    def __init__(self, crashes=0, status="processing"):
+        self.crashes = crashes
+        self.status = status
+        self.created = []
+
+    def create(self, version, input):
+        self.created.append(input)
+        prediction_id = f"prediction{len(self.created)}"
+        return FakePrediction(
+            prediction_id,
+            wait=self._crash if len(self.created) <= self.crashes else None,
+        )
+
+    def get(self, id):
+        return FakePrediction(id, self.status)
+
+    def _crash(self):
+        raise Crash("interrupted while waiting")
+
+
+@pytest.mark.parametrize(
+    "status, created, output",
+    [
+        # The saved prediction is still running, it is waited for instead of paying for a new one
+        ("processing", 1, "prediction1"),
+        # The saved prediction failed, a new one is created
+        ("failed", 2, "prediction2"),
+    ],
+)
+def test_interrupted_cloud_transcription_resumes_the_saved_prediction(
+    tmp_path, monkeypatch, status, created, output
+):
+    predictions = FakePredictions(crashes=1, status=status)
+    monkeypatch.setattr(
+        transcribe_cloud, "replicate", types.SimpleNamespace(predictions=predictions)
+    )
+    checkpoint_dir = str(tmp_path / "checkpoints")
+
+    with pytest.raises(Crash):
+        transcribe_cloud.get_transcribe_cloud(
+            "https://example.com/audio.wav", checkpoint_dir=checkpoint_dir
+        )
+    assert _files(checkpoint_dir) == ["prediction.json"]
+
+    transcript = transcribe_cloud.get_transcribe_cloud(
+        "https://example.com/audio.wav", checkpoint_dir=checkpoint_dir
+    )
+
+    assert transcript["segments"][0]["text"] == output
+    assert len(predictions.created) == created
+    assert os.listdir(checkpoint_dir) == []
@@ -0,0 +1,206 @@
+import asyncio
+
+import httpx
+import pytest
+from mock_replicate import MockReplicate
+
+from summarize_media.transcribe.cloud_jobs import ReplicateJobManager
+
+AUDIOS = [f"https://example.com/audio{i}.wav" for i in range(5)]
+
+
+def _manager(tmp_path, replicate_mock, **kwargs):
+    kwargs = dict(poll_interval=0.01, backoff_base=0, max_retries=3) | kwargs
+    return ReplicateJobManager(
+        str(tmp_path / "jobs.sqlite3"), client=replicate_mock.client(), **kwargs
+    )
+
+
+async def _prediction_id(manager, key):
+    """Waits for the job to create its prediction"""
+    for _ in range(500):
+        job = manager.status(key)
+        if job["prediction_id"] is not None:
+            return job["prediction_id"]
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {key} did not create a prediction")
+
+
+def _output(replicate_mock, prediction_id):
+    return replicate_mock.predictions[prediction_id]["output"]
+
+
+def test_at_most_max_in_flight_predictions_run(tmp_path):
+    replicate_mock = MockReplicate(polls=3)
+    manager = _manager(tmp_path, replicate_mock, max_in_flight=2)
+
+    outputs = asyncio.run(manager.run_many(AUDIOS, model_name="large-v3"))
+
+    assert replicate_mock.max_running == 2
+    assert len(replicate_mock.predictions) == len(AUDIOS)
+    assert [output["segments"][0]["text"] for output in outputs] == [
+        f'{{"audio_file": "{audio}"}}' for audio in AUDIOS
+    ]
+
+
+def test_manager_can_be_reused_across_event_loops(tmp_path):
+    replicate_mock = MockReplicate(polls=2)
+    manager = _manager(tmp_path, replicate_mock, max_in_flight=1)
+
+    first = asyncio.run(manager.run_many(AUDIOS[:2]))
+    second = asyncio.run(manager.run_many(AUDIOS[2:4]))
+
+    assert first + second == [
+        _output(replicate_mock, f"prediction{i}") for i in range(4)
+    ]
+    assert replicate_mock.max_running == 1
+
+
+def test_transient_errors_are_retried(tmp_path):
+    replicate_mock = MockReplicate(polls=2)
+    replicate_mock.fail_next("POST", "/v1/predictions", 429)
+    replicate_mock.fail_next("POST", "/v1/predictions", httpx.ConnectError)
+    replicate_mock.fail_next("GET", "/v1/predictions/", 500)
+    replicate_mock.fail_next("GET", "/v1/predictions/", httpx.ReadTimeout)
+    manager = _manager(tmp_path, replicate_mock)
+
+    [output] = asyncio.run(manager.run_many(AUDIOS[:1]))
+
+    # Neither the 429 nor the connection error created a prediction, so one prediction ran
+    assert len(replicate_mock.create_requests) == 3
+    assert list(replicate_mock.predictions) == ["prediction0"]
+    assert output == _output(replicate_mock, "prediction0")
+
+
+def test_creating_a_prediction_is_not_retried_after_a_read_error(tmp_path):
+    replicate_mock = MockReplicate()
+    replicate_mock.fail_next("POST", "/v1/predictions", httpx.ReadTimeout)
+    manager = _manager(tmp_path, replicate_mock)
+
+    async def main():
+        key = await manager.submit(AUDIOS[0])
+        with pytest.raises(httpx.ReadTimeout):
+            await manager.result(key)
+        return key
+
+    key = asyncio.run(main())
+
+    # The request may have created a prediction, whose id was lost with the response
+    assert len(replicate_mock.create_requests) == 1
+    assert manager.status(key)["status"] == "failed"
+
+
+def test_failed_predictions_are_retried(tmp_path):
+    replicate_mock = MockReplicate(failures=2)
+    manager = _manager(tmp_path, replicate_mock, max_retries=2)
+
+    [output] = asyncio.run(manager.run_many(AUDIOS[:1]))
+
+    assert list(replicate_mock.predictions) == [
+        "prediction0",
+        "prediction1",
+        "prediction2",
+    ]
+    assert output == _output(replicate_mock, "prediction2")
+
+
+def test_failed_predictions_are_retried_at_most_max_retries_times(tmp_path):
+    replicate_mock = MockReplicate(failures=2)
+    manager = _manager(tmp_path, replicate_mock, max_retries=1)
+
+    async def main():
+        key = await manager.submit(AUDIOS[0])
+        with pytest.raises(RuntimeError, match="CUDA out of memory"):
+            await manager.result(key)
+        return key
+
+    key = asyncio.run(main())
+
+    assert len(replicate_mock.predictions) == 2
+    assert manager.status(key)["attempts"] == 2
+
+
+def test_cancel_cancels_the_running_prediction(tmp_path):
+    replicate_mock = MockReplicate(polls=None)
+    manager = _manager(tmp_path, replicate_mock)
+
+    async def main():
+        key = await manager.submit(AUDIOS[0])
+        prediction_id = await _prediction_id(manager, key)
+        await manager.cancel(key)
+        with pytest.raises(RuntimeError, match="canceled"):
+            await manager.result(key)
+        return prediction_id
+
+    prediction_id = asyncio.run(main())
+
+    assert replicate_mock.predictions[prediction_id]["status"] == "canceled"
+    assert (
+        "POST",
+        f"/v1/predictions/{prediction_id}/cancel",
+    ) in replicate_mock.requests
+
+
+def test_predictions_running_longer_than_job_timeout_are_canceled(tmp_path):
+    replicate_mock = MockReplicate(polls=None)
+    manager = _manager(tmp_path, replicate_mock, job_timeout=0.1)
+
+    async def main():
+        key = await manager.submit(AUDIOS[0])
+        with pytest.raises(RuntimeError, match="Timed out"):
+            await asyncio.wait_for(manager.result(key), timeout=5)
+
+    asyncio.run(main())
+
+    assert replicate_mock.predictions["prediction0"]["status"] == "canceled"
+
+
+def test_webhook_wakes_the_waiting_job(tmp_path):
+    replicate_mock = MockReplicate(polls=None)
+    # Without the webhook, the prediction would only be polled again after a minute
+    manager = _manager(
+        tmp_path,
+        replicate_mock,
+        webhook_url="https://example.com/webhook",
+        webhook_poll_interval=60,
+    )
+
+    async def main():
+        key = await manager.submit(AUDIOS[0])
+        prediction_id = await _prediction_id(manager, key)
+        await asyncio.sleep(0.05)
+        manager.handle_webhook(replicate_mock.complete(prediction_id))
+        return await asyncio.wait_for(manager.result(key), timeout=5), prediction_id
+
+    output, prediction_id = asyncio.run(main())
+
+    assert output == _output(replicate_mock, prediction_id)
+    assert replicate_mock.create_requests[0]["webhook"] == "https://example.com/webhook"
+    assert replicate_mock.create_requests[0]["webhook_events_filter"] == ["completed"]
+
+
+def test_resume_follows_the_stored_prediction_after_a_restart(tmp_path):
+    replicate_mock = MockReplicate(polls=None)
+
+    async def interrupted():
+        manager = _manager(tmp_path, replicate_mock)
+        key = await manager.submit(AUDIOS[0])
+        prediction_id = await _prediction_id(manager, key)
+        # The process stops while the prediction runs
+        for task in manager._tasks.values():
+            task.cancel()
+        manager.store.close()
+        return key, prediction_id
+
+    key, prediction_id = asyncio.run(interrupted())
+    replicate_mock.complete(prediction_id)
+
+    async def restarted():
+        manager = _manager(tmp_path, replicate_mock)
+        assert await manager.resume() == [key]
+        return await manager.result(key)
+
+    output = asyncio.run(restarted())
+
+    assert output == _output(replicate_mock, prediction_id)
+    assert len(replicate_mock.create_requests) == 1
@@ -0,0 +1,237 @@
+import shutil
+import subprocess
+import sys
+import threading
+import wave
+
+import numpy as np
+import pytest
+
+from summarize_media.pre_processing import convert_audio_format
+from summarize_media.pre_processing.convert_audio_format import (
+    _convert_slice,
+    convert_ffmpeg,
+    convert_ffmpeg_parallel,
+    convert_to_array,
+)
+
+requires_ffmpeg = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None,
+    reason="ffmpeg is not installed",
+)
+
+SAMPLE_RATE = 16000
+
+
+def _make_input(path, seconds=24):
+    """A stereo 44.1 kHz flac of a sweeping tone under noise, so a shifted slice changes the samples"""
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-nostdin",
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency=440:beep_factor=3:sample_rate=44100:duration={seconds}",
+            "-f",
+            "lavfi",
+            "-i",
+            f"anoisesrc=color=pink:amplitude=0.05:sample_rate=44100:duration={seconds}:seed=1",
+            "-filter_complex",
+            "[0][1]amix=inputs=2:normalize=0,aformat=channel_layouts=stereo",
+            "-c:a",
+            "flac",
+            "-y",
+            str(path),
+        ],
+        check=True,
+    )
+
+
+def _read_wav(path):
+    with wave.open(str(path)) as file:
+        assert file.getframerate() == SAMPLE_RATE
+        frames = file.readframes(file.getnframes())
+        channels = file.getnchannels()
+    return np.frombuffer(frames, dtype="<i2").reshape(-1, channels) / 32768.0
+
+
+@requires_ffmpeg
+def test_parallel_conversion_matches_serial(tmp_path):
+    input_path = tmp_path / "input.flac"
+    _make_input(input_path)
+
+    convert_ffmpeg(
+        str(input_path), str(tmp_path / "serial.wav"), SAMPLE_RATE, "pcm_s16le", True
+    )
+    # 4 slices of 6 seconds, so there are 3 boundaries to get right
+    convert_ffmpeg_parallel(
+        str(input_path),
+        str(tmp_path / "parallel.wav"),
+        SAMPLE_RATE,
+        "pcm_s16le",
+        num_workers=4,
+        min_slice_seconds=5,
+    )
+
+    serial = _read_wav(tmp_path / "serial.wav")
+    parallel = _read_wav(tmp_path / "parallel.wav")
+    assert serial.shape[1] == parallel.shape[1] == 2
+    # The last slice runs to the end of the stream, the totals may differ by the resampler's flush
+    assert abs(len(serial) - len(parallel)) <= 0.005 * SAMPLE_RATE
+
+    # A slice shifted by a single sample would differ by ~0.1 on the 440 Hz tone
+    n = min(len(serial), len(parallel))
+    difference = np.abs(serial[:n] - parallel[:n])
+    assert difference.max() < 0.02
+    assert np.sqrt(np.mean(difference**2)) < 1e-3
+
+
+def _fake_ffmpeg(monkeypatch, script, duration=10.0):
+    """Runs `script` with python in place of the ffmpeg command of `convert_to_array`"""
+    popen = subprocess.Popen
+    monkeypatch.setattr(
+        convert_audio_format, "probe_media", lambda path: {"duration": duration}
+    )
+    monkeypatch.setattr(
+        subprocess,
+        "Popen",
+        lambda cmd, **kwargs: popen([sys.executable, "-c", script], **kwargs),
+    )
+
+
+def test_convert_to_array_reads_stdout_while_stderr_is_written(monkeypatch):
+    # More stderr than a pipe holds, written before any sample
+    _fake_ffmpeg(
+        monkeypatch,
+        "import struct, sys\n"
+        "sys.stderr.write('warning ' * 100000)\n"
+        "sys.stderr.flush()\n"
+        "sys.stdout.buffer.write(struct.pack('<16000f', *(i / 16000 for i in range(16000))))\n",
+    )
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(convert_to_array("audio.mp3")), daemon=True
+    )
+    thread.start()
+    thread.join(timeout=10)
+
+    assert results, "convert_to_array is blocked"
+    [samples] = results
+    assert samples.dtype == np.float32
+    np.testing.assert_array_equal(samples, np.arange(16000, dtype=np.float32) / 16000)
+    # Not a view of the buffer preallocated for 10 seconds
+    assert samples.base is None
+
+
+def test_convert_to_array_raises_ffmpeg_errors(monkeypatch):
+    _fake_ffmpeg(
+        monkeypatch, "import sys\nsys.stderr.write('Invalid data')\nsys.exit(1)\n"
+    )
+
+    with pytest.raises(RuntimeError, match="Invalid data"):
+        convert_to_array("audio.mp3")
+
+
+@pytest.mark.parametrize(
+    "duration, num_workers, boundaries",
+    [
+        # 4 slices of 2.5 seconds, the last one runs to the end of the stream
+        (10.0, 4, [(0, 40000), (40000, 80000), (80000, 120000), (120000, None)]),
+        # Slices are at least `min_slice_seconds` long
+        (
+            10.0,
+            8,
+            [
+                (0, 32000),
+                (32000, 64000),
+                (64000, 96000),
+                (96000, 128000),
+                (128000, None),
+            ],
+        ),
+        (1.5, 4, [(0, None)]),
+    ],
+)
+def test_parallel_conversion_stitches_the_slices_in_order(
+    tmp_path, monkeypatch, duration, num_workers, boundaries
+):
+    total_samples = round(duration * SAMPLE_RATE)
+    calls = []
+
+    def convert_slice(input_path, output_path, sample_rate, raw_format, start, end):
+        calls.append((start, end))
+        # The stream turns out slightly longer than probed
+        end = total_samples + 100 if end is None else end
+        # Every sample holds its index, on both channels
+        samples = np.repeat(np.arange(start, end, dtype="<i4"), 2)
+        with open(output_path, "wb") as file:
+            file.write(samples.tobytes())
+
+    monkeypatch.setattr(
+        convert_audio_format,
+        "probe_media",
+        lambda path: {"duration": duration, "channels": 2},
+    )
+    monkeypatch.setattr(convert_audio_format, "_convert_slice", convert_slice)
+
+    convert_ffmpeg_parallel(
+        "input.flac",
+        str(tmp_path / "output.wav"),
+        SAMPLE_RATE,
+        "pcm_s32le",
+        num_workers=num_workers,
+        min_slice_seconds=2,
+    )
+
+    assert sorted(calls) == boundaries
+    with wave.open(str(tmp_path / "output.wav")) as file:
+        assert (file.getnchannels(), file.getsampwidth()) == (2, 4)
+        assert file.getframerate() == SAMPLE_RATE
+        samples = np.frombuffer(file.readframes(file.getnframes()), dtype="<i4")
+    np.testing.assert_array_equal(
+        samples.reshape(-1, 2),
+        np.repeat(np.arange(total_samples + 100), 2).reshape(-1, 2),
+    )
+
+
+@pytest.mark.parametrize(
+    "start, end, seek, duration, trim",
+    [
+        # Padded by a second on both sides, then trimmed back to [start, end)
+        (
+            40000,
+            80000,
+            "1.500000",
+            "4.500000",
+            "atrim=start_sample=16000:end_sample=56000",
+        ),
+        # No padding before the start of the stream
+        (0, 40000, "0.000000", "3.500000", "atrim=start_sample=0:end_sample=40000"),
+        # The last slice runs to the end of the stream
+        (120000, None, "6.500000", None, "atrim=start_sample=16000"),
+    ],
+)
+def test_slices_are_decoded_with_padding_and_trimmed_to_their_samples(
+    monkeypatch, start, end, seek, duration, trim
+):
+    commands = []
+    monkeypatch.setattr(
+        subprocess,
+        "run",
+        lambda cmd, **kwargs: commands.append(cmd)
+        or subprocess.CompletedProcess(cmd, 0),
+    )
+
+    _convert_slice("input.flac", "slice.s16le", SAMPLE_RATE, "s16le", start, end)
+
+    [cmd] = commands
+    assert cmd[cmd.index("-ss") + 1] == seek
+    if duration is None:
+        assert "-t" not in cmd
+    else:
+        assert cmd[cmd.index("-t") + 1] == duration
+    filters = cmd[cmd.index("-af") + 1].split(",")
+    assert filters[1] == trim
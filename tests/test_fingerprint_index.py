@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+
+from summarize_media.cache.fingerprint_index import FingerprintIndex, shift_transcript
+from summarize_media.pre_processing.fingerprint import fingerprint
+
+SAMPLE_RATE = 16000
+
+TRANSCRIPT = {
+    "segments": [
+        {
+            "start": 2.0,
+            "end": 4.0,
+            "text": "intro",
+            "words": [
+                {"word": "intro", "start": 2.0, "end": 4.0},
+            ],
+        },
+        {
+            "start": 10.0,
+            "end": 12.5,
+            "text": "hello there",
+            "words": [
+                {"word": "hello", "start": 10.0, "end": 11.0},
+                {"word": "there", "start": 11.5, "end": 12.5},
+            ],
+        },
+    ]
+}
+
+
+def _program(seconds, seed):
+    """Deterministic audio with some structure to fingerprint, a chord of random tones every 200 ms"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(SAMPLE_RATE // 5) / SAMPLE_RATE
+    chords = []
+    for _ in range(int(seconds * 5)):
+        frequencies = rng.uniform(300, 2000, 3)[:, None]
+        amplitudes = rng.uniform(0.02, 0.2, 3)[:, None]
+        chords.append((amplitudes * np.sin(2 * np.pi * frequencies * t)).sum(axis=0))
+    return np.concatenate(chords).astype(np.float32)
+
+
+def _reencode(audio, sample_rate=22050, seed=1):
+    """Lossy copy of the audio: quieter, noisier, at another sample rate and in 16 bits"""
+    times = np.arange(int(len(audio) / SAMPLE_RATE * sample_rate)) / sample_rate
+    copy = np.interp(times, np.arange(len(audio)) / SAMPLE_RATE, audio)
+    copy = 0.8 * copy + np.random.default_rng(seed).normal(0, 0.003, len(copy))
+    return (np.round(copy * 32767) / 32767).astype(np.float32)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = FingerprintIndex(str(tmp_path / "fingerprints.sqlite3"))
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def audio(index):
+    audio = _program(60, seed=0)
+    index.add("original", fingerprint(audio), TRANSCRIPT)
+    return audio
+
+
+def test_trimmed_copy_matches_with_its_offset(index, audio):
+    # The first 7 seconds are cut
+    transcript, match = index.find_transcript(fingerprint(audio[7 * SAMPLE_RATE :]))
+
+    assert match.key == "original"
+    assert match.offset == pytest.approx(-7, abs=0.05)
+    assert match.bit_error_rate < 0.1
+    # The intro is dropped, the rest is on the timeline of the trimmed copy
+    [segment] = transcript["segments"]
+    assert segment["text"] == "hello there"
+    assert segment["start"] == pytest.approx(3, abs=0.05)
+    assert segment["words"][1]["end"] == pytest.approx(5.5, abs=0.05)
+
+
+def test_reencoded_copy_with_an_intro_matches_with_its_offset(index, audio):
+    intro = np.zeros(3 * SAMPLE_RATE, dtype=np.float32)
+    query = _reencode(np.concatenate([intro, audio]))
+
+    match = index.lookup(fingerprint(query, sample_rate=22050))
+
+    assert match.key == "original"
+    assert match.offset == pytest.approx(3, abs=0.05)
+    assert match.bit_error_rate < 0.3
+
+
+def test_unrelated_audio_does_not_match(index, audio):
+    assert index.lookup(fingerprint(_program(60, seed=1))) is None
+    # Files added with other params are not candidates
+    assert index.lookup(fingerprint(audio), params={"model": "other"}) is None
+
+
+def test_replaced_and_removed_files_leave_no_postings(index, audio):
+    def postings():
+        return index._conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+
+    indexed = postings()
+    assert indexed > 0
+    index.add("original", fingerprint(audio), TRANSCRIPT)
+    assert postings() == indexed
+    assert len(index) == 1
+
+    index.remove("original")
+    assert postings() == 0
+    assert len(index) == 0
+    assert index.lookup(fingerprint(audio)) is None
+
+
+def test_shift_transcript_clips_to_the_query():
+    shifted = shift_transcript(TRANSCRIPT, offset=-3, duration=8.5)
+
+    # The intro ends at 1s, the second segment is cut at the end of the query and loses its last word
+    assert [(segment["start"], segment["end"]) for segment in shifted["segments"]] == [
+        (0.0, 1.0),
+        (7.0, 8.5),
+    ]
+    assert [
+        (word["word"], word["start"], word["end"])
+        for word in shifted["segments"][1]["words"]
+    ] == [("hello", 7.0, 8.0)]
+    # The input is not modified
+    assert TRANSCRIPT["segments"][0]["start"] == 2.0
+
+
+def test_shift_transcript_accepts_lists_and_words_without_timestamps():
+    segments = [
+        {"start": 1.0, "end": 2.0, "words": [{"word": "um"}]},
+        {"start": 5.0, "end": 6.0},
+    ]
+
+    shifted = shift_transcript(segments, offset=2.5, duration=7)
+
+    assert shifted == [
+        {"start": 3.5, "end": 4.5, "words": [{"word": "um"}]},
+    ]
@@ -0,0 +1,206 @@
+import time
+
+import pytest
+
+from summarize_media.job_queue import cli, pipeline
+from summarize_media.job_queue.queue import JobQueue
+from summarize_media.job_queue.worker import Worker
+
+ALL_STAGES = list(pipeline.STAGES)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    yield queue
+    queue.close()
+
+
+def _make_available(queue, job_id):
+    """Skips the retry delay of a job"""
+    queue._conn.execute("UPDATE jobs SET available_at = 0 WHERE id = ?", (job_id,))
+
+
+def test_jobs_with_a_higher_priority_run_first_then_the_oldest(queue):
+    low = queue.submit("low")
+    first = queue.submit("first", priority=5)
+    second = queue.submit("second", priority=5)
+
+    claimed = [queue.claim("worker", ALL_STAGES, 60)["id"] for _ in range(3)]
+
+    assert claimed == [first, second, low]
+    assert queue.claim("worker", ALL_STAGES, 60) is None
+
+
+def test_jobs_are_claimed_for_the_stages_of_the_worker(queue):
+    queue.submit("download")
+    transcribe = queue.submit("transcribe", stage="transcribe")
+
+    assert queue.claim("gpu", ["transcribe"], 60)["id"] == transcribe
+    assert queue.claim("gpu", ["transcribe"], 60) is None
+
+
+def test_stage_slots_bound_the_running_jobs(queue):
+    queue.set_stage_limits({"convert": 1})
+    converts = [queue.submit(f"convert{i}", stage="convert") for i in range(2)]
+    download = queue.submit("download", priority=-1)
+
+    job = queue.claim("worker1", ALL_STAGES, 60)
+    assert job["id"] == converts[0]
+    # The convert slot is taken, the lower priority download runs instead
+    assert queue.claim("worker2", ALL_STAGES, 60)["id"] == download
+    assert queue.claim("worker3", ["convert"], 60) is None
+
+    # Completing the stage frees the slot
+    assert queue.advance(job["id"], "worker1", {}, "transcribe")
+    assert queue.claim("worker3", ["convert"], 60)["id"] == converts[1]
+
+    # Removing the limit
+    queue.submit("convert2", stage="convert")
+    queue.set_stage_limits({"convert": None})
+    assert queue.stage_limits() == {}
+    assert queue.claim("worker4", ["convert"], 60) is not None
+
+
+def test_expired_leases_are_claimed_again(queue):
+    job_id = queue.submit("source", max_attempts=2)
+    queue.claim("crashed", ALL_STAGES, lease_seconds=0)
+
+    job = queue.claim("worker", ALL_STAGES, 60)
+
+    assert job["id"] == job_id
+    assert job["lease_owner"] == "worker"
+    assert job["attempts"] == 2
+    # The crashed worker can't complete or renew the stage anymore
+    assert not queue.renew(job_id, "crashed", 60)
+    assert not queue.advance(job_id, "crashed", {"stale": True}, "convert")
+    assert queue.fail(job_id, "crashed", "stale") is None
+    assert queue.renew(job_id, "worker", 60)
+    assert queue.advance(job_id, "worker", {"media_path": "a.mp4"}, "convert")
+    job = queue.get(job_id)
+    assert (job["stage"], job["status"], job["attempts"]) == ("convert", "queued", 0)
+    assert job["state"] == {"media_path": "a.mp4"}
+
+
+def test_expired_lease_on_the_last_attempt_fails_the_job(queue):
+    job_id = queue.submit("source", max_attempts=1)
+    queue.claim("crashed", ALL_STAGES, lease_seconds=0)
+
+    assert queue.claim("worker", ALL_STAGES, 60) is None
+
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert "expired during the download stage" in job["error"]
+
+
+def test_failed_stages_are_retried_after_the_delay_until_out_of_attempts(queue):
+    job_id = queue.submit("source", max_attempts=2)
+
+    queue.claim("worker", ALL_STAGES, 60)
+    assert (
+        queue.fail(job_id, "worker", "RuntimeError: boom", retry_delay=60) == "queued"
+    )
+    # Not available before the delay
+    assert queue.claim("worker", ALL_STAGES, 60) is None
+    assert queue.get(job_id)["available_at"] >= time.time() + 59
+
+    _make_available(queue, job_id)
+    queue.claim("worker", ALL_STAGES, 60)
+    assert queue.fail(job_id, "worker", "RuntimeError: boom") == "failed"
+    job = queue.get(job_id)
+    assert (job["status"], job["error"]) == ("failed", "RuntimeError: boom")
+    assert queue.claim("worker", ALL_STAGES, 60) is None
+
+
+def test_released_jobs_keep_their_attempts(queue):
+    job_id = queue.submit("source")
+    queue.claim("worker", ALL_STAGES, 60)
+
+    assert queue.release(job_id, "worker")
+
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"]) == ("queued", 0)
+
+
+@pytest.fixture
+def stub_stages(monkeypatch):
+    """Replaces the stage runners, `failures[stage]` makes the next runs of a stage raise"""
+    failures = {}
+
+    def runner(name):
+        def run(job, worker):
+            if failures.get(name):
+                failures[name] -= 1
+                raise RuntimeError(f"{name} failed")
+            return {name: job["source"]}
+
+        return run
+
+    for name in ALL_STAGES:
+        monkeypatch.setitem(pipeline.STAGE_RUNNERS, name, runner(name))
+    return failures
+
+
+def _worker(queue, tmp_path, **kwargs):
+    return Worker(
+        queue, device="cpu", worker_id="worker", output_dir=str(tmp_path), **kwargs
+    )
+
+
+def test_worker_runs_every_stage_of_a_job(queue, tmp_path, stub_stages):
+    job_id = queue.submit("source", options={"summarize": False})
+    worker = _worker(queue, tmp_path)
+
+    assert worker.run(exit_when_idle=True) == 3
+
+    job = queue.get(job_id)
+    assert (job["status"], job["stage"]) == ("done", "done")
+    assert job["state"] == {
+        "download": "source",
+        "convert": "source",
+        "transcribe": "source",
+    }
+    assert not worker.run_once()
+
+
+def test_worker_backs_off_failed_stages(queue, tmp_path, stub_stages):
+    stub_stages["download"] = 3
+    job_id = queue.submit("source", max_attempts=3)
+    worker = _worker(queue, tmp_path, retry_delay=10)
+
+    delays = []
+    for _ in range(2):
+        assert worker.run_once()
+        job = queue.get(job_id)
+        assert job["status"] == "queued"
+        delays.append(job["available_at"] - job["updated_at"])
+        _make_available(queue, job_id)
+    assert worker.run_once()
+
+    assert delays == [pytest.approx(10), pytest.approx(20)]
+    job = queue.get(job_id)
+    assert (job["status"], job["error"]) == ("failed", "RuntimeError: download failed")
+
+
+def test_worker_rejects_unknown_stages(queue):
+    with pytest.raises(ValueError, match="Unknown stages"):
+        Worker(queue, stages=["transcribe", "translate"])
+
+
+def test_worker_command_rejects_unknown_stages(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        cli, "run_workers", lambda *args, **kwargs: pytest.fail("workers started")
+    )
+
+    with pytest.raises(SystemExit, match="Invalid --stages translate"):
+        cli.main(
+            [
+                "--queue",
+                str(tmp_path / "jobs.sqlite3"),
+                "worker",
+                "--device",
+                "cpu",
+                "--stages",
+                "transcribe,translate",
+            ]
+        )
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+from mock_llm import MockLLMServer
+
+from summarize_media.summarize_transcription.llm_inference import get_response_async
+from summarize_media.summarize_transcription.rate_limit import (
+    AsyncRateLimiter,
+    get_rate_limiter,
+)
+
+MESSAGES = [
+    {"role": "system", "content": "Summarize"},
+    {"role": "user", "content": "hello"},
+]
+CLIENT_ARGS = {"model": "mock", "max_tokens": 64}
+
+
+def _client(server):
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+
+
+def test_rate_limited_requests_are_retried_after_the_cool_down():
+    limiter = AsyncRateLimiter(requests_per_minute=None, max_concurrency=2)
+
+    async def main(server):
+        client = _client(server)
+        return await asyncio.gather(
+            *(
+                get_response_async(
+                    MESSAGES, client, CLIENT_ARGS, rate_limiter=limiter, backoff_base=0
+                )
+                for _ in range(4)
+            )
+        )
+
+    with MockLLMServer(rate_limited=2, retry_after=0.3) as server:
+        start = time.monotonic()
+        responses = asyncio.run(main(server))
+        elapsed = time.monotonic() - start
+
+    assert [response["role"] for response in responses] == ["assistant"] * 4
+    # Both 429s were retried, after the server mandated delay
+    assert server.requests == 6
+    assert elapsed >= 0.3
+
+
+def test_rate_limited_requests_give_up_after_max_retries():
+    from openai import RateLimitError
+
+    limiter = AsyncRateLimiter(requests_per_minute=None)
+    with MockLLMServer(rate_limited=10) as server:
+        with pytest.raises(RateLimitError):
+            asyncio.run(
+                get_response_async(
+                    MESSAGES,
+                    _client(server),
+                    CLIENT_ARGS,
+                    rate_limiter=limiter,
+                    max_retries=2,
+                    backoff_base=0,
+                )
+            )
+    assert server.requests == 3
+
+
+def test_limiter_bounds_concurrency_and_works_across_event_loops():
+    limiter = AsyncRateLimiter(requests_per_minute=600, max_concurrency=2)
+    in_flight = 0
+    peak = 0
+
+    async def request():
+        nonlocal in_flight, peak
+        async with limiter.slot():
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+    async def main():
+        await asyncio.gather(*(request() for _ in range(6)))
+
+    # The semaphore and the bucket lock are contended, so each run needs primitives of its own loop
+    asyncio.run(main())
+    asyncio.run(main())
+    assert peak == 2
+
+
+def test_get_rate_limiter_rejects_other_args():
+    class Client:
+        pass
+
+    client = Client()
+    limiter = get_rate_limiter(client, requests_per_minute=30, max_concurrency=4)
+    assert get_rate_limiter(client) is limiter
+    assert get_rate_limiter(client, max_concurrency=4) is limiter
+    with pytest.raises(ValueError):
+        get_rate_limiter(client, max_concurrency=8)
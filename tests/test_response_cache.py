@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from mock_llm import MockLLMServer
+
+from summarize_media.cache.response_cache import ResponseCache
+from summarize_media.summarize_transcription.llm_inference import get_response
+
+MESSAGES = [
+    {"role": "system", "content": "Summarize"},
+    {"role": "user", "content": "hello"},
+]
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "responses.sqlite3")
+
+
+def _response(i, size=10):
+    return {"role": "assistant", "content": str(i) * size}
+
+
+def test_expired_responses_are_misses(cache_path):
+    expired = ResponseCache(cache_path, ttl=0)
+    expired.put("key", _response(1))
+    assert expired.get("key") is None
+
+    kept = ResponseCache(cache_path, ttl=None)
+    kept.put("key", _response(1))
+    assert kept.get("key") == _response(1)
+
+
+def test_least_recently_used_responses_are_evicted_past_max_entries(cache_path):
+    cache = ResponseCache(cache_path, max_entries=3)
+    for i in range(3):
+        cache.put(f"key{i}", _response(i))
+    # key0 is used, so key1 is the least recently used one
+    cache.get("key0")
+    cache.put("key3", _response(3))
+
+    assert cache.get("key1") is None
+    assert all(cache.get(f"key{i}") is not None for i in (0, 2, 3))
+    assert cache.stats()["entries"] == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_least_recently_used_responses_are_evicted_past_max_bytes(cache_path):
+    size = len('{"role": "assistant", "content": "0000000000"}')
+    cache = ResponseCache(cache_path, max_bytes=2 * size)
+    for i in range(3):
+        cache.put(f"key{i}", _response(i))
+
+    assert cache.get("key0") is None
+    assert cache.stats()["size"] == 2 * size
+    # Replacing a response updates the total size instead of adding to it
+    cache.put("key2", _response(2, size=5))
+    assert cache.stats()["size"] == 2 * size - 5
+
+
+def test_totals_are_shared_through_the_file(cache_path):
+    writer = ResponseCache(cache_path)
+    for i in range(4):
+        writer.put(f"key{i}", _response(i))
+    writer.clear()
+    writer.put("key", _response(1))
+
+    stats = ResponseCache(cache_path).stats()
+    assert stats["entries"] == 1
+    assert stats["size"] == len('{"role": "assistant", "content": "1111111111"}')
+
+
+def test_sampled_requests_bypass_the_cache(cache_path):
+    cache = ResponseCache(cache_path, bypass_sampled=True)
+    assert cache.is_cacheable({"model": "mock", "temperature": 0})
+    assert not cache.is_cacheable({"model": "mock", "temperature": 0.7})
+    # The providers default to a temperature of 1
+    assert not cache.is_cacheable({"model": "mock"})
+
+    from openai import OpenAI
+
+    with MockLLMServer() as server:
+        client = OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+        for temperature in (0.7, 0.7, 0, 0):
+            get_response(
+                MESSAGES,
+                client,
+                {"model": "mock", "temperature": temperature},
+                cache=cache,
+            )
+
+    assert server.requests == 3
+    stats = cache.stats()
+    assert (stats["bypassed"], stats["hits"], stats["misses"]) == (2, 1, 1)
+
+
+def test_concurrent_identical_requests_share_one_call(cache_path):
+    cache = ResponseCache(cache_path)
+    calls = []
+
+    def call():
+        calls.append(1)
+        time.sleep(0.2)
+        return _response(1), 100
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_call("key", call)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [_response(1)] * 5
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"]) == (1, 4)
+    assert stats["saved_tokens"] == 400
+
+
+def test_concurrent_identical_async_requests_share_one_call(cache_path):
+    cache = ResponseCache(cache_path)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return _response(1), 100
+
+    async def main():
+        return await asyncio.gather(
+            *(cache.get_or_call_async("key", call) for _ in range(5))
+        )
+
+    assert asyncio.run(main()) == [_response(1)] * 5
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_stats_count_hits_and_saved_tokens(cache_path):
+    cache = ResponseCache(cache_path)
+    cache.get_or_call("key", lambda: (_response(1), 120))
+    for _ in range(3):
+        assert cache.get_or_call("key", lambda: pytest.fail("not cached")) == (
+            _response(1)
+        )
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+    assert stats["hit_rate"] == 0.75
+    assert stats["saved_tokens"] == 360
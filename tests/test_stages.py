@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+from summarize_media.instrumentation import stages
+from summarize_media.instrumentation.stages import remote_parent, stage
+
+
+class FakeCuda:
+    """Stands in for torch.cuda: the peak is the highest allocation since the last reset"""
+
+    def __init__(self):
+        self.allocated = 0
+        self.peak = 0
+        self.resets = 0
+
+    def allocate(self, size):
+        self.allocated = size
+        self.peak = max(self.peak, size)
+
+    def max_memory_allocated(self):
+        return self.peak
+
+    def reset_peak_memory_stats(self):
+        self.resets += 1
+        self.peak = self.allocated
+
+
+def test_only_the_outermost_stage_resets_the_gpu_peak(stage_events, monkeypatch):
+    cuda = FakeCuda()
+    monkeypatch.setattr(stages, "_get_cuda", lambda: cuda)
+    inner_started = threading.Event()
+    outer_done = threading.Event()
+
+    def concurrent():
+        # Starts while the outer stage runs, so it must not reset its peak either
+        with stage("concurrent"):
+            inner_started.set()
+            outer_done.wait(5)
+
+    with stage("outer"):
+        cuda.allocate(300)
+        cuda.allocate(100)
+        thread = threading.Thread(target=concurrent)
+        thread.start()
+        inner_started.wait(5)
+        with stage("outer.inner"):
+            cuda.allocate(200)
+        outer_done.set()
+        thread.join()
+
+    peaks = {event["stage"]: event["peak_gpu_bytes"] for event in stage_events}
+    assert cuda.resets == 1
+    assert peaks == {"outer.inner": 300, "concurrent": 300, "outer": 300}
+
+
+def test_remote_parent_names_the_parent_of_the_stages(stage_events):
+    with remote_parent("transcribe"):
+        with stage("transcribe.diarize"):
+            pass
+    with stage("other"):
+        pass
+
+    parents = {event["stage"]: event["parent"] for event in stage_events}
+    assert parents == {"transcribe.diarize": "transcribe", "other": None}
+
+
+def test_unknown_profilers_are_ignored(monkeypatch, caplog):
+    monkeypatch.setenv("SUMMARIZE_MEDIA_PROFILE", "demo=pyspy,other=cprofile")
+    monkeypatch.setattr(stages, "_env_loaded", False)
+    monkeypatch.setattr(stages, "_sinks", [])
+    monkeypatch.setattr(stages, "_profile", {})
+
+    for _ in range(2):
+        with stage("demo") as record:
+            assert stages.current_stage() is record
+        assert stages.current_stage() is None
+        assert not record.profiling
+
+    assert stages._profile == {"other": "cprofile"}
+    assert "Unknown profiler 'pyspy'" in caplog.text
+
+
+def test_a_profiler_failing_to_start_leaves_no_state_behind(stage_events, monkeypatch):
+    cuda = FakeCuda()
+    monkeypatch.setattr(stages, "_get_cuda", lambda: cuda)
+
+    with pytest.raises(ValueError, match="profiler must be one of"):
+        with stage("demo", profile="pyspy"):
+            pass
+
+    assert stages.current_stage() is None
+    assert stages._sampler._records == []
+    assert stages._gpu_peak._running == 0
+    assert stage_events[-1]["status"] == "error"
+    with stage("demo"):
+        pass
+    assert stage_events[-1]["status"] == "ok"
@@ -0,0 +1,155 @@
+import threading
+import time
+
+import pytest
+from mock_llm import MockLLMServer
+from synthetic import synthetic_segments
+
+from summarize_media.summarize_transcription import summarize
+from summarize_media.summarize_transcription.rate_limit import (
+    RateLimiter,
+    get_sync_rate_limiter,
+)
+
+
+class RecordingLLMServer(MockLLMServer):
+    """Mock server that also keeps the system prompt of every request"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.system_prompts = []
+
+    def reply(self, messages):
+        with self._lock:
+            self.system_prompts.append(messages[0]["content"])
+        return super().reply(messages)
+
+
+def test_rate_limiter_spaces_requests_across_threads():
+    limiter = RateLimiter(requests_per_minute=600, max_concurrency=2)
+    times = []
+
+    def send():
+        with limiter.slot():
+            times.append(time.monotonic())
+
+    threads = [threading.Thread(target=send) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    times.sort()
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert min(gaps) >= 0.09
+
+
+class Client:
+    pass
+
+
+def test_sync_rate_limiter_is_per_client_and_rejects_other_args():
+    first, second = Client(), Client()
+    limiter = get_sync_rate_limiter(first, requests_per_minute=60)
+    assert get_sync_rate_limiter(first) is limiter
+    assert get_sync_rate_limiter(first, requests_per_minute=60) is limiter
+    assert get_sync_rate_limiter(second) is not limiter
+    with pytest.raises(ValueError):
+        get_sync_rate_limiter(first, requests_per_minute=120)
+
+
+def test_map_reduce_combines_the_notes_with_the_combine_prompt(monkeypatch):
+    from openai import OpenAI
+
+    segments = synthetic_segments(400)
+    with RecordingLLMServer() as server:
+        client = OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+        get_sync_rate_limiter(client, requests_per_minute=None)
+        monkeypatch.setattr(summarize, "get_client", lambda: client)
+        timings = {}
+        summary = summarize.get_summarization_map_reduce(
+            segments, chunk_tokens=500, fan_in=2, timings=timings
+        )
+
+    assert summary
+    assert "reduce_1" in timings
+    prompts = server.system_prompts
+    assert prompts[-1] == summarize.load_prompt(summarize.COMBINE_PROMPT)
+    assert summarize.load_prompt(summarize.MAP_PROMPT) in prompts
+    assert summarize.load_prompt(summarize.REDUCE_PROMPT) in prompts
+    assert summarize.load_prompt(summarize.DEFAULT_PROMPT) not in prompts
+
+
+class SlowLLMServer(MockLLMServer):
+    """Mock server that reports whether a request is being answered"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.answering = threading.Event()
+
+    def reply(self, messages):
+        self.answering.set()
+        time.sleep(0.2)
+        self.answering.clear()
+        return super().reply(messages)
+
+
+def _stream_client(server):
+    from openai import OpenAI
+
+    client = OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+    get_sync_rate_limiter(client, requests_per_minute=None)
+    return client
+
+
+def test_response_stream_is_sent_on_iteration_and_cached(tmp_path):
+    from summarize_media.cache.response_cache import ResponseCache
+    from summarize_media.summarize_transcription.llm_inference import (
+        get_response_stream,
+    )
+
+    messages = [{"role": "user", "content": "hello"}]
+    client_args = {"model": "mock", "temperature": 0}
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    with MockLLMServer() as server:
+        client = _stream_client(server)
+        stream = get_response_stream(messages, client, client_args, cache=cache)
+        assert server.requests == 0
+
+        streamed = "".join(stream)
+        cached = list(get_response_stream(messages, client, client_args, cache=cache))
+        assert server.requests == 1
+    cache.close()
+
+    assert streamed.startswith("- input of 5 characters")
+    assert cached == [streamed]
+
+
+def test_summarize_stream_keeps_pulling_segments_while_summarizing(monkeypatch):
+    produced_while_answering = []
+
+    with SlowLLMServer() as server:
+
+        def segments():
+            for segment in synthetic_segments(120):
+                time.sleep(0.01)
+                produced_while_answering.append(server.answering.is_set())
+                yield segment
+
+        client = _stream_client(server)
+        monkeypatch.setattr(summarize, "get_client", lambda: client)
+        events = list(summarize.summarize_stream(segments(), window_tokens=300))
+
+    assert [kind for kind, _ in events][-1] == "summary"
+    assert sum(kind == "partial" for kind, _ in events) > 1
+    # The transcription (here the generator) went on while the windows were summarized
+    assert any(produced_while_answering)
+
+
+def test_summarize_stream_raises_the_errors_of_the_segments():
+    def segments():
+        yield from synthetic_segments(3)
+        raise RuntimeError("transcription failed")
+
+    with pytest.raises(RuntimeError, match="transcription failed"):
+        list(summarize.summarize_stream(segments()))
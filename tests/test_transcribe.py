@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+from stub_models import StubDiarizationPipeline, stub_whisperx, synthetic_samples
+
+from summarize_media.transcribe import transcribe as T
+
+ARGS = dict(device="cpu", preload_align_model=False, assign_speaker_labels=True)
+
+
+def _slow_diarize(**diarize_args):
+    """Stands in for `_diarize_in_process`, defined at module level so the spawned process can import it"""
+    time.sleep(60)
+
+
+@pytest.fixture
+def whisperx():
+    with stub_whisperx() as module:
+        yield module
+
+
+def test_concurrent_diarization_matches_sequential(whisperx):
+    audio = synthetic_samples(120)
+    sequential = T.get_transcription(audio, parallel_diarization=None, **ARGS)
+    timings = {}
+    concurrent = T.get_transcription(
+        audio, parallel_diarization="thread", timings=timings, **ARGS
+    )
+
+    assert concurrent == sequential
+    assert {segment["speaker"] for segment in concurrent["segments"]}
+    assert "diarize_wait" in timings
+
+
+def test_failed_transcription_waits_for_the_diarization_thread(whisperx):
+    finished = threading.Event()
+
+    class SlowDiarizationPipeline(StubDiarizationPipeline):
+        def __call__(self, audio, **kwargs):
+            time.sleep(0.5)
+            finished.set()
+            return super().__call__(audio, **kwargs)
+
+    def align(*args, **kwargs):
+        raise RuntimeError("alignment failed")
+
+    whisperx.DiarizationPipeline = SlowDiarizationPipeline
+    whisperx.align = align
+
+    with pytest.raises(RuntimeError, match="alignment failed"):
+        T.get_transcription(
+            synthetic_samples(30), parallel_diarization="thread", **ARGS
+        )
+    assert finished.is_set()
+
+
+def test_failed_transcription_terminates_the_diarization_process(whisperx, monkeypatch):
+    executors = []
+
+    class RecordingExecutor(T.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            executors.append(self)
+
+    processes = []
+
+    def align(*args, **kwargs):
+        # Once the diarization process is up, so there is something to terminate
+        while not executors[0]._processes:
+            time.sleep(0.01)
+        processes.extend(executors[0]._processes.values())
+        raise RuntimeError("alignment failed")
+
+    monkeypatch.setattr(T, "ProcessPoolExecutor", RecordingExecutor)
+    monkeypatch.setattr(T, "_diarize_in_process", _slow_diarize)
+    whisperx.align = align
+
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match="alignment failed"):
+        T.get_transcription(
+            synthetic_samples(30), parallel_diarization="process", **ARGS
+        )
+    assert time.monotonic() - start < 30
+    assert processes
+    for process in processes:
+        process.join(5)
+        assert not process.is_alive()
+
+
+def test_diarization_thread_stage_nests_under_the_transcription(whisperx, stage_events):
+    T.get_transcription(synthetic_samples(30), parallel_diarization="thread", **ARGS)
+
+    parents = {event["stage"]: event["parent"] for event in stage_events}
+    assert parents["transcribe.diarize"] == "transcribe"
+    assert parents["transcribe.transcribe"] == "transcribe"
+
+
+def test_preload_falls_back_only_without_a_default_align_model():
+    missing = T.Future()
+    missing.set_exception(ValueError("No default align-model for language: xx"))
+    assert T._preloaded_align_model(missing, "en", True, {}) == (None, None)
+
+    broken = T.Future()
+    broken.set_exception(ValueError("Unsupported device"))
+    with pytest.raises(ValueError, match="Unsupported device"):
+        T._preloaded_align_model(broken, "en", True, {})
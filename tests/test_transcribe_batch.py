@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from stub_models import SAMPLE_RATE, stub_whisperx, synthetic_samples
+
+from summarize_media.transcribe import transcribe_batch
+
+
+class FakeModel:
+    preset_language = None
+
+
+@pytest.fixture
+def fake_media(monkeypatch):
+    """Files of known durations, with one VAD segment per 10 seconds, and a record of the audio in memory"""
+    durations = {"long.wav": 50.0, "short.wav": 10.0, "medium.wav": 30.0}
+    state = {"loads": [], "live": set(), "peak": 0}
+
+    def load_audio(path):
+        state["loads"].append(path)
+        audio = synthetic_samples(durations[path], seed=len(path))
+        state["live"].add(path)
+        state["peak"] = max(state["peak"], len(state["live"]))
+        return audio
+
+    def detect_vad_segments(model, audio, chunk_size=30):
+        seconds = len(audio) / SAMPLE_RATE
+        return [
+            {"start": s, "end": min(seconds, s + 10.0)}
+            for s in range(0, int(seconds), 10)
+        ]
+
+    def run_batches(model, inputs, batch_size):
+        for item in inputs:
+            yield f"{float(np.abs(item['inputs']).mean()):.4f}"
+
+    def post_process(result, audio, *args):
+        return result["segments"]
+
+    monkeypatch.setattr(transcribe_batch, "detect_vad_segments", detect_vad_segments)
+    monkeypatch.setattr(transcribe_batch, "run_batches", run_batches)
+    monkeypatch.setattr(transcribe_batch, "set_language", lambda model, language: None)
+    monkeypatch.setattr(transcribe_batch, "reset_language", lambda model: None)
+    monkeypatch.setattr(transcribe_batch, "_post_process", post_process)
+    monkeypatch.setattr(
+        "summarize_media.pre_processing.convert_audio_format.probe_media",
+        lambda path: {"duration": durations[path]},
+    )
+    with stub_whisperx() as whisperx:
+        whisperx.load_model = lambda *args, **kwargs: FakeModel()
+        whisperx.load_audio = load_audio
+        yield state
+
+
+def _run(paths, state, **kwargs):
+    results = []
+    for path, segments in transcribe_batch.transcribe_many(
+        paths, device="cpu", **kwargs
+    ):
+        results.append((path, segments))
+        # The audio of a yielded file is dropped
+        state["live"].discard(path)
+    return results
+
+
+def test_files_are_loaded_lazily_shortest_first(fake_media):
+    results = _run(["long.wav", "short.wav", "medium.wav"], fake_media, language="en")
+
+    assert [path for path, _ in results] == ["short.wav", "medium.wav", "long.wav"]
+    assert [len(segments) for _, segments in results] == [1, 3, 5]
+    assert results[2][1][-1]["end"] == 50.0
+    # Durations come from ffprobe, so each file is loaded once, and never all at once
+    assert fake_media["loads"] == ["short.wav", "medium.wav", "long.wav"]
+    assert fake_media["peak"] <= 2
+
+
+def test_detected_languages_keep_only_the_vad_segments(fake_media, monkeypatch):
+    languages = {"long.wav": "fr", "short.wav": "en", "medium.wav": "en"}
+    monkeypatch.setattr(
+        transcribe_batch,
+        "find_language",
+        lambda model, language, audio: languages[fake_media["loads"][-1]],
+    )
+    scanned = _run(["long.wav", "short.wav", "medium.wav"], fake_media)
+
+    assert [path for path, _ in scanned] == ["short.wav", "medium.wav", "long.wav"]
+    # Loaded once to detect the language, once to transcribe
+    assert sorted(fake_media["loads"]) == sorted(
+        ["long.wav", "short.wav", "medium.wav"] * 2
+    )
+
+
+def test_stages_do_not_span_the_yields(fake_media, stage_events):
+    from summarize_media.instrumentation.stages import current_stage, stage
+
+    for path, segments in transcribe_batch.transcribe_many(
+        ["short.wav", "medium.wav"], device="cpu", language="en"
+    ):
+        # The consumer runs outside of the stages of `transcribe_many`
+        assert current_stage() is None
+        with stage("save"):
+            pass
+
+    events = [(event["stage"], event["parent"]) for event in stage_events]
+    assert events == [
+        ("transcribe.prepare", None),
+        ("transcribe.transcribe", None),
+        ("save", None),
+        ("transcribe.transcribe", None),
+        ("save", None),
+    ]
+    assert stage_events[0]["audio_seconds"] == 40.0
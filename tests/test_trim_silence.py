@@ -0,0 +1,154 @@
+import json
+import wave
+
+import numpy as np
+import pytest
+
+from summarize_media.pre_processing.trim_silence import (
+    OffsetMap,
+    trim_non_speech,
+    trim_wav,
+)
+
+SAMPLE_RATE = 16000
+
+# Where the synthetic speech is, in the original audio
+SPEECH = [(3.0, 6.0), (10.0, 13.0)]
+
+
+def _speech(seconds):
+    """Voiced sound: harmonics of 150 Hz up to 3 kHz, with a syllable-rate envelope"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    voiced = sum(np.sin(2 * np.pi * 150 * k * t) for k in range(1, 21)) / 20
+    return 0.5 * voiced * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+
+
+def _music(seconds):
+    """Loud, but below the speech band"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return 0.3 * np.sin(2 * np.pi * 80 * t)
+
+
+def _silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE))
+
+
+@pytest.fixture
+def audio():
+    audio = np.concatenate(
+        [_silence(3), _speech(3), _music(4), _speech(3), _silence(2)]
+    )
+    noise = np.random.default_rng(0).normal(0, 0.001, len(audio))
+    return (audio + noise).astype(np.float32)
+
+
+def _in_speech(t, padding=0.3):
+    return any(start - padding <= t <= end + padding for start, end in SPEECH)
+
+
+def test_non_speech_is_trimmed(audio):
+    trimmed, offset_map = trim_non_speech(audio)
+
+    # Both speech regions are kept with some of the silence around them, the silence and music are removed
+    assert len(trimmed) == round(offset_map.trimmed_duration * SAMPLE_RATE)
+    assert offset_map.trimmed_duration == pytest.approx(6.6, abs=0.2)
+    assert offset_map.removed_ratio == pytest.approx(1 - 6.6 / 15, abs=0.02)
+    assert len(offset_map.original_starts) == 2
+    for original_start, (speech_start, _) in zip(offset_map.original_starts, SPEECH):
+        assert speech_start - 0.3 <= original_start <= speech_start
+
+    # The kept samples are the original ones
+    start = round(offset_map.original_starts[1] * SAMPLE_RATE)
+    position = round(offset_map.trimmed_starts[1] * SAMPLE_RATE)
+    np.testing.assert_array_equal(
+        trimmed[position:], audio[start : start + len(trimmed) - position]
+    )
+
+
+def test_timestamps_are_mapped_back_to_the_speech(audio):
+    _, offset_map = trim_non_speech(audio)
+    boundary = offset_map.trimmed_starts[1]
+    segments = [
+        {
+            "start": 0.5,
+            "end": boundary,
+            "text": "first",
+            "words": [
+                {"word": "first", "start": 0.5, "end": 1.0},
+                {"word": "ends", "start": 2.0, "end": boundary},
+            ],
+        },
+        {
+            "start": boundary,
+            "end": boundary + 2.0,
+            "text": "second",
+            "words": [{"word": "second", "start": boundary, "end": boundary + 2.0}],
+        },
+    ]
+
+    remapped = offset_map.remap_segments(segments)
+
+    times = [
+        t
+        for segment in remapped
+        for item in [segment, *segment["words"]]
+        for t in (item["start"], item["end"])
+    ]
+    assert all(_in_speech(t) for t in times)
+    # A timestamp on the boundary between two regions ends the first one, or starts the second one
+    first, second = remapped
+    assert first["end"] == pytest.approx(
+        offset_map.original_starts[0] + boundary, abs=1e-3
+    )
+    assert first["end"] < SPEECH[0][1] + 0.3
+    assert second["start"] == offset_map.original_starts[1]
+    assert second["words"][0]["end"] == pytest.approx(
+        offset_map.original_starts[1] + 2.0, abs=1e-3
+    )
+    # The input is not modified
+    assert segments[1]["start"] == boundary
+
+
+def test_remap_transcript_accepts_every_transcript_format():
+    offset_map = OffsetMap([0.0, 2.0], [1.0, 10.0], 20.0, 5.0)
+    segment = {"start": 2.5, "end": 3.0, "text": "hi"}
+
+    assert offset_map.remap_transcript([segment]) == [
+        {"start": 10.5, "end": 11.0, "text": "hi"}
+    ]
+    remapped = offset_map.remap_transcript(
+        {"segments": [segment], "word_segments": [{"word": "hi", "start": 0.5}]}
+    )
+    assert remapped["segments"][0]["start"] == 10.5
+    assert remapped["word_segments"] == [{"word": "hi", "start": 1.5}]
+    assert offset_map.to_original(1.0) == 2.0
+
+
+def test_offset_map_survives_json():
+    offset_map = OffsetMap([0.0, 3.32], [2.83, 9.85], 15.0, 6.64)
+
+    restored = OffsetMap.from_dict(json.loads(json.dumps(offset_map.to_dict())))
+
+    assert restored.to_dict() == offset_map.to_dict()
+    assert restored.to_original(4.0) == offset_map.to_original(4.0)
+    assert restored.removed_seconds == pytest.approx(8.36)
+
+
+def test_trim_wav_writes_the_kept_samples(audio, tmp_path):
+    path = str(tmp_path / "audio.wav")
+    samples = (audio * 32767).astype(np.int16)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+
+    trimmed_path, offset_map = trim_wav(path)
+
+    with wave.open(trimmed_path, "rb") as wav:
+        assert wav.getframerate() == SAMPLE_RATE
+        trimmed = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    assert trimmed_path.endswith(" - trimmed.wav")
+    assert len(trimmed) / SAMPLE_RATE == pytest.approx(offset_map.trimmed_duration)
+    start = round(offset_map.original_starts[0] * SAMPLE_RATE)
+    np.testing.assert_array_equal(trimmed[:100], samples[start : start + 100])
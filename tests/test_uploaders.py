@@ -0,0 +1,86 @@
+import os
+from urllib.parse import parse_qs, urlparse
+
+import boto3
+import pytest
+from botocore.config import Config
+from moto import mock_aws
+
+from summarize_media.host_files.uploaders import S3Uploader, Uploader
+
+BUCKET = "summarize-media-test"
+MiB = 1024**2
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        monkeypatch.setenv(name, "testing")
+    with mock_aws():
+        # Signed like the client S3Uploader creates
+        client = boto3.client(
+            "s3", region_name="us-east-1", config=Config(signature_version="s3v4")
+        )
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def audio_file(tmp_path):
+    # 3 parts of 5 MiB (the smallest part size S3 accepts) and a partial one
+    path = tmp_path / "audio.opus"
+    path.write_bytes(os.urandom(16 * MiB))
+    return path
+
+
+def _uploader(client):
+    return S3Uploader(
+        bucket=BUCKET,
+        client=client,
+        multipart_threshold=5 * MiB,
+        multipart_chunksize=5 * MiB,
+        max_concurrency=4,
+    )
+
+
+def test_uploader_is_abstract():
+    with pytest.raises(TypeError):
+        Uploader()
+
+
+def test_multipart_upload_returns_a_presigned_url(s3, audio_file):
+    uploaded_parts = []
+    s3.meta.events.register(
+        "before-parameter-build.s3.UploadPart",
+        lambda params, **kwargs: uploaded_parts.append(params["PartNumber"]),
+    )
+
+    url = _uploader(s3).upload(str(audio_file))
+
+    assert sorted(uploaded_parts) == [1, 2, 3, 4]
+    parsed = urlparse(url)
+    key = parsed.path.split(f"/{BUCKET}/", 1)[-1].lstrip("/")
+    assert key.startswith("summarize-media/") and key.endswith("/audio.opus")
+    query = parse_qs(parsed.query)
+    assert query["X-Amz-Expires"] == [str(24 * 3600)]
+    assert "X-Amz-Signature" in query
+
+    head = s3.head_object(Bucket=BUCKET, Key=key)
+    assert head["ContentLength"] == 16 * MiB
+    assert head["ContentType"] == "audio/ogg"
+    body = s3.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    assert body == audio_file.read_bytes()
+
+
+def test_failed_multipart_upload_is_aborted(s3, audio_file):
+    def fail_third_part(params, **kwargs):
+        if params["PartNumber"] == 3:
+            raise ConnectionError("Connection reset while uploading a part")
+
+    s3.meta.events.register("before-parameter-build.s3.UploadPart", fail_third_part)
+
+    with pytest.raises(ConnectionError):
+        _uploader(s3).upload(str(audio_file))
+
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+    assert s3.list_objects_v2(Bucket=BUCKET).get("KeyCount") == 0
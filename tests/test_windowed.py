@@ -0,0 +1,146 @@
+import wave
+
+import numpy as np
+import pytest
+
+from summarize_media.pre_processing.audio_source import AudioSource
+from summarize_media.transcribe import transcribe as T
+from summarize_media.transcribe.windowed import _map_speakers, transcribe_windowed
+
+SAMPLE_RATE = 16000
+
+
+def _segment(start, end, speaker, text):
+    return {
+        "start": start,
+        "end": end,
+        "text": text,
+        "speaker": speaker,
+        "words": [{"word": text, "start": start, "end": end, "speaker": speaker}],
+    }
+
+
+# Diarization output of every window, on the timeline of the window, with labels local to the window. The
+# windows are (0, 10), (6, 16) and (12, 22): every window cuts at the middle of its overlap with the next one.
+WINDOWS = [
+    [
+        _segment(0.0, 4.0, "SPEAKER_00", "a"),
+        _segment(5.0, 7.5, "SPEAKER_01", "b"),
+        # Centered after the cut at 8s, left to the next window
+        _segment(7.5, 9.5, "SPEAKER_00", "c"),
+    ],
+    [
+        # "b" again, already kept by the previous window
+        _segment(0.0, 1.5, "SPEAKER_01", "b"),
+        _segment(1.5, 3.5, "SPEAKER_02", "c"),
+        # A speaker that wasn't in the overlap
+        _segment(4.0, 7.0, "SPEAKER_00", "d"),
+        _segment(7.0, 9.5, "SPEAKER_00", "e"),
+    ],
+    [
+        _segment(1.0, 3.5, "SPEAKER_05", "e"),
+        _segment(5.0, 8.0, "SPEAKER_07", "f"),
+    ],
+]
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "audio.wav")
+    with wave.open(path, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(SAMPLE_RATE)
+        file.writeframes(np.zeros(22 * SAMPLE_RATE, dtype=np.int16).tobytes())
+    with AudioSource(path) as source:
+        yield source
+
+
+@pytest.fixture
+def windows(monkeypatch):
+    """Replaces `get_transcription` with the scripted window results, returns the lengths of the windows read"""
+    lengths = []
+
+    def get_transcription(audio, timings=None, **kwargs):
+        lengths.append(len(audio) / SAMPLE_RATE)
+        segments = WINDOWS[len(lengths) - 1]
+        return {
+            "segments": [
+                {**segment, "words": [dict(word) for word in segment["words"]]}
+                for segment in segments
+            ]
+        }
+
+    monkeypatch.setattr(T, "get_transcription", get_transcription)
+    return lengths
+
+
+def test_windows_are_stitched_with_consistent_speaker_labels(source, windows):
+    timings = {}
+    transcript = transcribe_windowed(
+        source, window_seconds=10, overlap_seconds=4, timings=timings
+    )
+
+    assert windows == [10, 10, 10]
+    assert timings["windows"] == 3
+    # Every boundary segment once, on the timeline of the recording
+    assert [
+        (segment["text"], segment["start"], segment["end"], segment["speaker"])
+        for segment in transcript["segments"]
+    ] == [
+        ("a", 0.0, 4.0, "SPEAKER_00"),
+        ("b", 5.0, 7.5, "SPEAKER_01"),
+        # The labels carry over through the speech shared in the overlaps
+        ("c", 7.5, 9.5, "SPEAKER_00"),
+        # New speakers get the next free label
+        ("d", 10.0, 13.0, "SPEAKER_02"),
+        ("e", 13.0, 15.5, "SPEAKER_02"),
+        ("f", 17.0, 20.0, "SPEAKER_03"),
+    ]
+    assert [
+        (word["word"], word["start"], word["speaker"])
+        for word in transcript["word_segments"]
+    ] == [
+        (segment["text"], segment["start"], segment["speaker"])
+        for segment in transcript["segments"]
+    ]
+
+
+def test_speakers_are_mapped_by_shared_speech_time():
+    previous = [
+        _segment(0.0, 10.0, "SPEAKER_00", "long"),
+        _segment(10.0, 12.0, "SPEAKER_01", "short"),
+        _segment(12.0, 13.0, "SPEAKER_00", "long again"),
+    ]
+    # Both window speakers overlap SPEAKER_00 of the previous window, the one sharing more time gets it
+    segments = [
+        _segment(9.0, 11.5, "SPEAKER_01", "x"),
+        _segment(11.5, 13.0, "SPEAKER_00", "y"),
+        _segment(14.0, 15.0, "SPEAKER_02", "z"),
+    ]
+
+    mapping = _map_speakers(previous, segments, 9.0, {"SPEAKER_00", "SPEAKER_01"})
+
+    # x shares 1.5s with SPEAKER_01 and 1s with SPEAKER_00, y shares 1s with SPEAKER_00 and 0.5s with SPEAKER_01
+    assert mapping == {
+        "SPEAKER_01": "SPEAKER_01",
+        "SPEAKER_00": "SPEAKER_00",
+        "SPEAKER_02": "SPEAKER_02",
+    }
+
+
+def test_unmatched_speakers_get_labels_not_used_so_far():
+    previous = [_segment(0.0, 10.0, "SPEAKER_03", "a")]
+    segments = [
+        _segment(8.0, 10.0, "SPEAKER_00", "b"),
+        _segment(10.0, 12.0, "SPEAKER_01", "c"),
+        _segment(12.0, 14.0, "SPEAKER_02", "d"),
+    ]
+
+    mapping = _map_speakers(previous, segments, 8.0, {"SPEAKER_00", "SPEAKER_03"})
+
+    assert mapping == {
+        "SPEAKER_00": "SPEAKER_03",
+        "SPEAKER_01": "SPEAKER_02",
+        "SPEAKER_02": "SPEAKER_04",
+    }